@@ -0,0 +1,600 @@
+import asyncio
+import signal
+from os import getpid
+from time import monotonic
+
+import redis.asyncio
+import grpc
+from grpc_health.v1 import health_pb2_grpc
+import inventory_pb2
+import inventory_pb2_grpc
+import metrics
+from breaker import DEADLINE, guard_pool
+from cache import ProductCache
+from config import load_config
+from health import AsyncReadiness
+from log import logger, request_log
+from server import (COMPRESSION, END_OF_STREAM, NOTIFIER_BLOCK_MS, REDIS_UNAVAILABLE, WATCH_POLL_SECONDS, InventoryPlans, claims_request,
+                    create_breaker, create_pools, shard_names, query_limit, watch_request_error, resume_gap, change_event, server_options,
+                    compression_methods, low_stock_thresholds)
+from storage import AsyncCompactRedisStorage, AsyncRedisStorage, AsyncShardedStorage, AsyncStorageAdapter, MemoryStorage, async_run_plan
+
+class AsyncConcurrencyLimiter(grpc.aio.ServerInterceptor):
+    """
+    Sheds calls with RESOURCE_EXHAUSTED while max_concurrent_rpcs calls are running, as the threaded server does.
+    grpc.aio's own maximum_concurrent_rpcs stops taking calls off the connection instead, so they wait until their deadline.
+    """
+
+    def __init__(self, maximum):
+        """
+        Args:
+            maximum (int): Most calls running at once.
+        """
+        self.maximum = maximum
+        self.active = 0
+        self._handlers = {}
+
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        wrapped = self._handlers.get(handler_call_details.method)
+        if wrapped is None:
+            wrapped = self._handlers[handler_call_details.method] = metrics.wrap_handler(handler, handler_call_details.method,
+                                                                                          self._limited, self._limited_stream)
+        return wrapped
+
+
+    def _limited(self, behavior, method):
+        async def limited_behavior(request, context):
+            if self.active >= self.maximum:
+                await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, 'Concurrent RPC limit exceeded!')
+            self.active += 1
+            try:
+                return await behavior(request, context)
+            finally:
+                self.active -= 1
+        return limited_behavior
+
+
+    def _limited_stream(self, behavior, method):
+        async def limited_behavior(request, context):
+            if self.active >= self.maximum:
+                await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, 'Concurrent RPC limit exceeded!')
+            self.active += 1
+            try:
+                async for response in behavior(request, context):
+                    yield response
+            finally:
+                self.active -= 1
+        return limited_behavior
+
+
+class AsyncDeadlineInterceptor(grpc.aio.ServerInterceptor):
+    """
+    Passes each call's deadline to the Redis connections it uses. See server.DeadlineInterceptor.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        wrapped = self._handlers.get(handler_call_details.method)
+        if wrapped is None:
+            wrapped = self._handlers[handler_call_details.method] = metrics.wrap_handler(handler, handler_call_details.method,
+                                                                                          self._with_deadline, self._with_deadline_stream)
+        return wrapped
+
+
+    def _with_deadline(self, behavior, method):
+        async def deadline_behavior(request, context):
+            # Each call runs in its own task, so the value stays with this call
+            remaining = context.time_remaining()
+            DEADLINE.set(monotonic() + remaining if remaining is not None else None)
+            return await behavior(request, context)
+        return deadline_behavior
+
+
+    def _with_deadline_stream(self, behavior, method):
+        async def deadline_behavior(request, context):
+            remaining = context.time_remaining()
+            DEADLINE.set(monotonic() + remaining if remaining is not None else None)
+            async for response in behavior(request, context):
+                yield response
+        return deadline_behavior
+
+
+class AsyncCompressionInterceptor(grpc.aio.ServerInterceptor):
+    """
+    Compresses the responses of chosen RPCs of an asyncio gRPC server. See server.CompressionInterceptor.
+    """
+
+    def __init__(self, methods):
+        """
+        Args:
+            methods (dict): grpc.Compression of each chosen RPC, by name, see server.compression_methods().
+        """
+        self.methods = methods
+        self._handlers = {}
+
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        compression = self.methods.get(handler_call_details.method.rsplit('/', 1)[-1])
+        if handler is None or compression is None:
+            return handler
+        wrapped = self._handlers.get(handler_call_details.method)
+        if wrapped is None:
+            def compressed(behavior, method):
+                async def compressed_behavior(request, context):
+                    context.set_compression(compression)
+                    return await behavior(request, context)
+                return compressed_behavior
+            def compressed_stream(behavior, method):
+                async def compressed_behavior(request, context):
+                    context.set_compression(compression)
+                    async for response in behavior(request, context):
+                        yield response
+                return compressed_behavior
+            wrapped = self._handlers[handler_call_details.method] = metrics.wrap_handler(handler, handler_call_details.method,
+                                                                                          compressed, compressed_stream)
+        return wrapped
+
+
+class AsyncInventoryServiceServicer(InventoryPlans, inventory_pb2_grpc.InventoryServiceServicer):
+    """
+    Implements InventoryServiceServicer on grpc.aio and redis.asyncio.
+    Handlers run as coroutines on one event loop, so slow streaming clients hold no thread
+    and cannot starve unary calls. What the handlers do is shared with server.py, see server.InventoryPlans,
+    and only the waiting on Redis and on clients is written here.
+
+    Methods:
+        See server.InventoryServiceServicer.
+    """
+
+    def __init__(self, config=None, pool=None, storage=None):
+        """
+        Args:
+            config (dict): Server settings, see config.load_config(). Loaded from the environment if None.
+            pool (redis.asyncio.ConnectionPool or list): Connection pool to share between handlers, or one per shard.
+                Built from config if None.
+            storage: Where products are kept, with the coroutine interface of storage.AsyncRedisStorage.
+                Built from config['storage'] if None.
+        """
+        self.config = config if config is not None else load_config()
+        self.cache = ProductCache(self.config['cache_size'], self.config['cache_ttl'])
+        self.low_stock_thresholds = low_stock_thresholds(self.config)
+        self.pools = []
+        if storage is not None:
+            self.storage = storage
+        elif self.config['storage'] == 'memory':
+            self.storage = AsyncStorageAdapter(MemoryStorage(self.config['memory_shards'], self.config['changes_max_length'],
+                                                             self.config['request_id_max_entries'], self.low_stock_thresholds))
+        else:
+            self.pools = pool if isinstance(pool, list) else [pool] if pool is not None else create_pools(self.config, redis.asyncio)
+            shards = []
+            for shard_pool in self.pools:
+                guard_pool(shard_pool, create_breaker(self.config, shard_pool))
+                if self.config['metrics_port']:
+                    metrics.time_pool_waits(shard_pool)
+                    client = metrics.AsyncInstrumentedRedis(connection_pool=shard_pool)
+                else:
+                    client = redis.asyncio.Redis(connection_pool=shard_pool)
+                if self.config['redis_encoding'] == 'compact':
+                    shards.append(AsyncCompactRedisStorage(client, self.config['redis_bucket_size'], self.config['redis_key_prefix'],
+                                                           self.config['changes_max_length']))
+                else:
+                    shards.append(AsyncRedisStorage(client, self.config['redis_key_prefix'], self.config['changes_max_length']))
+            self.storage = shards[0] if len(shards) == 1 else AsyncShardedStorage(shards, shard_names(self.config, len(shards)))
+            if self.config['cache_subscribe'] and self.cache.enabled:
+                # The keyspace subscriptions run on their own thread with synchronous clients, one per shard
+                for shard_pool in self.pools:
+                    self.cache.subscribe(subscription_client(shard_pool), self.config['redis_db'], self.storage.key_identifiers)
+        self.changes = AsyncChangeNotifier(self.storage)
+
+
+    def pool_stats(self):
+        """
+        Reports usage of the shared Redis connection pools, summed over the shards.
+
+        Returns:
+            dict: Maximum, created, idle and in-use connection counts, empty if the storage uses no pool.
+        """
+        if not self.pools:
+            return {}
+        stats = {'max_connections': 0, 'created_connections': 0, 'idle_connections': 0, 'in_use_connections': 0}
+        for pool in self.pools:
+            idle = len(pool._available_connections)
+            in_use = len(pool._in_use_connections)
+            stats['max_connections'] += pool.max_connections
+            stats['created_connections'] += idle + in_use
+            stats['idle_connections'] += idle
+            stats['in_use_connections'] += in_use
+        return stats
+
+
+    @claims_request
+    async def AddProduct(self, request, context):
+        """Adds a product to the inventory. See server.InventoryServiceServicer.AddProduct."""
+        return await async_run_plan(self.add_product(request, context))
+
+
+    async def GetProductById(self, request, context):
+        """Retrieves a product from the inventory by ID. See server.InventoryServiceServicer.GetProductById."""
+        return await async_run_plan(self.get_product_by_id(request, context))
+
+
+    @claims_request
+    async def UpdateProductQuantity(self, request, context):
+        """Updates the quantity of a product in the inventory. See server.InventoryServiceServicer.UpdateProductQuantity."""
+        return await async_run_plan(self.update_product_quantity(request, context))
+
+
+    @claims_request
+    async def AdjustProductQuantity(self, request, context):
+        """Atomically adds to or subtracts from the quantity of a product. See server.InventoryServiceServicer.AdjustProductQuantity."""
+        return await async_run_plan(self.adjust_product_quantity(request, context))
+
+
+    @claims_request
+    async def DeleteProduct(self, request, context):
+        """Deletes a product from the inventory. See server.InventoryServiceServicer.DeleteProduct."""
+        return await async_run_plan(self.delete_product(request, context))
+
+
+    async def GetAllProducts(self, request, context):
+        """Streams all products in the inventory. See server.InventoryServiceServicer.GetAllProducts."""
+        streamed = 0
+        try:
+            # Stream out products one batch at a time. Each read is shielded, since a cancel landing inside
+            # a Redis command can leave its connection checked out of the pool
+            cursor = None
+            while True:
+                cursor, products = await asyncio.shield(self.storage.scan_batch(cursor, self.config['scan_batch_size']))
+                for product in products:
+                    yield product
+                    streamed += 1
+                if cursor is None:
+                    break
+
+        except REDIS_UNAVAILABLE as error:
+            await async_run_plan(self.unavailable(context, 'GetAllProducts', error))
+        finally:
+            request_log.log('GetAllProducts', items=streamed)
+
+
+    @claims_request
+    async def AddProducts(self, request, context):
+        """Adds a batch of products to the inventory. See server.InventoryServiceServicer.AddProducts."""
+        return await async_run_plan(self.add_products(request, context))
+
+
+    async def GetProductsByIds(self, request, context):
+        """Retrieves a batch of products from the inventory by ID. See server.InventoryServiceServicer.GetProductsByIds."""
+        return await async_run_plan(self.get_products_by_ids(request, context))
+
+
+    @claims_request
+    async def UpdateQuantities(self, request, context):
+        """Updates the quantities of a batch of products. See server.InventoryServiceServicer.UpdateQuantities."""
+        return await async_run_plan(self.update_quantities(request, context))
+
+
+    @claims_request
+    async def AdjustQuantities(self, request, context):
+        """Atomically adjusts the quantities of a batch of products. See server.InventoryServiceServicer.AdjustQuantities."""
+        return await async_run_plan(self.adjust_quantities(request, context))
+
+
+    @claims_request
+    async def DeleteProducts(self, request, context):
+        """Deletes a batch of products from the inventory. See server.InventoryServiceServicer.DeleteProducts."""
+        return await async_run_plan(self.delete_products(request, context))
+
+
+    async def StreamQuantities(self, request_iterator, context):
+        """Applies a stream of quantity updates in micro-batches. See server.InventoryServiceServicer.StreamQuantities."""
+        max_batch_size = self.config['stream_max_batch_size']
+        max_latency = self.config['stream_max_batch_latency_ms'] / 1000
+        queue = asyncio.Queue(maxsize=self.config['stream_queue_size'])
+        reader = asyncio.create_task(read_stream(request_iterator, queue))
+        loop = asyncio.get_running_loop()
+
+        applied = 0
+        try:
+            ended = False
+            while not ended:
+                # Wait for the first update of the batch, then collect more until the batch is full or due
+                quantity = await queue.get()
+                if quantity is END_OF_STREAM:
+                    break
+                batch = [quantity]
+                deadline = loop.time() + max_latency
+                while len(batch) < max_batch_size:
+                    if queue.empty():
+                        try:
+                            quantity = await asyncio.wait_for(queue.get(), deadline - loop.time())
+                        except asyncio.TimeoutError:
+                            break
+                    else:
+                        quantity = queue.get_nowait()
+                    if quantity is END_OF_STREAM:
+                        ended = True
+                        break
+                    batch.append(quantity)
+
+                # Shielded as the scans are, see GetAllProducts
+                results = await asyncio.shield(async_run_plan(self.apply_quantities(batch)))
+                applied += len(batch)
+                for result in results:
+                    yield result
+
+        except REDIS_UNAVAILABLE as error:
+            await async_run_plan(self.unavailable(context, 'StreamQuantities', error))
+        finally:
+            reader.cancel()
+            request_log.log('StreamQuantities', items=applied)
+
+
+    async def FindProductsByName(self, request, context):
+        """Finds products by name prefix. See server.InventoryServiceServicer.FindProductsByName."""
+        return await async_run_plan(self.find_products_by_name(request, context))
+
+
+    async def FindLowStock(self, request, context):
+        """Finds products with little stock. See server.InventoryServiceServicer.FindLowStock."""
+        return await async_run_plan(self.find_low_stock(request, context))
+
+
+    async def FindProductsByPrice(self, request, context):
+        """Finds products in a price range. See server.InventoryServiceServicer.FindProductsByPrice."""
+        return await async_run_plan(self.find_products_by_price(request, context))
+
+
+    async def ListProducts(self, request, context):
+        """Lists the inventory one page at a time. See server.InventoryServiceServicer.ListProducts."""
+        return await async_run_plan(self.list_products(request, context))
+
+
+    async def WatchInventory(self, request, context):
+        """Streams every change to the inventory as it happens. See server.InventoryServiceServicer.WatchInventory."""
+        if not self.config['changes_max_length']:
+            await context.abort(grpc.StatusCode.FAILED_PRECONDITION, 'Change capture is off, see INVENTORY_CHANGES_MAX_LENGTH.')
+        error = watch_request_error(request)
+        if error:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, error)
+
+        streamed = 0
+        try:
+            if resume_gap(request.from_offset, await self.storage.trimmed_offset()):
+                await context.abort(grpc.StatusCode.OUT_OF_RANGE, 'Changes after from_offset are no longer kept. '
+                                                                  'Reload with ListProducts and watch from its change_offset.')
+            offset = request.from_offset or await self.storage.latest_offset()
+            # Runs until the client cancels, which raises asyncio.CancelledError at the next await
+            while True:
+                changed = self.changes.changed()
+                # Shielded, since a cancel landing inside a Redis command can leave its connection checked out of the pool
+                events = await asyncio.shield(self.storage.read_changes(offset, self.config['scan_batch_size']))
+                for event in events:
+                    yield change_event(*event)
+                if events:
+                    offset = events[-1][0]
+                    streamed += len(events)
+                else:
+                    try:
+                        await asyncio.wait_for(changed.wait(), WATCH_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+
+        except REDIS_UNAVAILABLE as error:
+            await async_run_plan(self.unavailable(context, 'WatchInventory', error))
+        finally:
+            request_log.log('WatchInventory', items=streamed)
+
+
+    async def ImportProducts(self, request_iterator, context):
+        """Adds a stream of product batches to the inventory. See server.InventoryServiceServicer.ImportProducts."""
+        summary = inventory_pb2.ImportSummary()
+        try:
+            async for request in request_iterator:
+                await async_run_plan(self.import_batch(summary, request))
+            summary.status = 'Import complete.'
+            return summary
+
+        except REDIS_UNAVAILABLE as error:
+            await async_run_plan(self.unavailable(context, 'ImportProducts', error, f'Cannot reach Redis, import stopped after adding {summary.added} products. '
+                                                                                    'Run it again to add the rest.'))
+        finally:
+            request_log.log('ImportProducts', items=summary.received, succeeded=summary.added)
+
+
+    async def ExportProducts(self, request, context):
+        """Streams the whole inventory in batches. See server.InventoryServiceServicer.ExportProducts."""
+        batch_size = query_limit(request.batch_size or self.config['scan_batch_size'], self.config['query_max_results'])
+        streamed = 0
+        try:
+            # Shielded reads, see GetAllProducts. Steps can be short, so products are regrouped into full batches
+            batch = []
+            cursor = None
+            while True:
+                cursor, products = await asyncio.shield(self.storage.scan_batch(cursor, batch_size))
+                batch.extend(products)
+                while len(batch) >= batch_size or (cursor is None and batch):
+                    page, batch = batch[:batch_size], batch[batch_size:]
+                    yield inventory_pb2.ProductList(products=page)
+                    streamed += len(page)
+                if cursor is None:
+                    break
+
+        except REDIS_UNAVAILABLE as error:
+            await async_run_plan(self.unavailable(context, 'ExportProducts', error))
+        finally:
+            request_log.log('ExportProducts', items=streamed)
+
+
+    async def GetInventoryStats(self, request, context):
+        """Reports catalog totals and low-stock counts. See server.InventoryServiceServicer.GetInventoryStats."""
+        return await async_run_plan(self.get_inventory_stats(request, context))
+
+
+class AsyncChangeNotifier:
+    """
+    Tells WatchInventory calls when change events arrive. One task per event loop waits on the change log,
+    so idle watchers hold no Redis connection and make no Redis calls until something changes, costing only
+    their stream's memory.
+
+    Methods:
+        changed: Returns an event that is set when the next change events arrive.
+    """
+
+    def __init__(self, storage):
+        """
+        Args:
+            storage: Storage whose change log is watched, with the coroutine interface of storage.AsyncRedisStorage.
+        """
+        self.storage = storage
+        self._changed = None
+        self._task = None
+
+
+    def changed(self):
+        """
+        Returns an event that is set when the next change events arrive, starting the notifier task on first use.
+        Take it before reading the change log, so events that arrive in between still set it.
+
+        Returns:
+            asyncio.Event: The event.
+        """
+        if self._task is None:
+            self._changed = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        return self._changed
+
+
+    async def _run(self):
+        offset = None
+        while True:
+            try:
+                offset = offset or await self.storage.latest_offset()
+                if await self.storage.read_changes(offset, 1, block=NOTIFIER_BLOCK_MS):
+                    offset = await self.storage.latest_offset()
+                    changed, self._changed = self._changed, asyncio.Event()
+                    changed.set()
+            except redis.RedisError:
+                logger.warning('Cannot read the change log, watchers fall back to polling every %ss.', WATCH_POLL_SECONDS)
+                offset = None
+                await asyncio.sleep(WATCH_POLL_SECONDS)
+
+
+async def read_stream(request_iterator, queue):
+    """
+    Moves requests from a client stream into a bounded queue, followed by END_OF_STREAM.
+    Waits while the queue is full, which stops gRPC reading from the client.
+
+    Args:
+        request_iterator (async iterator): The client's request stream.
+        queue (asyncio.Queue): Bounded queue read by the handler.
+    """
+    try:
+        async for request in request_iterator:
+            await queue.put(request)
+    except grpc.RpcError: # Client cancelled or the call ended
+        pass
+    await queue.put(END_OF_STREAM)
+
+
+def subscription_client(pool):
+    """
+    Builds a synchronous client to the redis-server of an asyncio pool, for a keyspace subscription, see
+    cache.ProductCache.subscribe(). It holds a single connection, which the subscription keeps once it has checked
+    the notification settings, rather than a pool the size of redis_max_connections.
+
+    Args:
+        pool (redis.asyncio.ConnectionPool): The pool.
+
+    Returns:
+        redis.Redis: The client, to close once the subscription has ended.
+    """
+    kwargs = dict(pool.connection_kwargs)
+    if 'path' in kwargs: # Unix socket
+        kwargs['unix_socket_path'] = kwargs.pop('path')
+    # Connects lazily, unlike single_connection_client, so a server can start while Redis is down
+    return redis.Redis(max_connections=1, **kwargs)
+
+
+def serve(config=None, pool=None, readiness=None, servicer=None):
+    """
+    Initializes the asyncio gRPC server, with the grpc.health.v1 health service, and starts warming it up.
+    Must be called with an event loop running.
+
+    Args:
+        config (dict): Server settings, see config.load_config(). Loaded from the environment if None.
+        pool (redis.asyncio.ConnectionPool or list): Connection pool for the servicer, or one per shard. Built from config if None.
+        readiness (health.AsyncReadiness): Serves the health service and warms the server up, a new one if None.
+        servicer (AsyncInventoryServiceServicer): The servicer, built from config and pool if None.
+
+    Returns:
+        grpc.aio.Server: The initialized gRPC server.
+    """
+    config = config if config is not None else load_config()
+    interceptors = [metrics.AsyncMetricsInterceptor()] if config['metrics_port'] else []
+    interceptors.append(AsyncDeadlineInterceptor())
+    if config['max_concurrent_rpcs']:
+        interceptors.append(AsyncConcurrencyLimiter(config['max_concurrent_rpcs']))
+    methods = compression_methods(config)
+    if methods:
+        interceptors.append(AsyncCompressionInterceptor(methods))
+    server = grpc.aio.server(interceptors=interceptors, options=server_options(config), compression=COMPRESSION[config['compression']])
+    servicer = servicer if servicer is not None else AsyncInventoryServiceServicer(config, pool)
+    if config['metrics_port']:
+        metrics.register_servicer(servicer)
+    inventory_pb2_grpc.add_InventoryServiceServicer_to_server(servicer, server)
+    readiness = readiness if readiness is not None else AsyncReadiness(config)
+    health_pb2_grpc.add_HealthServicer_to_server(readiness.health, server)
+    readiness.start(servicer)
+    server.add_insecure_port(config['server_address'])
+    return server
+
+
+async def run(config=None):
+    """
+    Starts the asyncio gRPC server and serves until it is stopped. It listens at once, reporting NOT_SERVING
+    to health checks until it has warmed up, see health.AsyncReadiness.
+    On SIGTERM it reports NOT_SERVING, stops accepting calls and gives in-flight calls shutdown_grace seconds to finish.
+
+    Args:
+        config (dict): Server settings, see config.load_config(). Loaded from the environment if None.
+    """
+    config = config if config is not None else load_config()
+    readiness = AsyncReadiness(config)
+    servicer = AsyncInventoryServiceServicer(config)
+    server = serve(config, readiness=readiness, servicer=servicer)
+    await server.start()
+    logger.info('Server started on %s (asyncio, pid %d)', config['server_address'], getpid())
+    if config['metrics_port']:
+        metrics.start_http_server(config['metrics_host'], config['metrics_port'])
+        logger.info('Metrics on http://%s:%d/metrics', config['metrics_host'], config['metrics_port'])
+    logger.info('Kill with keyboard interrupt (Ctrl+C)')
+    
+    async def stop():
+        await readiness.stop()
+        await server.stop(config['shutdown_grace'])
+
+    def drain():
+        logger.info('Draining in-flight requests...')
+        asyncio.ensure_future(stop())
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, drain)
+    except NotImplementedError: # No loop signal handlers on Windows
+        pass
+    
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(0)
+        servicer.cache.close()
@@ -0,0 +1,373 @@
+import argparse
+import asyncio
+import random
+import socket
+import time
+from threading import Event, Lock, Thread
+
+import google.protobuf.empty_pb2
+import grpc
+import inventory_pb2
+import inventory_pb2_grpc
+from config import load_config, parse_settings
+import server
+import aio_server
+
+
+def seed(stub, products):
+    """
+    Adds products 0..products-1 to the inventory so reads and updates find data.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        products (int): Number of products to add.
+    """
+    for start in range(0, products, 1000):
+        stub.AddProducts(inventory_pb2.ProductList(products=[
+            inventory_pb2.Product(product_identifier=pid, product_name=f'Product {pid}', product_quantity=100, product_price=9.99)
+            for pid in range(start, min(start + 1000, products))]))
+
+
+def client_loop(address, products, write_ratio, stop, latencies, errors=None):
+    """
+    Issues GetProductById/UpdateProductQuantity calls on its own channel until stop is set.
+
+    Args:
+        address (str): Server address.
+        products (int): Number of seeded products to pick IDs from.
+        write_ratio (float): Fraction of calls that are updates.
+        stop (threading.Event): Set when the run is over.
+        latencies (list): Seconds taken by each completed call, appended to.
+        errors (list): Status code of each failed call, appended to. Failed calls raise if None.
+    """
+    with grpc.insecure_channel(address) as channel:
+        stub = inventory_pb2_grpc.InventoryServiceStub(channel)
+        while not stop.is_set():
+            pid = random.randrange(products)
+            start = time.perf_counter()
+            try:
+                if random.random() < write_ratio:
+                    stub.UpdateProductQuantity(inventory_pb2.Quantity(product_identifier=pid, product_quantity=random.randrange(1000)))
+                else:
+                    stub.GetProductById(inventory_pb2.ProductIdentifier(product_identifier=pid))
+            except grpc.RpcError as error:
+                if errors is None:
+                    raise
+                errors.append(error.code())
+                continue
+            latencies.append(time.perf_counter() - start)
+
+
+def stream_loop(address, delay, stop):
+    """
+    Reads GetAllProducts streams slowly until stop is set, holding the stream open like a slow consumer.
+
+    Args:
+        address (str): Server address.
+        delay (float): Seconds to wait after each product.
+        stop (threading.Event): Set when the run is over.
+    """
+    with grpc.insecure_channel(address) as channel:
+        stub = inventory_pb2_grpc.InventoryServiceStub(channel)
+        while not stop.is_set():
+            call = stub.GetAllProducts(google.protobuf.empty_pb2.Empty())
+            for product in call:
+                if stop.wait(delay):
+                    call.cancel()
+                    break
+
+
+class ByteCounter:
+    """
+    TCP proxy in front of the server that counts the bytes the server sends, so the wire size
+    of responses can be compared between settings.
+
+    Methods:
+        take: Returns the bytes counted so far and starts over.
+        close: Stops accepting connections.
+    """
+
+    def __init__(self, address):
+        """
+        Args:
+            address (str): host:port of the server.
+        """
+        host, port = address.rsplit(':', 1)
+        self._upstream = (host, int(port))
+        self._listener = socket.create_server(('127.0.0.1', 0))
+        self.address = f'127.0.0.1:{self._listener.getsockname()[1]}'
+        self._lock = Lock()
+        self._count = 0
+        Thread(target=self._accept, daemon=True).start()
+
+
+    def take(self):
+        """
+        Returns the bytes counted so far and starts over.
+
+        Returns:
+            int: Bytes the server sent since the last call.
+        """
+        with self._lock:
+            count, self._count = self._count, 0
+        return count
+
+
+    def close(self):
+        """
+        Stops accepting connections.
+        """
+        self._listener.close()
+
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._listener.accept()
+            except OSError:
+                return
+            server = socket.create_connection(self._upstream)
+            Thread(target=self._pump, args=(client, server, False), daemon=True).start()
+            Thread(target=self._pump, args=(server, client, True), daemon=True).start()
+
+
+    def _pump(self, source, destination, counted):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                if counted:
+                    with self._lock:
+                        self._count += len(data)
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            source.close()
+            destination.close()
+
+
+def start_server(mode, config, pool=None):
+    """
+    Starts a threaded or asyncio server in the background.
+
+    Args:
+        mode (str): 'threaded' or 'async'.
+        config (dict): Server settings, see config.load_config().
+        pool: Connection pool matching the mode, built from config if None.
+
+    Returns:
+        callable: Stops the server.
+    """
+    if mode == 'threaded':
+        grpc_server = server.serve(config, pool)
+        grpc_server.start()
+        return lambda: grpc_server.stop(0)
+
+    # Run the asyncio server on its own event loop thread
+    loop = asyncio.new_event_loop()
+    started = Event()
+    holder = {}
+    def run_loop():
+        asyncio.set_event_loop(loop)
+        holder['server'] = aio_server.serve(config, pool)
+        loop.run_until_complete(holder['server'].start())
+        started.set()
+        loop.run_forever()
+    Thread(target=run_loop, daemon=True).start()
+    started.wait()
+    def stop():
+        asyncio.run_coroutine_threadsafe(holder['server'].stop(0), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+    return stop
+
+
+def percentile(values, fraction):
+    """
+    Returns the value below which the given fraction of the sorted values fall.
+
+    Args:
+        values (list): Sorted values.
+        fraction (float): Between 0 and 1.
+
+    Returns:
+        float: The percentile, 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(config, clients, duration, products, write_ratio, mode='threaded', streamers=0, stream_delay=0.01, pool=None):
+    """
+    Starts a server with the given settings and measures its unary throughput and latency.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+        clients (int): Number of concurrent unary client threads.
+        duration (float): Seconds to measure for.
+        products (int): Catalog size.
+        write_ratio (float): Fraction of calls that are updates.
+        mode (str): 'threaded' or 'async' server.
+        streamers (int): Number of slow GetAllProducts consumers running alongside.
+        stream_delay (float): Seconds each streamer waits per product.
+        pool: Connection pool for the server, built from config if None.
+
+    Returns:
+        dict: Completed calls per second and p50/p99 latency in milliseconds.
+    """
+    stop_server = start_server(mode, config, pool)
+    address = config['server_address'].replace('[::]', 'localhost')
+    try:
+        with grpc.insecure_channel(address) as channel:
+            seed(inventory_pb2_grpc.InventoryServiceStub(channel), products)
+
+        stop = Event()
+        latencies = [[] for i in range(clients)]
+        threads = [Thread(target=stream_loop, args=(address, stream_delay, stop), daemon=True) for i in range(streamers)]
+        threads += [Thread(target=client_loop, args=(address, products, write_ratio, stop, latencies[i]), daemon=True)
+                    for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        latencies = sorted(latency for client in latencies for latency in client)
+        return {'throughput': len(latencies) / duration, 'p50_ms': percentile(latencies, 0.5) * 1000,
+                'p99_ms': percentile(latencies, 0.99) * 1000}
+    finally:
+        stop_server()
+
+
+def measure_streams(address, counter, batch_size=500):
+    """
+    Reads the whole catalog once with GetAllProducts and once with ExportProducts, through a ByteCounter.
+
+    Args:
+        address (str): Address of the ByteCounter.
+        counter (ByteCounter): Counts the bytes of each call.
+        batch_size (int): Products per ExportProducts message.
+
+    Returns:
+        dict: Kilobytes on the wire and milliseconds taken by each call.
+    """
+    results = {}
+    with grpc.insecure_channel(address) as channel:
+        stub = inventory_pb2_grpc.InventoryServiceStub(channel)
+        stub.GetProductById(inventory_pb2.ProductIdentifier(product_identifier=0))
+        counter.take()
+        calls = {'all': lambda: stub.GetAllProducts(google.protobuf.empty_pb2.Empty()),
+                 'export': lambda: stub.ExportProducts(inventory_pb2.ExportRequest(batch_size=batch_size))}
+        for name, call in calls.items():
+            start = time.perf_counter()
+            for message in call():
+                pass
+            results[f'{name}_ms'] = (time.perf_counter() - start) * 1000
+            # Give the proxy a moment to pass on the trailers
+            time.sleep(0.05)
+            results[f'{name}_kb'] = counter.take() / 1024
+    return results
+
+
+def run_tuning(config, variants, clients, duration, products, mode='threaded'):
+    """
+    Measures the wire size and speed of catalog streams and the unary throughput, latency and shed calls
+    of a server started with each variant of the settings.
+
+    Args:
+        config (dict): Server settings shared by every variant, see config.load_config().
+        variants (dict): Settings each variant overrides, by name.
+        clients (int): Number of concurrent unary client threads.
+        duration (float): Seconds to measure unary calls for.
+        products (int): Catalog size.
+        mode (str): 'threaded' or 'async' server.
+
+    Returns:
+        dict: measure_streams() results plus calls per second, p50/p99 latency in milliseconds
+            and the fraction of calls shed with RESOURCE_EXHAUSTED, by variant.
+    """
+    results = {}
+    address = config['server_address'].replace('[::]', 'localhost')
+    for name, settings in variants.items():
+        stop_server = start_server(mode, dict(config, **settings))
+        counter = ByteCounter(address)
+        try:
+            with grpc.insecure_channel(address) as channel:
+                seed(inventory_pb2_grpc.InventoryServiceStub(channel), products)
+            result = measure_streams(counter.address, counter)
+
+            stop = Event()
+            latencies = [[] for i in range(clients)]
+            errors = [[] for i in range(clients)]
+            threads = [Thread(target=client_loop, args=(address, products, 0.0, stop, latencies[i], errors[i]), daemon=True)
+                       for i in range(clients)]
+            for thread in threads:
+                thread.start()
+            time.sleep(duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+            latencies = sorted(latency for client in latencies for latency in client)
+            shed = sum(1 for client in errors for code in client if code == grpc.StatusCode.RESOURCE_EXHAUSTED)
+            result.update({'throughput': len(latencies) / duration, 'p50_ms': percentile(latencies, 0.5) * 1000,
+                           'p99_ms': percentile(latencies, 0.99) * 1000, 'shed': shed / max(len(latencies) + shed, 1)})
+            results[name] = result
+        finally:
+            counter.close()
+            stop_server()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure InventoryService throughput and latency as max_workers grows, '
+                                                 'or the effect of other server settings with --tuning.')
+    parser.add_argument('--mode', choices=['threaded', 'async', 'both'], default='threaded', help='server implementation to measure')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='max_workers values to compare (threaded)')
+    parser.add_argument('--tuning', nargs='+', metavar='VARIANT',
+                        help='settings to compare instead of max_workers, each "default" or NAME=VALUE pairs joined by +, '
+                             'e.g. default compression=gzip compression_methods=ExportProducts=gzip max_workers=4+max_concurrent_rpcs=8')
+    parser.add_argument('--set', dest='settings', action='append', default=[], metavar='NAME=VALUE',
+                        help='setting for every run, e.g. --set storage=memory')
+    parser.add_argument('--clients', type=int, default=32, help='concurrent unary client threads')
+    parser.add_argument('--streamers', type=int, default=0, help='slow GetAllProducts consumers running alongside')
+    parser.add_argument('--stream-delay', type=float, default=0.01, help='seconds each streamer waits per product')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per run')
+    parser.add_argument('--products', type=int, default=1000, help='catalog size')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='fraction of calls that are updates')
+    parser.add_argument('--address', default='localhost:50061', help='address for the benchmark server')
+    args = parser.parse_args()
+    try:
+        settings = parse_settings(args.settings)
+        variants = {variant: parse_settings(variant.split('+')) if variant != 'default' else {} for variant in args.tuning or []}
+    except (KeyError, ValueError) as error:
+        parser.error(error.args[0])
+
+    if args.tuning:
+        config = load_config(server_address=args.address, **settings)
+        print(f'{"variant":<40} {"all KB":>9} {"all ms":>8} {"export KB":>9} {"export ms":>9} {"calls/s":>9} {"p50 ms":>8} '
+              f'{"p99 ms":>8} {"shed":>6}')
+        for mode in (['threaded', 'async'] if args.mode == 'both' else [args.mode]):
+            for variant, result in run_tuning(config, variants, args.clients, args.duration, args.products, mode).items():
+                print(f'{(mode + " " + variant)[:40]:<40} {result["all_kb"]:>9.1f} {result["all_ms"]:>8.1f} {result["export_kb"]:>9.1f} '
+                      f'{result["export_ms"]:>9.1f} {result["throughput"]:>9.0f} {result["p50_ms"]:>8.2f} {result["p99_ms"]:>8.2f} '
+                      f'{result["shed"]:>6.1%}')
+        raise SystemExit()
+
+    runs = []
+    if args.mode in ('threaded', 'both'):
+        runs += [('threaded', workers) for workers in args.workers]
+    if args.mode in ('async', 'both'):
+        runs.append(('async', None))
+
+    print(f'{"mode":>10} {"max_workers":>12} {"calls/s":>10} {"p50 ms":>8} {"p99 ms":>8}')
+    for mode, workers in runs:
+        config = load_config(server_address=args.address, **settings)
+        if workers:
+            config['max_workers'] = workers
+        result = run(config, args.clients, args.duration, args.products, args.write_ratio,
+                     mode, args.streamers, args.stream_delay)
+        print(f'{mode:>10} {workers or "-":>12} {result["throughput"]:>10.0f} {result["p50_ms"]:>8.2f} {result["p99_ms"]:>8.2f}')
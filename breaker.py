@@ -0,0 +1,275 @@
+import inspect
+from contextvars import ContextVar
+from threading import Lock
+from time import monotonic
+
+import redis
+import redis.asyncio
+from log import logger
+
+
+# Monotonic time by which the current gRPC call must finish, None without a deadline. Set per call by
+# server.DeadlineInterceptor and aio_server.AsyncDeadlineInterceptor, read when a Redis connection is checked out
+DEADLINE = ContextVar('deadline', default=None)
+
+# Set while the current task checks a connection out of an asyncio pool, see guard_pool()
+_CHECKING_OUT = ContextVar('checking_out', default=False)
+
+
+class CircuitOpenError(redis.ConnectionError):
+    """
+    Raised instead of contacting a redis-server that keeps failing, until the breaker lets a probe through.
+    """
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failed uses of a redis-server's connections and, after failure_threshold of them,
+    fails every call at once instead of letting it wait out connect and socket timeouts. Every reset_timeout
+    seconds one call is let through as a probe, and the first success closes the circuit again.
+    Safe to share between threads and coroutines.
+
+    Methods:
+        allow: Says whether a call may contact the redis-server.
+        success: Records a use of a connection that went well.
+        failure: Records a use of a connection that failed.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, name='redis'):
+        """
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit.
+            reset_timeout (float): Seconds between probes while the circuit is open.
+            name (str): Name of the redis-server in log messages.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.failures = 0
+        self._retry_at = 0.0  # Monotonic time of the next probe while open
+        self._lock = Lock()
+
+
+    @property
+    def open(self):
+        """bool: Whether calls are failing fast."""
+        return self.failures >= self.failure_threshold
+
+
+    def allow(self):
+        """
+        Says whether a call may contact the redis-server: always while the circuit is closed,
+        and once per reset_timeout while it is open.
+
+        Returns:
+            bool: Whether the call may go ahead.
+        """
+        if not self.open:
+            return True
+        with self._lock:
+            now = monotonic()
+            if now < self._retry_at:
+                return False
+            self._retry_at = now + self.reset_timeout
+            return True
+
+
+    def success(self):
+        """
+        Records a use of a connection that went well, closing the circuit.
+        """
+        if self.failures:
+            with self._lock:
+                if self.open:
+                    logger.warning('Redis %s is back, closing the circuit.', self.name)
+                self.failures = 0
+
+
+    def failure(self):
+        """
+        Records a use of a connection that failed, opening the circuit after failure_threshold in a row.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.failures == self.failure_threshold:
+                logger.warning('Redis %s failed %d times in a row, failing calls fast for %ss between probes.',
+                               self.name, self.failures, self.reset_timeout)
+            if self.open:
+                self._retry_at = monotonic() + self.reset_timeout
+
+
+def remaining_timeout(socket_timeout):
+    """
+    Shortens a socket timeout to the time left before the current call's deadline.
+
+    Args:
+        socket_timeout (float): The configured timeout, None for none.
+
+    Returns:
+        float: The timeout to use, the configured one if the call has no deadline or more time than that.
+
+    Raises:
+        redis.TimeoutError: If the deadline has already passed.
+    """
+    deadline = DEADLINE.get()
+    if deadline is None:
+        return socket_timeout
+    remaining = deadline - monotonic()
+    if remaining <= 0:
+        raise redis.TimeoutError('Deadline exceeded before contacting Redis.')
+    return remaining if socket_timeout is None else min(socket_timeout, remaining)
+
+
+def deadline_passed():
+    """
+    Says whether the current call's deadline has passed.
+
+    Returns:
+        bool: True once past the deadline, False before it or without one.
+    """
+    deadline = DEADLINE.get()
+    return deadline is not None and monotonic() >= deadline
+
+
+class DeadlineConnection:
+    """
+    Mixed into a pool's connection class by guard_pool(), so connecting and the handshake that follows
+    end by the current call's deadline too. A timeout cut short is flagged with timeout_shortened.
+    """
+
+    def connect(self):
+        if self._sock:
+            return
+        connect_timeout = self.socket_connect_timeout
+        self.socket_connect_timeout = remaining_timeout(connect_timeout)
+        if self.socket_connect_timeout != connect_timeout:
+            self.timeout_shortened = True
+        try:
+            super().connect()
+        finally:
+            self.socket_connect_timeout = connect_timeout
+
+
+    def on_connect(self):
+        # Reads follow the socket's timeout, and the parser keeps socket_timeout to restore it after polling
+        timeout = remaining_timeout(self.socket_timeout)
+        if timeout != self.socket_timeout:
+            self._sock.settimeout(timeout)
+            self.timeout_shortened = True
+        super().on_connect()
+
+
+class AsyncDeadlineConnection:
+    """
+    Mixed into an asyncio pool's connection class by guard_pool(). See DeadlineConnection.
+    """
+
+    async def connect(self):
+        if self.is_connected:
+            return
+        connect_timeout, socket_timeout = self.socket_connect_timeout, self.socket_timeout
+        self.socket_connect_timeout = remaining_timeout(connect_timeout)
+        self.socket_timeout = remaining_timeout(socket_timeout)
+        if (self.socket_connect_timeout, self.socket_timeout) != (connect_timeout, socket_timeout):
+            self.timeout_shortened = True
+        try:
+            await super().connect()
+        finally:
+            self.socket_connect_timeout, self.socket_timeout = connect_timeout, socket_timeout
+
+
+def deadline_class(mixin, connection_class):
+    """
+    Derives a connection class that honors the current call's deadline while connecting.
+
+    Args:
+        mixin (type): DeadlineConnection or AsyncDeadlineConnection.
+        connection_class (type): The pool's connection class.
+
+    Returns:
+        type: The derived class, with the same name, or connection_class itself if it is a factory function
+        rather than a class.
+    """
+    if not isinstance(connection_class, type):
+        return connection_class
+    return type(connection_class)(connection_class.__name__, (mixin, connection_class), {})
+
+
+def guard_pool(pool, breaker=None):
+    """
+    Makes the connections of a pool honor the current call's deadline, see DEADLINE, and report to a circuit breaker.
+    Connecting is cut short at the deadline, and a connection's socket timeout is cut to the time left when it is
+    checked out and restored when it is released. A connection released disconnected, which redis-py does after
+    a connection error or timeout, counts as a failure, unless its timeout was cut short and the call's deadline
+    has passed: a call sent with too short a deadline says nothing about the redis-server. Waiting for a free
+    connection does not count either, since a busy pool says nothing about the redis-server.
+
+    Args:
+        pool: Threaded or asyncio connection pool, guarded in place before it makes any connection.
+        breaker (CircuitBreaker): Breaker of the pool's redis-server, None to only honor deadlines.
+    """
+    if getattr(pool, 'guarded', False):
+        return
+    get_connection, release = pool.get_connection, pool.release
+    socket_timeout = pool.connection_kwargs.get('socket_timeout')
+
+    def check_breaker():
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f'Redis {breaker.name} is failing, not contacted for up to {breaker.reset_timeout}s.')
+
+    if inspect.iscoroutinefunction(get_connection):
+        pool.connection_class = deadline_class(AsyncDeadlineConnection, pool.connection_class)
+
+        async def guarded_get_connection(*args, **kwargs):
+            timeout = remaining_timeout(socket_timeout)
+            check_breaker()
+            checking_out = _CHECKING_OUT.set(True)
+            try:
+                connection = await get_connection(*args, **kwargs)
+            finally:
+                _CHECKING_OUT.reset(checking_out)
+            connection.socket_timeout = timeout
+            if timeout != socket_timeout:
+                connection.timeout_shortened = True
+            return connection
+
+        async def guarded_release(connection):
+            shortened = connection.__dict__.pop('timeout_shortened', False)
+            if breaker is not None and connection.is_connected:
+                breaker.success()
+            elif breaker is not None and not (shortened and deadline_passed()):
+                breaker.failure()
+            connection.socket_timeout = socket_timeout
+            if _CHECKING_OUT.get() and isinstance(pool, redis.asyncio.BlockingConnectionPool):
+                # A connection that failed to connect, released by get_connection() while it holds the pool's condition:
+                # waiting for the condition would block until the pool timeout
+                await redis.asyncio.ConnectionPool.release(pool, connection)
+                pool._condition.notify()
+            else:
+                await release(connection)
+    else:
+        pool.connection_class = deadline_class(DeadlineConnection, pool.connection_class)
+
+        def guarded_get_connection(*args, **kwargs):
+            timeout = remaining_timeout(socket_timeout)
+            check_breaker()
+            connection = get_connection(*args, **kwargs)
+            if timeout != socket_timeout:
+                connection._sock.settimeout(timeout)
+                connection.timeout_shortened = True
+            return connection
+
+        def guarded_release(connection):
+            shortened = connection.__dict__.pop('timeout_shortened', False)
+            if connection._sock is None:
+                if breaker is not None and not (shortened and deadline_passed()):
+                    breaker.failure()
+            else:
+                if breaker is not None:
+                    breaker.success()
+                if shortened:
+                    connection._sock.settimeout(socket_timeout)
+            release(connection)
+    pool.get_connection = guarded_get_connection
+    pool.release = guarded_release
+    pool.guarded = True
@@ -0,0 +1,198 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic, sleep
+
+import redis
+from log import logger
+
+
+# Keyspace events the cache needs: K (keyspace channel), g (DEL, EXPIRE, ...) and h (hash commands)
+KEYSPACE_EVENTS = 'Kgh'
+
+
+class ProductCache:
+    """
+    Bounded LRU cache of decoded Product messages with a time-to-live, safe to share between threads.
+
+    Invalidation drops the entry and notes when the product changed, so a lookup that read Redis before a write
+    cannot store its stale result after the write invalidated the product. The notes are kept apart from the entries,
+    so writes to products that are not cached never evict those that are.
+
+    Methods:
+        get: Returns a cached product.
+        token: Marks the start of a Redis read whose result may be stored.
+        put: Stores a product read from Redis.
+        invalidate: Drops a product after it changed.
+        clear: Drops every product.
+        stats: Reports hit, miss, eviction and invalidation counts.
+        subscribe: Invalidates products changed by other processes, using Redis keyspace notifications.
+        close: Ends the subscriptions.
+    """
+
+    def __init__(self, max_size, ttl):
+        """
+        Args:
+            max_size (int): Most products held, 0 disables the cache.
+            ttl (float): Seconds a product may be served from the cache.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = max_size > 0
+        self._entries = OrderedDict()     # product_identifier -> (expiry, product)
+        self._invalidated = OrderedDict() # product_identifier -> clock of its last invalidation, at most max_size
+        self._lock = Lock()
+        self._clock = 0                   # Bumped by every invalidation
+        self._evicted_clock = 0           # Clock of the newest invalidation dropped from _invalidated
+        self._subscribers = []            # (listening thread, client) of each subscription
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+
+    def get(self, product_identifier):
+        """
+        Returns a cached product.
+
+        Args:
+            product_identifier (int): ID of the product.
+
+        Returns:
+            inventory_pb2.Product: The product, or None if it is not cached or has expired.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(product_identifier)
+            if entry is None or entry[0] < monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(product_identifier)
+            self.hits += 1
+            return entry[1]
+
+
+    def token(self):
+        """
+        Marks the start of a Redis read whose result may be stored with put().
+
+        Returns:
+            int: Token to pass to put().
+        """
+        return self._clock
+
+
+    def put(self, product_identifier, product, token):
+        """
+        Stores a product read from Redis, unless it was invalidated after the read started.
+
+        Args:
+            product_identifier (int): ID of the product.
+            product (inventory_pb2.Product): The product.
+            token (int): token() taken before the product was read.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if token < self._evicted_clock or token < self._invalidated.get(product_identifier, 0):
+                return
+            self._store(product_identifier, (monotonic() + self.ttl, product))
+
+
+    def invalidate(self, product_identifier):
+        """
+        Drops a product after it changed.
+
+        Args:
+            product_identifier (int): ID of the product.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._clock += 1
+            self.invalidations += 1
+            self._entries.pop(product_identifier, None)
+            # Only the newest invalidations need keeping, reads in flight started moments ago
+            self._invalidated[product_identifier] = self._clock
+            self._invalidated.move_to_end(product_identifier)
+            while len(self._invalidated) > self.max_size:
+                self._evicted_clock = max(self._evicted_clock, self._invalidated.popitem(last=False)[1])
+
+
+    def clear(self):
+        """
+        Drops every product, e.g. after invalidations may have been missed.
+        """
+        with self._lock:
+            self._clock += 1
+            self._evicted_clock = self._clock
+            self._entries.clear()
+            self._invalidated.clear()
+
+
+    def stats(self):
+        """
+        Reports cache usage.
+
+        Returns:
+            dict: Size, hit, miss, eviction and invalidation counts.
+        """
+        return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'invalidations': self.invalidations}
+
+
+    def _store(self, product_identifier, entry):
+        # Insert as most recently used and evict the least recently used entries beyond max_size
+        self._entries[product_identifier] = entry
+        self._entries.move_to_end(product_identifier)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+    def subscribe(self, client, db, key_identifiers):
+        """
+        Invalidates products changed by any Redis client, including other server replicas,
+        by listening to keyspace notifications on a background thread.
+        Enables the notifications on redis-server if it allows CONFIG SET.
+        Subscribe once to each redis-server holding products, notifications are not shared between servers.
+
+        Args:
+            client (redis.Redis): Synchronous client, the subscription holds one of its connections.
+            db (int): Redis database holding the products.
+            key_identifiers (callable): Lists the IDs of the products a changed key holds,
+                see storage.Storage.key_identifiers.
+        """
+        if not self.enabled:
+            return
+        try:
+            flags = client.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+            if not set(KEYSPACE_EVENTS) <= set(flags.replace('A', 'g$lshzxet')):
+                client.config_set('notify-keyspace-events', ''.join(sorted(set(flags + KEYSPACE_EVENTS))))
+        except redis.ResponseError:
+            logger.warning("Cannot enable keyspace notifications, other replicas' writes reach the cache only after %ss.", self.ttl)
+        except redis.ConnectionError:
+            logger.warning("Error connecting to redis-server, other replicas' writes reach the cache only after %ss.", self.ttl)
+            return
+
+        prefix = f'__keyspace@{db}__:'
+        def on_change(message):
+            for product_identifier in key_identifiers(message['channel'][len(prefix):]):
+                self.invalidate(product_identifier)
+        def on_error(error, pubsub, thread):
+            # Notifications may have been lost while disconnected
+            logger.error('Cache invalidation subscription failed: %s', error)
+            self.clear()
+            sleep(1.0)
+
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(**{f'{prefix}*': on_change})
+        self._subscribers.append((pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=on_error), client))
+
+
+    def close(self):
+        """
+        Ends the keyspace subscriptions and closes their clients. Each listening thread closes its connection
+        within a second.
+        """
+        for thread, client in self._subscribers:
+            thread.stop()
+            client.close()
+        self._subscribers = []
@@ -0,0 +1,326 @@
+import argparse
+import csv
+import json
+import sys
+import time
+
+import grpc
+import inventory_pb2
+import inventory_pb2_grpc
+from inventory_client import DEFAULT_CHUNK_SIZE, export_products, import_products
+
+
+# Columns of a CSV catalog, and keys of a JSON Lines one
+FIELDS = ['product_identifier', 'product_name', 'product_quantity', 'product_price']
+
+# Format of a catalog file, by extension
+EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.pb': 'protobuf', '.bin': 'protobuf'}
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 1.0
+
+
+def guess_format(path, format=None):
+    """
+    Picks the format of a catalog file.
+
+    Args:
+        path (str): The file, '-' for stdin or stdout.
+        format (str): 'csv', 'jsonl' or 'protobuf', guessed from the extension if None.
+
+    Returns:
+        str: The format.
+
+    Raises:
+        ValueError: If the extension does not say and no format was given.
+    """
+    if format is not None:
+        return format
+    for extension, name in EXTENSIONS.items():
+        if path.endswith(extension):
+            return name
+    raise ValueError(f'cannot tell the format of {path!r}, pass --format')
+
+
+def price_value(price):
+    """
+    Rounds a price read back from its 32-bit float field, so 9.99 is written as 9.99 rather than 9.98999977.
+
+    Args:
+        price (float): The price.
+
+    Returns:
+        float: The shortest value with the same 32-bit representation.
+    """
+    return float(f'{price:.7g}')
+
+
+def product_record(product):
+    """
+    Converts a product to the dictionary written as a JSON Lines record.
+
+    Args:
+        product (inventory_pb2.Product): The product.
+
+    Returns:
+        dict: The FIELDS of the product.
+    """
+    return {'product_identifier': product.product_identifier, 'product_name': product.product_name,
+            'product_quantity': product.product_quantity, 'product_price': price_value(product.product_price)}
+
+
+def read_csv(file):
+    """
+    Reads products from CSV with a header row naming the FIELDS columns, in any order.
+
+    Args:
+        file (text file): The catalog.
+
+    Yields:
+        inventory_pb2.Product: The products.
+
+    Raises:
+        ValueError: If a row cannot be read, naming its line.
+    """
+    reader = csv.DictReader(file)
+    missing = set(FIELDS) - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f'CSV header is missing {", ".join(sorted(missing))}')
+    for row in reader:
+        try:
+            yield inventory_pb2.Product(product_identifier=int(row['product_identifier']), product_name=row['product_name'],
+                                        product_quantity=int(row['product_quantity']), product_price=float(row['product_price']))
+        except (TypeError, ValueError) as error:
+            raise ValueError(f'line {reader.line_num}: {error}') from None
+
+
+def write_csv(file, products):
+    """
+    Writes products as CSV with a header row.
+
+    Args:
+        file (text file): Where to write.
+        products (iterable of inventory_pb2.Product): The products.
+    """
+    writer = csv.writer(file)
+    writer.writerow(FIELDS)
+    for product in products:
+        writer.writerow([product.product_identifier, product.product_name, product.product_quantity, price_value(product.product_price)])
+
+
+def read_jsonl(file):
+    """
+    Reads products from JSON Lines, one object with the FIELDS keys per line. Blank lines are skipped.
+
+    Args:
+        file (text file): The catalog.
+
+    Yields:
+        inventory_pb2.Product: The products.
+
+    Raises:
+        ValueError: If a line cannot be read, naming it.
+    """
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            yield inventory_pb2.Product(**json.loads(line))
+        except (TypeError, ValueError) as error:
+            raise ValueError(f'line {number}: {error}') from None
+
+
+def write_jsonl(file, products):
+    """
+    Writes products as JSON Lines.
+
+    Args:
+        file (text file): Where to write.
+        products (iterable of inventory_pb2.Product): The products.
+    """
+    for product in products:
+        file.write(json.dumps(product_record(product), ensure_ascii=False))
+        file.write('\n')
+
+
+def read_delimited(file):
+    """
+    Reads length-delimited Product messages, each preceded by its size as a varint,
+    as written by Java's writeDelimitedTo() and similar.
+
+    Args:
+        file (binary file): The catalog.
+
+    Yields:
+        inventory_pb2.Product: The products.
+
+    Raises:
+        ValueError: If the file ends inside a message.
+    """
+    while True:
+        size = read_varint(file)
+        if size is None:
+            return
+        data = file.read(size)
+        if len(data) < size:
+            raise ValueError('file ends inside a product')
+        yield inventory_pb2.Product.FromString(data)
+
+
+def write_delimited(file, products):
+    """
+    Writes products as length-delimited Product messages.
+
+    Args:
+        file (binary file): Where to write.
+        products (iterable of inventory_pb2.Product): The products.
+    """
+    for product in products:
+        data = product.SerializeToString()
+        file.write(varint(len(data)))
+        file.write(data)
+
+
+def varint(value):
+    """
+    Encodes a size as a protobuf varint.
+
+    Args:
+        value (int): The size.
+
+    Returns:
+        bytes: The varint.
+    """
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append(value & 0x7f | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def read_varint(file):
+    """
+    Reads a protobuf varint.
+
+    Args:
+        file (binary file): The file.
+
+    Returns:
+        int: The value, None at the end of the file.
+
+    Raises:
+        ValueError: If the file ends inside the varint.
+    """
+    value = shift = 0
+    while True:
+        byte = file.read(1)
+        if not byte:
+            if shift:
+                raise ValueError('file ends inside a size')
+            return None
+        value |= (byte[0] & 0x7f) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl, 'protobuf': read_delimited}
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl, 'protobuf': write_delimited}
+
+
+def open_catalog(path, format, mode):
+    """
+    Opens a catalog file, in binary mode for the protobuf format.
+
+    Args:
+        path (str): The file, '-' for stdin or stdout.
+        format (str): 'csv', 'jsonl' or 'protobuf'.
+        mode (str): 'r' or 'w'.
+
+    Returns:
+        file: The open file.
+    """
+    if format == 'protobuf':
+        if path == '-':
+            return open((sys.stdin if mode == 'r' else sys.stdout).fileno(), mode + 'b', closefd=False)
+        return open(path, mode + 'b')
+    if path == '-':
+        return open((sys.stdin if mode == 'r' else sys.stdout).fileno(), mode, encoding='utf-8', newline='', closefd=False)
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def progress(products, verb, interval=PROGRESS_INTERVAL):
+    """
+    Passes products through, printing to stderr how many went by and how fast, at most once per interval
+    and once more at the end.
+
+    Args:
+        products (iterable of inventory_pb2.Product): The products.
+        verb (str): What is being done to them, such as 'Imported'.
+        interval (float): Seconds between progress lines.
+
+    Yields:
+        inventory_pb2.Product: The same products.
+    """
+    count = 0
+    start = last = time.monotonic()
+    for product in products:
+        yield product
+        count += 1
+        now = time.monotonic()
+        if now - last >= interval:
+            print(f'{verb} {count} products ({count / (now - start):.0f}/s)', file=sys.stderr)
+            last = now
+    print(f'{verb} {count} products in {time.monotonic() - start:.1f}s.', file=sys.stderr)
+
+
+def stop_at_error(products, errors):
+    """
+    Passes products through until reading one fails, keeping the error instead of raising it.
+    gRPC reads request streams on its own thread and would only report a cancelled call.
+
+    Args:
+        products (iterable of inventory_pb2.Product): The products.
+        errors (list): Receives the ValueError that ended the products, if any.
+
+    Yields:
+        inventory_pb2.Product: The products read before the error.
+    """
+    try:
+        yield from products
+    except ValueError as error:
+        errors.append(error)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import or export the whole catalog as CSV, JSON Lines or length-delimited protobuf.')
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('path', help='catalog file, - for stdin or stdout')
+    parser.add_argument('--format', choices=list(READERS), help='file format, by default guessed from the extension')
+    parser.add_argument('--target', default='localhost:50051', help='address of the server')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_CHUNK_SIZE, help='products per message')
+    args = parser.parse_args()
+    try:
+        catalog_format = guess_format(args.path, args.format)
+    except ValueError as error:
+        parser.error(str(error))
+
+    try:
+        with grpc.insecure_channel(args.target) as channel:
+            stub = inventory_pb2_grpc.InventoryServiceStub(channel)
+            if args.command == 'import':
+                errors = []
+                with open_catalog(args.path, catalog_format, 'r') as file:
+                    products = stop_at_error(READERS[catalog_format](file), errors)
+                    summary = import_products(stub, progress(products, 'Read'), args.batch_size)
+                print(f'{summary.status} {summary.added} added, {summary.already_present} already present, {summary.rejected} rejected.',
+                      file=sys.stderr)
+                if errors:
+                    raise SystemExit(f'{args.path}: {errors[0]}. The products before it were imported.')
+            else:
+                with open_catalog(args.path, catalog_format, 'w') as file:
+                    WRITERS[catalog_format](file, progress(export_products(stub, args.batch_size), 'Exported'))
+    except grpc.RpcError as error:
+        # E.g. UNAVAILABLE when Redis went down, with how far an import got
+        raise SystemExit(f'{error.code().name}: {error.details()}')
@@ -1,106 +1,137 @@
-from os import system
+from os import name, system
 #from pick.src.pick import pick # https://github.com/wong2/pick
 from pick import pick
 import grpc
 import inventory_pb2
-import inventory_pb2_grpc
-import google.protobuf.empty_pb2
+from inventory_client import InventoryClient, list_pages
 
 
-def run(opcode):
+# Products shown per screen when listing the inventory
+PAGE_SIZE = 20
+
+OPTIONS = ['Add Product', 'Find Product By ID', 'Update Product Quantity', 'Delete Product', 'Find All Products', 'Quit']
+
+
+def run(client, opcode):
     """
     Executes the corresponding gRPC request based on the given opcode.
 
     Args:
+        client (inventory_client.InventoryClient): Connection shared by every request of the session.
         opcode (int): The operation code representing the action to perform.
+
+    Returns:
+        str: The outcome, shown above the next menu.
     """
-    system('cls')
-    with grpc.insecure_channel('localhost:50051') as channel:
-        stub = inventory_pb2_grpc.InventoryServiceStub(channel)
-        try:
-            if opcode == 0: # AddProduct Request
-                pid, pname, pquant, pprice = prompt(['id','name','quantity','price'])
-                print("Processing Add...")
-                response = stub.AddProduct(inventory_pb2.Product(product_identifier=pid, product_name=pname, product_quantity=pquant, product_price=pprice))
-                title = f"Received: {response.status}"
-                   
-            elif opcode == 1: # GetProductById Request
-                pid = prompt(['id'])
-                print("Processing Get Product...")
-                response = stub.GetProductById(inventory_pb2.ProductIdentifier(product_identifier=pid))
-                if response.product_identifier == -1:
-                    title = f"Received: Product with ID {pid} does not exist."
-                elif response.product_identifier == -2:
-                    title = f"Received: Server failure."
-                else:
-                    title = f"Received:\n\tProduct ID: {response.product_identifier} \n\tProduct Name: {response.product_name}\n\tProduct Quantity: x{response.product_quantity}\n\tProduct Price: ${response.product_price:.2f}"
-            
-            elif opcode == 2: # UpdateProductQuantity Request
-                pid, pquant = prompt(['id', 'quantity'])
-                print("Processing Update Quantity...")
-                response = stub.UpdateProductQuantity(inventory_pb2.Quantity(product_identifier=pid, product_quantity=pquant))
-                if response.product_identifier == -1:
-                    title = f"Received: Product with ID {pid} does not exist."
-                elif response.product_identifier == -2:
-                    title = f"Received: Server failure."
+    clear()
+    stub = client.stub
+    title = ''
+    if opcode == 0: # AddProduct Request
+        pid, pname, pquant, pprice = prompt(['id','name','quantity','price'])
+        print("Processing Add...")
+        response = stub.AddProduct(inventory_pb2.Product(product_identifier=pid, product_name=pname, product_quantity=pquant, product_price=pprice))
+        title = f"Received: {response.status}"
+           
+    elif opcode == 1: # GetProductById Request
+        pid = prompt(['id'])
+        print("Processing Get Product...")
+        response = stub.GetProductById(inventory_pb2.ProductIdentifier(product_identifier=pid))
+        title = f"Received:\n\tProduct ID: {response.product_identifier} \n\tProduct Name: {response.product_name}\n\tProduct Quantity: x{response.product_quantity}\n\tProduct Price: ${response.product_price:.2f}"
+    
+    elif opcode == 2: # UpdateProductQuantity Request
+        pid, pquant = prompt(['id', 'quantity'])
+        print("Processing Update Quantity...")
+        response = stub.UpdateProductQuantity(inventory_pb2.Quantity(product_identifier=pid, product_quantity=pquant))
+        title = f"Received:\n\tProduct ID: {response.product_identifier} \n\tProduct Name: {response.product_name}\n\tUpdated Product Quantity: x{response.product_quantity}\n\tProduct Price: ${response.product_price:.2f}"
+    
+    elif opcode == 3: # DeleteProduct Request
+        pid = prompt(['id'])
+        print("Processing Delete Product...")
+        response = stub.DeleteProduct(inventory_pb2.ProductIdentifier(product_identifier=pid))
+        title = f"Received: {response.status}"
+    
+    elif opcode == 4: # ListProducts Request, one screen of rows at a time
+        print("Processing Get All Products...")
+        found = False
+        for page in list_pages(stub, page_size=PAGE_SIZE):
+            for response in page.products:
+                found = True
+                print(f"Received:\n\tProduct ID: {response.product_identifier} \n\tProduct Name: {response.product_name}\n\tProduct Quantity: x{response.product_quantity}\n\tProduct Price: ${response.product_price:.2f}")
+            if not page.next_page_token or input("Show more products? [Y/n]").lower() == 'n':
+                break
+        if not found:
+            print("There are currently no products in the database.")
+        confirm("Make another request? [Y/n]")
+        
+    elif opcode == 5: # Exit program code
+        clear()
+        exit(0)
+    return title
+
+
+def main():
+    """
+    Runs the menu until the user quits, reusing one connection for every request.
+    """
+    with InventoryClient() as client:
+        opcode = prompt()
+        while True:
+            title = ''
+            try:
+                title = run(client, opcode)
+            except (TypeError, ValueError):
+                confirm("One or more inputs are of incorrect type. Continue? [Y/n]")
+            except grpc.RpcError as error:
+                # The server answers not found and already exists with a status code and a message for the user
+                if error.code() in (grpc.StatusCode.NOT_FOUND, grpc.StatusCode.ALREADY_EXISTS, grpc.StatusCode.INVALID_ARGUMENT):
+                    title = f"Received: {error.details()}"
+                elif error.code() == grpc.StatusCode.UNAVAILABLE:
+                    title = f"Received: Server failure. {error.details()}"
                 else:
-                    title = f"Received:\n\tProduct ID: {response.product_identifier} \n\tProduct Name: {response.product_name}\n\tUpdated Product Quantity: x{response.product_quantity}\n\tProduct Price: ${response.product_price:.2f}"
-            
-            elif opcode == 3: # DeleteProduct Request
-                pid = prompt(['id'])
-                print("Processing Delete Product...")
-                response = stub.DeleteProduct(inventory_pb2.ProductIdentifier(product_identifier=pid))
-                title = f"Received: {response.status}"
-            
-            elif opcode == 4: # GetAllProducts Request
-                print("Processing Get All Products...")
-                response_iterator = stub.GetAllProducts(google.protobuf.empty_pb2.Empty())
-                for response in response_iterator:
-                    if response.product_identifier == -1:
-                        print("There are currently no products in the database.")
-                        break     
-                    print(f"Received:\n\tProduct ID: {response.product_identifier} \n\tProduct Name: {response.product_name}\n\tProduct Quantity: x{response.product_quantity}\n\tProduct Price: ${response.product_price:.2f}")
-                
-                inp = input("Make another request? [Y/n]").lower()
-                while inp != 'y':
-                    if inp == 'n':
-                        system('cls')
-                        exit(0)
-                    inp = input("Make another request? [Y/n]").lower()
-                    
-                run(prompt())    
-                
-            elif opcode == 5: # Exit program code
-                system('cls')
-                exit(0)
-                
-            # Generating selection menu          
-            title += '\n\n What would you like to do '
-            options = ['Add Product', 'Find Product By ID', 'Update Product Quantity', 'Delete Product', 'Find All Products', 'Quit']
-            option, opcode = pick(options, title, indicator='=>')       
-            
-            run(opcode) # Looping
-            
-        except TypeError:
-            inp = input("One or more inputs are of incorrect type. Continue? [Y/n]").lower()
-            while inp != 'y':
-                if inp == 'n':
-                    system('cls')
-                    exit(0)
-                inp = input("One or more inputs are of incorrect type. Continue? [Y/n]").lower()
-                
-            run(prompt())
-            
-        except KeyboardInterrupt:
-            inp = input("Make another request? [Y/n]").lower()
-            while inp != 'y':
-                if inp == 'n':
-                    system('cls')
-                    exit(0)
-                inp = input("Make another request? [Y/n]").lower()
+                    title = f"Received: Server unreachable ({error.code().name})."
+            except KeyboardInterrupt:
+                confirm("Make another request? [Y/n]")
             
+            # Generating selection menu
+            opcode = menu(title + '\n\n ' if title else '')
+
+
+def clear():
+    """
+    Clears the terminal.
+    """
+    system('cls' if name == 'nt' else 'clear')
+
+
+def confirm(question):
+    """
+    Asks a yes/no question until answered, exiting the program on no.
+
+    Args:
+        question (str): The question.
+    """
+    inp = input(question).lower()
+    while inp != 'y':
+        if inp == 'n':
+            clear()
+            exit(0)
+        inp = input(question).lower()
+
+
+def menu(title=''):
+    """
+    Shows the action selection menu.
+
+    Args:
+        title (str): Text shown above the question, such as the outcome of the last request.
+
+    Returns:
+        int: The selected action.
+    """
+    option, opcode = pick(OPTIONS, title + 'What would you like to do ', indicator='=>')
+    return opcode
+
 
-        
 def prompt(type=0):
     """
     Prompts the user for information or action selection.
@@ -115,43 +146,32 @@ def prompt(type=0):
     try:
         # Generating Selection menu
         if type == 0:
-            title = 'What would you like to do '
-            options = ['Add Product', 'Find Product By ID', 'Update Product Quantity', 'Delete Product', 'Find All Products', 'Quit']
-            option, opcode = pick(options, title, indicator='=>')
-
-            return opcode
+            return menu()
         
         # Prompting user for information given by type    
-        else:
-            system('cls')
-            res = []
-            for each in type:
-                if each == 'id':
-                    res.append(int(input('Please input the Product ID: ')))
-                elif each == 'name':
-                    res.append(str(input('Please input the Product Name: ')))
-                elif each == 'quantity':
-                    res.append(int(input('Please input the Product Quantity: ')))
-                elif each == 'price':
-                    res.append(float(input('Please input the Product Price: ')))
-                    
-            if len(res) == 1: # Remove item from res when returning one object for cleaner use
-                return res[0]
-            return res
+        clear()
+        res = []
+        for each in type:
+            if each == 'id':
+                res.append(int(input('Please input the Product ID: ')))
+            elif each == 'name':
+                res.append(str(input('Please input the Product Name: ')))
+            elif each == 'quantity':
+                res.append(int(input('Please input the Product Quantity: ')))
+            elif each == 'price':
+                res.append(float(input('Please input the Product Price: ')))
+                
+        if len(res) == 1: # Remove item from res when returning one object for cleaner use
+            return res[0]
+        return res
     
     except KeyboardInterrupt:
         exit(0)
-    except:
-        if input("One or more inputs are of incorrect type. Continue? [Y/n]").lower() == 'y':
-            prompt()
-        else:
-            system('cls')
-            exit(0)
             
     
     
 if __name__ == '__main__':
     try:
-        run(prompt()) # First call to program loop
-    except:
-        exit(0)
\ No newline at end of file
+        main()
+    except KeyboardInterrupt:
+        exit(0)
@@ -0,0 +1,166 @@
+from os import environ
+
+
+# Default server settings (each can be overridden in a settings file, see read_config_file(), and then with an
+# INVENTORY_<NAME> environment variable)
+DEFAULTS = {
+    'server_address': '[::]:50051',
+    'max_workers': 10,                   # Threads serving RPCs
+    'max_concurrent_rpcs': 1000,         # RPCs accepted at once, running or waiting for a worker (0 for no limit),
+                                         # more are shed with RESOURCE_EXHAUSTED
+    'compression': 'none',               # Compression of responses: none, gzip or deflate
+    'compression_methods': None,         # Per-RPC compression overriding it, e.g. ExportProducts=gzip,GetAllProducts=none
+    'max_receive_message_length': 4194304,  # Largest request message in bytes
+    'max_send_message_length': -1,       # Largest response message in bytes, -1 for no limit
+    'keepalive_time_ms': 60000,          # Idle time after which the server pings a client, to drop dead connections
+    'keepalive_timeout_ms': 20000,       # Time a client has to answer a ping
+    'keepalive_min_ping_interval_ms': 30000,  # Shortest interval allowed between a client's pings, see inventory_client.KEEPALIVE_OPTIONS
+    'processes': 1,                      # Server processes sharing server_address, more than 1 starts a supervisor
+    'shutdown_grace': 10.0,              # Seconds in-flight RPCs get to finish on SIGTERM
+    'storage': 'redis',                  # redis, or memory for an in-process catalog (one server process only)
+    'memory_shards': 16,                 # Independently locked shards of the memory storage
+    'log_level': 'INFO',                 # DEBUG, INFO, WARNING or ERROR
+    'log_format': 'text',                # text or json
+    'log_request_sample_rate': 1.0,      # Fraction of requests logged, 0 turns request logging off
+    'metrics_host': '127.0.0.1',         # Interface serving /metrics, 0.0.0.0 to let a Prometheus on another host scrape it
+    'metrics_port': 9464,                # Port serving /metrics, 0 turns metrics off
+    'redis_host': 'localhost',
+    'redis_port': 6379,
+    'redis_shards': None,                # Comma-separated host:port of each redis-server to shard the catalog over, instead of redis_host/port
+    'redis_db': 0,
+    'redis_password': None,
+    'redis_unix_socket_path': None,      # Use a unix socket instead of host/port when set
+    'redis_max_connections': 32,         # Upper bound on the shared connection pool
+    'redis_pool_timeout': 5.0,           # Seconds to wait for a free connection before failing
+    'redis_socket_timeout': 5.0,
+    'redis_socket_connect_timeout': 2.0,
+    'redis_health_check_interval': 30,   # Seconds a connection may sit idle before it is PINGed
+    'redis_warmup_connections': 4,       # Connections of each pool opened before health checks report SERVING
+    'redis_breaker_failures': 5,         # Failed Redis round trips in a row after which calls fail fast with UNAVAILABLE,
+                                         # 0 turns the circuit breaker off
+    'redis_breaker_reset': 5.0,          # Seconds between probes of a redis-server while its circuit is open
+    'redis_key_prefix': 'inventory:',    # Namespace of every product and index key, see migrate.py --from-prefix
+    'redis_encoding': 'hash',            # hash (one hash per product) or compact (bucketed packed products), see migrate.py
+    'redis_bucket_size': 50,             # Products per bucket with the compact encoding
+    'changes_max_length': 100000,        # Change events kept for WatchInventory (approximately, in Redis), 0 turns change capture off
+    'watch_max_streams': 5,              # WatchInventory calls the threaded server serves at once, each holding a worker thread,
+                                         # kept below max_workers so other calls still get one. More are shed with RESOURCE_EXHAUSTED
+    'request_id_ttl': 600,               # Seconds the response to a write sent with a request ID is kept to answer retries
+    'request_id_max_entries': 100000,    # Request IDs kept by the memory storage, Redis keeps every one for request_id_ttl
+    'scan_batch_size': 500,              # Keys fetched per SCAN/pipeline round trip when streaming the catalog
+    'query_max_results': 1000,           # Most products a Find* query or ListProducts page returns, and the Find* default
+    'list_page_size': 100,               # Products per ListProducts page when the request sets no page_size
+    'stats_low_stock_thresholds': '0,10',  # Comma-separated quantities GetInventoryStats counts the products at or below
+    'stream_max_batch_size': 500,        # Most StreamQuantities updates applied per pipeline round trip
+    'stream_max_batch_latency_ms': 5.0,  # Longest an update waits for its micro-batch to fill
+    'stream_queue_size': 2000,           # Updates buffered per stream before reading from the client pauses
+    'cache_size': 0,                     # Products held in the in-process read cache, 0 disables it
+    'cache_ttl': 5.0,                    # Seconds a cached product may be served
+    'cache_subscribe': True,             # Invalidate the cache on other replicas' writes via keyspace notifications
+    'cache_warmup_file': None,           # File of product IDs, one per line, cached before health checks report SERVING
+}
+
+
+def _convert(value, default):
+    """
+    Converts a string setting to the type of its default value.
+
+    Args:
+        value (str): Raw value read from the environment or a settings file.
+        default: Default value of the setting, used to pick the type.
+
+    Returns:
+        The converted value, or None if the value is empty.
+    """
+    if value == '':
+        return None
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+
+def read_config_file(path):
+    """
+    Reads settings from a file of NAME=VALUE lines, where NAME is a DEFAULTS key.
+    Blank lines and lines starting with # are ignored.
+
+    Args:
+        path (str): The file.
+
+    Returns:
+        dict: The settings it sets, converted to the types of their defaults.
+
+    Raises:
+        KeyError: If a line names an unknown setting.
+        ValueError: If a line is not NAME=VALUE or its value has the wrong type.
+    """
+    with open(path, encoding='utf-8') as file:
+        lines = [line.strip() for line in file]
+    try:
+        return parse_settings(line for line in lines if line and not line.startswith('#'))
+    except ValueError as error:
+        raise ValueError(f'{path}: {error}') from None
+
+
+def parse_settings(items):
+    """
+    Converts NAME=VALUE strings, as given in a settings file or on a command line, to settings.
+
+    Args:
+        items (iterable of str): The settings, NAME being a DEFAULTS key.
+
+    Returns:
+        dict: The settings, converted to the types of their defaults.
+
+    Raises:
+        KeyError: If an item names an unknown setting.
+        ValueError: If an item is not NAME=VALUE or its value has the wrong type.
+    """
+    settings = {}
+    for item in items:
+        name, separator, value = item.partition('=')
+        name = name.strip().lower()
+        if not separator:
+            raise ValueError(f'expected NAME=VALUE, got {item!r}')
+        if name not in DEFAULTS:
+            raise KeyError(f'Unknown setting: {name}')
+        try:
+            settings[name] = _convert(value.strip(), DEFAULTS[name])
+        except ValueError:
+            raise ValueError(f'{name} must be a {type(DEFAULTS[name]).__name__}, got {value.strip()!r}') from None
+    return settings
+
+
+def load_config(config_file=None, **overrides):
+    """
+    Builds the server settings from the defaults, a settings file, the environment and any explicit overrides,
+    each taking precedence over the ones before.
+
+    Args:
+        config_file (str): Settings file, see read_config_file(). INVENTORY_CONFIG_FILE if None, none if that is unset.
+        **overrides: Settings that take precedence over the environment.
+
+    Returns:
+        dict: The resolved settings.
+
+    Raises:
+        KeyError: If an override names an unknown setting.
+    """
+    config = dict(DEFAULTS)
+    config_file = config_file or environ.get('INVENTORY_CONFIG_FILE')
+    if config_file:
+        config.update(read_config_file(config_file))
+    for name, default in DEFAULTS.items():
+        value = environ.get(f'INVENTORY_{name.upper()}')
+        if value is not None:
+            config[name] = _convert(value, default)
+
+    for name, value in overrides.items():
+        if name not in DEFAULTS:
+            raise KeyError(f'Unknown setting: {name}')
+        config[name] = value
+    return config
@@ -0,0 +1,77 @@
+import fakeredis
+import fakeredis._socket._base
+import pytest
+import redis
+import redis.asyncio
+from storage import (AsyncCompactRedisStorage, AsyncRedisStorage, AsyncShardedStorage, AsyncStorageAdapter, CompactRedisStorage,
+                     MemoryStorage, RedisStorage, ShardedStorage)
+
+
+# redis-py sets socket timeouts on its connections, which fakeredis' sockets do not take
+fakeredis._socket._base.BaseFakeSocket.settimeout = lambda self, timeout: None
+
+# Change events kept by the storages under test
+CHANGES_MAX_LENGTH = 1000
+
+# Storages every contract test runs against
+ENGINES = ('memory', 'hash', 'compact', 'sharded')
+
+
+def fake_pool(server, decode_responses=True, library=redis):
+    """
+    Builds a connection pool to an in-process fakeredis server.
+
+    Args:
+        server (fakeredis.FakeServer): The server.
+        decode_responses (bool): True for the hash encoding, False for the compact one.
+        library (module): redis or redis.asyncio.
+
+    Returns:
+        redis.BlockingConnectionPool: The pool.
+    """
+    connection_class = fakeredis.FakeAsyncRedisConnection if library is redis.asyncio else fakeredis.FakeRedisConnection
+    return library.BlockingConnectionPool(connection_class=connection_class, server=server, decode_responses=decode_responses,
+                                          max_connections=8)
+
+
+@pytest.fixture
+def pool():
+    """A pool to a fresh fakeredis server."""
+    return fake_pool(fakeredis.FakeServer())
+
+
+def make_storage(engine, library=redis):
+    """
+    Builds an empty storage of one of the ENGINES, on fakeredis unless it is the memory storage.
+
+    Args:
+        engine (str): One of ENGINES. 'sharded' spreads the hash encoding over two fakeredis servers.
+        library (module): redis for the synchronous storages, redis.asyncio for their coroutine versions.
+
+    Returns:
+        The storage.
+    """
+    asynchronous = library is redis.asyncio
+    if engine == 'memory':
+        storage = MemoryStorage(4, CHANGES_MAX_LENGTH)
+        return AsyncStorageAdapter(storage) if asynchronous else storage
+    if engine == 'compact':
+        client = library.Redis(connection_pool=fake_pool(fakeredis.FakeServer(), False, library))
+        return (AsyncCompactRedisStorage if asynchronous else CompactRedisStorage)(client, 7, 'inventory:', CHANGES_MAX_LENGTH)
+    if engine == 'hash':
+        client = library.Redis(connection_pool=fake_pool(fakeredis.FakeServer(), True, library))
+        return (AsyncRedisStorage if asynchronous else RedisStorage)(client, 'inventory:', CHANGES_MAX_LENGTH)
+    shards = [make_storage('hash', library) for index in range(2)]
+    return (AsyncShardedStorage if asynchronous else ShardedStorage)(shards, ['a', 'b'])
+
+
+@pytest.fixture(params=ENGINES)
+def storage(request):
+    """A fresh synchronous storage of each engine."""
+    return make_storage(request.param)
+
+
+@pytest.fixture(params=ENGINES)
+def async_storage(request):
+    """A fresh coroutine storage of each engine."""
+    return make_storage(request.param, redis.asyncio)
@@ -0,0 +1,292 @@
+import asyncio
+from threading import Event, Thread
+from time import monotonic
+
+import redis
+from breaker import DEADLINE
+from grpc_health.v1 import health, health_pb2
+from log import logger
+
+
+# Services the health service reports on, '' being the whole server, which load balancers check by default
+SERVICES = ('', 'InventoryService')
+
+# Seconds between warm-up attempts while Redis cannot be reached
+WARMUP_RETRY_SECONDS = 1.0
+
+
+def read_identifiers(path):
+    """
+    Reads the IDs of the products to cache before serving, one per line.
+    Blank lines and lines starting with # are ignored.
+
+    Args:
+        path (str): The file.
+
+    Returns:
+        list of int: The IDs, in file order.
+
+    Raises:
+        ValueError: If a line is not an ID, naming it.
+    """
+    identifiers = []
+    with open(path, encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                identifiers.append(int(line))
+            except ValueError:
+                raise ValueError(f'{path}: line {number}: expected a product ID, got {line!r}') from None
+    return identifiers
+
+
+def warm_pool(pool, connections):
+    """
+    Opens connections of a pool ahead of the first calls, checking that the redis-server answers on each.
+
+    Args:
+        pool (redis.ConnectionPool): The pool.
+        connections (int): Connections to open, held together so the pool cannot hand the same one out twice.
+
+    Raises:
+        redis.RedisError: If a connection cannot be opened or does not answer.
+    """
+    held = []
+    try:
+        for index in range(connections):
+            connection = pool.get_connection('PING')
+            held.append(connection)
+            try:
+                connection.send_command('PING')
+                connection.read_response()
+            except Exception:
+                # As redis-py does, so the next user reconnects instead of reading a stale reply
+                connection.disconnect()
+                raise
+    finally:
+        for connection in held:
+            pool.release(connection)
+
+
+async def async_warm_pool(pool, connections):
+    """
+    Opens connections of an asyncio pool ahead of the first calls. See warm_pool().
+
+    Args:
+        pool (redis.asyncio.ConnectionPool): The pool.
+        connections (int): Connections to open.
+
+    Raises:
+        redis.RedisError: If a connection cannot be opened or does not answer.
+    """
+    held = []
+    try:
+        for index in range(connections):
+            connection = await pool.get_connection('PING')
+            held.append(connection)
+            try:
+                await connection.send_command('PING')
+                await connection.read_response()
+            except Exception:
+                await connection.disconnect()
+                raise
+    finally:
+        for connection in held:
+            await pool.release(connection)
+
+
+def identifier_batches(identifiers, cache, batch_size):
+    """
+    Splits the IDs to cache into batches, keeping no more than the cache holds.
+
+    Args:
+        identifiers (list of int): The IDs.
+        cache (cache.ProductCache): The cache.
+        batch_size (int): Most IDs per batch.
+
+    Returns:
+        list of list of int: The batches.
+    """
+    identifiers = identifiers[:cache.max_size]
+    return [identifiers[start:start + batch_size] for start in range(0, len(identifiers), batch_size)]
+
+
+def set_deadline(timeout):
+    """
+    Bounds the Redis commands that follow in the current thread or task, as a call's deadline does, see breaker.DEADLINE.
+    Otherwise a redis-server that accepts connections but does not answer would hold an asyncio pool,
+    which connects while other callers wait, for the whole socket timeout.
+
+    Args:
+        timeout (float): Seconds they may take, None for no bound.
+    """
+    DEADLINE.set(None if timeout is None else monotonic() + timeout)
+
+
+class Readiness:
+    """
+    Serves the standard grpc.health.v1 health service, reporting NOT_SERVING until the server has warmed up:
+    redis_warmup_connections connections of each Redis pool are open and answering, and the products listed in
+    cache_warmup_file are cached. Warming up runs on its own thread while the server already listens, and is retried
+    while Redis cannot be reached, so a load balancer only sends calls once they no longer pay for connecting.
+
+    Methods:
+        start: Starts warming up a servicer.
+        warm_up: Warms up a servicer, then reports SERVING.
+        stop: Reports NOT_SERVING for good, as the server drains.
+    """
+
+    def __init__(self, config):
+        """
+        Args:
+            config (dict): Server settings, see config.load_config().
+
+        Raises:
+            ValueError: If cache_warmup_file lists something other than product IDs.
+        """
+        self.config = config
+        self.health = health.HealthServicer()
+        self.identifiers = read_identifiers(config['cache_warmup_file']) if config['cache_warmup_file'] else []
+        self._stopped = Event()
+        for service in SERVICES:
+            self.health.set(service, health_pb2.HealthCheckResponse.NOT_SERVING)
+
+
+    def start(self, servicer):
+        """
+        Starts warming up a servicer on a background thread.
+
+        Args:
+            servicer (server.InventoryServiceServicer): The servicer.
+        """
+        Thread(target=self.warm_up, args=(servicer,), name='warm-up', daemon=True).start()
+
+
+    def warm_up(self, servicer):
+        """
+        Warms up a servicer, retrying every WARMUP_RETRY_SECONDS while Redis cannot be reached, then reports SERVING.
+
+        Args:
+            servicer (server.InventoryServiceServicer): The servicer.
+        """
+        start = monotonic()
+        connections = min(self.config['redis_warmup_connections'], self.config['redis_max_connections'])
+        if self.identifiers and not servicer.cache.enabled:
+            logger.warning('cache_warmup_file is ignored, the cache is disabled (cache_size is 0).')
+        attempts = 0
+        while not self._stopped.is_set():
+            try:
+                for pool in servicer.pools:
+                    set_deadline(self.config['redis_socket_connect_timeout'])
+                    warm_pool(pool, connections)
+                if servicer.cache.enabled:
+                    for batch in identifier_batches(self.identifiers, servicer.cache, self.config['scan_batch_size']):
+                        set_deadline(self.config['redis_socket_timeout'])
+                        token = servicer.cache.token()
+                        for product_identifier, product in zip(batch, servicer.storage.get_many(batch)):
+                            if product is not None:
+                                servicer.cache.put(product_identifier, product, token)
+                break
+            except redis.RedisError as error:
+                attempts += 1
+                if attempts == 1:
+                    logger.warning('Cannot warm up, Redis is unavailable (%s). Retrying every %ss, NOT_SERVING until then.',
+                                   error, WARMUP_RETRY_SECONDS)
+                self._stopped.wait(WARMUP_RETRY_SECONDS)
+        else:
+            return
+        for service in SERVICES:
+            self.health.set(service, health_pb2.HealthCheckResponse.SERVING)
+        logger.info('Warmed up in %.2fs, serving.', monotonic() - start)
+
+
+    def stop(self):
+        """
+        Reports NOT_SERVING for good and stops warming up, as the server drains.
+        """
+        self._stopped.set()
+        self.health.enter_graceful_shutdown()
+
+
+class AsyncReadiness:
+    """
+    Serves the health service of the asyncio server, warming up as a task. See Readiness.
+
+    Methods:
+        start: Starts warming up a servicer.
+        warm_up: Warms up a servicer, then reports SERVING.
+        stop: Reports NOT_SERVING for good, as the server drains.
+    """
+
+    def __init__(self, config):
+        """
+        Args:
+            config (dict): Server settings, see config.load_config().
+
+        Raises:
+            ValueError: If cache_warmup_file lists something other than product IDs.
+        """
+        self.config = config
+        self.health = health.aio.HealthServicer()
+        self.identifiers = read_identifiers(config['cache_warmup_file']) if config['cache_warmup_file'] else []
+        self._task = None
+
+
+    def start(self, servicer):
+        """
+        Starts warming up a servicer as a task. Must be called with an event loop running, before the server starts.
+
+        Args:
+            servicer (aio_server.AsyncInventoryServiceServicer): The servicer.
+        """
+        self._task = asyncio.ensure_future(self.warm_up(servicer))
+
+
+    async def warm_up(self, servicer):
+        """
+        Warms up a servicer, retrying every WARMUP_RETRY_SECONDS while Redis cannot be reached, then reports SERVING.
+
+        Args:
+            servicer (aio_server.AsyncInventoryServiceServicer): The servicer.
+        """
+        # The health servicer starts out reporting SERVING for ''
+        for service in SERVICES:
+            await self.health.set(service, health_pb2.HealthCheckResponse.NOT_SERVING)
+        start = monotonic()
+        connections = min(self.config['redis_warmup_connections'], self.config['redis_max_connections'])
+        if self.identifiers and not servicer.cache.enabled:
+            logger.warning('cache_warmup_file is ignored, the cache is disabled (cache_size is 0).')
+        attempts = 0
+        while True:
+            try:
+                for pool in servicer.pools:
+                    set_deadline(self.config['redis_socket_connect_timeout'])
+                    await async_warm_pool(pool, connections)
+                if servicer.cache.enabled:
+                    for batch in identifier_batches(self.identifiers, servicer.cache, self.config['scan_batch_size']):
+                        set_deadline(self.config['redis_socket_timeout'])
+                        token = servicer.cache.token()
+                        for product_identifier, product in zip(batch, await servicer.storage.get_many(batch)):
+                            if product is not None:
+                                servicer.cache.put(product_identifier, product, token)
+                break
+            except redis.RedisError as error:
+                attempts += 1
+                if attempts == 1:
+                    logger.warning('Cannot warm up, Redis is unavailable (%s). Retrying every %ss, NOT_SERVING until then.',
+                                   error, WARMUP_RETRY_SECONDS)
+                await asyncio.sleep(WARMUP_RETRY_SECONDS)
+        for service in SERVICES:
+            await self.health.set(service, health_pb2.HealthCheckResponse.SERVING)
+        logger.info('Warmed up in %.2fs, serving.', monotonic() - start)
+
+
+    async def stop(self):
+        """
+        Reports NOT_SERVING for good and stops warming up, as the server drains.
+        """
+        if self._task is not None:
+            self._task.cancel()
+        await self.health.enter_graceful_shutdown()
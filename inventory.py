@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import sys
+
+import grpc
+from google.protobuf.empty_pb2 import Empty
+import inventory_pb2
+from catalog import product_record
+from inventory_client import (DEFAULT_TARGET, DEFAULT_TIMEOUT, InventoryClient, add_products, adjust_quantities, delete_products,
+                              get_products_by_ids, list_products, update_quantities, watch_inventory)
+
+
+def print_product(product, as_json):
+    """
+    Prints one product, as a JSON Lines record or as tab-separated ID, name, quantity and price.
+
+    Args:
+        product (inventory_pb2.Product): The product.
+        as_json (bool): Print JSON.
+    """
+    record = product_record(product)
+    if as_json:
+        print(json.dumps(record, ensure_ascii=False))
+    else:
+        print('\t'.join(str(record[field]) for field in ('product_identifier', 'product_name', 'product_quantity', 'product_price')))
+
+
+def print_results(results, as_json, show_products=True):
+    """
+    Prints the outcome of each item of a batch call.
+
+    Args:
+        results (iterable of inventory_pb2.ProductResult): The outcomes.
+        as_json (bool): Print JSON Lines records instead of text.
+        show_products (bool): Print the returned product of each successful item, rather than its status.
+
+    Returns:
+        bool: Whether every item succeeded.
+    """
+    succeeded = True
+    for result in results:
+        succeeded = succeeded and result.success
+        if show_products and result.success:
+            print_product(result.product, as_json)
+        elif as_json:
+            print(json.dumps({'product_identifier': result.product_identifier, 'success': result.success, 'status': result.status},
+                             ensure_ascii=False))
+        else:
+            print(f'{result.product_identifier}\t{result.status}', file=sys.stdout if result.success else sys.stderr)
+    return succeeded
+
+
+def print_stats(stats, as_json):
+    """
+    Prints the catalog totals, as one JSON object or as a line per statistic.
+
+    Args:
+        stats (inventory_pb2.InventoryStats): The statistics.
+        as_json (bool): Print JSON.
+    """
+    record = {'products': stats.products, 'total_quantity': stats.total_quantity, 'total_value': round(stats.total_value, 2),
+              'low_stock': {str(count.maximum_quantity): count.products for count in stats.low_stock}}
+    if as_json:
+        print(json.dumps(record))
+        return
+    for name in ('products', 'total_quantity', 'total_value'):
+        print(f'{name}\t{record[name]}')
+    for count in stats.low_stock:
+        print(f'low_stock<={count.maximum_quantity}\t{count.products}')
+
+
+def product_filter(args):
+    """
+    Builds the ListProducts filter from the list command's options.
+
+    Args:
+        args (argparse.Namespace): The parsed options.
+
+    Returns:
+        inventory_pb2.ProductFilter: The filter.
+    """
+    bounds = {field: getattr(args, field) for field in ('minimum_quantity', 'maximum_quantity', 'minimum_price', 'maximum_price')
+              if getattr(args, field) is not None}
+    return inventory_pb2.ProductFilter(name_prefix=args.prefix, **bounds)
+
+
+def run(args):
+    """
+    Runs one command against the server.
+
+    Args:
+        args (argparse.Namespace): The parsed command line.
+
+    Returns:
+        int: The exit status, 1 if any item failed.
+    """
+    with InventoryClient(args.target, args.timeout) as client:
+        stub = client.stub
+        if args.command == 'get':
+            succeeded = print_results(get_products_by_ids(stub, args.identifiers), args.json)
+        elif args.command == 'add':
+            product = inventory_pb2.Product(product_identifier=args.identifier, product_name=args.name,
+                                            product_quantity=args.quantity, product_price=args.price)
+            succeeded = print_results(add_products(stub, [product]), args.json, show_products=False)
+        elif args.command == 'update':
+            succeeded = print_results(update_quantities(stub, [(args.identifier, args.quantity)]), args.json)
+        elif args.command == 'adjust':
+            adjustment = inventory_pb2.Adjustment(product_identifier=args.identifier, delta=args.delta)
+            if args.minimum is not None:
+                adjustment.minimum_quantity = args.minimum
+            succeeded = print_results(adjust_quantities(stub, [adjustment]), args.json)
+        elif args.command == 'delete':
+            succeeded = print_results(delete_products(stub, args.identifiers), args.json, show_products=False)
+        elif args.command == 'list':
+            for product in list_products(stub, args.page_size, product_filter(args)):
+                print_product(product, args.json)
+            succeeded = True
+        elif args.command == 'find':
+            products = stub.FindProductsByName(inventory_pb2.NameQuery(prefix=args.prefix, limit=args.limit)).products
+            for product in products:
+                print_product(product, args.json)
+            succeeded = True
+        elif args.command == 'low-stock':
+            products = stub.FindLowStock(inventory_pb2.StockQuery(maximum_quantity=args.maximum, limit=args.limit)).products
+            for product in products:
+                print_product(product, args.json)
+            succeeded = True
+        elif args.command == 'stats':
+            print_stats(stub.GetInventoryStats(Empty()), args.json)
+            succeeded = True
+        else:
+            for event in watch_inventory(stub, args.from_offset):
+                operation = inventory_pb2.ChangeEvent.Operation.Name(event.operation)
+                if args.json:
+                    print(json.dumps({'offset': event.offset, 'operation': operation, 'product': product_record(event.product)},
+                                     ensure_ascii=False), flush=True)
+                else:
+                    print(f'{event.offset}\t{operation}\t' + '\t'.join(str(value) for value in product_record(event.product).values()),
+                          flush=True)
+            succeeded = True
+    return 0 if succeeded else 1
+
+
+def parse_args(argv=None):
+    """
+    Parses the command line.
+
+    Args:
+        argv (list of str): The arguments, sys.argv[1:] if None.
+
+    Returns:
+        argparse.Namespace: The parsed command line.
+    """
+    parser = argparse.ArgumentParser(description='Non-interactive inventory client, for scripts. Prints one product per line.')
+    parser.add_argument('--target', default=os.environ.get('INVENTORY_TARGET', DEFAULT_TARGET),
+                        help='address of the server, INVENTORY_TARGET by default')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='seconds each call may take')
+    parser.add_argument('--json', action='store_true', help='print JSON Lines instead of tab-separated text')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('get', help='print products by ID')
+    command.add_argument('identifiers', type=int, nargs='+', metavar='ID')
+
+    command = commands.add_parser('add', help='add a product')
+    command.add_argument('identifier', type=int, metavar='ID')
+    command.add_argument('name')
+    command.add_argument('quantity', type=int)
+    command.add_argument('price', type=float)
+
+    command = commands.add_parser('update', help="set a product's quantity")
+    command.add_argument('identifier', type=int, metavar='ID')
+    command.add_argument('quantity', type=int)
+
+    command = commands.add_parser('adjust', help="add to or subtract from a product's quantity")
+    command.add_argument('identifier', type=int, metavar='ID')
+    command.add_argument('delta', type=int)
+    command.add_argument('--minimum', type=int, help='reject the change if it would leave less stock than this')
+
+    command = commands.add_parser('delete', help='delete products by ID')
+    command.add_argument('identifiers', type=int, nargs='+', metavar='ID')
+
+    command = commands.add_parser('list', help='print the catalog in name order')
+    command.add_argument('--prefix', default='', help='only names starting with this')
+    command.add_argument('--minimum-quantity', type=int)
+    command.add_argument('--maximum-quantity', type=int)
+    command.add_argument('--minimum-price', type=float)
+    command.add_argument('--maximum-price', type=float)
+    command.add_argument('--page-size', type=int, default=0, help="products per call, 0 for the server's default")
+
+    command = commands.add_parser('find', help='print products whose name starts with a prefix')
+    command.add_argument('prefix')
+    command.add_argument('--limit', type=int, default=0, help="most products to print, 0 for the server's default")
+
+    command = commands.add_parser('low-stock', help='print products with at most this many units, lowest stock first')
+    command.add_argument('maximum', type=int)
+    command.add_argument('--limit', type=int, default=0, help="most products to print, 0 for the server's default")
+
+    commands.add_parser('stats', help='print the number of products, total units and stock value, and low-stock counts')
+
+    command = commands.add_parser('watch', help='print changes to the inventory as they happen')
+    command.add_argument('--from', dest='from_offset', default='', help='offset of the last change seen, 0 for every change kept')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    try:
+        sys.exit(run(args))
+    except grpc.RpcError as error:
+        sys.exit(f'{error.code().name}: {error.details()}')
+    except KeyboardInterrupt:
+        sys.exit(130)
@@ -0,0 +1,442 @@
+import json
+from collections import namedtuple
+from itertools import count, islice
+from uuid import uuid4
+
+import grpc
+from google.protobuf.field_mask_pb2 import FieldMask
+import inventory_pb2
+import inventory_pb2_grpc
+
+
+# Items sent per batch RPC, keeps each request well under gRPC's 4MB default message limit
+DEFAULT_CHUNK_SIZE = 1000
+
+DEFAULT_TARGET = 'localhost:50051'
+
+# Seconds a unary call may take when the caller passes no timeout, streaming calls have no default deadline
+DEFAULT_TIMEOUT = 10.0
+
+# Pings an idle connection every minute so a dead server is noticed before the next call waits on it,
+# within what the server's keepalive_min_ping_interval_ms allows, see server.server_options()
+KEEPALIVE_OPTIONS = [('grpc.keepalive_time_ms', 60000), ('grpc.keepalive_timeout_ms', 20000),
+                     ('grpc.keepalive_permit_without_calls', 1)]
+
+# Calls that are safe to send twice, retried by gRPC when the server is unreachable
+RETRYABLE_METHODS = ['GetProductById', 'GetProductsByIds', 'UpdateProductQuantity', 'UpdateQuantities', 'GetAllProducts',
+                     'FindProductsByName', 'FindLowStock', 'FindProductsByPrice', 'ListProducts', 'ExportProducts', 'GetInventoryStats']
+
+# Writes the server applies once per request ID (server.REQUEST_ID_METADATA), so they too are safe to retry once they carry one
+REQUEST_ID_METHODS = ['AddProduct', 'UpdateProductQuantity', 'AdjustProductQuantity', 'DeleteProduct',
+                      'AddProducts', 'UpdateQuantities', 'AdjustQuantities', 'DeleteProducts']
+
+REQUEST_ID_METADATA = 'request-id'
+
+
+def service_config(max_attempts, methods=RETRYABLE_METHODS):
+    """
+    Builds the gRPC service config that retries calls to some methods with exponential backoff.
+
+    Args:
+        max_attempts (int): Attempts per call, including the first. 1 turns retries off.
+        methods (list of str): Names of the methods to retry.
+
+    Returns:
+        str: The service config as JSON.
+    """
+    retry_policy = {'maxAttempts': max_attempts, 'initialBackoff': '0.1s', 'maxBackoff': '2s', 'backoffMultiplier': 2,
+                    'retryableStatusCodes': ['UNAVAILABLE', 'ABORTED']}
+    method_config = {'name': [{'service': 'InventoryService', 'method': method} for method in methods]}
+    if max_attempts > 1:
+        method_config['retryPolicy'] = retry_policy
+    return json.dumps({'methodConfig': [method_config]})
+
+
+def request_id_metadata(request_id=None):
+    """
+    Builds call metadata carrying a request ID. Send the same metadata again to retry a write
+    that may have been applied, such as after DEADLINE_EXCEEDED, and get its original response.
+
+    Args:
+        request_id (str): The ID, a new random one if None.
+
+    Returns:
+        tuple: Metadata to pass to the call.
+    """
+    return ((REQUEST_ID_METADATA, request_id or uuid4().hex),)
+
+
+class CallDetails(namedtuple('CallDetails', ['method', 'timeout', 'metadata', 'credentials', 'wait_for_ready', 'compression']),
+                  grpc.ClientCallDetails):
+    """Details of an outgoing call, rebuilt by DefaultDeadline."""
+
+
+class RequestIds(grpc.UnaryUnaryClientInterceptor):
+    """
+    Gives calls to REQUEST_ID_METHODS a random request ID unless the caller sent one, so gRPC's retries of them
+    are applied once.
+
+    Methods:
+        intercept_unary_unary: Adds the request ID to a write.
+    """
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        """
+        Adds a request ID to a call to one of REQUEST_ID_METHODS that has none.
+
+        Args:
+            continuation (callable): Makes the call.
+            client_call_details (grpc.ClientCallDetails): The call's method, timeout and metadata.
+            request: The request message.
+
+        Returns:
+            The call's response future.
+        """
+        metadata = list(client_call_details.metadata or [])
+        if (client_call_details.method.rsplit('/', 1)[-1] in REQUEST_ID_METHODS
+                and not any(key == REQUEST_ID_METADATA for key, value in metadata)):
+            client_call_details = CallDetails(client_call_details.method, client_call_details.timeout,
+                                              metadata + list(request_id_metadata()), client_call_details.credentials,
+                                              client_call_details.wait_for_ready, client_call_details.compression)
+        return continuation(client_call_details, request)
+
+
+class DefaultDeadline(grpc.UnaryUnaryClientInterceptor):
+    """
+    Gives unary calls made without a timeout a default deadline, so a stalled server cannot hang the caller.
+
+    Methods:
+        intercept_unary_unary: Sets the deadline of a unary call.
+    """
+
+    def __init__(self, timeout):
+        """
+        Args:
+            timeout (float): Default deadline in seconds.
+        """
+        self.timeout = timeout
+
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        """
+        Sets the deadline of a unary call if the caller did not.
+
+        Args:
+            continuation (callable): Makes the call.
+            client_call_details (grpc.ClientCallDetails): The call's method, timeout and metadata.
+            request: The request message.
+
+        Returns:
+            The call's response future.
+        """
+        if client_call_details.timeout is None:
+            client_call_details = CallDetails(client_call_details.method, self.timeout, client_call_details.metadata,
+                                              client_call_details.credentials, client_call_details.wait_for_ready,
+                                              client_call_details.compression)
+        return continuation(client_call_details, request)
+
+
+class InventoryClient:
+    """
+    Long-lived connection to the inventory server for scripts and services. Open one per process and share it
+    between threads; the functions of this module take its stub. Unary calls get a default deadline, writes get
+    request IDs so that they and the idempotent reads can be retried when the server is unreachable, and keepalive
+    pings notice dead connections.
+
+    Methods:
+        stub: Returns a stub, spreading calls over the pooled channels.
+        close: Closes the channels.
+    """
+
+    def __init__(self, target=DEFAULT_TARGET, timeout=DEFAULT_TIMEOUT, max_attempts=3, channels=1, options=None, request_ids=True):
+        """
+        Args:
+            target (str): Address of the server.
+            timeout (float): Deadline in seconds for unary calls made without a timeout, None for no deadline.
+            max_attempts (int): Attempts per retryable call, including the first.
+            channels (int): Connections to open. Each carries at most about 100 concurrent calls, so open more
+                for highly concurrent callers or long-running streams.
+            options (list of tuple): Extra gRPC channel arguments.
+            request_ids (bool): Send writes with request IDs and retry them too. Turn off for servers that predate request IDs.
+        """
+        methods = RETRYABLE_METHODS + [method for method in REQUEST_ID_METHODS if request_ids and method not in RETRYABLE_METHODS]
+        arguments = KEEPALIVE_OPTIONS + [('grpc.enable_retries', 1), ('grpc.service_config', service_config(max_attempts, methods)),
+                                         # Gives each channel its own connection instead of sharing one between equal channels
+                                         ('grpc.use_local_subchannel_pool', 1)] + (options or [])
+        self.channels = [grpc.insecure_channel(target, options=arguments) for index in range(channels)]
+        interceptors = ([RequestIds()] if request_ids else []) + ([DefaultDeadline(timeout)] if timeout is not None else [])
+        intercepted = [grpc.intercept_channel(channel, *interceptors) for channel in self.channels]
+        self._stubs = [inventory_pb2_grpc.InventoryServiceStub(channel) for channel in intercepted]
+        self._next = count()
+
+
+    @property
+    def stub(self):
+        """
+        Returns a stub, taking the channels in turn.
+
+        Returns:
+            inventory_pb2_grpc.InventoryServiceStub: The stub.
+        """
+        return self._stubs[next(self._next) % len(self._stubs)]
+
+
+    def close(self):
+        """Closes the channels, cancelling calls in progress."""
+        for channel in self.channels:
+            channel.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def chunked(items, size):
+    """
+    Splits an iterable into lists of at most size items without materializing it.
+
+    Args:
+        items (iterable): The items to split.
+        size (int): Maximum number of items per chunk.
+
+    Yields:
+        list: The next chunk.
+    """
+    iterator = iter(items)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def as_quantity(quantity):
+    """
+    Accepts a quantity update as either a Quantity message or an (id, quantity) pair.
+
+    Args:
+        quantity (inventory_pb2.Quantity or (int, int)): The update.
+
+    Returns:
+        inventory_pb2.Quantity: The update as a message.
+    """
+    if isinstance(quantity, inventory_pb2.Quantity):
+        return quantity
+    return inventory_pb2.Quantity(product_identifier=quantity[0], product_quantity=quantity[1])
+
+
+def add_products(stub, products, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Adds any number of products, one AddProducts call per chunk.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        products (iterable of inventory_pb2.Product): The products to add.
+        chunk_size (int): Maximum number of products per call.
+
+    Yields:
+        inventory_pb2.ProductResult: Outcome for each product, in input order.
+    """
+    for chunk in chunked(products, chunk_size):
+        yield from stub.AddProducts(inventory_pb2.ProductList(products=chunk)).results
+
+
+def get_products_by_ids(stub, product_identifiers, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Retrieves any number of products by ID, one GetProductsByIds call per chunk.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        product_identifiers (iterable of int): IDs of the products to retrieve.
+        chunk_size (int): Maximum number of IDs per call.
+
+    Yields:
+        inventory_pb2.ProductResult: Outcome for each ID, with the product when found, in input order.
+    """
+    for chunk in chunked(product_identifiers, chunk_size):
+        yield from stub.GetProductsByIds(inventory_pb2.ProductIdentifierList(product_identifiers=chunk)).results
+
+
+def update_quantities(stub, quantities, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Updates the quantities of any number of products, one UpdateQuantities call per chunk.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        quantities (iterable of inventory_pb2.Quantity or (int, int)): IDs and new quantities of the products.
+        chunk_size (int): Maximum number of updates per call.
+
+    Yields:
+        inventory_pb2.ProductResult: Outcome for each update, with the updated product when found, in input order.
+    """
+    for chunk in chunked(quantities, chunk_size):
+        yield from stub.UpdateQuantities(inventory_pb2.QuantityList(quantities=[as_quantity(quantity) for quantity in chunk])).results
+
+
+def delete_products(stub, product_identifiers, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Deletes any number of products by ID, one DeleteProducts call per chunk.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        product_identifiers (iterable of int): IDs of the products to delete.
+        chunk_size (int): Maximum number of IDs per call.
+
+    Yields:
+        inventory_pb2.ProductResult: Outcome for each ID, in input order.
+    """
+    for chunk in chunked(product_identifiers, chunk_size):
+        yield from stub.DeleteProducts(inventory_pb2.ProductIdentifierList(product_identifiers=chunk)).results
+
+
+def stream_quantities(stub, quantities):
+    """
+    Sends a feed of quantity updates over one StreamQuantities call.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        quantities (iterable of inventory_pb2.Quantity or (int, int)): IDs and new quantities, may be endless.
+
+    Yields:
+        inventory_pb2.ProductResult: Acknowledgement for each update, in input order.
+    """
+    yield from stub.StreamQuantities(as_quantity(quantity) for quantity in quantities)
+
+
+def as_adjustment(adjustment):
+    """
+    Accepts an adjustment as an Adjustment message, an (id, delta) pair or an (id, delta, minimum_quantity) triple.
+
+    Args:
+        adjustment (inventory_pb2.Adjustment or tuple): The adjustment.
+
+    Returns:
+        inventory_pb2.Adjustment: The adjustment as a message.
+    """
+    if isinstance(adjustment, inventory_pb2.Adjustment):
+        return adjustment
+    return inventory_pb2.Adjustment(product_identifier=adjustment[0], delta=adjustment[1], 
+                                    minimum_quantity=adjustment[2] if len(adjustment) > 2 else None)
+
+
+def adjust_quantities(stub, adjustments, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Atomically adjusts the quantities of any number of products, one AdjustQuantities call per chunk.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        adjustments (iterable of inventory_pb2.Adjustment or tuple): The adjustments, see as_adjustment().
+        chunk_size (int): Maximum number of adjustments per call.
+
+    Yields:
+        inventory_pb2.ProductResult: Outcome for each adjustment, in input order.
+    """
+    for chunk in chunked(adjustments, chunk_size):
+        yield from stub.AdjustQuantities(inventory_pb2.AdjustmentList(adjustments=[as_adjustment(adjustment) for adjustment in chunk])).results
+
+
+def reserve(stub, product_identifier, amount):
+    """
+    Takes amount units of a product out of stock, only if that many are available.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        product_identifier (int): ID of the product.
+        amount (int): Number of units to reserve.
+
+    Returns:
+        inventory_pb2.ProductResult: Outcome of the reservation, success is False if stock was insufficient.
+    """
+    return stub.AdjustProductQuantity(inventory_pb2.Adjustment(product_identifier=product_identifier, delta=-amount, minimum_quantity=0))
+
+
+def list_pages(stub, page_size=0, product_filter=None, fields=None, page_token=''):
+    """
+    Lists the inventory one ListProducts page at a time, following the continuation tokens.
+    To resume an interrupted listing, pass the next_page_token of the last page that arrived.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        page_size (int): Products per page, 0 for the server's default.
+        product_filter (inventory_pb2.ProductFilter): Conditions the products must meet, None for every product.
+        fields (list of str): Product fields to return, None for every field.
+        page_token (str): Token to start from, empty for the first page.
+
+    Yields:
+        inventory_pb2.ListProductsResponse: The pages, in name order.
+    """
+    while True:
+        page = stub.ListProducts(inventory_pb2.ListProductsRequest(page_size=page_size, page_token=page_token, filter=product_filter,
+                                                                   field_mask=FieldMask(paths=fields or [])))
+        yield page
+        if not page.next_page_token:
+            return
+        page_token = page.next_page_token
+
+
+def list_products(stub, page_size=0, product_filter=None, fields=None):
+    """
+    Lists the inventory, reading it one ListProducts page at a time.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        page_size (int): Products per page, 0 for the server's default.
+        product_filter (inventory_pb2.ProductFilter): Conditions the products must meet, None for every product.
+        fields (list of str): Product fields to return, None for every field.
+
+    Yields:
+        inventory_pb2.Product: The products, in name order.
+    """
+    for page in list_pages(stub, page_size, product_filter, fields):
+        yield from page.products
+
+
+def watch_inventory(stub, from_offset=''):
+    """
+    Streams changes to the inventory. To keep a copy of the catalog current, list it with list_pages(),
+    then watch from the change_offset of the first page; changes replayed onto products the listing
+    already reflected leave them unchanged.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        from_offset (str): Offset of the last change seen, empty for new changes only, '0' for every change the server keeps.
+
+    Yields:
+        inventory_pb2.ChangeEvent: The changes, oldest first. Raises grpc.RpcError with OUT_OF_RANGE when
+            changes after from_offset are no longer kept, and the catalog must be listed again.
+    """
+    yield from stub.WatchInventory(inventory_pb2.WatchRequest(from_offset=from_offset))
+
+
+def import_products(stub, products, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streams products to ImportProducts in chunks, reading the iterable lazily so catalogs of any size
+    are loaded in constant memory. Products that already exist are left as they are.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        products (iterable of inventory_pb2.Product): The products to add.
+        chunk_size (int): Products per message.
+
+    Returns:
+        inventory_pb2.ImportSummary: How many products were received, added, already present and rejected.
+    """
+    return stub.ImportProducts(inventory_pb2.ProductList(products=chunk) for chunk in chunked(products, chunk_size))
+
+
+def export_products(stub, batch_size=0):
+    """
+    Reads the whole inventory through ExportProducts.
+
+    Args:
+        stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+        batch_size (int): Products per message, 0 for the server's default.
+
+    Yields:
+        inventory_pb2.Product: The products, in no particular order.
+    """
+    for batch in stub.ExportProducts(inventory_pb2.ExportRequest(batch_size=batch_size)):
+        yield from batch.products
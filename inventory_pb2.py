@@ -13,23 +13,64 @@ _sym_db = _symbol_database.Default()
 
 
 from google.protobuf import empty_pb2 as google_dot_protobuf_dot_empty__pb2
+from google.protobuf import field_mask_pb2 as google_dot_protobuf_dot_field__mask__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0finventory.proto\x1a\x1bgoogle/protobuf/empty.proto\"l\n\x07Product\x12\x1a\n\x12product_identifier\x18\x01 \x01(\x05\x12\x14\n\x0cproduct_name\x18\x02 \x01(\t\x12\x18\n\x10product_quantity\x18\x03 \x01(\x05\x12\x15\n\rproduct_price\x18\x04 \x01(\x02\"\x18\n\x06Status\x12\x0e\n\x06status\x18\x01 \x01(\t\"/\n\x11ProductIdentifier\x12\x1a\n\x12product_identifier\x18\x01 \x01(\x05\"@\n\x08Quantity\x12\x1a\n\x12product_identifier\x18\x01 \x01(\x05\x12\x18\n\x10product_quantity\x18\x02 \x01(\x05\x32\xf5\x01\n\x10InventoryService\x12\x1f\n\nAddProduct\x12\x08.Product\x1a\x07.Status\x12.\n\x0eGetProductById\x12\x12.ProductIdentifier\x1a\x08.Product\x12,\n\x15UpdateProductQuantity\x12\t.Quantity\x1a\x08.Product\x12,\n\rDeleteProduct\x12\x12.ProductIdentifier\x1a\x07.Status\x12\x34\n\x0eGetAllProducts\x12\x16.google.protobuf.Empty\x1a\x08.Product0\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0finventory.proto\x1a\x1bgoogle/protobuf/empty.proto\x1a google/protobuf/field_mask.proto\"l\n\x07Product\x12\x1a\n\x12product_identifier\x18\x01 \x01(\x05\x12\x14\n\x0cproduct_name\x18\x02 \x01(\t\x12\x18\n\x10product_quantity\x18\x03 \x01(\x05\x12\x15\n\rproduct_price\x18\x04 \x01(\x02\"\x18\n\x06Status\x12\x0e\n\x06status\x18\x01 \x01(\t\"/\n\x11ProductIdentifier\x12\x1a\n\x12product_identifier\x18\x01 \x01(\x05\"@\n\x08Quantity\x12\x1a\n\x12product_identifier\x18\x01 \x01(\x05\x12\x18\n\x10product_quantity\x18\x02 \x01(\x05\"k\n\nAdjustment\x12\x1a\n\x12product_identifier\x18\x01 \x01(\x05\x12\r\n\x05\x64\x65lta\x18\x02 \x01(\x05\x12\x1d\n\x10minimum_quantity\x18\x03 \x01(\x05H\x00\x88\x01\x01\x42\x13\n\x11_minimum_quantity\"2\n\x0e\x41\x64justmentList\x12 \n\x0b\x61\x64justments\x18\x01 \x03(\x0b\x32\x0b.Adjustment\")\n\x0bProductList\x12\x1a\n\x08products\x18\x01 \x03(\x0b\x32\x08.Product\"4\n\x15ProductIdentifierList\x12\x1b\n\x13product_identifiers\x18\x01 \x03(\x05\"-\n\x0cQuantityList\x12\x1d\n\nquantities\x18\x01 \x03(\x0b\x32\t.Quantity\"g\n\rProductResult\x12\x1a\n\x12product_identifier\x18\x01 \x01(\x05\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\x0e\n\x06status\x18\x03 \x01(\t\x12\x19\n\x07product\x18\x04 \x01(\x0b\x32\x08.Product\"4\n\x11ProductResultList\x12\x1f\n\x07results\x18\x01 \x03(\x0b\x32\x0e.ProductResult\"*\n\tNameQuery\x12\x0e\n\x06prefix\x18\x01 \x01(\t\x12\r\n\x05limit\x18\x02 \x01(\x05\"5\n\nStockQuery\x12\x18\n\x10maximum_quantity\x18\x01 \x01(\x05\x12\r\n\x05limit\x18\x02 \x01(\x05\"I\n\nPriceQuery\x12\x15\n\rminimum_price\x18\x01 \x01(\x02\x12\x15\n\rmaximum_price\x18\x02 \x01(\x02\x12\r\n\x05limit\x18\x03 \x01(\x05\"\xe8\x01\n\rProductFilter\x12\x13\n\x0bname_prefix\x18\x01 \x01(\t\x12\x1d\n\x10minimum_quantity\x18\x02 \x01(\x05H\x00\x88\x01\x01\x12\x1d\n\x10maximum_quantity\x18\x03 \x01(\x05H\x01\x88\x01\x01\x12\x1a\n\rminimum_price\x18\x04 \x01(\x02H\x02\x88\x01\x01\x12\x1a\n\rmaximum_price\x18\x05 \x01(\x02H\x03\x88\x01\x01\x42\x13\n\x11_minimum_quantityB\x13\n\x11_maximum_quantityB\x10\n\x0e_minimum_priceB\x10\n\x0e_maximum_price\"\x8c\x01\n\x13ListProductsRequest\x12\x11\n\tpage_size\x18\x01 \x01(\x05\x12\x12\n\npage_token\x18\x02 \x01(\t\x12\x1e\n\x06\x66ilter\x18\x03 \x01(\x0b\x32\x0e.ProductFilter\x12.\n\nfield_mask\x18\x04 \x01(\x0b\x32\x1a.google.protobuf.FieldMask\"b\n\x14ListProductsResponse\x12\x1a\n\x08products\x18\x01 \x03(\x0b\x32\x08.Product\x12\x17\n\x0fnext_page_token\x18\x02 \x01(\t\x12\x15\n\rchange_offset\x18\x03 \x01(\t\"#\n\x0cWatchRequest\x12\x13\n\x0b\x66rom_offset\x18\x01 \x01(\t\"\xab\x01\n\x0b\x43hangeEvent\x12\x0e\n\x06offset\x18\x01 \x01(\t\x12)\n\toperation\x18\x02 \x01(\x0e\x32\x16.ChangeEvent.Operation\x12\x19\n\x07product\x18\x03 \x01(\x0b\x32\x08.Product\"F\n\tOperation\x12\x0b\n\x07UNKNOWN\x10\x00\x12\t\n\x05\x41\x44\x44\x45\x44\x10\x01\x12\x14\n\x10QUANTITY_CHANGED\x10\x02\x12\x0b\n\x07\x44\x45LETED\x10\x03\"k\n\rImportSummary\x12\x10\n\x08received\x18\x01 \x01(\x03\x12\r\n\x05\x61\x64\x64\x65\x64\x18\x02 \x01(\x03\x12\x17\n\x0f\x61lready_present\x18\x03 \x01(\x03\x12\x10\n\x08rejected\x18\x04 \x01(\x03\x12\x0e\n\x06status\x18\x05 \x01(\t\"#\n\rExportRequest\x12\x12\n\nbatch_size\x18\x01 \x01(\x05\"r\n\x0eInventoryStats\x12\x10\n\x08products\x18\x01 \x01(\x03\x12\x16\n\x0etotal_quantity\x18\x02 \x01(\x03\x12\x13\n\x0btotal_value\x18\x03 \x01(\x01\x12!\n\tlow_stock\x18\x04 \x03(\x0b\x32\x0e.LowStockCount\";\n\rLowStockCount\x12\x18\n\x10maximum_quantity\x18\x01 \x01(\x05\x12\x10\n\x08products\x18\x02 \x01(\x03\x32\x9a\x08\n\x10InventoryService\x12\x1f\n\nAddProduct\x12\x08.Product\x1a\x07.Status\x12.\n\x0eGetProductById\x12\x12.ProductIdentifier\x1a\x08.Product\x12,\n\x15UpdateProductQuantity\x12\t.Quantity\x1a\x08.Product\x12\x34\n\x15\x41\x64justProductQuantity\x12\x0b.Adjustment\x1a\x0e.ProductResult\x12,\n\rDeleteProduct\x12\x12.ProductIdentifier\x1a\x07.Status\x12\x34\n\x0eGetAllProducts\x12\x16.google.protobuf.Empty\x1a\x08.Product0\x01\x12/\n\x0b\x41\x64\x64Products\x12\x0c.ProductList\x1a\x12.ProductResultList\x12>\n\x10GetProductsByIds\x12\x16.ProductIdentifierList\x1a\x12.ProductResultList\x12\x35\n\x10UpdateQuantities\x12\r.QuantityList\x1a\x12.ProductResultList\x12\x37\n\x10\x41\x64justQuantities\x12\x0f.AdjustmentList\x1a\x12.ProductResultList\x12<\n\x0e\x44\x65leteProducts\x12\x16.ProductIdentifierList\x1a\x12.ProductResultList\x12\x31\n\x10StreamQuantities\x12\t.Quantity\x1a\x0e.ProductResult(\x01\x30\x01\x12.\n\x12\x46indProductsByName\x12\n.NameQuery\x1a\x0c.ProductList\x12)\n\x0c\x46indLowStock\x12\x0b.StockQuery\x1a\x0c.ProductList\x12\x30\n\x13\x46indProductsByPrice\x12\x0b.PriceQuery\x1a\x0c.ProductList\x12;\n\x0cListProducts\x12\x14.ListProductsRequest\x1a\x15.ListProductsResponse\x12/\n\x0eWatchInventory\x12\r.WatchRequest\x1a\x0c.ChangeEvent0\x01\x12\x30\n\x0eImportProducts\x12\x0c.ProductList\x1a\x0e.ImportSummary(\x01\x12\x30\n\x0e\x45xportProducts\x12\x0e.ExportRequest\x1a\x0c.ProductList0\x01\x12<\n\x11GetInventoryStats\x12\x16.google.protobuf.Empty\x1a\x0f.InventoryStatsb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'inventory_pb2', _globals)
 if _descriptor._USE_C_DESCRIPTORS == False:
   DESCRIPTOR._options = None
-  _globals['_PRODUCT']._serialized_start=48
-  _globals['_PRODUCT']._serialized_end=156
-  _globals['_STATUS']._serialized_start=158
-  _globals['_STATUS']._serialized_end=182
-  _globals['_PRODUCTIDENTIFIER']._serialized_start=184
-  _globals['_PRODUCTIDENTIFIER']._serialized_end=231
-  _globals['_QUANTITY']._serialized_start=233
-  _globals['_QUANTITY']._serialized_end=297
-  _globals['_INVENTORYSERVICE']._serialized_start=300
-  _globals['_INVENTORYSERVICE']._serialized_end=545
+  _globals['_PRODUCT']._serialized_start=82
+  _globals['_PRODUCT']._serialized_end=190
+  _globals['_STATUS']._serialized_start=192
+  _globals['_STATUS']._serialized_end=216
+  _globals['_PRODUCTIDENTIFIER']._serialized_start=218
+  _globals['_PRODUCTIDENTIFIER']._serialized_end=265
+  _globals['_QUANTITY']._serialized_start=267
+  _globals['_QUANTITY']._serialized_end=331
+  _globals['_ADJUSTMENT']._serialized_start=333
+  _globals['_ADJUSTMENT']._serialized_end=440
+  _globals['_ADJUSTMENTLIST']._serialized_start=442
+  _globals['_ADJUSTMENTLIST']._serialized_end=492
+  _globals['_PRODUCTLIST']._serialized_start=494
+  _globals['_PRODUCTLIST']._serialized_end=535
+  _globals['_PRODUCTIDENTIFIERLIST']._serialized_start=537
+  _globals['_PRODUCTIDENTIFIERLIST']._serialized_end=589
+  _globals['_QUANTITYLIST']._serialized_start=591
+  _globals['_QUANTITYLIST']._serialized_end=636
+  _globals['_PRODUCTRESULT']._serialized_start=638
+  _globals['_PRODUCTRESULT']._serialized_end=741
+  _globals['_PRODUCTRESULTLIST']._serialized_start=743
+  _globals['_PRODUCTRESULTLIST']._serialized_end=795
+  _globals['_NAMEQUERY']._serialized_start=797
+  _globals['_NAMEQUERY']._serialized_end=839
+  _globals['_STOCKQUERY']._serialized_start=841
+  _globals['_STOCKQUERY']._serialized_end=894
+  _globals['_PRICEQUERY']._serialized_start=896
+  _globals['_PRICEQUERY']._serialized_end=969
+  _globals['_PRODUCTFILTER']._serialized_start=972
+  _globals['_PRODUCTFILTER']._serialized_end=1204
+  _globals['_LISTPRODUCTSREQUEST']._serialized_start=1207
+  _globals['_LISTPRODUCTSREQUEST']._serialized_end=1347
+  _globals['_LISTPRODUCTSRESPONSE']._serialized_start=1349
+  _globals['_LISTPRODUCTSRESPONSE']._serialized_end=1447
+  _globals['_WATCHREQUEST']._serialized_start=1449
+  _globals['_WATCHREQUEST']._serialized_end=1484
+  _globals['_CHANGEEVENT']._serialized_start=1487
+  _globals['_CHANGEEVENT']._serialized_end=1658
+  _globals['_CHANGEEVENT_OPERATION']._serialized_start=1588
+  _globals['_CHANGEEVENT_OPERATION']._serialized_end=1658
+  _globals['_IMPORTSUMMARY']._serialized_start=1660
+  _globals['_IMPORTSUMMARY']._serialized_end=1767
+  _globals['_EXPORTREQUEST']._serialized_start=1769
+  _globals['_EXPORTREQUEST']._serialized_end=1804
+  _globals['_INVENTORYSTATS']._serialized_start=1806
+  _globals['_INVENTORYSTATS']._serialized_end=1920
+  _globals['_LOWSTOCKCOUNT']._serialized_start=1922
+  _globals['_LOWSTOCKCOUNT']._serialized_end=1981
+  _globals['_INVENTORYSERVICE']._serialized_start=1984
+  _globals['_INVENTORYSERVICE']._serialized_end=3034
 # @@protoc_insertion_point(module_scope)
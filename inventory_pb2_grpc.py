@@ -7,7 +7,9 @@ import inventory_pb2 as inventory__pb2
 
 
 class InventoryServiceStub(object):
-    """Missing associated documentation comment in .proto file."""
+    """Every RPC fails with UNAVAILABLE when the server cannot reach Redis (retry later), and with DEADLINE_EXCEEDED
+    when the client's deadline passes first; the server stops waiting on Redis at the deadline.
+    """
 
     def __init__(self, channel):
         """Constructor.
@@ -30,6 +32,11 @@ class InventoryServiceStub(object):
                 request_serializer=inventory__pb2.Quantity.SerializeToString,
                 response_deserializer=inventory__pb2.Product.FromString,
                 )
+        self.AdjustProductQuantity = channel.unary_unary(
+                '/InventoryService/AdjustProductQuantity',
+                request_serializer=inventory__pb2.Adjustment.SerializeToString,
+                response_deserializer=inventory__pb2.ProductResult.FromString,
+                )
         self.DeleteProduct = channel.unary_unary(
                 '/InventoryService/DeleteProduct',
                 request_serializer=inventory__pb2.ProductIdentifier.SerializeToString,
@@ -40,34 +47,113 @@ class InventoryServiceStub(object):
                 request_serializer=google_dot_protobuf_dot_empty__pb2.Empty.SerializeToString,
                 response_deserializer=inventory__pb2.Product.FromString,
                 )
+        self.AddProducts = channel.unary_unary(
+                '/InventoryService/AddProducts',
+                request_serializer=inventory__pb2.ProductList.SerializeToString,
+                response_deserializer=inventory__pb2.ProductResultList.FromString,
+                )
+        self.GetProductsByIds = channel.unary_unary(
+                '/InventoryService/GetProductsByIds',
+                request_serializer=inventory__pb2.ProductIdentifierList.SerializeToString,
+                response_deserializer=inventory__pb2.ProductResultList.FromString,
+                )
+        self.UpdateQuantities = channel.unary_unary(
+                '/InventoryService/UpdateQuantities',
+                request_serializer=inventory__pb2.QuantityList.SerializeToString,
+                response_deserializer=inventory__pb2.ProductResultList.FromString,
+                )
+        self.AdjustQuantities = channel.unary_unary(
+                '/InventoryService/AdjustQuantities',
+                request_serializer=inventory__pb2.AdjustmentList.SerializeToString,
+                response_deserializer=inventory__pb2.ProductResultList.FromString,
+                )
+        self.DeleteProducts = channel.unary_unary(
+                '/InventoryService/DeleteProducts',
+                request_serializer=inventory__pb2.ProductIdentifierList.SerializeToString,
+                response_deserializer=inventory__pb2.ProductResultList.FromString,
+                )
+        self.StreamQuantities = channel.stream_stream(
+                '/InventoryService/StreamQuantities',
+                request_serializer=inventory__pb2.Quantity.SerializeToString,
+                response_deserializer=inventory__pb2.ProductResult.FromString,
+                )
+        self.FindProductsByName = channel.unary_unary(
+                '/InventoryService/FindProductsByName',
+                request_serializer=inventory__pb2.NameQuery.SerializeToString,
+                response_deserializer=inventory__pb2.ProductList.FromString,
+                )
+        self.FindLowStock = channel.unary_unary(
+                '/InventoryService/FindLowStock',
+                request_serializer=inventory__pb2.StockQuery.SerializeToString,
+                response_deserializer=inventory__pb2.ProductList.FromString,
+                )
+        self.FindProductsByPrice = channel.unary_unary(
+                '/InventoryService/FindProductsByPrice',
+                request_serializer=inventory__pb2.PriceQuery.SerializeToString,
+                response_deserializer=inventory__pb2.ProductList.FromString,
+                )
+        self.ListProducts = channel.unary_unary(
+                '/InventoryService/ListProducts',
+                request_serializer=inventory__pb2.ListProductsRequest.SerializeToString,
+                response_deserializer=inventory__pb2.ListProductsResponse.FromString,
+                )
+        self.WatchInventory = channel.unary_stream(
+                '/InventoryService/WatchInventory',
+                request_serializer=inventory__pb2.WatchRequest.SerializeToString,
+                response_deserializer=inventory__pb2.ChangeEvent.FromString,
+                )
+        self.ImportProducts = channel.stream_unary(
+                '/InventoryService/ImportProducts',
+                request_serializer=inventory__pb2.ProductList.SerializeToString,
+                response_deserializer=inventory__pb2.ImportSummary.FromString,
+                )
+        self.ExportProducts = channel.unary_stream(
+                '/InventoryService/ExportProducts',
+                request_serializer=inventory__pb2.ExportRequest.SerializeToString,
+                response_deserializer=inventory__pb2.ProductList.FromString,
+                )
+        self.GetInventoryStats = channel.unary_unary(
+                '/InventoryService/GetInventoryStats',
+                request_serializer=google_dot_protobuf_dot_empty__pb2.Empty.SerializeToString,
+                response_deserializer=inventory__pb2.InventoryStats.FromString,
+                )
 
 
 class InventoryServiceServicer(object):
-    """Missing associated documentation comment in .proto file."""
+    """Every RPC fails with UNAVAILABLE when the server cannot reach Redis (retry later), and with DEADLINE_EXCEEDED
+    when the client's deadline passes first; the server stops waiting on Redis at the deadline.
+    """
 
     def AddProduct(self, request, context):
-        """Add a new product to the inventory
+        """Add a new product to the inventory, ALREADY_EXISTS if the ID is taken, INVALID_ARGUMENT if it is negative
         """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
     def GetProductById(self, request, context):
-        """Get information about a specific product
+        """Get information about a specific product, NOT_FOUND if it does not exist
         """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
     def UpdateProductQuantity(self, request, context):
-        """Update the quantity of a product
+        """Update the quantity of a product, NOT_FOUND if it does not exist
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def AdjustProductQuantity(self, request, context):
+        """Atomically add to or subtract from the quantity of a product, NOT_FOUND if it does not exist
         """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
     def DeleteProduct(self, request, context):
-        """Delete a product from the inventory
+        """Delete a product from the inventory, NOT_FOUND if it does not exist
         """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
@@ -82,6 +168,97 @@ class InventoryServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def AddProducts(self, request, context):
+        """Batch variants, results are returned in request order
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetProductsByIds(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def UpdateQuantities(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def AdjustQuantities(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def DeleteProducts(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamQuantities(self, request_iterator, context):
+        """Apply a continuous feed of quantity updates, acknowledging each one in order
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def FindProductsByName(self, request, context):
+        """Indexed queries, answered without scanning the catalog
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def FindLowStock(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def FindProductsByPrice(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ListProducts(self, request, context):
+        """List the catalog one page at a time, resuming from the token of the previous page
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def WatchInventory(self, request, context):
+        """Stream every change to the inventory, catching up from from_offset first
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ImportProducts(self, request_iterator, context):
+        """Bulk load and dump the catalog, one batch of products per message
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ExportProducts(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetInventoryStats(self, request, context):
+        """Catalog totals and low-stock counts for dashboards, without streaming the catalog
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_InventoryServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -100,6 +277,11 @@ def add_InventoryServiceServicer_to_server(servicer, server):
                     request_deserializer=inventory__pb2.Quantity.FromString,
                     response_serializer=inventory__pb2.Product.SerializeToString,
             ),
+            'AdjustProductQuantity': grpc.unary_unary_rpc_method_handler(
+                    servicer.AdjustProductQuantity,
+                    request_deserializer=inventory__pb2.Adjustment.FromString,
+                    response_serializer=inventory__pb2.ProductResult.SerializeToString,
+            ),
             'DeleteProduct': grpc.unary_unary_rpc_method_handler(
                     servicer.DeleteProduct,
                     request_deserializer=inventory__pb2.ProductIdentifier.FromString,
@@ -110,6 +292,76 @@ def add_InventoryServiceServicer_to_server(servicer, server):
                     request_deserializer=google_dot_protobuf_dot_empty__pb2.Empty.FromString,
                     response_serializer=inventory__pb2.Product.SerializeToString,
             ),
+            'AddProducts': grpc.unary_unary_rpc_method_handler(
+                    servicer.AddProducts,
+                    request_deserializer=inventory__pb2.ProductList.FromString,
+                    response_serializer=inventory__pb2.ProductResultList.SerializeToString,
+            ),
+            'GetProductsByIds': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetProductsByIds,
+                    request_deserializer=inventory__pb2.ProductIdentifierList.FromString,
+                    response_serializer=inventory__pb2.ProductResultList.SerializeToString,
+            ),
+            'UpdateQuantities': grpc.unary_unary_rpc_method_handler(
+                    servicer.UpdateQuantities,
+                    request_deserializer=inventory__pb2.QuantityList.FromString,
+                    response_serializer=inventory__pb2.ProductResultList.SerializeToString,
+            ),
+            'AdjustQuantities': grpc.unary_unary_rpc_method_handler(
+                    servicer.AdjustQuantities,
+                    request_deserializer=inventory__pb2.AdjustmentList.FromString,
+                    response_serializer=inventory__pb2.ProductResultList.SerializeToString,
+            ),
+            'DeleteProducts': grpc.unary_unary_rpc_method_handler(
+                    servicer.DeleteProducts,
+                    request_deserializer=inventory__pb2.ProductIdentifierList.FromString,
+                    response_serializer=inventory__pb2.ProductResultList.SerializeToString,
+            ),
+            'StreamQuantities': grpc.stream_stream_rpc_method_handler(
+                    servicer.StreamQuantities,
+                    request_deserializer=inventory__pb2.Quantity.FromString,
+                    response_serializer=inventory__pb2.ProductResult.SerializeToString,
+            ),
+            'FindProductsByName': grpc.unary_unary_rpc_method_handler(
+                    servicer.FindProductsByName,
+                    request_deserializer=inventory__pb2.NameQuery.FromString,
+                    response_serializer=inventory__pb2.ProductList.SerializeToString,
+            ),
+            'FindLowStock': grpc.unary_unary_rpc_method_handler(
+                    servicer.FindLowStock,
+                    request_deserializer=inventory__pb2.StockQuery.FromString,
+                    response_serializer=inventory__pb2.ProductList.SerializeToString,
+            ),
+            'FindProductsByPrice': grpc.unary_unary_rpc_method_handler(
+                    servicer.FindProductsByPrice,
+                    request_deserializer=inventory__pb2.PriceQuery.FromString,
+                    response_serializer=inventory__pb2.ProductList.SerializeToString,
+            ),
+            'ListProducts': grpc.unary_unary_rpc_method_handler(
+                    servicer.ListProducts,
+                    request_deserializer=inventory__pb2.ListProductsRequest.FromString,
+                    response_serializer=inventory__pb2.ListProductsResponse.SerializeToString,
+            ),
+            'WatchInventory': grpc.unary_stream_rpc_method_handler(
+                    servicer.WatchInventory,
+                    request_deserializer=inventory__pb2.WatchRequest.FromString,
+                    response_serializer=inventory__pb2.ChangeEvent.SerializeToString,
+            ),
+            'ImportProducts': grpc.stream_unary_rpc_method_handler(
+                    servicer.ImportProducts,
+                    request_deserializer=inventory__pb2.ProductList.FromString,
+                    response_serializer=inventory__pb2.ImportSummary.SerializeToString,
+            ),
+            'ExportProducts': grpc.unary_stream_rpc_method_handler(
+                    servicer.ExportProducts,
+                    request_deserializer=inventory__pb2.ExportRequest.FromString,
+                    response_serializer=inventory__pb2.ProductList.SerializeToString,
+            ),
+            'GetInventoryStats': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetInventoryStats,
+                    request_deserializer=google_dot_protobuf_dot_empty__pb2.Empty.FromString,
+                    response_serializer=inventory__pb2.InventoryStats.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'InventoryService', rpc_method_handlers)
@@ -118,7 +370,9 @@ def add_InventoryServiceServicer_to_server(servicer, server):
 
  # This class is part of an EXPERIMENTAL API.
 class InventoryService(object):
-    """Missing associated documentation comment in .proto file."""
+    """Every RPC fails with UNAVAILABLE when the server cannot reach Redis (retry later), and with DEADLINE_EXCEEDED
+    when the client's deadline passes first; the server stops waiting on Redis at the deadline.
+    """
 
     @staticmethod
     def AddProduct(request,
@@ -171,6 +425,23 @@ class InventoryService(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def AdjustProductQuantity(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/InventoryService/AdjustProductQuantity',
+            inventory__pb2.Adjustment.SerializeToString,
+            inventory__pb2.ProductResult.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def DeleteProduct(request,
             target,
@@ -204,3 +475,241 @@ class InventoryService(object):
             inventory__pb2.Product.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def AddProducts(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/InventoryService/AddProducts',
+            inventory__pb2.ProductList.SerializeToString,
+            inventory__pb2.ProductResultList.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetProductsByIds(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/InventoryService/GetProductsByIds',
+            inventory__pb2.ProductIdentifierList.SerializeToString,
+            inventory__pb2.ProductResultList.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def UpdateQuantities(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/InventoryService/UpdateQuantities',
+            inventory__pb2.QuantityList.SerializeToString,
+            inventory__pb2.ProductResultList.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def AdjustQuantities(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/InventoryService/AdjustQuantities',
+            inventory__pb2.AdjustmentList.SerializeToString,
+            inventory__pb2.ProductResultList.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def DeleteProducts(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/InventoryService/DeleteProducts',
+            inventory__pb2.ProductIdentifierList.SerializeToString,
+            inventory__pb2.ProductResultList.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def StreamQuantities(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/InventoryService/StreamQuantities',
+            inventory__pb2.Quantity.SerializeToString,
+            inventory__pb2.ProductResult.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def FindProductsByName(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/InventoryService/FindProductsByName',
+            inventory__pb2.NameQuery.SerializeToString,
+            inventory__pb2.ProductList.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def FindLowStock(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/InventoryService/FindLowStock',
+            inventory__pb2.StockQuery.SerializeToString,
+            inventory__pb2.ProductList.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def FindProductsByPrice(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/InventoryService/FindProductsByPrice',
+            inventory__pb2.PriceQuery.SerializeToString,
+            inventory__pb2.ProductList.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def ListProducts(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/InventoryService/ListProducts',
+            inventory__pb2.ListProductsRequest.SerializeToString,
+            inventory__pb2.ListProductsResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def WatchInventory(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/InventoryService/WatchInventory',
+            inventory__pb2.WatchRequest.SerializeToString,
+            inventory__pb2.ChangeEvent.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def ImportProducts(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(request_iterator, target, '/InventoryService/ImportProducts',
+            inventory__pb2.ProductList.SerializeToString,
+            inventory__pb2.ImportSummary.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def ExportProducts(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/InventoryService/ExportProducts',
+            inventory__pb2.ExportRequest.SerializeToString,
+            inventory__pb2.ProductList.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetInventoryStats(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/InventoryService/GetInventoryStats',
+            google_dot_protobuf_dot_empty__pb2.Empty.SerializeToString,
+            inventory__pb2.InventoryStats.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
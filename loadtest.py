@@ -0,0 +1,367 @@
+import argparse
+import json
+import platform
+import random
+import time
+from datetime import datetime, timezone
+from threading import Event, Thread
+
+import google.protobuf.empty_pb2
+import grpc
+import redis
+import redis.asyncio
+import inventory_pb2
+import inventory_pb2_grpc
+from benchmark import percentile, seed, start_server
+from config import load_config
+
+
+# Statuses that answer a call rather than fail it, such as deleting a churned product that is already gone
+EXPECTED_CODES = (grpc.StatusCode.NOT_FOUND, grpc.StatusCode.ALREADY_EXISTS)
+
+# RPC mix used when --mix is not given, as relative weights
+DEFAULT_MIX = {'GetProductById': 70, 'UpdateProductQuantity': 15, 'AdjustProductQuantity': 5,
+               'GetProductsByIds': 5, 'UpdateQuantities': 5}
+
+
+class Workload:
+    """
+    Builds and sends one call of each RPC against a seeded catalog.
+    Reads and updates target the catalog, products 0..catalog-1. Adds and deletes churn
+    a second range of the same size, so they never empty the catalog the reads depend on.
+
+    Methods:
+        call: Sends one call of the given RPC and waits for its whole response.
+    """
+
+    def __init__(self, catalog, batch_size):
+        """
+        Args:
+            catalog (int): Number of seeded products.
+            batch_size (int): Items per call for the batch and streaming RPCs.
+        """
+        self.catalog = catalog
+        self.batch_size = batch_size
+
+
+    def call(self, stub, method, rng):
+        """
+        Sends one call of the given RPC and waits for its whole response.
+
+        Args:
+            stub (inventory_pb2_grpc.InventoryServiceStub): Stub connected to the server.
+            method (str): Name of the RPC, one of OPERATIONS.
+            rng (random.Random): Source of IDs and quantities.
+        """
+        getattr(self, method)(stub, rng)
+
+
+    def product_identifier(self, rng):
+        return rng.randrange(self.catalog)
+
+
+    def churn_identifier(self, rng):
+        return self.catalog + rng.randrange(self.catalog)
+
+
+    def batch(self, rng, pick):
+        return [pick(rng) for i in range(self.batch_size)]
+
+
+    def AddProduct(self, stub, rng):
+        stub.AddProduct(new_product(self.churn_identifier(rng)))
+
+
+    def GetProductById(self, stub, rng):
+        stub.GetProductById(inventory_pb2.ProductIdentifier(product_identifier=self.product_identifier(rng)))
+
+
+    def UpdateProductQuantity(self, stub, rng):
+        stub.UpdateProductQuantity(inventory_pb2.Quantity(product_identifier=self.product_identifier(rng),
+                                                          product_quantity=rng.randrange(1000)))
+
+
+    def AdjustProductQuantity(self, stub, rng):
+        stub.AdjustProductQuantity(inventory_pb2.Adjustment(product_identifier=self.product_identifier(rng),
+                                                            delta=rng.randint(-5, 5), minimum_quantity=0))
+
+
+    def DeleteProduct(self, stub, rng):
+        stub.DeleteProduct(inventory_pb2.ProductIdentifier(product_identifier=self.churn_identifier(rng)))
+
+
+    def GetAllProducts(self, stub, rng):
+        for product in stub.GetAllProducts(google.protobuf.empty_pb2.Empty()):
+            pass
+
+
+    def AddProducts(self, stub, rng):
+        stub.AddProducts(inventory_pb2.ProductList(products=[new_product(pid) for pid in self.batch(rng, self.churn_identifier)]))
+
+
+    def GetProductsByIds(self, stub, rng):
+        stub.GetProductsByIds(inventory_pb2.ProductIdentifierList(product_identifiers=self.batch(rng, self.product_identifier)))
+
+
+    def UpdateQuantities(self, stub, rng):
+        stub.UpdateQuantities(inventory_pb2.QuantityList(quantities=self.quantities(rng)))
+
+
+    def AdjustQuantities(self, stub, rng):
+        stub.AdjustQuantities(inventory_pb2.AdjustmentList(adjustments=[
+            inventory_pb2.Adjustment(product_identifier=pid, delta=rng.randint(-5, 5), minimum_quantity=0)
+            for pid in self.batch(rng, self.product_identifier)]))
+
+
+    def DeleteProducts(self, stub, rng):
+        stub.DeleteProducts(inventory_pb2.ProductIdentifierList(product_identifiers=self.batch(rng, self.churn_identifier)))
+
+
+    def StreamQuantities(self, stub, rng):
+        for result in stub.StreamQuantities(iter(self.quantities(rng))):
+            pass
+
+
+    def FindProductsByName(self, stub, rng):
+        stub.FindProductsByName(inventory_pb2.NameQuery(prefix=f'Product {self.product_identifier(rng)}', limit=self.batch_size))
+
+
+    def FindLowStock(self, stub, rng):
+        stub.FindLowStock(inventory_pb2.StockQuery(maximum_quantity=rng.randrange(100), limit=self.batch_size))
+
+
+    def FindProductsByPrice(self, stub, rng):
+        minimum = rng.uniform(0, 20)
+        stub.FindProductsByPrice(inventory_pb2.PriceQuery(minimum_price=minimum, maximum_price=minimum + 1, limit=self.batch_size))
+
+
+    def GetInventoryStats(self, stub, rng):
+        stub.GetInventoryStats(google.protobuf.empty_pb2.Empty())
+
+
+    def quantities(self, rng):
+        return [inventory_pb2.Quantity(product_identifier=pid, product_quantity=rng.randrange(1000))
+                for pid in self.batch(rng, self.product_identifier)]
+
+
+# Every RPC of InventoryServiceStub the load generator can drive
+OPERATIONS = ('AddProduct', 'GetProductById', 'UpdateProductQuantity', 'AdjustProductQuantity', 'DeleteProduct',
+              'GetAllProducts', 'AddProducts', 'GetProductsByIds', 'UpdateQuantities', 'AdjustQuantities',
+              'DeleteProducts', 'StreamQuantities', 'FindProductsByName', 'FindLowStock', 'FindProductsByPrice', 'GetInventoryStats')
+
+
+def new_product(product_identifier):
+    return inventory_pb2.Product(product_identifier=product_identifier, product_name=f'Product {product_identifier}',
+                                 product_quantity=100, product_price=9.99)
+
+
+def parse_mix(text):
+    """
+    Parses an RPC mix such as 'GetProductById=80,UpdateProductQuantity=20'.
+
+    Args:
+        text (str): Comma separated RPC=weight pairs, a bare RPC name has weight 1.
+
+    Returns:
+        dict: Weight of each RPC.
+    """
+    mix = {}
+    for item in text.split(','):
+        method, _, weight = item.strip().partition('=')
+        if method not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'unknown RPC {method!r}, expected one of {", ".join(OPERATIONS)}')
+        mix[method] = float(weight or 1)
+    return mix
+
+
+def client_loop(address, workload, mix, rng, measure_from, stop, latencies, errors):
+    """
+    Sends calls drawn from the mix on its own channel until stop is set.
+
+    Args:
+        address (str): Server address.
+        workload (Workload): Builds the calls.
+        mix (dict): Weight of each RPC.
+        rng (random.Random): This client's source of randomness.
+        measure_from (float): perf_counter() time after which calls are recorded, earlier calls are warm-up.
+        stop (threading.Event): Set when the run is over.
+        latencies (dict): Seconds taken by each recorded call, by RPC, appended to.
+        errors (dict): Number of recorded calls that failed, other than with EXPECTED_CODES, by RPC, incremented.
+    """
+    methods, weights = list(mix), list(mix.values())
+    with grpc.insecure_channel(address) as channel:
+        stub = inventory_pb2_grpc.InventoryServiceStub(channel)
+        while not stop.is_set():
+            method = rng.choices(methods, weights)[0]
+            start = time.perf_counter()
+            try:
+                workload.call(stub, method, rng)
+                failed = False
+            except grpc.RpcError as error:
+                failed = error.code() not in EXPECTED_CODES
+            if start < measure_from:
+                continue
+            latencies[method].append(time.perf_counter() - start)
+            if failed:
+                errors[method] += 1
+
+
+def summarize(latencies, errors, duration):
+    """
+    Computes throughput and latency percentiles.
+
+    Args:
+        latencies (list): Seconds taken by each call.
+        errors (int): Number of failed calls.
+        duration (float): Seconds measured.
+
+    Returns:
+        dict: Call and error counts, calls per second and latencies in milliseconds.
+    """
+    latencies = sorted(latencies)
+    return {'calls': len(latencies), 'errors': errors, 'throughput': len(latencies) / duration,
+            'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            'p50_ms': percentile(latencies, 0.5) * 1000, 'p99_ms': percentile(latencies, 0.99) * 1000,
+            'p999_ms': percentile(latencies, 0.999) * 1000, 'max_ms': (latencies[-1] if latencies else 0.0) * 1000}
+
+
+def fake_pool(mode, config):
+    """
+    Creates a connection pool backed by an in-process fake Redis, so no redis-server is needed.
+    Requires the optional fakeredis and lupa packages.
+
+    Args:
+        mode (str): 'threaded' or 'async'.
+        config (dict): Server settings, see config.load_config().
+
+    Returns:
+        BlockingConnectionPool: The connection pool.
+    """
+    try:
+        import fakeredis
+        import fakeredis.aioredis
+    except ImportError:
+        raise SystemExit('--storage fakeredis needs the fakeredis and lupa packages: pip install fakeredis lupa')
+    kwargs = {'server': fakeredis.FakeServer(), 'decode_responses': config['redis_encoding'] != 'compact',
+              'max_connections': config['redis_max_connections']}
+    if mode == 'async':
+        return redis.asyncio.BlockingConnectionPool(connection_class=fakeredis.aioredis.FakeConnection, **kwargs)
+    return redis.BlockingConnectionPool(connection_class=fakeredis.FakeConnection, **kwargs)
+
+
+def run(address, mix, concurrency, duration, warmup, catalog, batch_size, random_seed=None):
+    """
+    Seeds the catalog, then drives the server with concurrent clients and measures every RPC in the mix.
+
+    Args:
+        address (str): Server address.
+        mix (dict): Weight of each RPC.
+        concurrency (int): Number of client threads, each with its own channel.
+        duration (float): Seconds to measure for.
+        warmup (float): Seconds to run before measuring.
+        catalog (int): Number of products to seed.
+        batch_size (int): Items per call for the batch and streaming RPCs.
+        random_seed (int): Makes the sequence of calls reproducible, random if None.
+
+    Returns:
+        dict: summarize() results for all calls ('total') and for each RPC.
+    """
+    with grpc.insecure_channel(address) as channel:
+        seed(inventory_pb2_grpc.InventoryServiceStub(channel), catalog)
+
+    workload = Workload(catalog, batch_size)
+    base = random.Random(random_seed)
+    stop = Event()
+    measure_from = time.perf_counter() + warmup
+    latencies = [{method: [] for method in mix} for i in range(concurrency)]
+    errors = [{method: 0 for method in mix} for i in range(concurrency)]
+    threads = [Thread(target=client_loop, daemon=True,
+                      args=(address, workload, mix, random.Random(base.random()), measure_from, stop, latencies[i], errors[i]))
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup + duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    results = {'total': summarize([latency for client in latencies for method in mix for latency in client[method]],
+                                  sum(client[method] for client in errors for method in mix), duration)}
+    for method in mix:
+        results[method] = summarize([latency for client in latencies for latency in client[method]],
+                                    sum(client[method] for client in errors), duration)
+    return results
+
+
+def print_results(results, baseline=None):
+    """
+    Prints a results table, with the change from a baseline run if one is given.
+
+    Args:
+        results (dict): Results from run().
+        baseline (dict): Results of an earlier run, as saved with --json.
+    """
+    print(f'{"rpc":<24} {"calls":>8} {"errors":>7} {"calls/s":>10} {"p50 ms":>8} {"p99 ms":>8} {"p999 ms":>8}'
+          + (f' {"calls/s vs base":>16} {"p99 vs base":>12}' if baseline else ''))
+    for method, result in results.items():
+        line = (f'{method:<24} {result["calls"]:>8} {result["errors"]:>7} {result["throughput"]:>10.0f} '
+                f'{result["p50_ms"]:>8.2f} {result["p99_ms"]:>8.2f} {result["p999_ms"]:>8.2f}')
+        if baseline and method in baseline:
+            line += f' {change(baseline[method]["throughput"], result["throughput"]):>16} {change(baseline[method]["p99_ms"], result["p99_ms"]):>12}'
+        print(line)
+
+
+def change(before, after):
+    return f'{(after - before) / before * 100:+.1f}%' if before else '-'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless load generator for InventoryService.')
+    parser.add_argument('--target', help='address of a running server, otherwise one is started in-process')
+    parser.add_argument('--server', choices=['threaded', 'async'], default='threaded', help='in-process server implementation')
+    parser.add_argument('--storage', choices=['redis', 'fakeredis', 'memory'], default='redis',
+                        help='in-process server storage: redis-server from INVENTORY_REDIS_* settings, '
+                             'an in-process fake Redis, or the memory storage')
+    parser.add_argument('--address', default='localhost:50062', help='address for the in-process server')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='RPC=weight pairs, e.g. GetProductById=80,UpdateProductQuantity=20')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent client threads')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to measure')
+    parser.add_argument('--warmup', type=float, default=2.0, help='seconds to run before measuring')
+    parser.add_argument('--catalog', type=int, default=10000, help='number of products to seed')
+    parser.add_argument('--batch-size', type=int, default=100, help='items per call for batch and streaming RPCs')
+    parser.add_argument('--seed', type=int, help='random seed, for reproducible call sequences')
+    parser.add_argument('--json', help='save the parameters and results to this file')
+    parser.add_argument('--compare', help='results file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    stop_server = None
+    address = args.target
+    if address is None:
+        config = load_config(server_address=args.address, storage='memory' if args.storage == 'memory' else 'redis')
+        pool = None
+        if args.storage == 'fakeredis':
+            config['cache_subscribe'] = False
+            pool = fake_pool(args.server, config)
+        stop_server = start_server(args.server, config, pool)
+        address = args.address
+
+    try:
+        results = run(address, args.mix, args.concurrency, args.duration, args.warmup, args.catalog, args.batch_size, args.seed)
+    finally:
+        if stop_server:
+            stop_server()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+    print_results(results, baseline)
+
+    if args.json:
+        parameters = {key: value for key, value in vars(args).items() if key not in ('json', 'compare')}
+        environment = {'python': platform.python_version(), 'grpcio': grpc.__version__, 'redis': redis.__version__,
+                       'platform': platform.platform()}
+        with open(args.json, 'w') as file:
+            json.dump({'started_at': datetime.now(timezone.utc).isoformat(), 'parameters': parameters,
+                       'environment': environment, 'results': results}, file, indent=2)
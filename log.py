@@ -0,0 +1,108 @@
+import atexit
+import json
+import logging
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from random import random
+
+
+# Server events (startup, failures, ...) are logged here
+logger = logging.getLogger('inventory')
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread as they are, so message formatting happens off the request path.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Formats records as '<time> <LEVEL> <message> key=value ...'.
+    """
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(message)s', datefmt='%d/%m/%Y %H:%M:%S')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, with structured fields at the top level.
+    """
+
+    def format(self, record):
+        entry = {'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'), 'level': record.levelname,
+                 'logger': record.name, 'process': record.process, 'message': record.getMessage()}
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestLogger:
+    """
+    Logs one structured line per handled request, keeping only a sample of them.
+    Requests skipped by sampling, or below the logger's level, cost a comparison and no formatting.
+
+    Methods:
+        log: Logs the outcome of a request.
+    """
+
+    def __init__(self, name, sample_rate=1.0):
+        """
+        Args:
+            name (str): Name of the underlying logger.
+            sample_rate (float): Fraction of requests logged, 0 turns request logging off.
+        """
+        self.logger = logging.getLogger(name)
+        self.sample_rate = sample_rate
+
+
+    def log(self, method, **fields):
+        """
+        Logs the outcome of a request at INFO level.
+
+        Args:
+            method (str): Name of the RPC.
+            **fields: Structured details, e.g. product_identifier or outcome.
+        """
+        if self.sample_rate <= 0 or (self.sample_rate < 1 and random() >= self.sample_rate):
+            return
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(method, extra={'fields': fields})
+
+
+# Per-request lines are logged here
+request_log = RequestLogger('inventory.requests')
+
+
+def setup_logging(config):
+    """
+    Sends the server's logs to stdout through a queue drained by a background thread,
+    so request threads never wait on stdout.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+    """
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if config['log_format'] == 'json' else TextFormatter())
+    queue = SimpleQueue()
+    listener = QueueListener(queue, stream)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger.handlers[:] = [RecordQueueHandler(queue)]
+    logger.setLevel(config['log_level'].upper())
+    logger.propagate = False
+    request_log.sample_rate = config['log_request_sample_rate']
@@ -0,0 +1,607 @@
+import inspect
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter
+
+import grpc
+import redis
+import redis.asyncio
+
+
+# Upper bounds, in seconds, of the latency histogram buckets
+RPC_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REDIS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class Metric:
+    """
+    A family of samples sharing a name, with one child per combination of label values.
+    Children are created on first use and kept for the life of the process.
+
+    Methods:
+        labels: Returns the child for the given label values.
+        samples: Lists the family's current samples.
+    """
+
+    def __init__(self, name, description, kind, labelnames=(), child=None):
+        """
+        Args:
+            name (str): Metric name.
+            description (str): Help text.
+            kind (str): 'counter', 'gauge' or 'histogram'.
+            labelnames (tuple): Names of the labels.
+            child (callable): Builds the child holding the values for one combination of labels.
+        """
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self.labelnames = labelnames
+        self._child = child
+        self._children = {}
+        self._lock = Lock()
+        REGISTRY.register(self)
+
+
+    def labels(self, *values):
+        """
+        Returns the child for the given label values.
+
+        Args:
+            *values: One value per label name.
+
+        Returns:
+            The child, e.g. a Value or a HistogramValue.
+        """
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+
+    def samples(self):
+        """
+        Lists the family's current samples.
+
+        Returns:
+            list: (name, labels dict, value) tuples.
+        """
+        samples = []
+        for values, child in list(self._children.items()):
+            for suffix, extra, value in child.samples():
+                samples.append((self.name + suffix, {**dict(zip(self.labelnames, values)), **extra}, value))
+        return samples
+
+
+class Value:
+    """
+    Counter or gauge value, safe to update from several threads.
+
+    Methods:
+        inc: Adds to the value.
+        dec: Subtracts from the value.
+        set: Replaces the value.
+        samples: Lists the value as a sample.
+    """
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = Lock()
+
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+
+    def set(self, value):
+        self.value = value
+
+
+    def samples(self):
+        return [('', {}, self.value)]
+
+
+class HistogramValue:
+    """
+    Bucketed distribution of observations, safe to update from several threads.
+
+    Methods:
+        observe: Records an observation.
+        samples: Lists the cumulative buckets, sum and count as samples.
+    """
+
+    def __init__(self, buckets):
+        """
+        Args:
+            buckets (tuple): Sorted upper bounds of the buckets, +Inf is added.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = Lock()
+
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            samples.append(('_bucket', {'le': format_value(bound)}, cumulative))
+        samples.append(('_sum', {}, total))
+        samples.append(('_count', {}, cumulative))
+        return samples
+
+
+def counter(name, description, labelnames=()):
+    """Creates and registers a counter family."""
+    return Metric(name, description, 'counter', labelnames, Value)
+
+
+def gauge(name, description, labelnames=()):
+    """Creates and registers a gauge family."""
+    return Metric(name, description, 'gauge', labelnames, Value)
+
+
+def histogram(name, description, labelnames=(), buckets=RPC_BUCKETS):
+    """Creates and registers a histogram family with the given bucket bounds in seconds."""
+    return Metric(name, description, 'histogram', labelnames, lambda: HistogramValue(buckets))
+
+
+class Registry:
+    """
+    Holds every metric of the process and renders them in the Prometheus text format.
+
+    Methods:
+        register: Adds a metric family.
+        register_collector: Adds a callable producing samples when metrics are scraped.
+        render: Renders every metric.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = {}
+
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+
+    def register_collector(self, name, collect):
+        """
+        Adds a callable producing samples when metrics are scraped, replacing any collector of the same name.
+
+        Args:
+            name (str): Name of the collector.
+            collect (callable): Returns a list of (name, kind, description, [(labels dict, value), ...]) tuples.
+        """
+        self._collectors[name] = collect
+
+
+    def render(self):
+        """
+        Renders every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition.
+        """
+        lines = []
+        families = [(metric.name, metric.kind, metric.description, metric.samples()) for metric in self._metrics]
+        for collect in list(self._collectors.values()):
+            families += [(name, kind, description, [(name, labels, value) for labels, value in values])
+                         for name, kind, description, values in collect()]
+        for name, kind, description, samples in families:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for sample_name, labels, value in samples:
+                label_text = ','.join(f'{key}="{escape(label)}"' for key, label in labels.items())
+                lines.append(f'{sample_name}{{{label_text}}} {format_value(value)}' if label_text else
+                             f'{sample_name} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_value(value):
+    """
+    Formats a sample value, or a bucket bound, the way Prometheus expects.
+
+    Args:
+        value (float): The value.
+
+    Returns:
+        str: The formatted value.
+    """
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape(value):
+    """
+    Escapes a label value for the text format.
+
+    Args:
+        value: The label value.
+
+    Returns:
+        str: The escaped value.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Every metric of the process, exported on /metrics
+REGISTRY = Registry()
+
+RPC_DURATION = histogram('inventory_rpc_duration_seconds', 'Time taken by RPCs, until the last message for streams.', ('method',))
+RPC_IN_FLIGHT = gauge('inventory_rpc_in_flight', 'RPCs being handled.', ('method',))
+RPC_ERRORS = counter('inventory_rpc_errors_total', 'RPCs that ended with a non-OK status.', ('method', 'code'))
+REDIS_DURATION = histogram('inventory_redis_command_duration_seconds',
+                           'Time taken by Redis commands and pipelines, including the wait for a pooled connection.',
+                           ('command',), REDIS_BUCKETS)
+REDIS_ERRORS = counter('inventory_redis_errors_total', 'Redis commands and pipelines that raised an error.', ('command',))
+POOL_WAIT = histogram('inventory_redis_pool_wait_seconds', 'Time spent checking a connection out of the Redis pool.',
+                      (), REDIS_BUCKETS)
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """
+    Records the duration, in-flight count and errors of every RPC of a threaded gRPC server.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+        # Wrap each method's handler once, not on every call
+        wrapped = self._handlers.get(handler_call_details.method)
+        if wrapped is None:
+            wrapped = self._handlers[handler_call_details.method] = wrap_handler(handler, handler_call_details.method,
+                                                                                  timed, timed_stream)
+        return wrapped
+
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """
+    Records the duration, in-flight count and errors of every RPC of an asyncio gRPC server.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        wrapped = self._handlers.get(handler_call_details.method)
+        if wrapped is None:
+            wrapped = self._handlers[handler_call_details.method] = wrap_handler(handler, handler_call_details.method,
+                                                                                  async_timed, async_timed_stream)
+        return wrapped
+
+
+def wrap_handler(handler, path, unary, stream):
+    """
+    Returns a copy of a method handler whose behavior records metrics.
+
+    Args:
+        handler (grpc.RpcMethodHandler): The handler.
+        path (str): Full method path, e.g. '/InventoryService/GetProductById'.
+        unary (callable): Wraps a behavior returning a single response.
+        stream (callable): Wraps a behavior returning a response stream.
+
+    Returns:
+        grpc.RpcMethodHandler: The wrapped handler.
+    """
+    method = path.rsplit('/', 1)[-1]
+    if handler.unary_unary:
+        return handler._replace(unary_unary=unary(handler.unary_unary, method))
+    if handler.stream_unary:
+        return handler._replace(stream_unary=unary(handler.stream_unary, method))
+    # An asyncio stream written with context.write() rather than yielded, such as the health service's Watch,
+    # is a coroutine awaited like a single response
+    if handler.unary_stream:
+        behavior = handler.unary_stream
+        return handler._replace(unary_stream=(unary if inspect.iscoroutinefunction(behavior) else stream)(behavior, method))
+    behavior = handler.stream_stream
+    return handler._replace(stream_stream=(unary if inspect.iscoroutinefunction(behavior) else stream)(behavior, method))
+
+
+class MethodMetrics:
+    """
+    Metrics of one RPC method, looked up once so each call only updates them.
+
+    Methods:
+        begin: Records the start of a call.
+        end: Records the end of a call.
+    """
+
+    def __init__(self, method):
+        """
+        Args:
+            method (str): Name of the RPC method.
+        """
+        self.method = method
+        self.duration = RPC_DURATION.labels(method)
+        self.in_flight = RPC_IN_FLIGHT.labels(method)
+
+
+    def begin(self):
+        """
+        Records the start of a call.
+
+        Returns:
+            float: Start time to pass to end().
+        """
+        self.in_flight.inc()
+        return perf_counter()
+
+
+    def end(self, start, context, error):
+        """
+        Records the duration of a call and, unless it ended OK, its status code.
+
+        Args:
+            start (float): Value returned by begin().
+            context (grpc.ServicerContext): Context of the call.
+            error (bool): Whether the handler raised.
+        """
+        self.duration.observe(perf_counter() - start)
+        self.in_flight.dec()
+        code = context.code()
+        if error and code is None:
+            code = grpc.StatusCode.UNKNOWN
+        if code is not None and code != grpc.StatusCode.OK:
+            RPC_ERRORS.labels(self.method, getattr(code, 'name', code)).inc()
+
+
+def timed(behavior, method):
+    tracked = MethodMetrics(method)
+    def wrapper(request, context):
+        start = tracked.begin()
+        error = True
+        try:
+            response = behavior(request, context)
+            error = False
+            return response
+        finally:
+            tracked.end(start, context, error)
+    return wrapper
+
+
+def timed_stream(behavior, method):
+    tracked = MethodMetrics(method)
+    def wrapper(request, context):
+        start = tracked.begin()
+        error = True
+        try:
+            yield from behavior(request, context)
+            error = False
+        except GeneratorExit: # Cancelled by the client
+            error = False
+            raise
+        finally:
+            tracked.end(start, context, error)
+    return wrapper
+
+
+def async_timed(behavior, method):
+    tracked = MethodMetrics(method)
+    async def wrapper(request, context):
+        start = tracked.begin()
+        error = True
+        try:
+            response = await behavior(request, context)
+            error = False
+            return response
+        finally:
+            tracked.end(start, context, error)
+    return wrapper
+
+
+def async_timed_stream(behavior, method):
+    # Handlers that write with context.write() are coroutines rather than async generators
+    if not inspect.isasyncgenfunction(behavior):
+        return async_timed(behavior, method)
+    tracked = MethodMetrics(method)
+    async def wrapper(request, context):
+        start = tracked.begin()
+        error = True
+        try:
+            async for response in behavior(request, context):
+                yield response
+            error = False
+        except GeneratorExit:
+            error = False
+            raise
+        finally:
+            tracked.end(start, context, error)
+    return wrapper
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    Redis client that records the duration and errors of each command and pipeline.
+    """
+
+    def execute_command(self, *args, **options):
+        start = perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        except redis.exceptions.NoScriptError: # Scripts load themselves and retry
+            raise
+        except redis.RedisError:
+            REDIS_ERRORS.labels(args[0]).inc()
+            raise
+        finally:
+            REDIS_DURATION.labels(args[0]).observe(perf_counter() - start)
+
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    """
+    Pipeline that records the duration and errors of each round trip as a 'PIPELINE' command.
+    """
+
+    def execute(self, raise_on_error=True):
+        start = perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        except redis.RedisError:
+            REDIS_ERRORS.labels('PIPELINE').inc()
+            raise
+        finally:
+            REDIS_DURATION.labels('PIPELINE').observe(perf_counter() - start)
+
+
+class AsyncInstrumentedRedis(redis.asyncio.Redis):
+    """
+    Asyncio Redis client that records the duration and errors of each command and pipeline.
+    """
+
+    async def execute_command(self, *args, **options):
+        start = perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except redis.exceptions.NoScriptError: # Scripts load themselves and retry
+            raise
+        except redis.RedisError:
+            REDIS_ERRORS.labels(args[0]).inc()
+            raise
+        finally:
+            REDIS_DURATION.labels(args[0]).observe(perf_counter() - start)
+
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return AsyncInstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class AsyncInstrumentedPipeline(redis.asyncio.client.Pipeline):
+    """
+    Asyncio pipeline that records the duration and errors of each round trip as a 'PIPELINE' command.
+    """
+
+    async def execute(self, raise_on_error=True):
+        start = perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        except redis.RedisError:
+            REDIS_ERRORS.labels('PIPELINE').inc()
+            raise
+        finally:
+            REDIS_DURATION.labels('PIPELINE').observe(perf_counter() - start)
+
+
+def time_pool_waits(pool):
+    """
+    Records how long callers wait to check a connection out of a pool,
+    which is where handlers queue when Redis is the bottleneck.
+
+    Args:
+        pool: Threaded or asyncio connection pool, instrumented in place.
+    """
+    if getattr(pool, 'pool_waits_timed', False):
+        return
+    get_connection = pool.get_connection
+    observe = POOL_WAIT.labels().observe
+    if inspect.iscoroutinefunction(get_connection):
+        async def timed_get_connection(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return await get_connection(*args, **kwargs)
+            finally:
+                observe(perf_counter() - start)
+    else:
+        def timed_get_connection(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return get_connection(*args, **kwargs)
+            finally:
+                observe(perf_counter() - start)
+    pool.get_connection = timed_get_connection
+    pool.pool_waits_timed = True
+
+
+def register_servicer(servicer):
+    """
+    Exports the connection pool and cache usage of a servicer when metrics are scraped.
+
+    Args:
+        servicer: server.InventoryServiceServicer or aio_server.AsyncInventoryServiceServicer.
+    """
+    def collect():
+        pool, cache = servicer.pool_stats(), servicer.cache.stats()
+        families = [('inventory_cache_size', 'gauge', 'Products held by the cache.', [({}, cache['size'])])]
+        families += [(f'inventory_cache_{name}_total', 'counter', f'Cache {name}.', [({}, cache[name])])
+                     for name in ('hits', 'misses', 'evictions', 'invalidations')]
+        if pool: # No pool with in-process storage
+            families += [
+                ('inventory_redis_pool_connections', 'gauge', 'Redis connections by state.',
+                 [({'state': 'idle'}, pool['idle_connections']), ({'state': 'in_use'}, pool['in_use_connections'])]),
+                ('inventory_redis_pool_max_connections', 'gauge', 'Size limit of the Redis connection pool.',
+                 [({}, pool['max_connections'])]),
+            ]
+        return families
+    REGISTRY.register_collector('servicer', collect)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves REGISTRY on GET /metrics.
+    """
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        # Scrapes are not worth a log line each
+        pass
+
+
+def start_http_server(host, port):
+    """
+    Serves /metrics over HTTP on a background thread.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on.
+
+    Returns:
+        ThreadingHTTPServer: The HTTP server, shut down with shutdown().
+    """
+    http_server = ThreadingHTTPServer((host, port), MetricsHandler)
+    http_server.daemon_threads = True
+    Thread(target=http_server.serve_forever, name='metrics-http', daemon=True).start()
+    return http_server
@@ -0,0 +1,243 @@
+import argparse
+import random
+import time
+
+import redis
+import inventory_pb2
+from config import load_config
+from server import create_pools, shard_names
+from storage import STATS_FIELDS, CompactRedisStorage, RedisStorage, ShardedStorage
+
+
+def open_storage(config, encoding, pool=None, prefix=None):
+    """
+    Opens the Redis storage for one encoding, sharded over redis_shards when set.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+        encoding (str): 'hash' or 'compact'.
+        pool (redis.ConnectionPool): Connection pool matching the encoding, built from config if None.
+        prefix (str): Key namespace, config['redis_key_prefix'] if None.
+
+    Returns:
+        storage.Storage: The storage.
+    """
+    pools = [pool] if pool is not None else create_pools(dict(config, redis_encoding=encoding))
+    prefix = prefix if prefix is not None else config['redis_key_prefix']
+    shards = []
+    for shard_pool in pools:
+        client = redis.Redis(connection_pool=shard_pool)
+        if encoding == 'compact':
+            shards.append(CompactRedisStorage(client, config['redis_bucket_size'], prefix, config['changes_max_length']))
+        else:
+            shards.append(RedisStorage(client, prefix, config['changes_max_length']))
+    return shards[0] if len(shards) == 1 else ShardedStorage(shards, shard_names(config, len(shards)))
+
+
+def migrate(source, target, batch_size, keep_source=False):
+    """
+    Copies every product from one storage to another, one batch at a time, then deletes the originals.
+    The target builds its indexes as the products are added.
+    Products that already exist in the target are left as they are, so an interrupted migration can be run again.
+    Run it while no server is writing, since writes to the source during the copy could be lost.
+
+    Args:
+        source (storage.Storage): Storage to read.
+        target (storage.Storage): Storage to write.
+        batch_size (int): Products per round trip.
+        keep_source (bool): Leave the originals in place.
+
+    Returns:
+        tuple: Numbers of products copied and of products skipped because the target already had them.
+    """
+    copied = skipped = 0
+    batch = []
+    def flush():
+        nonlocal copied, skipped
+        added = target.add_many(batch)
+        copied += sum(added)
+        skipped += len(added) - sum(added)
+        if not keep_source:
+            source.delete_many([product.product_identifier for product in batch])
+        batch.clear()
+
+    for product in source.scan(batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return copied, skipped
+
+
+def rebalance(storage, batch_size):
+    """
+    Moves every product to the shard the hash ring now assigns it, after redis_shards gained or lost a server.
+    Only the products whose shard changed are moved, about 1/n of them when an nth server is added.
+    Run it while no server is writing, since writes to a product being moved could be lost.
+
+    Args:
+        storage (storage.ShardedStorage): The sharded storage, opened with the new redis_shards.
+        batch_size (int): Products per round trip.
+
+    Returns:
+        int: Number of products moved.
+    """
+    moved = 0
+    for index, shard in enumerate(storage.shards):
+        batch = []
+        def flush():
+            nonlocal moved
+            # A product the owner already holds is a copy left by an interrupted run, so only the stray one is deleted
+            storage.add_many(batch)
+            shard.delete_many([product.product_identifier for product in batch])
+            moved += len(batch)
+            batch.clear()
+
+        for product in shard.scan(batch_size):
+            if storage.ring.index(product.product_identifier) != index:
+                batch.append(product)
+                if len(batch) >= batch_size:
+                    flush()
+        if batch:
+            flush()
+    return moved
+
+
+def rebuild_stats(storage, batch_size):
+    """
+    Recomputes the totals behind GetInventoryStats from the products, on each shard. Needed once for a catalog
+    written before the totals were kept, and clears the rounding the total value picks up over many writes.
+    Run it while no server is writing, since a write during the scan could be counted twice or not at all.
+
+    Args:
+        storage (storage.Storage): The Redis storage, sharded or not.
+        batch_size (int): Products per round trip.
+
+    Returns:
+        int: Number of products counted.
+    """
+    counted = 0
+    for shard in storage.shards if isinstance(storage, ShardedStorage) else [storage]:
+        totals = dict.fromkeys(STATS_FIELDS, 0)
+        for product in shard.scan(batch_size):
+            totals['products'] += 1
+            totals['quantity'] += product.product_quantity
+            totals['value'] += product.product_quantity * product.product_price
+        shard.redis.hset(shard.stats_key, mapping=totals)
+        counted += totals['products']
+    return counted
+
+
+def used_memory(client):
+    """
+    Reads redis-server's memory use.
+
+    Args:
+        client (redis.Redis): Client connected to the server.
+
+    Returns:
+        int: Bytes in use, None if the server does not report it.
+    """
+    try:
+        return client.info('memory')['used_memory']
+    except redis.ResponseError:
+        return None
+
+
+def compare(config, products, reads, batch_size):
+    """
+    Measures Redis memory and read throughput of both encodings on an empty database.
+    The database is flushed after each encoding.
+
+    Args:
+        config (dict): Server settings, see config.load_config(). redis_db must name an empty scratch database.
+        products (int): Catalog size.
+        reads (int): Single-product reads to time.
+        batch_size (int): Products per batch read and per round trip while loading.
+
+    Returns:
+        dict: For each encoding, bytes per product and reads, batch reads and scanned products per second.
+    """
+    results = {}
+    catalog = [inventory_pb2.Product(product_identifier=pid, product_name=f'Product {pid}', product_quantity=100, product_price=9.99)
+               for pid in range(products)]
+    identifiers = [random.randrange(products) for i in range(reads)]
+    for encoding in ('hash', 'compact'):
+        # One redis-server's memory is measured, so shards are ignored
+        storage = open_storage(dict(config, redis_shards=None), encoding)
+        if storage.redis.dbsize():
+            raise SystemExit(f'Database {config["redis_db"]} is not empty, pick an empty scratch database with INVENTORY_REDIS_DB.')
+        before = used_memory(storage.redis)
+        for start in range(0, products, batch_size):
+            storage.add_many(catalog[start:start + batch_size])
+        after = used_memory(storage.redis)
+
+        start = time.perf_counter()
+        for product_identifier in identifiers:
+            storage.get(product_identifier)
+        get_rate = reads / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for offset in range(0, reads, batch_size):
+            storage.get_many(identifiers[offset:offset + batch_size])
+        get_many_rate = reads / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        scanned = sum(1 for product in storage.scan(batch_size))
+        scan_rate = scanned / (time.perf_counter() - start)
+
+        storage.redis.flushdb()
+        results[encoding] = {'bytes_per_product': (after - before) / products if before is not None else None,
+                             'get_per_s': get_rate, 'get_many_per_s': get_many_rate, 'scan_per_s': scan_rate}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the Redis product encoding or key namespace, rebalance shards, or compare the encodings.')
+    parser.add_argument('--to', choices=['hash', 'compact'], help='encoding to convert every product to')
+    parser.add_argument('--from', dest='source', choices=['hash', 'compact'],
+                        help='encoding to convert from, by default the other one, or the --to one when only --from-prefix differs')
+    parser.add_argument('--from-prefix', help='key prefix to convert from, INVENTORY_REDIS_KEY_PREFIX by default. '
+                                              'Pass "" to move products written before keys were namespaced')
+    parser.add_argument('--keep-source', action='store_true', help='leave the products in the old encoding in place')
+    parser.add_argument('--rebalance', action='store_true',
+                        help='move products to the shard INVENTORY_REDIS_SHARDS assigns them, after adding or removing a server')
+    parser.add_argument('--rebuild-stats', action='store_true',
+                        help='recompute the totals behind GetInventoryStats, once for a catalog stored before they were kept')
+    parser.add_argument('--compare', action='store_true', help='compare memory and read throughput on an empty scratch database')
+    parser.add_argument('--products', type=int, default=100000, help='catalog size for --compare')
+    parser.add_argument('--reads', type=int, default=20000, help='reads timed by --compare')
+    parser.add_argument('--batch-size', type=int, default=500, help='products per round trip')
+    args = parser.parse_args()
+    config = load_config()
+
+    if args.rebalance:
+        storage = open_storage(config, config['redis_encoding'])
+        if not isinstance(storage, ShardedStorage):
+            parser.error('--rebalance needs INVENTORY_REDIS_SHARDS to list at least two servers')
+        print(f'Moved {rebalance(storage, args.batch_size)} products to their new shard.')
+    elif args.rebuild_stats:
+        print(f'Counted {rebuild_stats(open_storage(config, config["redis_encoding"]), args.batch_size)} products.')
+    elif args.compare:
+        print(f'{"encoding":>10} {"bytes/product":>14} {"get/s":>10} {"batch get/s":>12} {"scan/s":>10}')
+        for encoding, result in compare(config, args.products, args.reads, args.batch_size).items():
+            size = f'{result["bytes_per_product"]:.0f}' if result['bytes_per_product'] is not None else 'n/a'
+            print(f'{encoding:>10} {size:>14} {result["get_per_s"]:>10.0f} {result["get_many_per_s"]:>12.0f} {result["scan_per_s"]:>10.0f}')
+    elif args.to:
+        source_prefix = args.from_prefix if args.from_prefix is not None else config['redis_key_prefix']
+        if args.source is not None:
+            source_encoding = args.source
+        elif source_prefix != config['redis_key_prefix']:
+            source_encoding = args.to
+        else:
+            source_encoding = 'compact' if args.to == 'hash' else 'hash'
+        if (source_encoding, source_prefix) == (args.to, config['redis_key_prefix']):
+            parser.error('the source and target are the same, change --from or --from-prefix')
+        source = open_storage(config, source_encoding, prefix=source_prefix)
+        target = open_storage(config, args.to)
+        copied, skipped = migrate(source, target, args.batch_size, args.keep_source)
+        print(f'Copied {copied} products to the {args.to} encoding, {skipped} were already there.')
+        print(f'Set INVENTORY_REDIS_ENCODING={args.to} on every server.')
+    else:
+        parser.error('pass --to, --rebalance, --rebuild-stats or --compare')
@@ -1,17 +1,595 @@
+import inspect
+import signal
+from base64 import b64decode, b64encode, urlsafe_b64decode, urlsafe_b64encode
 from concurrent import futures
-from datetime import datetime
-from threading import Semaphore
+from contextvars import ContextVar
+from functools import wraps
+from os import getpid
+from queue import Empty, Full, Queue
+from threading import BoundedSemaphore, Event, Lock, Thread
+from time import monotonic, sleep
 
 import redis
 import grpc
+from grpc_health.v1 import health_pb2_grpc
 import inventory_pb2
 import inventory_pb2_grpc
+import metrics
+from breaker import DEADLINE, CircuitBreaker, CircuitOpenError, guard_pool
+from cache import ProductCache
+from config import load_config, parse_settings
+from health import Readiness
+from log import logger, request_log, setup_logging
+from storage import (ADJUST_APPLIED, ADJUST_NOT_FOUND, ADJUST_OUT_OF_RANGE, ADJUST_REJECTED, CHANGE_ADDED, CHANGE_DELETED, CHANGE_QUANTITY, QUANTITY_RANGE,
+                     REQUEST_PENDING, CompactRedisStorage, MemoryStorage, RedisStorage, ShardedStorage, async_run_plan, name_identifier, name_position,
+                     offset_key, run_plan)
 
 
-# Global lock (allows one thread access)
-LOCK = Semaphore(1)
+# Redis errors that mean the redis-server could not be reached in time, reported as UNAVAILABLE (or DEADLINE_EXCEEDED)
+REDIS_UNAVAILABLE = (redis.ConnectionError, redis.TimeoutError)
 
-class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
+# Logged when a handler cannot reach Redis
+REDIS_DOWN = '%s failed, cannot reach redis-server: %s'
+
+# Details of the NOT_FOUND and ALREADY_EXISTS statuses, and of the matching batch results
+PRODUCT_NOT_FOUND = "Product does not exist."
+PRODUCT_EXISTS = "Product already exists and was NOT added."
+
+# Marks the end of a StreamQuantities request stream
+END_OF_STREAM = object()
+
+# Pages of products one ListProducts call may read, so a selective filter returns a short page
+# with a continuation token instead of walking the whole catalog in one call
+LIST_MAX_READS = 10
+
+# Metadata key of the optional request ID that makes a write safe to retry: a repeated ID gets the first call's response
+REQUEST_ID_METADATA = 'request-id'
+REQUEST_ID_MAX_LENGTH = 128  # Characters of the ID that count, longer IDs are cut
+
+# Seconds a request ID stays claimed while its call runs, retries meanwhile are told to wait
+REQUEST_PENDING_TTL = 30
+
+# Request ID the current call's write has claimed but saved no outcome for yet, see claims_request()
+CLAIMED_REQUEST = ContextVar('claimed_request', default=None)
+
+# Saved in place of a response when a write sent with a request ID failed: REQUEST_FAILED<status code>:<details>,
+# so retries get the same error. Saved responses are base64 and never start with it
+REQUEST_FAILED = '!'
+
+# gRPC compression algorithm for each compression setting
+COMPRESSION = {'none': grpc.Compression.NoCompression, 'gzip': grpc.Compression.Gzip, 'deflate': grpc.Compression.Deflate}
+
+# Longest a WatchInventory call sleeps between reads of the change log when no notification arrives
+WATCH_POLL_SECONDS = 1.0
+
+# Milliseconds the change notifier blocks on the change log per read, kept below redis_socket_timeout
+NOTIFIER_BLOCK_MS = 1000
+
+# ChangeEvent operation for each storage CHANGE_* operation
+CHANGE_OPERATIONS = {CHANGE_ADDED: inventory_pb2.ChangeEvent.ADDED, CHANGE_QUANTITY: inventory_pb2.ChangeEvent.QUANTITY_CHANGED,
+                     CHANGE_DELETED: inventory_pb2.ChangeEvent.DELETED}
+
+
+class CompressionInterceptor(grpc.ServerInterceptor):
+    """
+    Compresses the responses of chosen RPCs of a threaded gRPC server with their own algorithm,
+    instead of the server's default compression.
+    """
+
+    def __init__(self, methods):
+        """
+        Args:
+            methods (dict): grpc.Compression of each chosen RPC, by name, see compression_methods().
+        """
+        self.methods = methods
+        self._handlers = {}
+
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        compression = self.methods.get(handler_call_details.method.rsplit('/', 1)[-1])
+        if handler is None or compression is None:
+            return handler
+        # Wrap each method's handler once, not on every call
+        wrapped = self._handlers.get(handler_call_details.method)
+        if wrapped is None:
+            def compressed(behavior, method):
+                def compressed_behavior(request, context):
+                    context.set_compression(compression)
+                    return behavior(request, context)
+                return compressed_behavior
+            wrapped = self._handlers[handler_call_details.method] = metrics.wrap_handler(handler, handler_call_details.method,
+                                                                                          compressed, compressed)
+        return wrapped
+
+
+class DeadlineInterceptor(grpc.ServerInterceptor):
+    """
+    Passes each call's deadline to the Redis connections it uses, see breaker.DEADLINE, so a call stops waiting
+    on Redis once its client has given up instead of holding a worker thread for the full socket timeout.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+        wrapped = self._handlers.get(handler_call_details.method)
+        if wrapped is None:
+            wrapped = self._handlers[handler_call_details.method] = metrics.wrap_handler(handler, handler_call_details.method,
+                                                                                          self._with_deadline, self._with_deadline)
+        return wrapped
+
+
+    def _with_deadline(self, behavior, method):
+        def deadline_behavior(request, context):
+            # Set on every call, since the worker thread still holds the previous call's deadline
+            DEADLINE.set(monotonic() + context.time_remaining())
+            return behavior(request, context)
+        return deadline_behavior
+
+
+def claims_request(handler):
+    """
+    Decorates a write handler that claims its request ID with replayed(). If the call ends without saving an outcome,
+    because Redis could not be reached, the deadline passed or the handler raised, the ID is released, so a retry
+    goes ahead instead of being refused with ABORTED until the claim expires. Works on coroutine handlers too.
+
+    Args:
+        handler (callable): The servicer method.
+
+    Returns:
+        callable: The decorated method.
+    """
+    if inspect.iscoroutinefunction(handler):
+        @wraps(handler)
+        async def released_on_failure(self, request, context):
+            claim = CLAIMED_REQUEST.set(None)
+            try:
+                return await handler(self, request, context)
+            finally:
+                key = CLAIMED_REQUEST.get()
+                CLAIMED_REQUEST.reset(claim)
+                if key is not None:
+                    await async_run_plan(self.release(key))
+        return released_on_failure
+    
+    @wraps(handler)
+    def released_on_failure(self, request, context):
+        # Reset on every call, since the worker thread still holds the previous call's claim
+        claim = CLAIMED_REQUEST.set(None)
+        try:
+            return handler(self, request, context)
+        finally:
+            key = CLAIMED_REQUEST.get()
+            CLAIMED_REQUEST.reset(claim)
+            if key is not None:
+                run_plan(self.release(key))
+    return released_on_failure
+
+
+class InventoryPlans:
+    """
+    What the inventory servicers do, shared by InventoryServiceServicer and aio_server.AsyncInventoryServiceServicer.
+    Methods are plans, see storage.run_plan(), yielding every storage call and abort they make: the threaded servicer
+    runs them with run_plan() and the asyncio one awaits the calls with async_run_plan().
+    Expects the config, cache and storage of the servicer it is mixed into.
+
+    Methods:
+        replayed: Finds the response already sent for a write's request ID.
+        remember: Saves the response to a write's request ID.
+        save: Saves the outcome of a write's request ID.
+        release: Releases the request ID of a write that failed.
+        fail: Aborts a call whose request cannot be carried out.
+        unavailable: Aborts a call that could not reach Redis.
+        apply_quantities: Sets the quantities of several products.
+        import_batch: Adds one batch of an import.
+        add_product ... get_inventory_stats: The unary RPCs, run by the servicer methods of the same names in CamelCase.
+    """
+
+    def replayed(self, context, method, response_class):
+        """
+        Makes a write sent with a request ID run once. The first call claims the ID and goes ahead,
+        a retry gets the response saved by remember(), or the error saved by fail(), and a retry while the first call runs
+        is aborted with ABORTED. Writes without a request ID always go ahead.
+
+        Args:
+            context (grpc.ServicerContext): Context of the gRPC call.
+            method (str): Name of the RPC, so the same ID sent to different RPCs does not collide.
+            response_class (type): Message class of the RPC's response.
+
+        Returns:
+            The saved response, None if the write should go ahead.
+        """
+        key = request_key(context, method)
+        if key is None:
+            return None
+        saved = yield self.storage.claim_request(key, REQUEST_PENDING_TTL)
+        if saved == REQUEST_PENDING:
+            yield context.abort(grpc.StatusCode.ABORTED, 'A call with this request ID is still running, retry later.')
+        if saved is not None:
+            request_log.log(method, outcome='replayed')
+            if saved.startswith(REQUEST_FAILED):
+                code, _, details = saved[len(REQUEST_FAILED):].partition(':')
+                yield context.abort(grpc.StatusCode[code], details)
+            return response_class.FromString(b64decode(saved))
+        CLAIMED_REQUEST.set(key)
+        return None
+    
+    
+    def remember(self, context, method, response):
+        """
+        Saves the response to a write sent with a request ID, for retries to get. 
+
+        Args:
+            context (grpc.ServicerContext): Context of the gRPC call.
+            method (str): Name of the RPC.
+            response: The response message.
+
+        Returns:
+            The response.
+        """
+        yield from self.save(context, method, b64encode(response.SerializeToString()).decode())
+        return response
+    
+    
+    def save(self, context, method, saved):
+        """
+        Saves the outcome of a write sent with a request ID. The write has been carried out,
+        so a failure to save is logged rather than reported. Saving is tried once more past the call's deadline,
+        since a claim left to expire would let a retry apply the write again.
+
+        Args:
+            context (grpc.ServicerContext): Context of the gRPC call.
+            method (str): Name of the RPC.
+            saved (str): The encoded response, or REQUEST_FAILED and the error.
+        """
+        key = request_key(context, method)
+        if key is None:
+            return
+        CLAIMED_REQUEST.set(None)
+        try:
+            yield self.storage.save_request(key, saved, self.config['request_id_ttl'])
+            return
+        except REDIS_UNAVAILABLE:
+            DEADLINE.set(None)
+        try:
+            yield self.storage.save_request(key, saved, self.config['request_id_ttl'])
+        except REDIS_UNAVAILABLE as error:
+            logger.error('%s applied, but its response could not be saved, a retry after %ss may apply it again: %s',
+                         method, REQUEST_PENDING_TTL, error)
+
+
+    def release(self, key):
+        """
+        Releases the request ID of a write that failed before saving an outcome, see claims_request().
+        Tried past the call's deadline, which may be why the write failed.
+
+        Args:
+            key (str): The request ID, as claimed.
+        """
+        DEADLINE.set(None)
+        try:
+            yield self.storage.release_request(key)
+        except REDIS_UNAVAILABLE as error:
+            logger.warning('Cannot release request ID %s, retries are refused for up to %ss: %s', key, REQUEST_PENDING_TTL, error)
+    
+    
+    def fail(self, context, method, code, details):
+        """
+        Aborts a call whose request cannot be carried out, such as a write to a product that does not exist.
+        The error is saved like a response, so a retry with the same request ID gets it too.
+
+        Args:
+            context (grpc.ServicerContext): Context of the gRPC call.
+            method (str): Name of the RPC.
+            code (grpc.StatusCode): Status of the call.
+            details (str): What went wrong.
+        """
+        yield from self.save(context, method, f'{REQUEST_FAILED}{code.name}:{details}')
+        yield context.abort(code, details)
+    
+    
+    def unavailable(self, context, method, error, details='Cannot reach Redis, retry later.'):
+        """
+        Aborts a call that could not reach Redis in time: with DEADLINE_EXCEEDED if the call's deadline has passed,
+        otherwise with UNAVAILABLE, which clients may retry. Calls failed fast by an open circuit are only logged
+        at debug level, since the circuit breaker has already logged why.
+
+        Args:
+            context (grpc.ServicerContext): Context of the gRPC call.
+            method (str): Name of the RPC.
+            error (redis.RedisError): The connection error or timeout.
+            details (str): Message of the UNAVAILABLE status.
+        """
+        if isinstance(error, CircuitOpenError):
+            logger.debug(REDIS_DOWN, method, error)
+        else:
+            logger.error(REDIS_DOWN, method, error)
+        # grpc.aio reports no time remaining for calls without a deadline
+        remaining = context.time_remaining()
+        if remaining is not None and remaining <= 0:
+            yield context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, 'Deadline exceeded while waiting for Redis.')
+        yield context.abort(grpc.StatusCode.UNAVAILABLE, details)
+
+
+    def apply_quantities(self, quantities):
+        """
+        Sets the quantities of several products in a single storage batch.
+
+        Args:
+            quantities (list of inventory_pb2.Quantity): IDs and new quantities of the products.
+
+        Returns:
+            list of inventory_pb2.ProductResult: Outcome for each update, with the updated product when found.
+        """
+        products = yield self.storage.set_quantities([(quantity.product_identifier, quantity.product_quantity) for quantity in quantities])
+        for quantity in quantities:
+            self.cache.invalidate(quantity.product_identifier)
+        return [product_result(quantity.product_identifier, product, "Product found, quantity updated.")
+                for quantity, product in zip(quantities, products)]
+
+
+    def import_batch(self, summary, request):
+        """
+        Adds one batch of an import, leaving products that already exist as they are.
+
+        Args:
+            summary (inventory_pb2.ImportSummary): Counts of the import so far, updated with the batch's.
+            request (inventory_pb2.ProductList): The batch.
+        """
+        valid = [product for product in request.products if product.product_identifier >= 0]
+        count_import(summary, request.products, (yield self.storage.add_many(valid)))
+        for product in valid:
+            self.cache.invalidate(product.product_identifier)
+
+
+    def add_product(self, request, context):
+        if request.product_identifier < 0:
+            yield context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Cannot have a Product ID less than 0.")
+        try:
+            replayed = yield from self.replayed(context, 'AddProduct', inventory_pb2.Status)
+            if replayed is not None:
+                return replayed
+            # Add product if the ID is free
+            added = yield self.storage.add(request)
+            self.cache.invalidate(request.product_identifier)
+            request_log.log('AddProduct', product_identifier=request.product_identifier, outcome='added' if added else 'exists')
+            if not added:
+                yield from self.fail(context, 'AddProduct', grpc.StatusCode.ALREADY_EXISTS, PRODUCT_EXISTS)
+            return (yield from self.remember(context, 'AddProduct', inventory_pb2.Status(status="Product successfully added.")))
+            
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'AddProduct', error)
+
+
+    def get_product_by_id(self, request, context):
+        try:
+            # Serve hot products from the cache
+            product = self.cache.get(request.product_identifier)
+            if product is not None:
+                request_log.log('GetProductById', product_identifier=request.product_identifier, outcome='found', cached=True)
+                return product
+            
+            token = self.cache.token()
+            product = yield self.storage.get(request.product_identifier)
+            request_log.log('GetProductById', product_identifier=request.product_identifier, outcome='found' if product else 'not_found')
+            if product is None:
+                yield context.abort(grpc.StatusCode.NOT_FOUND, PRODUCT_NOT_FOUND)
+            self.cache.put(request.product_identifier, product, token)
+            return product
+           
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'GetProductById', error)
+
+
+    def update_product_quantity(self, request, context):
+        try:
+            replayed = yield from self.replayed(context, 'UpdateProductQuantity', inventory_pb2.Product)
+            if replayed is not None:
+                return replayed
+            # Locate, update quantity, and return product in one atomic step
+            product = yield self.storage.set_quantity(request.product_identifier, request.product_quantity)
+            self.cache.invalidate(request.product_identifier)
+            request_log.log('UpdateProductQuantity', product_identifier=request.product_identifier, outcome='updated' if product else 'not_found')
+            if product is None:
+                yield from self.fail(context, 'UpdateProductQuantity', grpc.StatusCode.NOT_FOUND, PRODUCT_NOT_FOUND)
+            return (yield from self.remember(context, 'UpdateProductQuantity', product))
+            
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'UpdateProductQuantity', error)
+
+
+    def adjust_product_quantity(self, request, context):
+        try:
+            replayed = yield from self.replayed(context, 'AdjustProductQuantity', inventory_pb2.ProductResult)
+            if replayed is not None:
+                return replayed
+            outcome, product = yield self.storage.adjust(*adjustment_args(request))
+            self.cache.invalidate(request.product_identifier)
+            
+            request_log.log('AdjustProductQuantity', product_identifier=request.product_identifier, delta=request.delta, 
+                            success=outcome == ADJUST_APPLIED)
+            if outcome == ADJUST_NOT_FOUND:
+                yield from self.fail(context, 'AdjustProductQuantity', grpc.StatusCode.NOT_FOUND, PRODUCT_NOT_FOUND)
+            return (yield from self.remember(context, 'AdjustProductQuantity', adjustment_result(request, outcome, product)))
+        
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'AdjustProductQuantity', error)
+
+
+    def delete_product(self, request, context):
+        try:
+            replayed = yield from self.replayed(context, 'DeleteProduct', inventory_pb2.Status)
+            if replayed is not None:
+                return replayed
+            deleted = yield self.storage.delete(request.product_identifier)
+            self.cache.invalidate(request.product_identifier)
+            request_log.log('DeleteProduct', product_identifier=request.product_identifier, outcome='deleted' if deleted else 'not_found')
+            if not deleted:
+                yield from self.fail(context, 'DeleteProduct', grpc.StatusCode.NOT_FOUND, "Product does not exist and was NOT deleted.")
+            return (yield from self.remember(context, 'DeleteProduct', inventory_pb2.Status(status="Product successfully deleted.")))
+        
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'DeleteProduct', error)
+
+
+    def add_products(self, request, context):
+        try:
+            replayed = yield from self.replayed(context, 'AddProducts', inventory_pb2.ProductResultList)
+            if replayed is not None:
+                return replayed
+            # Atomically add every valid product
+            valid = [product for product in request.products if product.product_identifier >= 0]
+            results = add_results(request.products, (yield self.storage.add_many(valid)))
+            for product in valid:
+                self.cache.invalidate(product.product_identifier)
+                    
+            request_log.log('AddProducts', items=len(results), succeeded=sum(result.success for result in results))
+            return (yield from self.remember(context, 'AddProducts', inventory_pb2.ProductResultList(results=results)))
+        
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'AddProducts', error)
+
+
+    def get_products_by_ids(self, request, context):
+        try:
+            # Serve cached products, read the rest in one round trip
+            cached = {product_identifier: self.cache.get(product_identifier) for product_identifier in request.product_identifiers}
+            missing = [product_identifier for product_identifier, product in cached.items() if product is None]
+            token = self.cache.token()
+            for product_identifier, product in zip(missing, (yield self.storage.get_many(missing))):
+                if product is not None:
+                    cached[product_identifier] = product
+                    self.cache.put(product_identifier, product, token)
+            
+            results = [product_result(product_identifier, cached[product_identifier], "Product found.")
+                       for product_identifier in request.product_identifiers]
+            
+            request_log.log('GetProductsByIds', items=len(results), succeeded=sum(result.success for result in results))
+            return inventory_pb2.ProductResultList(results=results)
+        
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'GetProductsByIds', error)
+
+
+    def update_quantities(self, request, context):
+        try:
+            replayed = yield from self.replayed(context, 'UpdateQuantities', inventory_pb2.ProductResultList)
+            if replayed is not None:
+                return replayed
+            results = yield from self.apply_quantities(request.quantities)
+            
+            request_log.log('UpdateQuantities', items=len(results), succeeded=sum(result.success for result in results))
+            return (yield from self.remember(context, 'UpdateQuantities', inventory_pb2.ProductResultList(results=results)))
+        
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'UpdateQuantities', error)
+
+
+    def adjust_quantities(self, request, context):
+        try:
+            replayed = yield from self.replayed(context, 'AdjustQuantities', inventory_pb2.ProductResultList)
+            if replayed is not None:
+                return replayed
+            outcomes = yield self.storage.adjust_many([adjustment_args(adjustment) for adjustment in request.adjustments])
+            results = [adjustment_result(adjustment, *outcome) for adjustment, outcome in zip(request.adjustments, outcomes)]
+            for adjustment in request.adjustments:
+                self.cache.invalidate(adjustment.product_identifier)
+            
+            request_log.log('AdjustQuantities', items=len(results), succeeded=sum(result.success for result in results))
+            return (yield from self.remember(context, 'AdjustQuantities', inventory_pb2.ProductResultList(results=results)))
+        
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'AdjustQuantities', error)
+
+
+    def delete_products(self, request, context):
+        try:
+            replayed = yield from self.replayed(context, 'DeleteProducts', inventory_pb2.ProductResultList)
+            if replayed is not None:
+                return replayed
+            results = delete_results(request.product_identifiers, (yield self.storage.delete_many(list(request.product_identifiers))))
+            for product_identifier in request.product_identifiers:
+                self.cache.invalidate(product_identifier)
+            
+            request_log.log('DeleteProducts', items=len(results), succeeded=sum(result.success for result in results))
+            return (yield from self.remember(context, 'DeleteProducts', inventory_pb2.ProductResultList(results=results)))
+        
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'DeleteProducts', error)
+
+
+    def find_products_by_name(self, request, context):
+        try:
+            products = yield self.storage.find_by_name(request.prefix, query_limit(request.limit, self.config['query_max_results']))
+            request_log.log('FindProductsByName', items=len(products))
+            return inventory_pb2.ProductList(products=products)
+        
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'FindProductsByName', error)
+
+
+    def find_low_stock(self, request, context):
+        try:
+            products = yield self.storage.find_by_quantity(request.maximum_quantity, query_limit(request.limit, self.config['query_max_results']))
+            request_log.log('FindLowStock', items=len(products))
+            return inventory_pb2.ProductList(products=products)
+        
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'FindLowStock', error)
+
+
+    def find_products_by_price(self, request, context):
+        try:
+            products = yield self.storage.find_by_price(request.minimum_price, request.maximum_price,
+                                                        query_limit(request.limit, self.config['query_max_results']))
+            request_log.log('FindProductsByPrice', items=len(products))
+            return inventory_pb2.ProductList(products=products)
+        
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'FindProductsByPrice', error)
+
+
+    def list_products(self, request, context):
+        error = list_request_error(request)
+        if error:
+            yield context.abort(grpc.StatusCode.INVALID_ARGUMENT, error)
+        
+        try:
+            # Read a page at a time until it is full, the catalog ends or the read budget is spent
+            page_size = query_limit(request.page_size or self.config['list_page_size'], self.config['query_max_results'])
+            # Read before the products, so watching from it replays every change the page may have missed
+            change_offset = (yield self.storage.latest_offset()) if self.config['changes_max_length'] else ''
+            products, position = [], position_from_token(request.page_token)
+            for reads in range(LIST_MAX_READS):
+                batch, end = yield self.storage.list_by_name(request.filter.name_prefix, position, page_size)
+                position = fill_page(products, batch, end, page_size, request.filter)
+                if position is None or len(products) == page_size:
+                    break
+            
+            request_log.log('ListProducts', items=len(products), last_page=position is None)
+            return inventory_pb2.ListProductsResponse(products=project(products, request.field_mask), 
+                                                      next_page_token=token_from_position(position), change_offset=change_offset)
+        
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'ListProducts', error)
+
+
+    def get_inventory_stats(self, request, context):
+        try:
+            stats = yield self.storage.stats(self.low_stock_thresholds)
+            request_log.log('GetInventoryStats', items=stats.products)
+            return stats
+        
+        except REDIS_UNAVAILABLE as error:
+            yield from self.unavailable(context, 'GetInventoryStats', error)
+
+
+class InventoryServiceServicer(InventoryPlans, inventory_pb2_grpc.InventoryServiceServicer):
     """
     Implements the methods to handle inventory management operations.
 
@@ -19,10 +597,93 @@ class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
         AddProduct: Adds a product to the inventory.
         GetProductById: Retrieves a product from the inventory by ID.
         UpdateProductQuantity: Updates the quantity of a product in the inventory.
+        AdjustProductQuantity: Atomically adds to or subtracts from the quantity of a product.
         DeleteProduct: Deletes a product from the inventory.
         GetAllProducts: Retrieves all products from the inventory.
+        AddProducts: Adds a batch of products to the inventory.
+        GetProductsByIds: Retrieves a batch of products from the inventory by ID.
+        UpdateQuantities: Updates the quantities of a batch of products in the inventory.
+        AdjustQuantities: Atomically adjusts the quantities of a batch of products.
+        DeleteProducts: Deletes a batch of products from the inventory.
+        StreamQuantities: Applies a stream of quantity updates in micro-batches.
+        FindProductsByName: Finds products by name prefix.
+        FindLowStock: Finds products with little stock.
+        FindProductsByPrice: Finds products in a price range.
+        ListProducts: Lists the inventory one page at a time.
+        WatchInventory: Streams every change to the inventory.
+        ImportProducts: Adds a stream of product batches to the inventory.
+        ExportProducts: Streams the whole inventory in batches.
+        GetInventoryStats: Reports catalog totals and low-stock counts.
+        pool_stats: Reports usage of the shared Redis connection pools.
     """
     
+    def __init__(self, config=None, pool=None, storage=None):
+        """
+        Args:
+            config (dict): Server settings, see config.load_config(). Loaded from the environment if None.
+            pool (redis.ConnectionPool or list): Connection pool to share between handlers, or one per shard.
+                Built from config if None.
+            storage (storage.Storage): Where products are kept. Built from config['storage'] if None.
+        """
+        self.config = config if config is not None else load_config()
+        self.cache = ProductCache(self.config['cache_size'], self.config['cache_ttl'])
+        self.low_stock_thresholds = low_stock_thresholds(self.config)
+        self.pools = []
+        if storage is not None:
+            self.storage = storage
+        elif self.config['storage'] == 'memory':
+            self.storage = MemoryStorage(self.config['memory_shards'], self.config['changes_max_length'],
+                                         self.config['request_id_max_entries'], self.low_stock_thresholds)
+        else:
+            self.pools = pool if isinstance(pool, list) else [pool] if pool is not None else create_pools(self.config)
+            shards = []
+            for shard_pool in self.pools:
+                # Commands stop at the call's deadline, and fail fast while the redis-server is down
+                guard_pool(shard_pool, create_breaker(self.config, shard_pool))
+                # Thread-safe, connections are checked out per command
+                if self.config['metrics_port']:
+                    metrics.time_pool_waits(shard_pool)
+                    client = metrics.InstrumentedRedis(connection_pool=shard_pool)
+                else:
+                    client = redis.Redis(connection_pool=shard_pool)
+                if self.config['redis_encoding'] == 'compact':
+                    shard = CompactRedisStorage(client, self.config['redis_bucket_size'], self.config['redis_key_prefix'],
+                                                self.config['changes_max_length'])
+                else:
+                    shard = RedisStorage(client, self.config['redis_key_prefix'], self.config['changes_max_length'])
+                if self.config['cache_subscribe']:
+                    self.cache.subscribe(client, self.config['redis_db'], shard.key_identifiers)
+                shards.append(shard)
+            self.storage = shards[0] if len(shards) == 1 else ShardedStorage(shards, shard_names(self.config, len(shards)), self.config['max_workers'])
+        self.changes = ChangeNotifier(self.storage)
+        # A watcher holds its worker thread for as long as it watches, so some workers are always left for other calls
+        self.watch_slots = BoundedSemaphore(max(0, min(self.config['watch_max_streams'], self.config['max_workers'] - 1)))
+        
+    
+    def pool_stats(self):
+        """
+        Reports usage of the shared Redis connection pools, summed over the shards.
+
+        Returns:
+            dict: Maximum, created, idle and in-use connection counts, empty if the storage uses no pool.
+        """
+        if not self.pools:
+            return {}
+        stats = {'max_connections': 0, 'created_connections': 0, 'idle_connections': 0, 'in_use_connections': 0}
+        for pool in self.pools:
+            created = len(pool._connections)
+            if isinstance(pool, redis.BlockingConnectionPool):
+                idle = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+            else:
+                idle = len(pool._available_connections)
+            stats['max_connections'] += pool.max_connections
+            stats['created_connections'] += created
+            stats['idle_connections'] += idle
+            stats['in_use_connections'] += created - idle
+        return stats
+    
+
+    @claims_request
     def AddProduct(self, request, context):
         """
         Adds a product to the inventory.
@@ -32,34 +693,12 @@ class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
             context (grpc.ServicerContext): Context of the gRPC call.
 
         Returns:
-            inventory_pb2.Status: Status of the operation.
+            inventory_pb2.Status: Status of the operation. 
+            Aborts with INVALID_ARGUMENT for a negative ID and ALREADY_EXISTS if the ID is taken.
         """
-        if request.product_identifier < 0:
-            return inventory_pb2.Status(status="Cannot have a Product ID less than 0.")
-        try:
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Request: Add Product\n', fr"{{'product_identifier : '{request.product_identifier}', 'product_name' : '{request.product_name}', 'product_quantity' : '{request.product_quantity}', 'product_price' : '{request.product_price: .2f}'}}")
-            r = redis.Redis(host='localhost', port=6379, decode_responses=True)
-        
-            # Return Status if product exists
-            if r.exists(request.product_identifier) > 0:
-                print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Product exists, NOT added.')
-                return inventory_pb2.Status(status="Product already exists and was NOT added. \nTry deleting the product first, or change the Product ID.")
-            
-            # Add product and return status 
-            result = r.hset(request.product_identifier, mapping={
-                    'product_name': request.product_name,
-                    'product_quantity': request.product_quantity,
-                    'product_price': request.product_price
-                    })
-            
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Product added.')
-            return inventory_pb2.Status(status="Product successfully added.")
-            
-        except ConnectionError:
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Error connecting to redis-server. Maybe the server wasn\'t started?')
-            return inventory_pb2.Status(status="Server failure. Product was NOT added.")
-        
-        
+        return run_plan(self.add_product(request, context))
+    
+    
     def GetProductById(self, request, context):
         """
         Retrieves a product from the inventory by ID.
@@ -69,34 +708,12 @@ class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
             context (grpc.ServicerContext): Context of the gRPC call.
 
         Returns:
-            inventory_pb2.Product: The retrieved product.
+            inventory_pb2.Product: The retrieved product. Aborts with NOT_FOUND if it does not exist.
         """
-        try:
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Request: Product ID {request.product_identifier}')
-            r = redis.Redis(host='localhost', port=6379, decode_responses=True)
-
-            LOCK.acquire()
-            # Return empty NULL product if product_identifier does not exist
-            if r.exists(request.product_identifier) < 1:
-                LOCK.release()
-                print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Product does not exist.')
-                return inventory_pb2.Product(product_identifier=-1, product_name="NULL", 
-                                            product_quantity=-1, product_price=float(-1))
-            
-            # Locate and return product
-            result = r.hgetall(request.product_identifier)
-            LOCK.release()
-            
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Product found.')
-            return inventory_pb2.Product(product_identifier=int(request.product_identifier), product_name=str(result.get('product_name')), 
-                                        product_quantity=int(result.get('product_quantity')), product_price=float(result.get('product_price')))
-           
-        except ConnectionError:
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Error connecting to redis-server. Maybe the server wasn\'t started?')
-            return inventory_pb2.Product(product_identifier=-2, product_name="NULL", 
-                                            product_quantity=-1, product_price=float(-1))
-            
-        
+        return run_plan(self.get_product_by_id(request, context))
+    
+    
+    @claims_request
     def UpdateProductQuantity(self, request, context):
         """
         Updates the quantity of a product in the inventory.
@@ -106,35 +723,30 @@ class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
             context (grpc.ServicerContext): Context of the gRPC call.
 
         Returns:
-            inventory_pb2.Product: The updated product.
+            inventory_pb2.Product: The updated product. Aborts with NOT_FOUND if it does not exist.
         """
-        try:
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Request: Update Product Quantity \n\tProduct ID: {request.product_identifier} \n\tQuantity: {request.product_quantity}')
-            r = redis.Redis(host='localhost', port=6379, decode_responses=True)
-            
-            LOCK.acquire()
-            # Return empty NULL product if product_identifier does not exist
-            if r.exists(request.product_identifier) < 1:
-                LOCK.release()
-                print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Product does not exist.')
-                return inventory_pb2.Product(product_identifier=-1, product_name="NULL", 
-                                            product_quantity=-1, product_price=float(-1))
-                
-            # Locate, update quantity, and return product
-            r.hset(request.product_identifier, 'product_quantity', request.product_quantity)
-            result = r.hgetall(request.product_identifier)
-            LOCK.release()
-            
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Product found, quantity updated.')
-            return inventory_pb2.Product(product_identifier=int(request.product_identifier), product_name=str(result.get('product_name')), 
-                                        product_quantity=int(result.get('product_quantity')), product_price=float(result.get('product_price')))
-            
-        except ConnectionError:
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Error connecting to redis-server. Maybe the server wasn\'t started?')
-            return inventory_pb2.Product(product_identifier=-2, product_name="NULL", 
-                                            product_quantity=-1, product_price=float(-1))
+        return run_plan(self.update_product_quantity(request, context))
+    
+    
+    @claims_request
+    def AdjustProductQuantity(self, request, context):
+        """
+        Atomically adds a signed delta to the quantity of a product, so concurrent terminals 
+        never need to read-modify-write. With minimum_quantity set the change is applied 
+        only if it leaves at least that much stock, e.g. 0 to reserve without overselling.
+
+        Args:
+            request (inventory_pb2.Adjustment): The product ID, delta and optional minimum quantity.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Returns:
+            inventory_pb2.ProductResult: Outcome of the adjustment, with the product as it now stands. 
+            Aborts with NOT_FOUND if the product does not exist.
+        """
+        return run_plan(self.adjust_product_quantity(request, context))
     
     
+    @claims_request
     def DeleteProduct(self, request, context):
         """
         Deletes a product from the inventory.
@@ -144,30 +756,10 @@ class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
             context (grpc.ServicerContext): Context of the gRPC call.
 
         Returns:
-            inventory_pb2.Status: Status of the operation.
+            inventory_pb2.Status: Status of the operation. Aborts with NOT_FOUND if the product does not exist.
         """
-        try:
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Request: Delete Product ID {request.product_identifier}')
-            r = redis.Redis(host='localhost', port=6379, decode_responses=True)
-        
-            LOCK.acquire()
-            # Return Status if product does not exists
-            if r.exists(request.product_identifier) < 1:
-                LOCK.release()
-                print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Product does not exist, NOT deleted.')
-                return inventory_pb2.Status(status="Product does not exist and was NOT deleted.")
-            
-            # Delete product and return status 
-            result = r.delete(request.product_identifier)
-            LOCK.release()
-            
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Product deleted.')
-            return inventory_pb2.Status(status="Product successfully deleted.")
-        
-        except ConnectionError:
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Error connecting to redis-server. Maybe the server wasn\'t started?')
-            return inventory_pb2.Status(status="Server failure. Product was NOT deleted.")
-        
+        return run_plan(self.delete_product(request, context))
+    
     
     def GetAllProducts(self, request, context):
         """
@@ -178,66 +770,1000 @@ class InventoryServiceServicer(inventory_pb2_grpc.InventoryServiceServicer):
             context (grpc.ServicerContext): Context of the gRPC call.
 
         Yields:
-            inventory_pb2.Product: The products in the inventory.
-        
-        Returns:
-            inventory_pb2.Product: A NULL generated product.
+            inventory_pb2.Product: The products in the inventory, none if it is empty.
         """
+        streamed = 0
         try:
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Request: All Products')
-            r = redis.Redis(host='localhost', port=6379, decode_responses=True)
-            LOCK.acquire()
-            products = r.keys('*') # Return list of keys that match wildcard (return all keys)
+            # Stream out products one batch at a time, so memory use does not grow with the catalog
+            for product in self.storage.scan(self.config['scan_batch_size']):
+                yield product
+                streamed += 1
             
-            # Return empty NULL product if database is empty
-            if len(products) <= 0:
-                LOCK.release()
-                print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Redis server contains no data at the moment.')
-                yield inventory_pb2.Product(product_identifier=-1, product_name="NULL", 
-                                                product_quantity=-1, product_price=float(-1))
-                return None
-           
-            # Stream out products in database
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Streaming out all products.')
-            for i in range(len(products)):
-                result = r.hgetall(products[i])
-                yield inventory_pb2.Product(product_identifier=int(products[i]), product_name=str(result.get('product_name')), 
-                                            product_quantity=int(result.get('product_quantity')), product_price=float(result.get('product_price')))
-            LOCK.release()
+        except REDIS_UNAVAILABLE as error:
+            run_plan(self.unavailable(context, 'GetAllProducts', error))
+        finally:
+            request_log.log('GetAllProducts', items=streamed)
             
-        except ConnectionError:
-            print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Error connecting to redis-server. Maybe the server wasn\'t started?')
-            return inventory_pb2.Product(product_identifier=-2, product_name="NULL", 
-                                            product_quantity=-1, product_price=float(-1))
-        except(e):
-            print(f"All other except: {e}")
     
+    @claims_request
+    def AddProducts(self, request, context):
+        """
+        Adds a batch of products to the inventory in a single pipelined round trip.
 
+        Args:
+            request (inventory_pb2.ProductList): The products to add.
+            context (grpc.ServicerContext): Context of the gRPC call.
 
-def serve():
-    """
-    Initializes and starts the gRPC server.
+        Returns:
+            inventory_pb2.ProductResultList: Outcome for each product, in request order.
+        """
+        return run_plan(self.add_products(request, context))
+    
+    
+    def GetProductsByIds(self, request, context):
+        """
+        Retrieves a batch of products from the inventory by ID in a single pipelined round trip.
 
-    Returns:
-        grpc.Server: The initialized gRPC server.
-    """
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    inventory_pb2_grpc.add_InventoryServiceServicer_to_server(InventoryServiceServicer(), server)
-    server.add_insecure_port('[::]:50051')
-    return server
+        Args:
+            request (inventory_pb2.ProductIdentifierList): IDs of the products to retrieve.
+            context (grpc.ServicerContext): Context of the gRPC call.
 
+        Returns:
+            inventory_pb2.ProductResultList: Outcome for each ID, with the product when found, in request order.
+        """
+        return run_plan(self.get_products_by_ids(request, context))
+    
+    
+    @claims_request
+    def UpdateQuantities(self, request, context):
+        """
+        Updates the quantities of a batch of products in the inventory in a single pipelined round trip.
 
-if __name__ == '__main__':
-    try:
-        server = serve()
-        server.start()
-        print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Server Started...')
-        print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")} Kill with keyboard interrupt (Ctrl+C)')
-        server.wait_for_termination()
-        
+        Args:
+            request (inventory_pb2.QuantityList): IDs and new quantities of the products.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Returns:
+            inventory_pb2.ProductResultList: Outcome for each update, with the updated product when found, in request order.
+        """
+        return run_plan(self.update_quantities(request, context))
+    
+    
+    @claims_request
+    def AdjustQuantities(self, request, context):
+        """
+        Atomically adjusts the quantities of a batch of products in a single pipelined round trip.
+        Each adjustment is applied or rejected on its own, see AdjustProductQuantity.
+
+        Args:
+            request (inventory_pb2.AdjustmentList): The product IDs, deltas and optional minimum quantities.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Returns:
+            inventory_pb2.ProductResultList: Outcome for each adjustment, in request order.
+        """
+        return run_plan(self.adjust_quantities(request, context))
+    
+    
+    @claims_request
+    def DeleteProducts(self, request, context):
+        """
+        Deletes a batch of products from the inventory in a single pipelined round trip.
+
+        Args:
+            request (inventory_pb2.ProductIdentifierList): IDs of the products to delete.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Returns:
+            inventory_pb2.ProductResultList: Outcome for each ID, in request order.
+        """
+        return run_plan(self.delete_products(request, context))
+    
+    
+    def StreamQuantities(self, request_iterator, context):
+        """
+        Applies a stream of quantity updates in micro-batches and acknowledges each one.
+        A batch is applied once stream_max_batch_size updates are waiting, or stream_max_batch_latency_ms 
+        after its first update arrived. Reading from the client pauses while stream_queue_size updates 
+        are waiting, so a fast producer is held back by gRPC flow control instead of buffering without limit.
+
+        Args:
+            request_iterator (iterator of inventory_pb2.Quantity): IDs and new quantities of the products.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Yields:
+            inventory_pb2.ProductResult: Outcome for each update, with the updated product when found, in request order.
+        """
+        max_batch_size = self.config['stream_max_batch_size']
+        max_latency = self.config['stream_max_batch_latency_ms'] / 1000
+        queue = Queue(maxsize=self.config['stream_queue_size'])
+        stop = Event()
+        Thread(target=read_stream, args=(request_iterator, queue, stop), daemon=True).start()
+        
+        applied = 0
+        try:
+            ended = False
+            while not ended:
+                # Wait for the first update of the batch, then collect more until the batch is full or due
+                quantity = queue.get()
+                if quantity is END_OF_STREAM:
+                    break
+                batch = [quantity]
+                deadline = monotonic() + max_latency
+                while len(batch) < max_batch_size:
+                    try:
+                        quantity = queue.get(timeout=max(deadline - monotonic(), 0))
+                    except Empty:
+                        break
+                    if quantity is END_OF_STREAM:
+                        ended = True
+                        break
+                    batch.append(quantity)
+                
+                results = run_plan(self.apply_quantities(batch))
+                applied += len(batch)
+                yield from results
+        
+        # The updates acknowledged so far were applied, the rest were not
+        except REDIS_UNAVAILABLE as error:
+            run_plan(self.unavailable(context, 'StreamQuantities', error))
+        finally:
+            stop.set()
+            request_log.log('StreamQuantities', items=applied)
+    
+    
+    def FindProductsByName(self, request, context):
+        """
+        Finds the products whose name starts with a prefix, using the name index instead of scanning the catalog.
+
+        Args:
+            request (inventory_pb2.NameQuery): The case-sensitive name prefix and the most products to return.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Returns:
+            inventory_pb2.ProductList: The matching products in name order.
+        """
+        return run_plan(self.find_products_by_name(request, context))
+    
+    
+    def FindLowStock(self, request, context):
+        """
+        Finds the products with at most a given quantity in stock, using the quantity index.
+
+        Args:
+            request (inventory_pb2.StockQuery): The highest quantity to match and the most products to return.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Returns:
+            inventory_pb2.ProductList: The matching products, lowest stock first.
+        """
+        return run_plan(self.find_low_stock(request, context))
+    
+    
+    def FindProductsByPrice(self, request, context):
+        """
+        Finds the products priced within a range, using the price index.
+
+        Args:
+            request (inventory_pb2.PriceQuery): The inclusive price range and the most products to return.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Returns:
+            inventory_pb2.ProductList: The matching products, cheapest first.
+        """
+        return run_plan(self.find_products_by_price(request, context))
+    
+    
+    def ListProducts(self, request, context):
+        """
+        Lists the inventory in name order, one page at a time. Each page carries a token that resumes the listing 
+        where it stopped, so clients fetch only the rows they show and a dropped connection costs one page.
+        Only the fields in the request's field mask are returned.
+
+        Args:
+            request (inventory_pb2.ListProductsRequest): Page size, continuation token, filter and field mask.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Returns:
+            inventory_pb2.ListProductsResponse: The page and the token of the next one.
+        """
+        return run_plan(self.list_products(request, context))
+    
+    
+    def WatchInventory(self, request, context):
+        """
+        Streams every change to the inventory as it happens, after first replaying the changes made since from_offset,
+        so a downstream replica stays current without re-reading the catalog. Idle watchers wait on one shared
+        notifier instead of each polling Redis, but each holds a worker thread, so calls beyond watch_max_streams
+        are aborted with RESOURCE_EXHAUSTED. The asyncio server has no such limit.
+
+        Args:
+            request (inventory_pb2.WatchRequest): Offset of the last change the client has seen.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Yields:
+            inventory_pb2.ChangeEvent: The changes, oldest first.
+        """
+        if not self.config['changes_max_length']:
+            context.abort(grpc.StatusCode.FAILED_PRECONDITION, 'Change capture is off, see INVENTORY_CHANGES_MAX_LENGTH.')
+        error = watch_request_error(request)
+        if error:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, error)
+        if not self.watch_slots.acquire(blocking=False):
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, 'Too many WatchInventory calls, see INVENTORY_WATCH_MAX_STREAMS, '
+                                                              'or serve watchers with --async.')
+        
+        streamed = 0
+        try:
+            if resume_gap(request.from_offset, self.storage.trimmed_offset()):
+                context.abort(grpc.StatusCode.OUT_OF_RANGE, 'Changes after from_offset are no longer kept. '
+                                                            'Reload with ListProducts and watch from its change_offset.')
+            offset = request.from_offset or self.storage.latest_offset()
+            while context.is_active():
+                # Take the notification before reading, so changes arriving in between still wake this call
+                changed = self.changes.changed()
+                events = self.storage.read_changes(offset, self.config['scan_batch_size'])
+                for event in events:
+                    yield change_event(*event)
+                if events:
+                    offset = events[-1][0]
+                    streamed += len(events)
+                else:
+                    changed.wait(WATCH_POLL_SECONDS)
+        
+        except REDIS_UNAVAILABLE as error:
+            run_plan(self.unavailable(context, 'WatchInventory', error))
+        finally:
+            self.watch_slots.release()
+            request_log.log('WatchInventory', items=streamed)
+    
+    
+    def ImportProducts(self, request_iterator, context):
+        """
+        Adds a stream of product batches to the inventory, one pipelined storage batch per message,
+        so memory use stays flat however large the catalog. gRPC flow control holds the client back
+        while a batch is being written. Products that already exist are left as they are.
+
+        Args:
+            request_iterator (iterator of inventory_pb2.ProductList): The batches to add.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Returns:
+            inventory_pb2.ImportSummary: How many products were received, added, already present and rejected.
+        """
+        summary = inventory_pb2.ImportSummary()
+        try:
+            for request in request_iterator:
+                run_plan(self.import_batch(summary, request))
+            summary.status = 'Import complete.'
+            return summary
+        
+        except REDIS_UNAVAILABLE as error:
+            run_plan(self.unavailable(context, 'ImportProducts', error, f'Cannot reach Redis, import stopped after adding {summary.added} products. '
+                                                                        'Run it again to add the rest.'))
+        finally:
+            request_log.log('ImportProducts', items=summary.received, succeeded=summary.added)
+    
+    
+    def ExportProducts(self, request, context):
+        """
+        Streams the whole inventory, reading it with cursor-based scans one batch at a time.
+        Products added or deleted during the export may or may not be included.
+
+        Args:
+            request (inventory_pb2.ExportRequest): Products per message.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Yields:
+            inventory_pb2.ProductList: The products, in no particular order.
+        """
+        batch_size = query_limit(request.batch_size or self.config['scan_batch_size'], self.config['query_max_results'])
+        streamed = 0
+        try:
+            batch = []
+            for product in self.storage.scan(batch_size):
+                batch.append(product)
+                if len(batch) == batch_size:
+                    yield inventory_pb2.ProductList(products=batch)
+                    streamed += len(batch)
+                    batch = []
+            if batch:
+                yield inventory_pb2.ProductList(products=batch)
+                streamed += len(batch)
+        
+        except REDIS_UNAVAILABLE as error:
+            run_plan(self.unavailable(context, 'ExportProducts', error))
+        finally:
+            request_log.log('ExportProducts', items=streamed)
+    
+    
+    def GetInventoryStats(self, request, context):
+        """
+        Reports the number of products, their total quantity and value, and how many are at or below each
+        stats_low_stock_thresholds quantity. Every write keeps the totals up to date, so this never scans the catalog.
+
+        Args:
+            request: Empty message.
+            context (grpc.ServicerContext): Context of the gRPC call.
+
+        Returns:
+            inventory_pb2.InventoryStats: The statistics.
+        """
+        return run_plan(self.get_inventory_stats(request, context))
+    
+    
+class ChangeNotifier:
+    """
+    Tells WatchInventory calls when change events arrive. One thread per process waits on the change log,
+    so idle watchers hold no Redis connection and make no Redis calls until something changes. Each still holds
+    a worker thread, see watch_max_streams.
+
+    Methods:
+        changed: Returns an event that is set when the next change events arrive.
+    """
+
+    def __init__(self, storage):
+        """
+        Args:
+            storage (storage.Storage): Storage whose change log is watched.
+        """
+        self.storage = storage
+        self._changed = Event()
+        self._lock = Lock()
+        self._thread = None
+
+
+    def changed(self):
+        """
+        Returns an event that is set when the next change events arrive, starting the notifier thread on first use.
+        Take it before reading the change log, so events that arrive in between still set it.
+
+        Returns:
+            threading.Event: The event.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='change-notifier', daemon=True)
+                self._thread.start()
+            return self._changed
+
+
+    def _run(self):
+        offset = None
+        while True:
+            try:
+                offset = offset or self.storage.latest_offset()
+                if self.storage.read_changes(offset, 1, block=NOTIFIER_BLOCK_MS):
+                    offset = self.storage.latest_offset()
+                    changed, self._changed = self._changed, Event()
+                    changed.set()
+            except redis.RedisError:
+                logger.warning('Cannot read the change log, watchers fall back to polling every %ss.', WATCH_POLL_SECONDS)
+                offset = None
+                sleep(WATCH_POLL_SECONDS)
+
+
+def read_stream(request_iterator, queue, stop):
+    """
+    Moves requests from a client stream into a bounded queue, followed by END_OF_STREAM.
+    Blocks while the queue is full, which stops gRPC reading from the client.
+
+    Args:
+        request_iterator (iterator): The client's request stream.
+        queue (queue.Queue): Bounded queue read by the handler.
+        stop (threading.Event): Set by the handler when it stops consuming.
+    """
+    def put(item):
+        # Wait for room in the queue, giving up if the handler has stopped consuming
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+    
+    try:
+        for request in request_iterator:
+            if not put(request):
+                return
+    except grpc.RpcError: # Client cancelled or the call ended
+        pass
+    finally:
+        put(END_OF_STREAM)
+
+
+def count_import(summary, products, added):
+    """
+    Adds the outcome of one ImportProducts batch to the totals.
+
+    Args:
+        summary (inventory_pb2.ImportSummary): Totals to update.
+        products (list of inventory_pb2.Product): The batch, including rejected products.
+        added (list of bool): Whether each valid product was added, from the storage's add_many().
+    """
+    summary.received += len(products)
+    summary.added += sum(added)
+    summary.already_present += len(added) - sum(added)
+    summary.rejected += len(products) - len(added)
+
+
+def request_key(context, method):
+    """
+    Reads the request ID a client sent with a write.
+
+    Args:
+        context (grpc.ServicerContext): Context of the gRPC call.
+        method (str): Name of the RPC.
+
+    Returns:
+        str: The RPC name and request ID, None if the call has no request ID.
+    """
+    for key, value in context.invocation_metadata():
+        if key == REQUEST_ID_METADATA and value:
+            return f'{method}:{value[:REQUEST_ID_MAX_LENGTH]}'
+    return None
+
+
+def add_results(products, added):
+    """
+    Builds the results of AddProducts.
+
+    Args:
+        products (list of inventory_pb2.Product): The requested products.
+        added (list of bool): Whether each product with a valid ID was added, in order.
+
+    Returns:
+        list of inventory_pb2.ProductResult: Outcome for each product.
+    """
+    added = iter(added)
+    results = []
+    for product in products:
+        if product.product_identifier < 0:
+            results.append(inventory_pb2.ProductResult(product_identifier=product.product_identifier, success=False, 
+                                                       status="Cannot have a Product ID less than 0."))
+        elif next(added):
+            results.append(inventory_pb2.ProductResult(product_identifier=product.product_identifier, success=True, 
+                                                       status="Product successfully added."))
+        else:
+            results.append(inventory_pb2.ProductResult(product_identifier=product.product_identifier, success=False, 
+                                                       status=PRODUCT_EXISTS))
+    return results
+
+
+def delete_results(product_identifiers, deleted):
+    """
+    Builds the results of DeleteProducts.
+
+    Args:
+        product_identifiers (list of int): The requested IDs.
+        deleted (list of bool): Whether each product existed.
+
+    Returns:
+        list of inventory_pb2.ProductResult: Outcome for each ID.
+    """
+    results = []
+    for product_identifier, existed in zip(product_identifiers, deleted):
+        if existed:
+            results.append(inventory_pb2.ProductResult(product_identifier=product_identifier, success=True, 
+                                                       status="Product successfully deleted."))
+        else:
+            results.append(inventory_pb2.ProductResult(product_identifier=product_identifier, success=False, 
+                                                       status="Product does not exist and was NOT deleted."))
+    return results
+
+
+def product_result(product_identifier, product, status):
+    """
+    Builds the batch result for a decoded product lookup.
+
+    Args:
+        product_identifier (int): ID of the product.
+        product (inventory_pb2.Product): The product, None if it does not exist.
+        status (str): Status to report when the product exists.
+
+    Returns:
+        inventory_pb2.ProductResult: The result, carrying the product when it exists.
+    """
+    if product is None:
+        return inventory_pb2.ProductResult(product_identifier=product_identifier, success=False, status=PRODUCT_NOT_FOUND)
+    return inventory_pb2.ProductResult(product_identifier=product_identifier, success=True, status=status, product=product)
+
+
+def adjustment_args(adjustment):
+    """
+    Builds the Storage.adjust() arguments for an adjustment.
+
+    Args:
+        adjustment (inventory_pb2.Adjustment): The adjustment.
+
+    Returns:
+        tuple: The product ID, the delta and the minimum quantity, or None if there is none.
+    """
+    minimum = adjustment.minimum_quantity if adjustment.HasField('minimum_quantity') else None
+    return adjustment.product_identifier, adjustment.delta, minimum
+
+
+def adjustment_result(adjustment, outcome, product):
+    """
+    Builds the result of an adjustment from the Storage.adjust() outcome.
+
+    Args:
+        adjustment (inventory_pb2.Adjustment): The adjustment.
+        outcome (int): ADJUST_NOT_FOUND, ADJUST_REJECTED, ADJUST_OUT_OF_RANGE or ADJUST_APPLIED.
+        product (inventory_pb2.Product): The product as it now stands, None if it does not exist.
+
+    Returns:
+        inventory_pb2.ProductResult: The result, carrying the product when it exists.
+    """
+    if outcome == ADJUST_NOT_FOUND:
+        return inventory_pb2.ProductResult(product_identifier=adjustment.product_identifier, success=False, status=PRODUCT_NOT_FOUND)
+    
+    if outcome == ADJUST_REJECTED:
+        return inventory_pb2.ProductResult(product_identifier=adjustment.product_identifier, success=False, product=product, 
+                                           status=f"Insufficient quantity, NOT adjusted. Quantity cannot go below {adjustment.minimum_quantity}.")
+    
+    if outcome == ADJUST_OUT_OF_RANGE:
+        return inventory_pb2.ProductResult(product_identifier=adjustment.product_identifier, success=False, product=product, 
+                                           status=f"Quantity out of range, NOT adjusted. Quantity must stay between {QUANTITY_RANGE[0]} and {QUANTITY_RANGE[1]}.")
+    return inventory_pb2.ProductResult(product_identifier=adjustment.product_identifier, success=True, product=product, 
+                                       status="Product found, quantity adjusted.")
+
+
+def low_stock_thresholds(config):
+    """
+    Reads the quantities GetInventoryStats counts low-stock products at.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+
+    Returns:
+        list of int: The thresholds, ascending.
+
+    Raises:
+        ValueError: If a threshold is not a whole number.
+    """
+    return sorted({int(threshold) for threshold in (config['stats_low_stock_thresholds'] or '').split(',') if threshold.strip()})
+
+
+def query_limit(limit, maximum):
+    """
+    Resolves the number of products a query may return.
+
+    Args:
+        limit (int): Limit set by the client, 0 or less for none.
+        maximum (int): The server's query_max_results.
+
+    Returns:
+        int: The limit, capped at maximum.
+    """
+    return min(limit, maximum) if limit > 0 else maximum
+
+
+def list_request_error(request):
+    """
+    Checks the parts of a ListProducts request the client may have got wrong.
+
+    Args:
+        request (inventory_pb2.ListProductsRequest): The request.
+
+    Returns:
+        str: What is wrong with the request, None if nothing is.
+    """
+    if request.page_size < 0:
+        return 'page_size cannot be negative.'
+    if not request.field_mask.IsValidForDescriptor(inventory_pb2.Product.DESCRIPTOR):
+        return f'field_mask may only name fields of Product: {", ".join(request.field_mask.paths)}'
+    try:
+        position_from_token(request.page_token)
+    except ValueError:
+        return 'page_token is not a next_page_token returned by ListProducts.'
+    return None
+
+
+def token_from_position(position):
+    """
+    Encodes a listing position as an opaque page token.
+
+    Args:
+        position (str): Position to continue from, see storage.name_position(). None when the listing is complete.
+
+    Returns:
+        str: The page token, empty when the listing is complete.
+    """
+    return urlsafe_b64encode(position.encode()).decode() if position is not None else ''
+
+
+def position_from_token(token):
+    """
+    Decodes a page token back into a listing position.
+
+    Args:
+        token (str): The page token, empty for the first page.
+
+    Returns:
+        str: Position to continue from, None for the first page.
+
+    Raises:
+        ValueError: If the token was not made by token_from_position().
+    """
+    if not token:
+        return None
+    position = urlsafe_b64decode(token.encode()).decode()
+    name_identifier(position) # Raises ValueError unless it ends with a product ID
+    return position
+
+
+def product_matches(product, product_filter):
+    """
+    Checks a product against the quantity and price conditions of a filter (the storage applies the name prefix).
+
+    Args:
+        product (inventory_pb2.Product): The product.
+        product_filter (inventory_pb2.ProductFilter): The filter.
+
+    Returns:
+        bool: Whether the product meets every condition.
+    """
+    if product_filter.HasField('minimum_quantity') and product.product_quantity < product_filter.minimum_quantity:
+        return False
+    if product_filter.HasField('maximum_quantity') and product.product_quantity > product_filter.maximum_quantity:
+        return False
+    if product_filter.HasField('minimum_price') and product.product_price < product_filter.minimum_price:
+        return False
+    if product_filter.HasField('maximum_price') and product.product_price > product_filter.maximum_price:
+        return False
+    return True
+
+
+def fill_page(products, batch, end, page_size, product_filter):
+    """
+    Adds the products of a storage batch that match a filter to a page, until it holds page_size products.
+
+    Args:
+        products (list of inventory_pb2.Product): The page, extended in place.
+        batch (list of inventory_pb2.Product): Products read by Storage.list_by_name().
+        end (str): Position after the batch, None if the listing is complete.
+        page_size (int): Most products the page may hold.
+        product_filter (inventory_pb2.ProductFilter): Conditions the products must meet.
+
+    Returns:
+        str: Position to continue from, None when the listing is complete.
+    """
+    for index, product in enumerate(batch):
+        if product_matches(product, product_filter):
+            products.append(product)
+            if len(products) == page_size:
+                return end if index == len(batch) - 1 else name_position(product)
+    return end
+
+
+def project(products, field_mask):
+    """
+    Keeps only the fields named by a field mask.
+
+    Args:
+        products (list of inventory_pb2.Product): The products.
+        field_mask (google.protobuf.field_mask_pb2.FieldMask): Fields to keep, every field when empty.
+
+    Returns:
+        list of inventory_pb2.Product: The projected products.
+    """
+    if not field_mask.paths:
+        return products
+    projected = []
+    for product in products:
+        projection = inventory_pb2.Product()
+        field_mask.MergeMessage(product, projection)
+        projected.append(projection)
+    return projected
+
+
+def watch_request_error(request):
+    """
+    Checks the from_offset of a WatchInventory request.
+
+    Args:
+        request (inventory_pb2.WatchRequest): The request.
+
+    Returns:
+        str: What is wrong with the request, None if nothing is.
+    """
+    try:
+        for offset in (request.from_offset or '0').split(','):
+            offset_key(offset)
+    except ValueError:
+        return 'from_offset is not an offset returned by WatchInventory or ListProducts.'
+    return None
+
+
+def resume_gap(from_offset, trimmed_offset):
+    """
+    Checks whether changes a watcher has not seen were dropped from the change log.
+
+    Args:
+        from_offset (str): Offset of the last change the watcher has seen, empty for new changes only, '0' for every change kept.
+            A sharded catalog's offsets name the last change seen from each shard, comma-separated.
+        trimmed_offset (str): Offset of the newest dropped change, see storage.Storage.trimmed_offset().
+
+    Returns:
+        bool: Whether the watcher would miss changes, also when its offset is for a different number of shards.
+    """
+    if from_offset in ('', '0'):
+        return False
+    # A shard the watcher has seen no change from yet is read from its oldest change kept, as with '0'
+    seen, trimmed = from_offset.split(','), trimmed_offset.split(',')
+    return len(seen) != len(trimmed) or any(offset != '0' and offset_key(offset) < offset_key(dropped)
+                                            for offset, dropped in zip(seen, trimmed))
+
+
+def change_event(offset, operation, product):
+    """
+    Builds the ChangeEvent for a change read from the storage.
+
+    Args:
+        offset (str): Offset of the change.
+        operation (str): The storage's CHANGE_* operation.
+        product (inventory_pb2.Product): The product's ID and changed fields.
+
+    Returns:
+        inventory_pb2.ChangeEvent: The event.
+    """
+    return inventory_pb2.ChangeEvent(offset=offset, operation=CHANGE_OPERATIONS[operation], product=product)
+
+
+def create_pool(config, library=redis):
+    """
+    Creates the bounded Redis connection pool shared by all worker threads.
+    Callers block for up to redis_pool_timeout seconds when every connection is in use.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+        library (module): redis for a threaded pool, redis.asyncio for an asyncio pool.
+
+    Returns:
+        BlockingConnectionPool: The connection pool.
+    """
+    kwargs = {
+        'max_connections': config['redis_max_connections'],
+        'timeout': config['redis_pool_timeout'],
+        'db': config['redis_db'],
+        'password': config['redis_password'],
+        'socket_timeout': config['redis_socket_timeout'],
+        'health_check_interval': config['redis_health_check_interval'],
+        'decode_responses': config['redis_encoding'] != 'compact', # Compact products are binary
+    }
+    
+    # Connect over a unix socket when one is configured, TCP otherwise
+    if config['redis_unix_socket_path']:
+        return library.BlockingConnectionPool(connection_class=library.UnixDomainSocketConnection,
+                                              path=config['redis_unix_socket_path'], **kwargs)
+    return library.BlockingConnectionPool(host=config['redis_host'], port=config['redis_port'],
+                                          socket_connect_timeout=config['redis_socket_connect_timeout'], **kwargs)
+
+
+def shard_addresses(config):
+    """
+    Reads the redis-servers a sharded catalog is spread over.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+
+    Returns:
+        list of tuple: Host and port of each shard, empty if the catalog is not sharded.
+    """
+    addresses = []
+    for address in (config['redis_shards'] or '').split(','):
+        if address.strip():
+            host, port = address.strip().rsplit(':', 1)
+            addresses.append((host.strip('[]'), int(port)))
+    return addresses
+
+
+def shard_names(config, shards):
+    """
+    Names the shards on the hash ring after their addresses, so reordering redis_shards moves no products.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+        shards (int): Number of shards in use.
+
+    Returns:
+        list of str: The name of each shard, None to name them by position when the pools did not come from redis_shards.
+    """
+    names = [f'{host}:{port}' for host, port in shard_addresses(config)]
+    return names if len(names) == shards else None
+
+
+def create_breaker(config, pool):
+    """
+    Creates the circuit breaker of the redis-server a pool connects to.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+        pool: Threaded or asyncio connection pool, see create_pool().
+
+    Returns:
+        breaker.CircuitBreaker: The breaker, None if redis_breaker_failures turns it off.
+    """
+    if not config['redis_breaker_failures']:
+        return None
+    kwargs = pool.connection_kwargs
+    name = kwargs.get('path') or f"{kwargs.get('host', 'localhost')}:{kwargs.get('port', 6379)}"
+    return CircuitBreaker(config['redis_breaker_failures'], config['redis_breaker_reset'], name)
+
+
+def create_pools(config, library=redis):
+    """
+    Creates one connection pool per shard, see create_pool(). Each pool may hold up to redis_max_connections.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+        library (module): redis for threaded pools, redis.asyncio for asyncio pools.
+
+    Returns:
+        list of BlockingConnectionPool: The pool of each redis_shards address, or the one redis_host/port pool.
+    """
+    addresses = shard_addresses(config)
+    if not addresses:
+        return [create_pool(config, library)]
+    return [create_pool(dict(config, redis_host=host, redis_port=port, redis_unix_socket_path=None), library) for host, port in addresses]
+
+
+def server_options(config):
+    """
+    Builds the gRPC server options from the settings: message size limits and keepalive.
+    SO_REUSEPORT lets several server processes bind the same port and share its connections.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+
+    Returns:
+        list of tuple: The options.
+    """
+    return [('grpc.so_reuseport', 1),
+            ('grpc.max_receive_message_length', config['max_receive_message_length']),
+            ('grpc.max_send_message_length', config['max_send_message_length']),
+            # Ping idle clients to drop dead connections, and let clients ping us as often as keepalive_min_ping_interval_ms
+            ('grpc.keepalive_time_ms', config['keepalive_time_ms']),
+            ('grpc.keepalive_timeout_ms', config['keepalive_timeout_ms']),
+            ('grpc.http2.min_recv_ping_interval_without_data_ms', config['keepalive_min_ping_interval_ms']),
+            ('grpc.keepalive_permit_without_calls', 1)]
+
+
+def compression_methods(config):
+    """
+    Reads the per-RPC compression setting.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+
+    Returns:
+        dict: grpc.Compression of each RPC named in compression_methods, by name.
+
+    Raises:
+        ValueError: If the setting names an unknown RPC or algorithm.
+    """
+    if config['compression'] not in COMPRESSION:
+        raise ValueError(f'compression must be one of {", ".join(COMPRESSION)}, got {config["compression"]!r}')
+    rpcs = inventory_pb2.DESCRIPTOR.services_by_name['InventoryService'].methods_by_name
+    methods = {}
+    for item in (config['compression_methods'] or '').split(','):
+        if not item.strip():
+            continue
+        method, _, algorithm = item.strip().partition('=')
+        if method not in rpcs or algorithm not in COMPRESSION:
+            raise ValueError(f'compression_methods takes RPC=algorithm pairs with algorithms {", ".join(COMPRESSION)}, got {item!r}')
+        methods[method] = COMPRESSION[algorithm]
+    return methods
+
+
+def serve(config=None, pool=None, readiness=None):
+    """
+    Initializes the gRPC server, with the grpc.health.v1 health service, and starts warming it up.
+
+    Args:
+        config (dict): Server settings, see config.load_config(). Loaded from the environment if None.
+        pool (redis.ConnectionPool or list): Connection pool for the servicer, or one per shard. Built from config if None.
+        readiness (health.Readiness): Serves the health service and warms the server up, a new one if None.
+
+    Returns:
+        grpc.Server: The initialized gRPC server.
+    """
+    config = config if config is not None else load_config()
+    interceptors = [metrics.MetricsInterceptor()] if config['metrics_port'] else []
+    interceptors.append(DeadlineInterceptor())
+    methods = compression_methods(config)
+    if methods:
+        interceptors.append(CompressionInterceptor(methods))
+    # Calls beyond max_concurrent_rpcs are shed with RESOURCE_EXHAUSTED instead of queuing for a worker without limit
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=config['max_workers']), interceptors=interceptors,
+                         options=server_options(config), maximum_concurrent_rpcs=config['max_concurrent_rpcs'] or None,
+                         compression=COMPRESSION[config['compression']])
+    servicer = InventoryServiceServicer(config, pool)
+    if config['metrics_port']:
+        metrics.register_servicer(servicer)
+    inventory_pb2_grpc.add_InventoryServiceServicer_to_server(servicer, server)
+    readiness = readiness if readiness is not None else Readiness(config)
+    health_pb2_grpc.add_HealthServicer_to_server(readiness.health, server)
+    readiness.start(servicer)
+    server.add_insecure_port(config['server_address'])
+    return server
+
+
+def run(config=None):
+    """
+    Starts the gRPC server and serves until interrupted. It listens at once, reporting NOT_SERVING
+    to health checks until it has warmed up, see health.Readiness.
+    On SIGTERM it reports NOT_SERVING, stops accepting calls and gives in-flight calls shutdown_grace seconds to finish.
+
+    Args:
+        config (dict): Server settings, see config.load_config(). Loaded from the environment if None.
+    """
+    config = config if config is not None else load_config()
+    readiness = Readiness(config)
+    server = serve(config, readiness=readiness)
+    server.start()
+    logger.info('Server started on %s (pid %d)', config['server_address'], getpid())
+    if config['metrics_port']:
+        metrics.start_http_server(config['metrics_host'], config['metrics_port'])
+        logger.info('Metrics on http://%s:%d/metrics', config['metrics_host'], config['metrics_port'])
+    logger.info('Kill with keyboard interrupt (Ctrl+C)')
+    
+    def drain(signum, frame):
+        logger.info('Draining in-flight requests...')
+        readiness.stop()
+        server.stop(config['shutdown_grace'])
+    signal.signal(signal.SIGTERM, drain)
+    
+    try:
+        server.wait_for_termination()
     except KeyboardInterrupt:
         server.stop(0)
+
+
+if __name__ == '__main__':
+    # Only needed here, not in supervisor workers or when aio_server imports this module
+    import argparse
+    parser = argparse.ArgumentParser(description='Inventory gRPC server.')
+    parser.add_argument('--async', dest='use_async', action='store_true', 
+                        help='serve with grpc.aio and redis.asyncio instead of a thread pool')
+    parser.add_argument('--processes', type=int, 
+                        help='number of worker processes sharing the port (SO_REUSEPORT), overrides INVENTORY_PROCESSES')
+    parser.add_argument('--config', help='settings file of NAME=VALUE lines, see config.DEFAULTS; INVENTORY_* variables override it')
+    parser.add_argument('--set', dest='settings', action='append', default=[], metavar='NAME=VALUE',
+                        help='override a setting, e.g. --set max_concurrent_rpcs=200 --set compression_methods=ExportProducts=gzip')
+    args = parser.parse_args()
+    try:
+        overrides = parse_settings(args.settings)
+    except (KeyError, ValueError) as error:
+        parser.error(error.args[0])
+    
+    try:
+        config = load_config(args.config, **overrides)
+    except KeyError as error:
+        parser.error(error.args[0])
+    except (OSError, ValueError) as error:
+        # A settings file that cannot be read or holds a bad value
+        parser.error(str(error))
+    if args.processes is not None:
+        config['processes'] = args.processes
+    
+    try:
+        setup_logging(config)
+            
+        if config['processes'] > 1:
+            import supervisor
+            supervisor.supervise(config, args.use_async)
+        elif args.use_async:
+            import asyncio
+            import aio_server
+            asyncio.run(aio_server.run(config))
+        else:
+            run(config)
+        
+    except KeyboardInterrupt:
         exit(0)
-    except:
-        print(f'{datetime.now().strftime("%d/%m/%Y %H:%M:%S")}An error occurred initiating the server')
-        exit(0)
\ No newline at end of file
+    except Exception:
+        logger.exception('An error occurred initiating the server')
+        exit(1)
@@ -0,0 +1,2443 @@
+import asyncio
+from bisect import bisect
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from hashlib import blake2b
+from heapq import nsmallest
+from itertools import chain, islice
+from threading import Condition, Lock
+from time import monotonic
+
+import inventory_pb2
+
+
+# Every key lives under a configurable prefix (redis_key_prefix), so the catalog can share a database
+# and SCAN never has to look at keys it does not own. Secondary indexes are sorted sets under the same prefix:
+# QUANTITY_INDEX and PRICE_INDEX score product IDs by quantity and price, NAME_INDEX holds <name>\0<ID> members
+# with score 0 so ZRANGEBYLEX finds name prefixes. The write scripts keep them in step with the products.
+# The compact encoding keeps its own indexes and change stream under <prefix>BUCKET_PREFIX, so both encodings can share
+# a namespace while migrating.
+QUANTITY_INDEX = 'idx:quantity'
+PRICE_INDEX = 'idx:price'
+NAME_INDEX = 'idx:name'
+
+# Every write also appends a change event to a Redis stream under the same prefix, capped at about changes_max_length
+# entries (0 turns change capture off). Entries hold the operation (CHANGE_*), the product ID and the changed fields.
+CHANGES = 'changes'
+CHANGE_ADDED, CHANGE_QUANTITY, CHANGE_DELETED = 'added', 'quantity', 'deleted'
+
+# Catalog totals are a hash under the same prefix, updated by every write script so GetInventoryStats reads them
+# instead of scanning the catalog: STATS_FIELDS count the products, sum their quantities and sum quantity * price.
+# Low-stock counts are read from QUANTITY_INDEX with ZCOUNT, which the writes already keep in step.
+# A catalog written before the totals existed needs them rebuilt once, see migrate.py --rebuild-stats.
+STATS = 'stats'
+STATS_FIELDS = ('products', 'quantity', 'value')
+
+# Responses to writes sent with a request ID are kept under <prefix>REQUESTS<key> for a while, so a retried call gets
+# the original response instead of being applied twice. REQUEST_PENDING holds the key while the first call runs.
+REQUESTS = 'requests:'
+REQUEST_PENDING = 'pending'
+
+# A sharded catalog spreads products over several redis-servers by consistent hashing of their IDs,
+# see ShardedStorage. Each shard owns this many points on the hash ring, which evens out the shards' shares.
+SHARD_REPLICAS = 100
+
+# Lua scripts run atomically on the redis-server, so check-then-act sequences need no client-side lock
+# Adds the product only if its ID is free. Returns 1 if added, 0 if it already existed.
+# KEYS are the product, the quantity, price and name indexes, the change stream and the totals,
+# ARGV the name, quantity, price, ID and change stream length.
+ADD_PRODUCT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'product_name', ARGV[1], 'product_quantity', ARGV[2], 'product_price', ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[4])
+redis.call('ZADD', KEYS[3], ARGV[3], ARGV[4])
+redis.call('ZADD', KEYS[4], 0, ARGV[1] .. '\\0' .. ARGV[4])
+if ARGV[5] ~= '0' then
+    redis.call('XADD', KEYS[5], 'MAXLEN', '~', ARGV[5], '*', 'op', 'added', 'id', ARGV[4], 'name', ARGV[1], 'quantity', ARGV[2], 'price', ARGV[3])
+end
+redis.call('HINCRBY', KEYS[6], 'products', 1)
+redis.call('HINCRBY', KEYS[6], 'quantity', ARGV[2])
+redis.call('HINCRBYFLOAT', KEYS[6], 'value', ARGV[2] * ARGV[3])
+return 1
+"""
+
+# Sets the quantity of an existing product. Returns the updated hash as a flat list, empty if it does not exist.
+# KEYS are the product, the quantity index, the change stream and the totals, ARGV the quantity, ID and change stream length.
+UPDATE_QUANTITY_SCRIPT = """
+local old = redis.call('HMGET', KEYS[1], 'product_quantity', 'product_price')
+if not old[1] then
+    return {}
+end
+redis.call('HSET', KEYS[1], 'product_quantity', ARGV[1])
+redis.call('ZADD', KEYS[2], ARGV[1], ARGV[2])
+if ARGV[3] ~= '0' then
+    redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[3], '*', 'op', 'quantity', 'id', ARGV[2], 'quantity', ARGV[1])
+end
+redis.call('HINCRBY', KEYS[4], 'quantity', ARGV[1] - old[1])
+redis.call('HINCRBYFLOAT', KEYS[4], 'value', (ARGV[1] - old[1]) * old[2])
+return redis.call('HGETALL', KEYS[1])
+"""
+
+# Adds a signed delta to the quantity of an existing product, unless that would leave less than ARGV[2] (if given)
+# or a quantity outside QUANTITY_RANGE, which Product.product_quantity could not carry.
+# KEYS are the product, the quantity index, the change stream and the totals, ARGV the delta, minimum, ID and change stream length.
+# Returns {ADJUST_*, flat hash}, the hash holding the product after the change, or unchanged if it was rejected.
+ADJUST_QUANTITY_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0, {}}
+end
+local adjusted = tonumber(redis.call('HGET', KEYS[1], 'product_quantity')) + tonumber(ARGV[1])
+if adjusted < -2147483648 or adjusted > 2147483647 then
+    return {3, redis.call('HGETALL', KEYS[1])}
+end
+if ARGV[2] ~= '' and adjusted < tonumber(ARGV[2]) then
+    return {1, redis.call('HGETALL', KEYS[1])}
+end
+local quantity = redis.call('HINCRBY', KEYS[1], 'product_quantity', ARGV[1])
+redis.call('ZADD', KEYS[2], quantity, ARGV[3])
+if ARGV[4] ~= '0' then
+    redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[4], '*', 'op', 'quantity', 'id', ARGV[3], 'quantity', quantity)
+end
+redis.call('HINCRBY', KEYS[4], 'quantity', ARGV[1])
+redis.call('HINCRBYFLOAT', KEYS[4], 'value', ARGV[1] * redis.call('HGET', KEYS[1], 'product_price'))
+return {2, redis.call('HGETALL', KEYS[1])}
+"""
+ADJUST_NOT_FOUND, ADJUST_REJECTED, ADJUST_APPLIED, ADJUST_OUT_OF_RANGE = 0, 1, 2, 3
+
+# Quantities a product may hold, those of an int32 (the adjust scripts spell the bounds out)
+QUANTITY_RANGE = (-2**31, 2**31 - 1)
+
+# Products read per step when a backend without indexes answers a query by scanning
+QUERY_SCAN_BATCH = 500
+
+# Deletes a product and its index entries. KEYS are the product, the quantity, price and name indexes, the change stream
+# and the totals, ARGV the ID and change stream length. Returns 1 if it existed.
+DELETE_PRODUCT_SCRIPT = """
+local old = redis.call('HMGET', KEYS[1], 'product_name', 'product_quantity', 'product_price')
+if not old[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('ZREM', KEYS[4], old[1] .. '\\0' .. ARGV[1])
+if ARGV[2] ~= '0' then
+    redis.call('XADD', KEYS[5], 'MAXLEN', '~', ARGV[2], '*', 'op', 'deleted', 'id', ARGV[1])
+end
+redis.call('HINCRBY', KEYS[6], 'products', -1)
+redis.call('HINCRBY', KEYS[6], 'quantity', -old[2])
+redis.call('HINCRBYFLOAT', KEYS[6], 'value', -old[2] * old[3])
+return 1
+"""
+
+# Compact encoding: products are grouped into hashes of bucket_size products under <prefix>BUCKET_PREFIX<ID // bucket_size>,
+# each product stored as a packed Product (name and price) in field <ID> and its quantity in field <ID>:q.
+# Small hashes are stored as listpacks by redis-server, so a product costs a few dozen bytes instead of a key and hash of its own.
+BUCKET_PREFIX = 'b:'
+
+# Adds the product only if its ID is free. KEYS are the bucket, the quantity, price and name indexes, the change stream
+# and the totals, ARGV the ID, packed product, quantity, price, name and change stream length. Returns 1 if added.
+COMPACT_ADD_PRODUCT_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1] .. ':q') == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2], ARGV[1] .. ':q', ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+redis.call('ZADD', KEYS[4], 0, ARGV[5] .. '\\0' .. ARGV[1])
+if ARGV[6] ~= '0' then
+    redis.call('XADD', KEYS[5], 'MAXLEN', '~', ARGV[6], '*', 'op', 'added', 'id', ARGV[1], 'name', ARGV[5], 'quantity', ARGV[3], 'price', ARGV[4])
+end
+redis.call('HINCRBY', KEYS[6], 'products', 1)
+redis.call('HINCRBY', KEYS[6], 'quantity', ARGV[3])
+redis.call('HINCRBYFLOAT', KEYS[6], 'value', ARGV[3] * ARGV[4])
+return 1
+"""
+
+# Sets the quantity of an existing product. KEYS are the bucket, the quantity index, the change stream, the price index
+# (the price is packed) and the totals, ARGV the ID, quantity and change stream length.
+# Returns {packed product, quantity}, empty if it does not exist.
+COMPACT_UPDATE_QUANTITY_SCRIPT = """
+local old = redis.call('HGET', KEYS[1], ARGV[1] .. ':q')
+if not old then
+    return {}
+end
+redis.call('HSET', KEYS[1], ARGV[1] .. ':q', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+if ARGV[3] ~= '0' then
+    redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[3], '*', 'op', 'quantity', 'id', ARGV[1], 'quantity', ARGV[2])
+end
+redis.call('HINCRBY', KEYS[5], 'quantity', ARGV[2] - old)
+redis.call('HINCRBYFLOAT', KEYS[5], 'value', (ARGV[2] - old) * redis.call('ZSCORE', KEYS[4], ARGV[1]))
+return redis.call('HMGET', KEYS[1], ARGV[1], ARGV[1] .. ':q')
+"""
+
+# Adds the signed delta ARGV[2] to the quantity of an existing product, unless that would leave less than ARGV[3] (if given)
+# or a quantity outside QUANTITY_RANGE. KEYS are the bucket, the quantity index, the change stream, the price index
+# and the totals, ARGV[4] the change stream length. Returns {ADJUST_*, {packed product, quantity}}, empty if it does not exist.
+COMPACT_ADJUST_QUANTITY_SCRIPT = """
+local quantity = redis.call('HGET', KEYS[1], ARGV[1] .. ':q')
+if not quantity then
+    return {0, {}}
+end
+local adjusted = tonumber(quantity) + tonumber(ARGV[2])
+if adjusted < -2147483648 or adjusted > 2147483647 then
+    return {3, {redis.call('HGET', KEYS[1], ARGV[1]), quantity}}
+end
+if ARGV[3] ~= '' and adjusted < tonumber(ARGV[3]) then
+    return {1, {redis.call('HGET', KEYS[1], ARGV[1]), quantity}}
+end
+quantity = redis.call('HINCRBY', KEYS[1], ARGV[1] .. ':q', ARGV[2])
+redis.call('ZADD', KEYS[2], quantity, ARGV[1])
+if ARGV[4] ~= '0' then
+    redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[4], '*', 'op', 'quantity', 'id', ARGV[1], 'quantity', quantity)
+end
+redis.call('HINCRBY', KEYS[5], 'quantity', ARGV[2])
+redis.call('HINCRBYFLOAT', KEYS[5], 'value', ARGV[2] * redis.call('ZSCORE', KEYS[4], ARGV[1]))
+return {2, {redis.call('HGET', KEYS[1], ARGV[1]), tostring(quantity)}}
+"""
+
+# Deletes a product and its index entries. KEYS are the bucket, the quantity, price and name indexes, the change stream
+# and the totals, ARGV the ID and change stream length.
+# The name index member is rebuilt from the packed product, whose first field is the name (tag 0x12, varint length)
+# unless the name is empty. Returns 1 if it existed.
+COMPACT_DELETE_PRODUCT_SCRIPT = """
+local stored = redis.call('HMGET', KEYS[1], ARGV[1], ARGV[1] .. ':q')
+local packed, quantity = stored[1], stored[2]
+if redis.call('HDEL', KEYS[1], ARGV[1], ARGV[1] .. ':q') == 0 then
+    return 0
+end
+local name = ''
+if packed and string.byte(packed, 1) == 18 then
+    local length, scale, position = 0, 1, 2
+    repeat
+        local byte = string.byte(packed, position)
+        length = length + (byte % 128) * scale
+        scale = scale * 128
+        position = position + 1
+    until byte < 128
+    name = string.sub(packed, position, position + length - 1)
+end
+local price = redis.call('ZSCORE', KEYS[3], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('ZREM', KEYS[4], name .. '\\0' .. ARGV[1])
+if ARGV[2] ~= '0' then
+    redis.call('XADD', KEYS[5], 'MAXLEN', '~', ARGV[2], '*', 'op', 'deleted', 'id', ARGV[1])
+end
+redis.call('HINCRBY', KEYS[6], 'products', -1)
+redis.call('HINCRBY', KEYS[6], 'quantity', -quantity)
+redis.call('HINCRBYFLOAT', KEYS[6], 'value', -quantity * price)
+return 1
+"""
+
+
+class Storage:
+    """
+    Interface the servicers use to store products. Every write is atomic per product.
+    Batch methods default to one call per item, backends override them to save round trips.
+
+    Methods:
+        get: Retrieves a product.
+        get_many: Retrieves several products.
+        add: Adds a product if its ID is free.
+        add_many: Adds several products.
+        set_quantity: Sets the quantity of a product.
+        set_quantities: Sets the quantities of several products.
+        adjust: Adds a signed delta to the quantity of a product.
+        adjust_many: Adjusts the quantities of several products.
+        delete: Deletes a product.
+        delete_many: Deletes several products.
+        scan: Iterates over every product.
+        find_by_name: Finds products by name prefix.
+        find_by_quantity: Finds products with little stock.
+        find_by_price: Finds products in a price range.
+        list_by_name: Lists products in name order, one page at a time.
+        stats: Reports the catalog's totals and low-stock counts.
+        claim_request: Claims a request ID, or finds the response saved for it.
+        save_request: Saves the response to a request ID.
+        release_request: Releases a request ID whose call failed.
+        read_changes: Reads the change events recorded after an offset.
+        latest_offset: Offset of the newest change event.
+        trimmed_offset: Offset of the newest change event no longer kept.
+    """
+
+    def get(self, product_identifier):
+        """
+        Retrieves a product.
+
+        Args:
+            product_identifier (int): ID of the product.
+
+        Returns:
+            inventory_pb2.Product: The product, None if it does not exist.
+        """
+        raise NotImplementedError
+
+
+    def get_many(self, product_identifiers):
+        """
+        Retrieves several products.
+
+        Args:
+            product_identifiers (list of int): IDs of the products.
+
+        Returns:
+            list of inventory_pb2.Product: The product for each ID, None where it does not exist.
+        """
+        return [self.get(product_identifier) for product_identifier in product_identifiers]
+
+
+    def add(self, product):
+        """
+        Adds a product if its ID is free.
+
+        Args:
+            product (inventory_pb2.Product): The product.
+
+        Returns:
+            bool: Whether the product was added.
+        """
+        raise NotImplementedError
+
+
+    def add_many(self, products):
+        """
+        Adds several products, each only if its ID is free.
+
+        Args:
+            products (list of inventory_pb2.Product): The products.
+
+        Returns:
+            list of bool: Whether each product was added.
+        """
+        return [self.add(product) for product in products]
+
+
+    def set_quantity(self, product_identifier, quantity):
+        """
+        Sets the quantity of an existing product.
+
+        Args:
+            product_identifier (int): ID of the product.
+            quantity (int): New quantity.
+
+        Returns:
+            inventory_pb2.Product: The updated product, None if it does not exist.
+        """
+        raise NotImplementedError
+
+
+    def set_quantities(self, quantities):
+        """
+        Sets the quantities of several existing products.
+
+        Args:
+            quantities (list of (int, int)): IDs and new quantities.
+
+        Returns:
+            list of inventory_pb2.Product: Each updated product, None where it does not exist.
+        """
+        return [self.set_quantity(product_identifier, quantity) for product_identifier, quantity in quantities]
+
+
+    def adjust(self, product_identifier, delta, minimum=None):
+        """
+        Adds a signed delta to the quantity of a product, unless that would leave less than minimum
+        or a quantity outside QUANTITY_RANGE.
+
+        Args:
+            product_identifier (int): ID of the product.
+            delta (int): Amount to add, negative to subtract.
+            minimum (int): Least quantity the product may be left with, None for no limit.
+
+        Returns:
+            tuple: ADJUST_NOT_FOUND, ADJUST_REJECTED, ADJUST_OUT_OF_RANGE or ADJUST_APPLIED, and the product as it now stands
+            (None if not found).
+        """
+        raise NotImplementedError
+
+
+    def adjust_many(self, adjustments):
+        """
+        Adjusts the quantities of several products, each applied or rejected on its own.
+
+        Args:
+            adjustments (list of (int, int, int)): IDs, deltas and minimums (None for no limit).
+
+        Returns:
+            list of tuple: adjust() outcome for each adjustment.
+        """
+        return [self.adjust(*adjustment) for adjustment in adjustments]
+
+
+    def delete(self, product_identifier):
+        """
+        Deletes a product.
+
+        Args:
+            product_identifier (int): ID of the product.
+
+        Returns:
+            bool: Whether the product existed.
+        """
+        raise NotImplementedError
+
+
+    def delete_many(self, product_identifiers):
+        """
+        Deletes several products.
+
+        Args:
+            product_identifiers (list of int): IDs of the products.
+
+        Returns:
+            list of bool: Whether each product existed.
+        """
+        return [self.delete(product_identifier) for product_identifier in product_identifiers]
+
+
+    def key_identifiers(self, key):
+        """
+        Lists the products a Redis key may hold, so a change to the key can invalidate them.
+
+        Args:
+            key (str or bytes): The key.
+
+        Returns:
+            list of int: IDs of the products, empty if the key holds no products.
+        """
+        return []
+
+
+    def scan(self, batch_size):
+        """
+        Iterates over every product without holding the whole catalog in memory at once.
+        Products added or deleted during the scan may or may not be seen.
+
+        Args:
+            batch_size (int): Products read per step.
+
+        Yields:
+            inventory_pb2.Product: The products, in no particular order.
+        """
+        raise NotImplementedError
+
+
+    def find_by_name(self, prefix, limit):
+        """
+        Finds the products whose name starts with a prefix.
+        This default scans the whole catalog, indexed backends override it.
+
+        Args:
+            prefix (str): Start of the name, case-sensitive. Empty matches every product.
+            limit (int): Most products to return.
+
+        Returns:
+            list of inventory_pb2.Product: The first matches in name order.
+        """
+        matches = (product for product in self.scan(QUERY_SCAN_BATCH) if product.product_name.startswith(prefix))
+        return nsmallest(limit, matches, key=name_position)
+
+
+    def find_by_quantity(self, maximum, limit):
+        """
+        Finds the products with at most a given quantity in stock.
+        This default scans the whole catalog, indexed backends override it.
+
+        Args:
+            maximum (int): Highest quantity to match.
+            limit (int): Most products to return.
+
+        Returns:
+            list of inventory_pb2.Product: The first matches, lowest quantity first.
+        """
+        matches = (product for product in self.scan(QUERY_SCAN_BATCH) if product.product_quantity <= maximum)
+        return nsmallest(limit, matches, key=lambda product: (product.product_quantity, str(product.product_identifier)))
+
+
+    def find_by_price(self, minimum, maximum, limit):
+        """
+        Finds the products priced within a range.
+        This default scans the whole catalog, indexed backends override it.
+
+        Args:
+            minimum (float): Lowest price to match.
+            maximum (float): Highest price to match.
+            limit (int): Most products to return.
+
+        Returns:
+            list of inventory_pb2.Product: The first matches, cheapest first.
+        """
+        matches = (product for product in self.scan(QUERY_SCAN_BATCH) if minimum <= product.product_price <= maximum)
+        return nsmallest(limit, matches, key=lambda product: (product.product_price, str(product.product_identifier)))
+
+
+    def list_by_name(self, prefix, after, count):
+        """
+        Lists products in name order, one page at a time, reading at most count entries of the name index.
+        This default scans the whole catalog, indexed backends override it.
+
+        Args:
+            prefix (str): Start of the name, case-sensitive. Empty lists every product.
+            after (str): Position to continue from, see name_position(). None to start at the beginning.
+            count (int): Most products to read.
+
+        Returns:
+            tuple: The products, and the position to continue from (None when the listing is complete).
+                Products deleted while being read are left out, so there may be fewer than count even when the listing goes on.
+        """
+        matches = (product for product in self.scan(QUERY_SCAN_BATCH)
+                   if product.product_name.startswith(prefix) and (after is None or name_position(product) > after))
+        products = nsmallest(count, matches, key=name_position)
+        return products, name_position(products[-1]) if len(products) == count else None
+
+
+    def stats(self, thresholds):
+        """
+        Reports the number of products, their total quantity and value, and how many have little stock.
+        This default scans the whole catalog, backends override it with totals their writes keep up to date.
+
+        Args:
+            thresholds (list of int): Quantities to count the products at or below.
+
+        Returns:
+            inventory_pb2.InventoryStats: The totals, and the low-stock count of each threshold in the given order.
+        """
+        products = quantity = 0
+        value = 0.0
+        low_stock = [0] * len(thresholds)
+        for product in self.scan(QUERY_SCAN_BATCH):
+            products += 1
+            quantity += product.product_quantity
+            value += product.product_quantity * product.product_price
+            for position, threshold in enumerate(thresholds):
+                low_stock[position] += product.product_quantity <= threshold
+        return inventory_stats(products, quantity, value, thresholds, low_stock)
+
+
+    def read_changes(self, after, count, block=None):
+        """
+        Reads the change events recorded after an offset, oldest first.
+
+        Args:
+            after (str): Offset of the last event already read, '0' to read from the oldest event kept.
+            count (int): Most events to read.
+            block (int): Milliseconds to wait for an event when there is none yet, None to return at once.
+
+        Returns:
+            list of tuple: The offset, CHANGE_* operation and product of each event. The product holds the ID
+                and the fields that changed (every field when added, the quantity when it changed, none when deleted).
+        """
+        raise NotImplementedError
+
+
+    def latest_offset(self):
+        """
+        Names the newest change event.
+
+        Returns:
+            str: Its offset, '0-0' if there is none.
+        """
+        raise NotImplementedError
+
+
+    def trimmed_offset(self):
+        """
+        Names the newest change event dropped to keep the log within changes_max_length.
+        A reader whose last event is older than this has missed events.
+
+        Returns:
+            str: Its offset, '0-0' if no event was dropped.
+        """
+        raise NotImplementedError
+
+
+    def claim_request(self, key, ttl):
+        """
+        Claims a request ID for the call about to run, unless an earlier call holds it.
+
+        Args:
+            key (str): The request ID, qualified by the RPC it was sent with.
+            ttl (int): Seconds to hold the claim, in case the call dies before saving its response.
+
+        Returns:
+            str: None if claimed, REQUEST_PENDING while the earlier call runs, else the response it saved.
+        """
+        raise NotImplementedError
+
+
+    def save_request(self, key, response, ttl):
+        """
+        Saves the response to a claimed request ID.
+
+        Args:
+            key (str): The request ID, as claimed.
+            response (str): The serialized response.
+            ttl (int): Seconds to keep it.
+        """
+        raise NotImplementedError
+
+
+    def release_request(self, key):
+        """
+        Releases a claimed request ID whose call failed before it could save a response, so a retry goes ahead.
+
+        Args:
+            key (str): The request ID, as claimed.
+        """
+        raise NotImplementedError
+
+
+class PlanRunner:
+    """
+    The Storage methods of a storage whose operations are written as plans, see run_plan(),
+    each running its plan with the client's replies.
+    """
+
+    def get(self, product_identifier):
+        return run_plan(self._get(product_identifier))
+
+
+    def get_many(self, product_identifiers):
+        return run_plan(self._get_many(product_identifiers))
+
+
+    def add(self, product):
+        return run_plan(self._add(product))
+
+
+    def add_many(self, products):
+        return run_plan(self._add_many(products))
+
+
+    def set_quantity(self, product_identifier, quantity):
+        return run_plan(self._set_quantity(product_identifier, quantity))
+
+
+    def set_quantities(self, quantities):
+        return run_plan(self._set_quantities(quantities))
+
+
+    def adjust(self, product_identifier, delta, minimum=None):
+        return run_plan(self._adjust(product_identifier, delta, minimum))
+
+
+    def adjust_many(self, adjustments):
+        return run_plan(self._adjust_many(adjustments))
+
+
+    def delete(self, product_identifier):
+        return run_plan(self._delete(product_identifier))
+
+
+    def delete_many(self, product_identifiers):
+        return run_plan(self._delete_many(product_identifiers))
+
+
+    def scan(self, batch_size):
+        cursor = None
+        while True:
+            cursor, products = run_plan(self._scan_batch(cursor, batch_size))
+            yield from products
+            if cursor is None:
+                break
+
+
+    def find_by_name(self, prefix, limit):
+        return run_plan(self._find_by_name(prefix, limit))
+
+
+    def find_by_quantity(self, maximum, limit):
+        return run_plan(self._find_by_quantity(maximum, limit))
+
+
+    def find_by_price(self, minimum, maximum, limit):
+        return run_plan(self._find_by_price(minimum, maximum, limit))
+
+
+    def list_by_name(self, prefix, after, count):
+        return run_plan(self._list_by_name(prefix, after, count))
+
+
+    def stats(self, thresholds):
+        return run_plan(self._stats(thresholds))
+
+
+    def read_changes(self, after, count, block=None):
+        return run_plan(self._read_changes(after, count, block))
+
+
+    def latest_offset(self):
+        return run_plan(self._latest_offset())
+
+
+    def trimmed_offset(self):
+        return run_plan(self._trimmed_offset())
+
+
+    def claim_request(self, key, ttl):
+        return run_plan(self._claim_request(key, ttl))
+
+
+    def save_request(self, key, response, ttl):
+        run_plan(self._save_request(key, response, ttl))
+
+
+    def release_request(self, key):
+        run_plan(self._release_request(key))
+
+
+class AsyncPlanRunner:
+    """
+    PlanRunner for storages on redis.asyncio, every method is a coroutine (scan returns an async iterator)
+    awaiting the calls of its plan, see async_run_plan().
+    """
+
+    async def get(self, product_identifier):
+        return await async_run_plan(self._get(product_identifier))
+
+
+    async def get_many(self, product_identifiers):
+        return await async_run_plan(self._get_many(product_identifiers))
+
+
+    async def add(self, product):
+        return await async_run_plan(self._add(product))
+
+
+    async def add_many(self, products):
+        return await async_run_plan(self._add_many(products))
+
+
+    async def set_quantity(self, product_identifier, quantity):
+        return await async_run_plan(self._set_quantity(product_identifier, quantity))
+
+
+    async def set_quantities(self, quantities):
+        return await async_run_plan(self._set_quantities(quantities))
+
+
+    async def adjust(self, product_identifier, delta, minimum=None):
+        return await async_run_plan(self._adjust(product_identifier, delta, minimum))
+
+
+    async def adjust_many(self, adjustments):
+        return await async_run_plan(self._adjust_many(adjustments))
+
+
+    async def delete(self, product_identifier):
+        return await async_run_plan(self._delete(product_identifier))
+
+
+    async def delete_many(self, product_identifiers):
+        return await async_run_plan(self._delete_many(product_identifiers))
+
+
+    async def scan_batch(self, cursor, batch_size):
+        """
+        Reads the next step of a scan as one coroutine, so a caller can shield each read from cancellation
+        instead of iterating over scan() across its own awaits.
+
+        Args:
+            cursor: Position returned by the previous call, None to start.
+            batch_size (int): Products read per step.
+
+        Returns:
+            tuple: The position to continue from, None once the scan is over, and the products read, possibly none.
+        """
+        return await async_run_plan(self._scan_batch(cursor, batch_size))
+
+
+    def scan(self, batch_size):
+        return scan_batches(self, batch_size)
+
+
+    async def find_by_name(self, prefix, limit):
+        return await async_run_plan(self._find_by_name(prefix, limit))
+
+
+    async def find_by_quantity(self, maximum, limit):
+        return await async_run_plan(self._find_by_quantity(maximum, limit))
+
+
+    async def find_by_price(self, minimum, maximum, limit):
+        return await async_run_plan(self._find_by_price(minimum, maximum, limit))
+
+
+    async def list_by_name(self, prefix, after, count):
+        return await async_run_plan(self._list_by_name(prefix, after, count))
+
+
+    async def stats(self, thresholds):
+        return await async_run_plan(self._stats(thresholds))
+
+
+    async def read_changes(self, after, count, block=None):
+        return await async_run_plan(self._read_changes(after, count, block))
+
+
+    async def latest_offset(self):
+        return await async_run_plan(self._latest_offset())
+
+
+    async def trimmed_offset(self):
+        return await async_run_plan(self._trimmed_offset())
+
+
+    async def claim_request(self, key, ttl):
+        return await async_run_plan(self._claim_request(key, ttl))
+
+
+    async def save_request(self, key, response, ttl):
+        await async_run_plan(self._save_request(key, response, ttl))
+
+
+    async def release_request(self, key):
+        await async_run_plan(self._release_request(key))
+
+
+class RedisQueries:
+    """
+    Indexed queries, totals, change reads and request IDs of the Redis storages, which keep QUANTITY_INDEX, PRICE_INDEX,
+    NAME_INDEX, the STATS totals and the CHANGES stream up to date. Each query reads the matching IDs from an index,
+    then the products in a second round trip.
+    Methods are plans, see run_plan(), so the storages on redis and on redis.asyncio share them.
+    Expects the redis client, key prefix, index, totals and stream keys and _get_many() of the storage it is mixed into.
+    """
+
+    def _find_by_name(self, prefix, limit):
+        members = yield self.redis.zrangebylex(self.name_index, *name_range(prefix), start=0, num=limit)
+        return (yield from self._found([name_identifier(member) for member in members]))
+
+
+    def _find_by_quantity(self, maximum, limit):
+        product_identifiers = yield self.redis.zrangebyscore(self.quantity_index, '-inf', maximum, start=0, num=limit)
+        return (yield from self._found(product_identifiers))
+
+
+    def _find_by_price(self, minimum, maximum, limit):
+        product_identifiers = yield self.redis.zrangebyscore(self.price_index, minimum, maximum, start=0, num=limit)
+        return (yield from self._found(product_identifiers))
+
+
+    def _list_by_name(self, prefix, after, count):
+        members = yield self.redis.zrangebylex(self.name_index, *name_range(prefix, after), start=0, num=count)
+        position = as_text(members[-1]) if len(members) == count else None
+        return (yield from self._found([name_identifier(member) for member in members])), position
+
+
+    def _found(self, product_identifiers):
+        # Products deleted since the index was read are left out
+        products = yield from self._get_many([int(product_identifier) for product_identifier in product_identifiers])
+        return [product for product in products if product is not None]
+
+
+    def _stats(self, thresholds):
+        # One MULTI round trip, so the totals and low-stock counts are read at the same moment. ZCOUNT is O(log n)
+        pipe = self.redis.pipeline()
+        pipe.hmget(self.stats_key, *STATS_FIELDS)
+        for threshold in thresholds:
+            pipe.zcount(self.quantity_index, '-inf', threshold)
+        totals, *low_stock = yield pipe.execute()
+        return stats_from_totals(totals, thresholds, low_stock)
+
+
+    def _read_changes(self, after, count, block=None):
+        reply = yield self.redis.xread({self.changes_key: after}, count=count, block=block)
+        return [change_from_fields(offset, fields) for offset, fields in reply[0][1]] if reply else []
+
+
+    def _latest_offset(self):
+        entries = yield self.redis.xrevrange(self.changes_key, count=1)
+        return as_text(entries[0][0]) if entries else '0-0'
+
+
+    def _trimmed_offset(self):
+        if not (yield self.redis.exists(self.changes_key)):
+            return '0-0'
+        return trimmed_from_info((yield self.redis.xinfo_stream(self.changes_key)))
+
+
+    def _claim_request(self, key, ttl):
+        if (yield self.redis.set(f'{self.prefix}{REQUESTS}{key}', REQUEST_PENDING, nx=True, ex=ttl)):
+            return None
+        # A claim that expired in between reads as still pending, the caller retries
+        return as_text((yield self.redis.get(f'{self.prefix}{REQUESTS}{key}')) or REQUEST_PENDING)
+
+
+    def _save_request(self, key, response, ttl):
+        yield self.redis.set(f'{self.prefix}{REQUESTS}{key}', response, ex=ttl)
+
+
+    def _release_request(self, key):
+        # Only the claiming call saves or releases the ID, so it still holds REQUEST_PENDING
+        yield self.redis.delete(f'{self.prefix}{REQUESTS}{key}')
+
+
+class HashEncoding(RedisQueries):
+    """
+    Commands and replies of the hash encoding, one Redis hash per product, as plans shared by RedisStorage
+    and AsyncRedisStorage. Scripts queued on a pipeline are yielded too, since redis.asyncio queues them in a coroutine.
+    """
+
+    def __init__(self, client, prefix='', changes_max_length=0):
+        """
+        Args:
+            client (redis.Redis or redis.asyncio.Redis): Client sharing the server's connection pool.
+            prefix (str): Namespace prepended to every key.
+            changes_max_length (int): Approximate number of change events kept, 0 to record none.
+        """
+        self.redis = client
+        self.prefix = prefix
+        self.changes_max_length = changes_max_length
+        self.quantity_index, self.price_index, self.name_index = index_keys(prefix)
+        self.changes_key = f'{prefix}{CHANGES}'
+        self.stats_key = f'{prefix}{STATS}'
+        self.add_product_script = client.register_script(ADD_PRODUCT_SCRIPT)
+        self.update_quantity_script = client.register_script(UPDATE_QUANTITY_SCRIPT)
+        self.adjust_quantity_script = client.register_script(ADJUST_QUANTITY_SCRIPT)
+        self.delete_product_script = client.register_script(DELETE_PRODUCT_SCRIPT)
+
+
+    def key(self, product_identifier):
+        return f'{self.prefix}{product_identifier}'
+
+
+    def _get(self, product_identifier):
+        # HGETALL returns an empty hash for missing keys
+        return product_or_none(product_identifier, (yield self.redis.hgetall(self.key(product_identifier))))
+
+
+    def _get_many(self, product_identifiers):
+        if not product_identifiers:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for product_identifier in product_identifiers:
+            pipe.hgetall(self.key(product_identifier))
+        results = yield pipe.execute()
+        return [product_or_none(product_identifier, result) for product_identifier, result in zip(product_identifiers, results)]
+
+
+    def _add(self, product):
+        return bool((yield self.add_product_script(keys=self.add_keys(product), args=[*product_args(product), self.changes_max_length])))
+
+
+    def _add_many(self, products):
+        if not products:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for product in products:
+            yield self.add_product_script(keys=self.add_keys(product), args=[*product_args(product), self.changes_max_length], client=pipe)
+        return [bool(added) for added in (yield pipe.execute())]
+
+
+    def _set_quantity(self, product_identifier, quantity):
+        reply = yield self.update_quantity_script(keys=self.quantity_keys(product_identifier), args=[quantity, product_identifier, self.changes_max_length])
+        return product_or_none(product_identifier, hash_from_list(reply))
+
+
+    def _set_quantities(self, quantities):
+        if not quantities:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for product_identifier, quantity in quantities:
+            yield self.update_quantity_script(keys=self.quantity_keys(product_identifier), args=[quantity, product_identifier, self.changes_max_length], client=pipe)
+        results = yield pipe.execute()
+        return [product_or_none(product_identifier, hash_from_list(result))
+                for (product_identifier, quantity), result in zip(quantities, results)]
+
+
+    def _adjust(self, product_identifier, delta, minimum=None):
+        reply = yield self.adjust_quantity_script(keys=self.quantity_keys(product_identifier), args=[*adjust_args(delta, minimum), product_identifier, self.changes_max_length])
+        return adjust_outcome(product_identifier, reply)
+
+
+    def _adjust_many(self, adjustments):
+        if not adjustments:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for product_identifier, delta, minimum in adjustments:
+            yield self.adjust_quantity_script(keys=self.quantity_keys(product_identifier), args=[*adjust_args(delta, minimum), product_identifier, self.changes_max_length], client=pipe)
+        replies = yield pipe.execute()
+        return [adjust_outcome(adjustment[0], reply) for adjustment, reply in zip(adjustments, replies)]
+
+
+    def _delete(self, product_identifier):
+        return bool((yield self.delete_product_script(keys=self.delete_keys(product_identifier), args=[product_identifier, self.changes_max_length])))
+
+
+    def _delete_many(self, product_identifiers):
+        if not product_identifiers:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for product_identifier in product_identifiers:
+            yield self.delete_product_script(keys=self.delete_keys(product_identifier), args=[product_identifier, self.changes_max_length], client=pipe)
+        return [bool(deleted) for deleted in (yield pipe.execute())]
+
+
+    def add_keys(self, product):
+        return [self.key(product.product_identifier), self.quantity_index, self.price_index, self.name_index, self.changes_key, self.stats_key]
+
+
+    def quantity_keys(self, product_identifier):
+        return [self.key(product_identifier), self.quantity_index, self.changes_key, self.stats_key]
+
+
+    def delete_keys(self, product_identifier):
+        return [self.key(product_identifier), self.quantity_index, self.price_index, self.name_index, self.changes_key, self.stats_key]
+
+
+    def key_identifiers(self, key):
+        return hash_identifiers(key, self.prefix)
+
+
+    def _scan_batch(self, cursor, batch_size):
+        # SCAN one batch at a time, so redis-server is never blocked walking the whole keyspace,
+        # and read each batch in a single round trip
+        cursor, keys = yield self.redis.scan(cursor or 0, match=f'{glob_escape(self.prefix)}[0-9]*', count=batch_size)
+        products = []
+        if keys:
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+            results = yield pipe.execute()
+            products = [product_from_hash(key[len(self.prefix):], result)
+                        for key, result in zip(keys, results) if result] # Empty if deleted since it was scanned
+        return cursor or None, products
+
+
+class RedisStorage(PlanRunner, HashEncoding, Storage):
+    """
+    Stores each product as a Redis hash keyed by its prefixed ID, indexed by quantity, price and name.
+    Writes are Lua scripts and batches are pipelined, one round trip per batch.
+    """
+
+
+class AsyncRedisStorage(AsyncPlanRunner, HashEncoding):
+    """
+    RedisStorage on redis.asyncio, every method is a coroutine (scan returns an async iterator).
+    """
+
+
+class CompactEncoding(RedisQueries):
+    """
+    Commands and replies of the compact encoding, see BUCKET_PREFIX, as plans shared by CompactRedisStorage
+    and AsyncCompactRedisStorage.
+    """
+
+    def __init__(self, client, bucket_size=50, prefix='', changes_max_length=0):
+        """
+        Args:
+            client (redis.Redis or redis.asyncio.Redis): Client sharing the server's connection pool, with decode_responses off.
+            bucket_size (int): Products per bucket hash. Keep 2 * bucket_size within redis-server's
+                hash-max-listpack-entries (128 by default) so buckets stay compact.
+            prefix (str): Namespace prepended to every key.
+            changes_max_length (int): Approximate number of change events kept, 0 to record none.
+        """
+        self.redis = client
+        self.bucket_size = bucket_size
+        self.prefix = prefix
+        self.changes_max_length = changes_max_length
+        self.quantity_index, self.price_index, self.name_index = index_keys(prefix + BUCKET_PREFIX)
+        self.changes_key = f'{prefix}{BUCKET_PREFIX}{CHANGES}'
+        self.stats_key = f'{prefix}{BUCKET_PREFIX}{STATS}'
+        self.add_product_script = client.register_script(COMPACT_ADD_PRODUCT_SCRIPT)
+        self.update_quantity_script = client.register_script(COMPACT_UPDATE_QUANTITY_SCRIPT)
+        self.adjust_quantity_script = client.register_script(COMPACT_ADJUST_QUANTITY_SCRIPT)
+        self.delete_product_script = client.register_script(COMPACT_DELETE_PRODUCT_SCRIPT)
+
+
+    def bucket(self, product_identifier):
+        return f'{self.prefix}{BUCKET_PREFIX}{product_identifier // self.bucket_size}'
+
+
+    def _get(self, product_identifier):
+        return product_from_packed(product_identifier, *(yield self.redis.hmget(self.bucket(product_identifier), *fields(product_identifier))))
+
+
+    def _get_many(self, product_identifiers):
+        if not product_identifiers:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for product_identifier in product_identifiers:
+            pipe.hmget(self.bucket(product_identifier), *fields(product_identifier))
+        replies = yield pipe.execute()
+        return [product_from_packed(product_identifier, *reply) for product_identifier, reply in zip(product_identifiers, replies)]
+
+
+    def _add(self, product):
+        return bool((yield self.add_product_script(keys=self.add_keys(product), args=[*packed_args(product), self.changes_max_length])))
+
+
+    def _add_many(self, products):
+        if not products:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for product in products:
+            yield self.add_product_script(keys=self.add_keys(product), args=[*packed_args(product), self.changes_max_length], client=pipe)
+        return [bool(added) for added in (yield pipe.execute())]
+
+
+    def _set_quantity(self, product_identifier, quantity):
+        reply = yield self.update_quantity_script(keys=self.quantity_keys(product_identifier), args=[product_identifier, quantity, self.changes_max_length])
+        return product_from_packed(product_identifier, *reply) if reply else None
+
+
+    def _set_quantities(self, quantities):
+        if not quantities:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for product_identifier, quantity in quantities:
+            yield self.update_quantity_script(keys=self.quantity_keys(product_identifier), args=[product_identifier, quantity, self.changes_max_length], client=pipe)
+        replies = yield pipe.execute()
+        return [product_from_packed(product_identifier, *reply) if reply else None
+                for (product_identifier, quantity), reply in zip(quantities, replies)]
+
+
+    def _adjust(self, product_identifier, delta, minimum=None):
+        reply = yield self.adjust_quantity_script(keys=self.quantity_keys(product_identifier), args=[product_identifier, *adjust_args(delta, minimum), self.changes_max_length])
+        return compact_adjust_outcome(product_identifier, reply)
+
+
+    def _adjust_many(self, adjustments):
+        if not adjustments:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for product_identifier, delta, minimum in adjustments:
+            yield self.adjust_quantity_script(keys=self.quantity_keys(product_identifier), args=[product_identifier, *adjust_args(delta, minimum), self.changes_max_length],
+                                              client=pipe)
+        replies = yield pipe.execute()
+        return [compact_adjust_outcome(adjustment[0], reply) for adjustment, reply in zip(adjustments, replies)]
+
+
+    def _delete(self, product_identifier):
+        # Redis removes a bucket once its last field is deleted
+        return bool((yield self.delete_product_script(keys=self.delete_keys(product_identifier), args=[product_identifier, self.changes_max_length])))
+
+
+    def _delete_many(self, product_identifiers):
+        if not product_identifiers:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for product_identifier in product_identifiers:
+            yield self.delete_product_script(keys=self.delete_keys(product_identifier), args=[product_identifier, self.changes_max_length], client=pipe)
+        return [bool(deleted) for deleted in (yield pipe.execute())]
+
+
+    def add_keys(self, product):
+        return [self.bucket(product.product_identifier), self.quantity_index, self.price_index, self.name_index, self.changes_key, self.stats_key]
+
+
+    def quantity_keys(self, product_identifier):
+        return [self.bucket(product_identifier), self.quantity_index, self.changes_key, self.price_index, self.stats_key]
+
+
+    def delete_keys(self, product_identifier):
+        return [self.bucket(product_identifier), self.quantity_index, self.price_index, self.name_index, self.changes_key, self.stats_key]
+
+
+    def key_identifiers(self, key):
+        return bucket_identifiers(key, self.bucket_size, self.prefix)
+
+
+    def _scan_batch(self, cursor, batch_size):
+        # Each bucket holds up to bucket_size products, so SCAN asks for proportionally fewer keys
+        cursor, keys = yield self.redis.scan(cursor or 0, match=f'{glob_escape(self.prefix)}{BUCKET_PREFIX}[0-9]*',
+                                             count=max(batch_size // self.bucket_size, 1))
+        products = []
+        if keys:
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+            for result in (yield pipe.execute()):
+                products.extend(products_from_bucket(result))
+        return cursor or None, products
+
+
+class CompactRedisStorage(PlanRunner, CompactEncoding, Storage):
+    """
+    Stores products in bucketed hashes of packed Product messages, see BUCKET_PREFIX, indexed by quantity, price and name.
+    Uses far less Redis memory per product than one hash each and decodes with a single protobuf parse.
+    The client must not decode responses, since packed products are binary.
+    """
+
+
+class AsyncCompactRedisStorage(AsyncPlanRunner, CompactEncoding):
+    """
+    CompactRedisStorage on redis.asyncio, every method is a coroutine (scan returns an async iterator).
+    """
+
+
+class Record:
+    """
+    Stored fields of one product. Slots instead of a per-record __dict__ keep large catalogs compact.
+    """
+    __slots__ = ('name', 'quantity', 'price')
+
+    def __init__(self, name, quantity, price):
+        self.name = name
+        self.quantity = quantity
+        self.price = price
+
+
+class Totals:
+    """
+    Running totals of one MemoryStorage shard, see MemoryStorage.stats().
+    """
+    __slots__ = ('products', 'quantity', 'value', 'low_stock')
+
+    def __init__(self, thresholds):
+        self.products = 0
+        self.quantity = 0
+        self.value = 0.0
+        self.low_stock = [0] * thresholds
+
+
+class MemoryStorage(Storage):
+    """
+    Stores products in this process, for single-node deployments, tests and benchmarks.
+    Products are spread over shards by ID, each an ID -> Record index with its own lock,
+    so threads working on different shards never wait for each other.
+    Nothing is persisted, and every server process has its own catalog.
+    Queries scan the catalog instead of keeping indexes, which is quick at the sizes it is meant for.
+    Change events go to a bounded log shared by every shard, appended while the product's shard is locked.
+    Each shard also keeps running totals and low-stock counts for the low_stock_thresholds, updated by every write.
+    Request IDs are kept in insertion order, so the oldest is dropped first once requests_max_entries are held.
+    """
+
+    def __init__(self, shards=16, changes_max_length=0, requests_max_entries=100000, low_stock_thresholds=()):
+        """
+        Args:
+            shards (int): Number of independently locked shards.
+            changes_max_length (int): Number of change events kept, 0 to record none.
+            requests_max_entries (int): Number of request IDs kept.
+            low_stock_thresholds (list of int): Quantities whose low-stock counts stats() keeps up to date,
+                other thresholds are counted by scanning.
+        """
+        self._records = [{} for i in range(shards)]
+        self._locks = [Lock() for i in range(shards)]
+        self._low_stock_thresholds = list(low_stock_thresholds)
+        self._totals = [Totals(len(self._low_stock_thresholds)) for i in range(shards)]
+        self._changes = deque(maxlen=changes_max_length) if changes_max_length else None
+        self._changes_appended = Condition()
+        self._change_sequence = 0
+        self._requests = OrderedDict()
+        self._requests_lock = Lock()
+        self._requests_max_entries = requests_max_entries
+
+
+    def _record_change(self, operation, product):
+        # Offsets mimic stream IDs, the sequence number of each event after '0-'
+        if self._changes is None:
+            return
+        with self._changes_appended:
+            self._change_sequence += 1
+            self._changes.append((f'0-{self._change_sequence}', operation, product))
+            self._changes_appended.notify_all()
+
+
+    def _shard(self, product_identifier):
+        index = product_identifier % len(self._records)
+        return self._records[index], self._locks[index], self._totals[index]
+
+
+    def _count(self, totals, quantity, price, sign):
+        # Counts a product into (sign 1) or out of (sign -1) its shard's totals, with the shard locked
+        totals.products += sign
+        totals.quantity += sign * quantity
+        totals.value += sign * quantity * price
+        for position, threshold in enumerate(self._low_stock_thresholds):
+            if quantity <= threshold:
+                totals.low_stock[position] += sign
+
+
+    def get(self, product_identifier):
+        records, lock, _ = self._shard(product_identifier)
+        with lock:
+            record = records.get(product_identifier)
+            return product_from_record(product_identifier, record) if record is not None else None
+
+
+    def add(self, product):
+        records, lock, totals = self._shard(product.product_identifier)
+        with lock:
+            if product.product_identifier in records:
+                return False
+            records[product.product_identifier] = record = Record(product.product_name, product.product_quantity, product.product_price)
+            self._count(totals, record.quantity, record.price, 1)
+            self._record_change(CHANGE_ADDED, product_from_record(product.product_identifier, records[product.product_identifier]))
+            return True
+
+
+    def set_quantity(self, product_identifier, quantity):
+        records, lock, totals = self._shard(product_identifier)
+        with lock:
+            record = records.get(product_identifier)
+            if record is None:
+                return None
+            self._count(totals, record.quantity, record.price, -1)
+            record.quantity = quantity
+            self._count(totals, record.quantity, record.price, 1)
+            self._record_change(CHANGE_QUANTITY, inventory_pb2.Product(product_identifier=product_identifier, product_quantity=quantity))
+            return product_from_record(product_identifier, record)
+
+
+    def adjust(self, product_identifier, delta, minimum=None):
+        records, lock, totals = self._shard(product_identifier)
+        with lock:
+            record = records.get(product_identifier)
+            if record is None:
+                return ADJUST_NOT_FOUND, None
+            if not QUANTITY_RANGE[0] <= record.quantity + delta <= QUANTITY_RANGE[1]:
+                return ADJUST_OUT_OF_RANGE, product_from_record(product_identifier, record)
+            if minimum is not None and record.quantity + delta < minimum:
+                return ADJUST_REJECTED, product_from_record(product_identifier, record)
+            self._count(totals, record.quantity, record.price, -1)
+            record.quantity += delta
+            self._count(totals, record.quantity, record.price, 1)
+            self._record_change(CHANGE_QUANTITY, inventory_pb2.Product(product_identifier=product_identifier, product_quantity=record.quantity))
+            return ADJUST_APPLIED, product_from_record(product_identifier, record)
+
+
+    def delete(self, product_identifier):
+        records, lock, totals = self._shard(product_identifier)
+        with lock:
+            record = records.pop(product_identifier, None)
+            if record is None:
+                return False
+            self._count(totals, record.quantity, record.price, -1)
+            self._record_change(CHANGE_DELETED, inventory_pb2.Product(product_identifier=product_identifier))
+            return True
+
+
+    def scan(self, batch_size):
+        # Copy one shard at a time, so no lock is held while products are streamed
+        for records, lock in zip(self._records, self._locks):
+            with lock:
+                items = [(product_identifier, Record(record.name, record.quantity, record.price))
+                         for product_identifier, record in records.items()]
+            for product_identifier, record in items:
+                yield product_from_record(product_identifier, record)
+
+
+    def stats(self, thresholds):
+        if list(thresholds) != self._low_stock_thresholds:
+            return super().stats(thresholds)
+        products = quantity = 0
+        value = 0.0
+        low_stock = [0] * len(thresholds)
+        # One shard at a time, so writes to the others carry on
+        for totals, lock in zip(self._totals, self._locks):
+            with lock:
+                products += totals.products
+                quantity += totals.quantity
+                value += totals.value
+                low_stock = [count + shard_count for count, shard_count in zip(low_stock, totals.low_stock)]
+        return inventory_stats(products, quantity, value, thresholds, low_stock)
+
+
+    def read_changes(self, after, count, block=None):
+        after = offset_key(after)
+        with self._changes_appended:
+            if block and self._change_sequence <= after[-1]:
+                self._changes_appended.wait_for(lambda: self._change_sequence > after[-1], block / 1000)
+            if not self._changes:
+                return []
+            # Sequence numbers have no gaps, so the first unread event is found by arithmetic
+            start = max(after[-1] - offset_key(self._changes[0][0])[-1] + 1, 0)
+            return list(islice(self._changes, start, start + count))
+
+
+    def latest_offset(self):
+        with self._changes_appended:
+            return self._changes[-1][0] if self._changes else '0-0'
+
+
+    def trimmed_offset(self):
+        with self._changes_appended:
+            return f'0-{offset_key(self._changes[0][0])[-1] - 1}' if self._changes else '0-0'
+
+
+    def claim_request(self, key, ttl):
+        now = monotonic()
+        with self._requests_lock:
+            response, expires = self._requests.get(key, (None, 0))
+            if expires > now:
+                return response
+            self._save_request(key, REQUEST_PENDING, now + ttl)
+            return None
+
+
+    def save_request(self, key, response, ttl):
+        with self._requests_lock:
+            self._save_request(key, response, monotonic() + ttl)
+
+
+    def release_request(self, key):
+        with self._requests_lock:
+            self._requests.pop(key, None)
+
+
+    def _save_request(self, key, response, expires):
+        # Entries are roughly in expiry order, so expired ones are dropped from the front along with any over the limit
+        self._requests.pop(key, None)
+        self._requests[key] = (response, expires)
+        now = monotonic()
+        while self._requests and (len(self._requests) > self._requests_max_entries
+                                  or next(iter(self._requests.values()))[1] <= now):
+            self._requests.popitem(last=False)
+
+
+class AsyncStorageAdapter:
+    """
+    Gives a synchronous in-process storage, such as MemoryStorage, the coroutine interface of AsyncRedisStorage.
+    Its calls take microseconds and never wait on I/O, so they run directly on the event loop.
+    """
+
+    def __init__(self, storage):
+        """
+        Args:
+            storage (Storage): The storage to wrap.
+        """
+        self.storage = storage
+
+
+    async def get(self, product_identifier):
+        return self.storage.get(product_identifier)
+
+
+    async def get_many(self, product_identifiers):
+        return self.storage.get_many(product_identifiers)
+
+
+    async def add(self, product):
+        return self.storage.add(product)
+
+
+    async def add_many(self, products):
+        return self.storage.add_many(products)
+
+
+    async def set_quantity(self, product_identifier, quantity):
+        return self.storage.set_quantity(product_identifier, quantity)
+
+
+    async def set_quantities(self, quantities):
+        return self.storage.set_quantities(quantities)
+
+
+    async def adjust(self, product_identifier, delta, minimum=None):
+        return self.storage.adjust(product_identifier, delta, minimum)
+
+
+    async def adjust_many(self, adjustments):
+        return self.storage.adjust_many(adjustments)
+
+
+    async def delete(self, product_identifier):
+        return self.storage.delete(product_identifier)
+
+
+    async def delete_many(self, product_identifiers):
+        return self.storage.delete_many(product_identifiers)
+
+
+    async def scan_batch(self, cursor, batch_size):
+        # The cursor is the storage's own scan, started by the first call
+        scan = cursor if cursor is not None else self.storage.scan(batch_size)
+        batch = next_batch(scan, batch_size)
+        return scan if len(batch) == batch_size else None, batch
+
+
+    def scan(self, batch_size):
+        return scan_batches(self, batch_size)
+
+
+    async def find_by_name(self, prefix, limit):
+        return self.storage.find_by_name(prefix, limit)
+
+
+    async def find_by_quantity(self, maximum, limit):
+        return self.storage.find_by_quantity(maximum, limit)
+
+
+    async def find_by_price(self, minimum, maximum, limit):
+        return self.storage.find_by_price(minimum, maximum, limit)
+
+
+    async def list_by_name(self, prefix, after, count):
+        return self.storage.list_by_name(prefix, after, count)
+
+
+    async def stats(self, thresholds):
+        return self.storage.stats(thresholds)
+
+
+    async def read_changes(self, after, count, block=None):
+        # Waiting for an event would stall the event loop, so blocking reads run on a worker thread
+        if block:
+            return await asyncio.to_thread(self.storage.read_changes, after, count, block)
+        return self.storage.read_changes(after, count)
+
+
+    async def latest_offset(self):
+        return self.storage.latest_offset()
+
+
+    async def trimmed_offset(self):
+        return self.storage.trimmed_offset()
+
+
+    async def claim_request(self, key, ttl):
+        return self.storage.claim_request(key, ttl)
+
+
+    async def save_request(self, key, response, ttl):
+        self.storage.save_request(key, response, ttl)
+
+
+    async def release_request(self, key):
+        self.storage.release_request(key)
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to shards. Each shard owns SHARD_REPLICAS points on the ring, so adding a shard
+    moves only about 1/n of the keys, taken evenly from the others.
+
+    Methods:
+        index: Finds the shard owning a key.
+    """
+
+    def __init__(self, names, replicas=SHARD_REPLICAS):
+        """
+        Args:
+            names (list of str): Stable name of each shard, such as its address. Renaming a shard moves its keys.
+            replicas (int): Points each shard owns on the ring.
+        """
+        points = sorted((ring_hash(f'{name}#{replica}'), index) for index, name in enumerate(names) for replica in range(replicas))
+        self._hashes = [point for point, index in points]
+        self._indexes = [index for point, index in points]
+
+
+    def index(self, key):
+        """
+        Finds the shard owning a key: the first point at or after the key's hash, wrapping around.
+
+        Args:
+            key: A product ID or any other key, hashed as text.
+
+        Returns:
+            int: Index of the shard in the names given to the ring.
+        """
+        return self._indexes[bisect(self._hashes, ring_hash(str(key))) % len(self._hashes)]
+
+
+class ShardRouting:
+    """
+    Routing of the sharded storages, shared by ShardedStorage and AsyncShardedStorage. Single-product calls go to
+    the owning shard, batches are split by shard with fan_out() and queries ask every shard with each(), then the answers
+    are merged. Methods are plans, see run_plan(), yielding the shards' calls.
+    Expects each() and fan_out() of the storage it is mixed into.
+    """
+
+    def __init__(self, shards, names=None):
+        """
+        Args:
+            shards (list): The shards, all using the same key prefix.
+            names (list of str): Stable name of each shard for the hash ring, by default its position.
+        """
+        self.shards = shards
+        self.ring = HashRing(names if names is not None else [str(index) for index in range(len(shards))])
+
+
+    def shard(self, key):
+        """
+        Finds the shard owning a key.
+
+        Args:
+            key: Product ID or request ID.
+
+        Returns:
+            The shard.
+        """
+        return self.shards[self.ring.index(key)]
+
+
+    def key_identifiers(self, key):
+        return self.shards[0].key_identifiers(key)
+
+
+    def _get(self, product_identifier):
+        return (yield self.shard(product_identifier).get(product_identifier))
+
+
+    def _get_many(self, product_identifiers):
+        return (yield self.fan_out('get_many', product_identifiers, lambda product_identifier: product_identifier))
+
+
+    def _add(self, product):
+        return (yield self.shard(product.product_identifier).add(product))
+
+
+    def _add_many(self, products):
+        return (yield self.fan_out('add_many', products, lambda product: product.product_identifier))
+
+
+    def _set_quantity(self, product_identifier, quantity):
+        return (yield self.shard(product_identifier).set_quantity(product_identifier, quantity))
+
+
+    def _set_quantities(self, quantities):
+        return (yield self.fan_out('set_quantities', quantities, lambda item: item[0]))
+
+
+    def _adjust(self, product_identifier, delta, minimum=None):
+        return (yield self.shard(product_identifier).adjust(product_identifier, delta, minimum))
+
+
+    def _adjust_many(self, adjustments):
+        return (yield self.fan_out('adjust_many', adjustments, lambda item: item[0]))
+
+
+    def _delete(self, product_identifier):
+        return (yield self.shard(product_identifier).delete(product_identifier))
+
+
+    def _delete_many(self, product_identifiers):
+        return (yield self.fan_out('delete_many', product_identifiers, lambda product_identifier: product_identifier))
+
+
+    def _find_by_name(self, prefix, limit):
+        return nsmallest(limit, chain.from_iterable((yield self.each('find_by_name', prefix, limit))), key=name_position)
+
+
+    def _find_by_quantity(self, maximum, limit):
+        return nsmallest(limit, chain.from_iterable((yield self.each('find_by_quantity', maximum, limit))),
+                         key=lambda product: (product.product_quantity, str(product.product_identifier)))
+
+
+    def _find_by_price(self, minimum, maximum, limit):
+        return nsmallest(limit, chain.from_iterable((yield self.each('find_by_price', minimum, maximum, limit))),
+                         key=lambda product: (product.product_price, str(product.product_identifier)))
+
+
+    def _list_by_name(self, prefix, after, count):
+        return merge_pages((yield self.each('list_by_name', prefix, after, count)), count)
+
+
+    def _stats(self, thresholds):
+        return merge_stats((yield self.each('stats', thresholds)), thresholds)
+
+
+    def _latest_offset(self):
+        return ','.join((yield self.each('latest_offset')))
+
+
+    def _trimmed_offset(self):
+        return ','.join((yield self.each('trimmed_offset')))
+
+
+    def _claim_request(self, key, ttl):
+        return (yield self.shard(key).claim_request(key, ttl))
+
+
+    def _save_request(self, key, response, ttl):
+        yield self.shard(key).save_request(key, response, ttl)
+
+
+    def _release_request(self, key):
+        yield self.shard(key).release_request(key)
+
+
+class ShardedStorage(PlanRunner, ShardRouting, Storage):
+    """
+    Spreads the catalog over several storages, usually one per redis-server, by consistent hashing of product IDs.
+    Single-product calls go to the owning shard. Batch calls are split by shard and sent to the shards in parallel,
+    so a batch takes about as long as its slowest shard. Queries ask every shard and merge the answers.
+
+    Change events get offsets naming the last event read from each shard, comma-separated, since the shards' logs
+    are ordered independently.
+    """
+
+    def __init__(self, shards, names=None, workers=1):
+        """
+        Args:
+            shards (list of Storage): The shards, all using the same key prefix.
+            names (list of str): Stable name of each shard for the hash ring, by default its position.
+            workers (int): Calls that may use the storage at once, the server's max_workers. Each gets a thread
+                per shard, so concurrent batches never wait for one another's shard calls.
+        """
+        super().__init__(shards, names)
+        self._executor = ThreadPoolExecutor(max_workers=workers * len(shards), thread_name_prefix='shard')
+        # Scans read ahead on their own threads, so long catalog streams never hold up batches
+        self._scanners = ThreadPoolExecutor(max_workers=workers * len(shards), thread_name_prefix='shard-scanner')
+        # Blocking change reads get their own threads, so they never hold up batches
+        self._readers = ThreadPoolExecutor(max_workers=2 * len(shards), thread_name_prefix='shard-reader')
+        self._reads = {}  # Shard index -> ((after, count), future) of a blocking change read still running
+        self._reads_lock = Lock()
+
+
+    def submit(self, function, *args, executor=None):
+        """
+        Runs a function on a shard worker thread, in a copy of the caller's context
+        so the deadline of the gRPC call (breaker.DEADLINE) still applies there.
+
+        Args:
+            function (callable): The function.
+            *args: Its arguments.
+            executor (concurrent.futures.Executor): The threads to use, by default those of batches and queries.
+
+        Returns:
+            concurrent.futures.Future: Its result.
+        """
+        return (executor or self._executor).submit(copy_context().run, function, *args)
+
+
+    def each(self, method, *args):
+        """
+        Calls a method of every shard in parallel.
+
+        Args:
+            method (str): Name of the Storage method.
+            *args: Its arguments.
+
+        Returns:
+            list: Each shard's result, in shard order.
+        """
+        futures = [self.submit(getattr(shard, method), *args) for shard in self.shards]
+        return [future.result() for future in futures]
+
+
+    def fan_out(self, method, items, key):
+        """
+        Splits a batch by shard and calls a batch method of each shard involved in parallel.
+
+        Args:
+            method (str): Name of the Storage batch method, which returns one result per item.
+            items (list): The batch.
+            key (callable): Gives the product ID of an item.
+
+        Returns:
+            list: The result for each item, in the batch's order.
+        """
+        groups = shard_groups(self.ring, items, key)
+        # A batch owned by one shard needs no worker thread
+        if len(groups) == 1:
+            index, = groups
+            return getattr(self.shards[index], method)(items)
+        futures = {index: self.submit(getattr(self.shards[index], method), [items[position] for position in positions])
+                   for index, positions in groups.items()}
+        return merge_groups(groups, {index: future.result() for index, future in futures.items()}, len(items))
+
+
+    def scan(self, batch_size):
+        # Read the next batch of every shard while the current batches are consumed, so the merged stream runs
+        # at the pace of the fastest reads rather than the sum of each shard's round trips
+        scans = [shard.scan(batch_size) for shard in self.shards]
+        futures = {self.submit(next_batch, scan, batch_size, executor=self._scanners): scan for scan in scans}
+        while futures:
+            done, pending = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                scan = futures.pop(future)
+                batch = future.result()
+                if batch:
+                    futures[self.submit(next_batch, scan, batch_size, executor=self._scanners)] = scan
+                    yield from batch
+
+
+    def read_changes(self, after, count, block=None):
+        afters = split_offset(after, len(self.shards))
+        if not block:
+            futures = [self.submit(shard.read_changes, shard_after, count) for shard, shard_after in zip(self.shards, afters)]
+            return merge_changes(afters, [future.result() for future in futures], count)
+
+        # A blocking read returns as soon as any shard has events. The reads still blocked are kept for the next call,
+        # which reads the same shards from the same offsets, rather than piling up on the reader threads
+        with self._reads_lock:
+            futures = []
+            for index, (shard, shard_after) in enumerate(zip(self.shards, afters)):
+                read = self._reads.pop(index, None)
+                if read is None or read[0] != (shard_after, count) or read[1].done():
+                    read = (shard_after, count), self._readers.submit(shard.read_changes, shard_after, count, block)
+                futures.append(read[1])
+        pending = futures
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if any(future.result() for future in done):
+                break
+        with self._reads_lock:
+            for index, future in enumerate(futures):
+                if not future.done():
+                    self._reads[index] = (afters[index], count), future
+        return merge_changes(afters, [future.result() if future.done() else [] for future in futures], count)
+
+
+class AsyncShardedStorage(AsyncPlanRunner, ShardRouting):
+    """
+    Coroutine version of ShardedStorage, over AsyncRedisStorage, AsyncCompactRedisStorage or AsyncStorageAdapter shards.
+    Shards are called concurrently on the event loop.
+    """
+
+    def __init__(self, shards, names=None):
+        """
+        Args:
+            shards (list): The asynchronous shards, all using the same key prefix.
+            names (list of str): Stable name of each shard for the hash ring, by default its position.
+        """
+        super().__init__(shards, names)
+        self._reads = {}  # Shard index -> ((after, count), task) of a blocking change read still running
+
+
+    async def each(self, method, *args):
+        return await asyncio.gather(*(getattr(shard, method)(*args) for shard in self.shards))
+
+
+    async def fan_out(self, method, items, key):
+        groups = shard_groups(self.ring, items, key)
+        if len(groups) == 1:
+            index, = groups
+            return await getattr(self.shards[index], method)(items)
+        results = await asyncio.gather(*(getattr(self.shards[index], method)([items[position] for position in positions])
+                                         for index, positions in groups.items()))
+        return merge_groups(groups, dict(zip(groups, results)), len(items))
+
+
+    async def scan_batch(self, cursor, batch_size):
+        # The cursor maps each shard still being scanned to its own cursor, and the shards are read concurrently
+        cursors = cursor if cursor is not None else dict.fromkeys(range(len(self.shards)))
+        indexes = list(cursors)
+        steps = await asyncio.gather(*(self.shards[index].scan_batch(cursors[index], batch_size) for index in indexes))
+        cursors = {index: shard_cursor for index, (shard_cursor, products) in zip(indexes, steps) if shard_cursor is not None}
+        return cursors or None, [product for shard_cursor, products in steps for product in products]
+
+
+    async def read_changes(self, after, count, block=None):
+        afters = split_offset(after, len(self.shards))
+        if not block:
+            batches = await asyncio.gather(*(shard.read_changes(shard_after, count) for shard, shard_after in zip(self.shards, afters)))
+            return merge_changes(afters, batches, count)
+
+        # Keep the reads still blocked for the next call, as ShardedStorage.read_changes() does.
+        # Cancelling them instead could leak their connections.
+        tasks = []
+        for index, (shard, shard_after) in enumerate(zip(self.shards, afters)):
+            read = self._reads.pop(index, None)
+            if read is None or read[0] != (shard_after, count) or read[1].done():
+                read = (shard_after, count), asyncio.ensure_future(shard.read_changes(shard_after, count, block))
+            tasks.append(read[1])
+        pending = tasks
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if any(task.result() for task in done):
+                break
+        for index, task in enumerate(tasks):
+            if not task.done():
+                self._reads[index] = (afters[index], count), task
+        return merge_changes(afters, [task.result() if task.done() else [] for task in tasks], count)
+
+
+def product_from_hash(product_identifier, result):
+    """
+    Builds a Product message from its stored Redis hash.
+
+    Args:
+        product_identifier (int or str): ID (Redis key) of the product.
+        result (dict): The product's hash fields.
+
+    Returns:
+        inventory_pb2.Product: The product.
+    """
+    return inventory_pb2.Product(product_identifier=int(product_identifier), product_name=str(result.get('product_name')),
+                                 product_quantity=int(result.get('product_quantity')), product_price=float(result.get('product_price')))
+
+
+def product_or_none(product_identifier, result):
+    """
+    Builds a Product message from its stored Redis hash, if there is one.
+
+    Args:
+        product_identifier (int or str): ID (Redis key) of the product.
+        result (dict): The product's hash fields, empty if it does not exist.
+
+    Returns:
+        inventory_pb2.Product: The product, None if it does not exist.
+    """
+    return product_from_hash(product_identifier, result) if result else None
+
+
+def product_from_record(product_identifier, record):
+    """
+    Builds a Product message from its in-memory record.
+
+    Args:
+        product_identifier (int): ID of the product.
+        record (Record): The product's fields.
+
+    Returns:
+        inventory_pb2.Product: The product.
+    """
+    return inventory_pb2.Product(product_identifier=product_identifier, product_name=record.name,
+                                 product_quantity=record.quantity, product_price=record.price)
+
+
+def inventory_stats(products, quantity, value, thresholds, low_stock):
+    """
+    Builds the InventoryStats message of a catalog.
+
+    Args:
+        products (int): Number of products.
+        quantity (int): Their total quantity.
+        value (float): Their total quantity * price.
+        thresholds (list of int): The low-stock thresholds.
+        low_stock (list of int): Number of products at or below each threshold.
+
+    Returns:
+        inventory_pb2.InventoryStats: The statistics.
+    """
+    return inventory_pb2.InventoryStats(products=products, total_quantity=quantity, total_value=value,
+                                        low_stock=[inventory_pb2.LowStockCount(maximum_quantity=threshold, products=count)
+                                                   for threshold, count in zip(thresholds, low_stock)])
+
+
+def stats_from_totals(totals, thresholds, low_stock):
+    """
+    Builds the InventoryStats message of a Redis storage from its STATS hash.
+
+    Args:
+        totals (list): Values of the STATS_FIELDS, None where unset (no product was ever added).
+        thresholds (list of int): The low-stock thresholds.
+        low_stock (list of int): ZCOUNT of the quantity index at each threshold.
+
+    Returns:
+        inventory_pb2.InventoryStats: The statistics.
+    """
+    products, quantity, value = totals
+    return inventory_stats(int(products or 0), int(quantity or 0), float(value or 0), thresholds, low_stock)
+
+
+def merge_stats(stats, thresholds):
+    """
+    Adds up the statistics of several shards.
+
+    Args:
+        stats (list of inventory_pb2.InventoryStats): Each shard's statistics, for the same thresholds.
+        thresholds (list of int): The low-stock thresholds.
+
+    Returns:
+        inventory_pb2.InventoryStats: The statistics of the whole catalog.
+    """
+    return inventory_stats(sum(shard.products for shard in stats), sum(shard.total_quantity for shard in stats),
+                           sum(shard.total_value for shard in stats), thresholds,
+                           [sum(shard.low_stock[position].products for shard in stats) for position in range(len(thresholds))])
+
+
+def product_args(product):
+    """
+    Builds the ADD_PRODUCT_SCRIPT arguments for a product.
+
+    Args:
+        product (inventory_pb2.Product): The product to add.
+
+    Returns:
+        list: The product's name, quantity, price and ID.
+    """
+    return [product.product_name, product.product_quantity, product.product_price, product.product_identifier]
+
+
+def adjust_args(delta, minimum):
+    """
+    Builds the ADJUST_QUANTITY_SCRIPT arguments for an adjustment.
+
+    Args:
+        delta (int): Amount to add, negative to subtract.
+        minimum (int): Least quantity the product may be left with, None for no limit.
+
+    Returns:
+        list: The delta and the minimum quantity, or '' if there is none.
+    """
+    return [delta, '' if minimum is None else minimum]
+
+
+def adjust_outcome(product_identifier, reply):
+    """
+    Decodes the ADJUST_QUANTITY_SCRIPT reply.
+
+    Args:
+        product_identifier (int): ID of the product.
+        reply (list): The script's [outcome, flat hash] reply.
+
+    Returns:
+        tuple: The ADJUST_* outcome and the product as it now stands (None if not found).
+    """
+    return reply[0], product_or_none(product_identifier, hash_from_list(reply[1]))
+
+
+def fields(product_identifier):
+    """
+    Names the bucket fields holding a product in the compact encoding.
+
+    Args:
+        product_identifier (int): ID of the product.
+
+    Returns:
+        tuple: The packed product field and the quantity field.
+    """
+    return product_identifier, f'{product_identifier}:q'
+
+
+def packed_args(product):
+    """
+    Builds the COMPACT_ADD_PRODUCT_SCRIPT arguments for a product.
+    The ID and quantity are left out of the packed message, the ID names the field and the quantity has a field of its own.
+
+    Args:
+        product (inventory_pb2.Product): The product to add.
+
+    Returns:
+        list: The product's ID, packed name and price, quantity, and the price and name again for the indexes.
+    """
+    packed = inventory_pb2.Product(product_name=product.product_name, product_price=product.product_price).SerializeToString()
+    return [product.product_identifier, packed, product.product_quantity, product.product_price, product.product_name]
+
+
+def product_from_packed(product_identifier, packed, quantity):
+    """
+    Builds a Product message from its compact encoding.
+
+    Args:
+        product_identifier (int or bytes): ID of the product.
+        packed (bytes): The packed name and price, None if the product does not exist.
+        quantity (bytes): The quantity.
+
+    Returns:
+        inventory_pb2.Product: The product, None if it does not exist.
+    """
+    if packed is None or quantity is None:
+        return None
+    product = inventory_pb2.Product.FromString(packed)
+    product.product_identifier = int(product_identifier)
+    product.product_quantity = int(quantity)
+    return product
+
+
+def products_from_bucket(result):
+    """
+    Decodes every product of a bucket hash.
+
+    Args:
+        result (dict): The bucket's fields, as returned by HGETALL.
+
+    Yields:
+        inventory_pb2.Product: The products.
+    """
+    for field, packed in result.items():
+        if not field.endswith(b':q'):
+            product = product_from_packed(field, packed, result.get(field + b':q'))
+            if product is not None: # Half-deleted products are skipped
+                yield product
+
+
+def compact_adjust_outcome(product_identifier, reply):
+    """
+    Decodes the COMPACT_ADJUST_QUANTITY_SCRIPT reply.
+
+    Args:
+        product_identifier (int): ID of the product.
+        reply (list): The script's [outcome, [packed product, quantity]] reply.
+
+    Returns:
+        tuple: The ADJUST_* outcome and the product as it now stands (None if not found).
+    """
+    return reply[0], product_from_packed(product_identifier, *reply[1]) if reply[1] else None
+
+
+def hash_identifiers(key, prefix=''):
+    """
+    Lists the product a hash-per-product key holds.
+
+    Args:
+        key (str or bytes): Redis key.
+        prefix (str): Namespace of the storage's keys.
+
+    Returns:
+        list of int: ID of the product, empty if the key is not a product.
+    """
+    key = as_text(key)
+    if not key.startswith(prefix):
+        return []
+    try:
+        return [int(key[len(prefix):])]
+    except ValueError:
+        return []
+
+
+def bucket_identifiers(key, bucket_size, prefix=''):
+    """
+    Lists the products a compact bucket may hold.
+
+    Args:
+        key (str or bytes): Redis key of the bucket.
+        bucket_size (int): Products per bucket.
+        prefix (str): Namespace of the storage's keys.
+
+    Returns:
+        list of int: IDs of the products, empty if the key is not a bucket.
+    """
+    key = as_text(key)
+    if not key.startswith(prefix + BUCKET_PREFIX):
+        return []
+    try:
+        bucket = int(key[len(prefix + BUCKET_PREFIX):])
+    except ValueError:
+        return []
+    return list(range(bucket * bucket_size, (bucket + 1) * bucket_size))
+
+
+def index_keys(prefix):
+    """
+    Names the secondary index keys of a namespace.
+
+    Args:
+        prefix (str): Namespace of the storage's keys.
+
+    Returns:
+        tuple: The quantity, price and name index keys.
+    """
+    return f'{prefix}{QUANTITY_INDEX}', f'{prefix}{PRICE_INDEX}', f'{prefix}{NAME_INDEX}'
+
+
+def name_range(prefix, after=None):
+    """
+    Builds the ZRANGEBYLEX bounds matching every NAME_INDEX member that starts with a name prefix.
+    The bounds are bytes, since 0xff (which sorts after any UTF-8 text) is not valid text.
+
+    Args:
+        prefix (str): Start of the name, empty for every name.
+        after (str): Position to continue from, see name_position(). None to start at the first match.
+
+    Returns:
+        tuple: The lower and upper bounds.
+    """
+    prefix = prefix.encode()
+    lower, upper = (b'[' + prefix, b'[' + prefix + b'\xff') if prefix else ('-', '+')
+    if after is not None and after.encode() >= prefix:
+        lower = b'(' + after.encode()
+    return lower, upper
+
+
+def name_position(product):
+    """
+    Names a product's place in name order, which is its NAME_INDEX member.
+
+    Args:
+        product (inventory_pb2.Product): The product.
+
+    Returns:
+        str: The name and ID joined by a NUL character.
+    """
+    return f'{product.product_name}\0{product.product_identifier}'
+
+
+def name_identifier(member):
+    """
+    Extracts the product ID from a NAME_INDEX member.
+
+    Args:
+        member (str or bytes): The member, the name and ID joined by a NUL character.
+
+    Returns:
+        int: ID of the product.
+    """
+    separator = b'\0' if isinstance(member, bytes) else '\0'
+    return int(member.rpartition(separator)[2])
+
+
+def as_text(value):
+    """
+    Decodes a Redis reply that may be bytes, for clients that do not decode responses.
+
+    Args:
+        value (str or bytes): The reply.
+
+    Returns:
+        str: The reply as text.
+    """
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def offset_key(offset):
+    """
+    Orders change event offsets, which are stream IDs of the form <milliseconds>-<sequence>.
+
+    Args:
+        offset (str): The offset, the sequence may be left out.
+
+    Returns:
+        tuple of int: The offset's parts, comparable with those of other offsets.
+
+    Raises:
+        ValueError: If the text is not an offset.
+    """
+    return tuple(int(part) for part in offset.split('-', 1))
+
+
+def change_from_fields(offset, fields):
+    """
+    Decodes a change stream entry.
+
+    Args:
+        offset (str or bytes): Stream ID of the entry.
+        fields (dict): The entry's fields, see CHANGES.
+
+    Returns:
+        tuple: The offset, CHANGE_* operation and product, see Storage.read_changes().
+    """
+    fields = {as_text(field): as_text(value) for field, value in fields.items()}
+    product = inventory_pb2.Product(product_identifier=int(fields['id']))
+    if 'name' in fields:
+        product.product_name = fields['name']
+        product.product_price = float(fields['price'])
+    if 'quantity' in fields:
+        product.product_quantity = int(fields['quantity'])
+    return as_text(offset), fields['op'], product
+
+
+def trimmed_from_info(info):
+    """
+    Finds the newest dropped entry of a change stream from XINFO STREAM.
+
+    Args:
+        info (dict): XINFO STREAM reply.
+
+    Returns:
+        str: Offset of the newest dropped event, '0-0' if none was dropped.
+    """
+    if 'max-deleted-entry-id' in info:
+        return as_text(info['max-deleted-entry-id'])
+    # Before Redis 7 the stream does not say, so readers behind the oldest event kept are assumed to have missed some
+    return as_text(info['first-entry'][0]) if info.get('first-entry') else '0-0'
+
+
+def glob_escape(text):
+    """
+    Escapes the characters SCAN MATCH patterns treat specially.
+
+    Args:
+        text (str): Literal text, such as a key prefix.
+
+    Returns:
+        str: A pattern matching exactly the text.
+    """
+    return ''.join(f'\\{character}' if character in '*?[]\\' else character for character in text)
+
+
+def hash_from_list(values):
+    """
+    Converts a flat [field, value, ...] list, as returned by HGETALL inside a Lua script, to a dict.
+
+    Args:
+        values (list): Alternating field names and values.
+
+    Returns:
+        dict: The hash fields.
+    """
+    return dict(zip(values[::2], values[1::2]))
+
+
+def ring_hash(text):
+    """
+    Places text on the hash ring.
+
+    Args:
+        text (str): A shard point name or a key.
+
+    Returns:
+        int: Its 64-bit position.
+    """
+    return int.from_bytes(blake2b(text.encode(), digest_size=8).digest(), 'big')
+
+
+def shard_groups(ring, items, key):
+    """
+    Splits a batch by the shard owning each item.
+
+    Args:
+        ring (HashRing): The shards' ring.
+        items (list): The batch.
+        key (callable): Gives the product ID of an item.
+
+    Returns:
+        dict: Positions in the batch of the items each shard owns, by shard index.
+    """
+    groups = {}
+    for position, item in enumerate(items):
+        groups.setdefault(ring.index(key(item)), []).append(position)
+    return groups
+
+
+def merge_groups(groups, results, size):
+    """
+    Puts the results of the shards' share of a batch back in the batch's order.
+
+    Args:
+        groups (dict): Positions of each shard's items, see shard_groups().
+        results (dict): Each shard's results, one per item, by shard index.
+        size (int): Items in the batch.
+
+    Returns:
+        list: The result for each item.
+    """
+    merged = [None] * size
+    for index, positions in groups.items():
+        for position, result in zip(positions, results[index]):
+            merged[position] = result
+    return merged
+
+
+def next_batch(scan, batch_size):
+    """
+    Reads the next batch of a shard's scan.
+
+    Args:
+        scan (iterator of inventory_pb2.Product): The scan.
+        batch_size (int): Most products to read.
+
+    Returns:
+        list of inventory_pb2.Product: The products, empty when the scan is over.
+    """
+    return list(islice(scan, batch_size))
+
+
+async def scan_batches(storage, batch_size):
+    """
+    Iterates over every product of an asynchronous storage, one scan_batch() step at a time.
+
+    Args:
+        storage: The storage, with the coroutine interface of AsyncRedisStorage.
+        batch_size (int): Products read per step.
+
+    Yields:
+        inventory_pb2.Product: The products, in no particular order.
+    """
+    cursor = None
+    while True:
+        cursor, products = await storage.scan_batch(cursor, batch_size)
+        for product in products:
+            yield product
+        if cursor is None:
+            return
+
+
+def merge_pages(pages, count):
+    """
+    Merges the shards' list_by_name() pages into one page. A shard that stopped early only vouches for the names
+    up to its position, so the page ends at the earliest such position.
+
+    Args:
+        pages (list of tuple): Each shard's products and position.
+        count (int): Most products to return.
+
+    Returns:
+        tuple: The products, and the position to continue from (None when the listing is complete).
+    """
+    positions = [position for products, position in pages if position is not None]
+    limit = min(positions) if positions else None
+    candidates = sorted((product for products, position in pages for product in products
+                         if limit is None or name_position(product) <= limit), key=name_position)
+    if len(candidates) > count:
+        return candidates[:count], name_position(candidates[count - 1])
+    return candidates, limit
+
+
+def split_offset(offset, shards):
+    """
+    Splits a sharded change offset into each shard's offset.
+
+    Args:
+        offset (str): Comma-separated offsets, one per shard, or '0' for every shard's oldest event.
+        shards (int): Number of shards.
+
+    Returns:
+        list of str: Each shard's offset.
+
+    Raises:
+        ValueError: If the offset does not name one offset per shard.
+    """
+    if offset == '0':
+        return ['0'] * shards
+    offsets = offset.split(',')
+    if len(offsets) != shards:
+        raise ValueError(f'offset {offset!r} names {len(offsets)} shards, not {shards}')
+    return offsets
+
+
+def merge_changes(afters, batches, count):
+    """
+    Merges the change events read from each shard, oldest first by stream ID, and gives each event
+    the sharded offset of everything read up to and including it.
+
+    Args:
+        afters (list of str): Offset each shard was read after.
+        batches (list of list): Events read from each shard, see Storage.read_changes().
+        count (int): Most events to return.
+
+    Returns:
+        list of tuple: The offset, CHANGE_* operation and product of each event.
+    """
+    events = sorted(((offset_key(offset), index, offset, operation, product)
+                     for index, batch in enumerate(batches) for offset, operation, product in batch), key=lambda event: event[:2])
+    offsets = list(afters)
+    merged = []
+    for key, index, offset, operation, product in events[:count]:
+        offsets[index] = offset
+        merged.append((','.join(offsets), operation, product))
+    return merged
+
+
+def run_plan(plan):
+    """
+    Runs a plan: a generator that yields each call it makes to a client and is sent back the call's result,
+    so the same commands and reply parsing serve synchronous and asyncio code.
+    On synchronous clients the call has already returned by the time it is yielded.
+
+    Args:
+        plan (generator): The plan.
+
+    Returns:
+        What the plan returns.
+    """
+    try:
+        result = next(plan)
+        while True:
+            result = plan.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def async_run_plan(plan):
+    """
+    Runs a plan, see run_plan(), on asyncio clients, whose calls return awaitables. A call that fails
+    raises inside the plan where it was made, so the plan handles errors as it would on synchronous clients.
+
+    Args:
+        plan (generator): The plan.
+
+    Returns:
+        What the plan returns.
+    """
+    try:
+        call = next(plan)
+        while True:
+            try:
+                result = await call
+            except Exception as error:
+                call = plan.throw(error)
+            else:
+                call = plan.send(result)
+    except StopIteration as stop:
+        return stop.value
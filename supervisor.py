@@ -0,0 +1,106 @@
+import multiprocessing
+import signal
+import socket
+from time import monotonic, sleep
+
+from log import logger, setup_logging
+
+
+# Restart delay for a worker that keeps crashing, doubled after each quick crash
+MIN_RESTART_DELAY = 0.5
+MAX_RESTART_DELAY = 30.0
+
+# Seconds a worker must stay up before a crash no longer counts as quick
+STABLE_UPTIME = 10.0
+
+
+def worker(config, use_async):
+    """
+    Runs one server process until it is sent SIGTERM.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+        use_async (bool): Serve with the asyncio server instead of the threaded one.
+    """
+    # Ctrl+C reaches the whole process group, the supervisor decides how workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(config)
+    if use_async:
+        import asyncio
+        import aio_server
+        asyncio.run(aio_server.run(config))
+    else:
+        import server
+        server.run(config)
+
+
+def supervise(config, use_async=False):
+    """
+    Forks config['processes'] server processes that share server_address through SO_REUSEPORT,
+    so the kernel spreads connections across them and throughput scales with cores.
+    Restarts workers that exit unexpectedly, backing off while they keep crashing.
+    On SIGTERM or SIGINT every worker drains its in-flight calls before the supervisor exits.
+
+    Args:
+        config (dict): Server settings, see config.load_config().
+        use_async (bool): Serve with the asyncio server instead of the threaded one.
+    """
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise RuntimeError('Multiple server processes need SO_REUSEPORT, which this platform does not support.')
+    if config['storage'] == 'memory':
+        raise RuntimeError('Each server process would have its own memory storage, run one process or use redis storage.')
+
+    # Workers are spawned rather than forked so no gRPC state is inherited from the supervisor
+    context = multiprocessing.get_context('spawn')
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    def start(index):
+        # Each worker has its own metrics, served on consecutive ports from metrics_port
+        worker_config = dict(config, metrics_port=config['metrics_port'] + index) if config['metrics_port'] else config
+        process = context.Process(target=worker, args=(worker_config, use_async), name=f'inventory-worker-{index}', daemon=False)
+        process.start()
+        return process
+
+    count = config['processes']
+    workers = [start(index) for index in range(count)]
+    started = [monotonic()] * count
+    delays = [MIN_RESTART_DELAY] * count
+    restart_at = [None] * count
+    logger.info('Supervisor started %d workers on %s.', count, config['server_address'])
+
+    while not stopping:
+        for index, process in enumerate(workers):
+            if process.is_alive():
+                continue
+
+            # Schedule a restart, waiting longer each time a worker dies soon after starting
+            if restart_at[index] is None:
+                if monotonic() - started[index] >= STABLE_UPTIME:
+                    delays[index] = MIN_RESTART_DELAY
+                logger.warning('Worker %d exited with code %s, restarting in %.1fs.', process.pid, process.exitcode, delays[index])
+                restart_at[index] = monotonic() + delays[index]
+                delays[index] = min(delays[index] * 2, MAX_RESTART_DELAY)
+            elif monotonic() >= restart_at[index]:
+                workers[index] = start(index)
+                started[index] = monotonic()
+                restart_at[index] = None
+        sleep(0.2)
+
+    # Ask every worker to drain, then kill any that outlive the grace period
+    logger.info('Stopping workers...')
+    for process in workers:
+        if process.is_alive():
+            process.terminate()
+    deadline = monotonic() + config['shutdown_grace'] + 5
+    for process in workers:
+        process.join(max(deadline - monotonic(), 0))
+        if process.is_alive():
+            logger.warning('Worker %d did not drain in time, killing it.', process.pid)
+            process.kill()
+            process.join()
+    logger.info('Supervisor stopped.')
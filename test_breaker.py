@@ -0,0 +1,99 @@
+import asyncio
+import socket
+from time import monotonic, sleep
+
+import pytest
+import redis
+import redis.asyncio
+
+from breaker import DEADLINE, CircuitBreaker, CircuitOpenError, guard_pool, remaining_timeout
+
+
+def test_circuit_opens_after_consecutive_failures_and_probes():
+    breaker = CircuitBreaker(3, 0.05)
+    for attempt in range(2):
+        breaker.failure()
+    breaker.success()
+    for attempt in range(3):
+        assert breaker.allow()
+        breaker.failure()
+    assert breaker.open and not breaker.allow()
+    sleep(0.06)
+    assert breaker.allow() # One probe per reset_timeout
+    assert not breaker.allow()
+    breaker.success()
+    assert not breaker.open and breaker.allow()
+
+
+def test_socket_timeouts_are_cut_to_the_deadline():
+    assert remaining_timeout(5.0) == 5.0
+    token = DEADLINE.set(monotonic() + 1.0)
+    try:
+        assert 0.5 < remaining_timeout(5.0) <= 1.0
+        assert remaining_timeout(0.1) == 0.1
+        assert 0.5 < remaining_timeout(None) <= 1.0
+        DEADLINE.set(monotonic() - 1.0)
+        with pytest.raises(redis.TimeoutError):
+            remaining_timeout(5.0)
+    finally:
+        DEADLINE.reset(token)
+
+
+def test_guarded_pool_fails_fast_while_redis_is_down():
+    # Nothing listens on port 1, so every connect is refused
+    pool = redis.ConnectionPool(host='127.0.0.1', port=1, socket_connect_timeout=1)
+    breaker = CircuitBreaker(2, 60)
+    guard_pool(pool, breaker)
+    client = redis.Redis(connection_pool=pool)
+    for attempt in range(2):
+        with pytest.raises(redis.ConnectionError) as error:
+            client.ping()
+        assert not isinstance(error.value, CircuitOpenError)
+    assert breaker.open
+    with pytest.raises(CircuitOpenError):
+        client.ping()
+
+
+@pytest.fixture
+def silent_port():
+    """Port of a server that accepts connections, through its backlog, but never answers."""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(8)
+    yield listener.getsockname()[1]
+    listener.close()
+
+
+def test_short_deadlines_leave_the_breaker_closed(silent_port):
+    pool = redis.ConnectionPool(host='127.0.0.1', port=silent_port, socket_timeout=0.2)
+    breaker = CircuitBreaker(1, 60)
+    guard_pool(pool, breaker)
+    client = redis.Redis(connection_pool=pool)
+    token = DEADLINE.set(monotonic() + 0.05)
+    try:
+        with pytest.raises(redis.TimeoutError):
+            client.ping()
+    finally:
+        DEADLINE.reset(token)
+    assert not breaker.open
+    # The same timeout without a deadline cutting it short counts
+    with pytest.raises(redis.TimeoutError):
+        client.ping()
+    assert breaker.open
+
+
+def test_short_deadlines_leave_the_asyncio_breaker_closed(silent_port):
+    async def ping():
+        pool = redis.asyncio.ConnectionPool(host='127.0.0.1', port=silent_port, socket_timeout=0.2)
+        breaker = CircuitBreaker(1, 60)
+        guard_pool(pool, breaker)
+        client = redis.asyncio.Redis(connection_pool=pool)
+        DEADLINE.set(monotonic() + 0.05)
+        with pytest.raises(redis.TimeoutError):
+            await client.ping()
+        assert not breaker.open
+        DEADLINE.set(None)
+        with pytest.raises(redis.TimeoutError):
+            await client.ping()
+        assert breaker.open
+    asyncio.run(ping())
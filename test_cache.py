@@ -0,0 +1,68 @@
+from threading import enumerate as threads
+
+import fakeredis
+from redis.client import PubSubWorkerThread
+from cache import ProductCache
+
+
+def test_least_recently_used_is_evicted():
+    cache = ProductCache(2, 60)
+    for product_identifier in (1, 2):
+        cache.put(product_identifier, f'product {product_identifier}', cache.token())
+    cache.get(1)
+    cache.put(3, 'product 3', cache.token())
+    assert [cache.get(product_identifier) for product_identifier in (1, 2, 3)] == ['product 1', None, 'product 3']
+    assert cache.stats()['evictions'] == 1
+
+
+def test_expired_products_are_not_served():
+    cache = ProductCache(2, 0)
+    cache.put(1, 'product 1', cache.token())
+    assert cache.get(1) is None
+
+
+def test_read_started_before_invalidation_is_not_stored():
+    cache = ProductCache(10, 60)
+    token = cache.token()
+    cache.invalidate(1)
+    cache.put(1, 'stale', token)
+    assert cache.get(1) is None
+    cache.put(1, 'fresh', cache.token())
+    assert cache.get(1) == 'fresh'
+
+
+def test_invalidating_uncached_products_evicts_nothing():
+    cache = ProductCache(3, 60)
+    for product_identifier in range(3):
+        cache.put(product_identifier, f'product {product_identifier}', cache.token())
+    for product_identifier in range(10, 13):
+        cache.invalidate(product_identifier)
+    assert [cache.get(product_identifier) for product_identifier in range(3)] == ['product 0', 'product 1', 'product 2']
+    assert cache.stats()['evictions'] == 0
+
+
+def test_forgotten_invalidations_still_reject_older_reads():
+    cache = ProductCache(2, 60)
+    token = cache.token()
+    for product_identifier in range(1, 5):
+        cache.invalidate(product_identifier)
+    cache.put(1, 'stale', token)
+    assert cache.get(1) is None
+
+
+def test_clear_rejects_reads_in_flight():
+    cache = ProductCache(2, 60)
+    cache.put(1, 'product 1', cache.token())
+    token = cache.token()
+    cache.clear()
+    cache.put(2, 'stale', token)
+    assert cache.get(1) is None and cache.get(2) is None
+
+
+def test_close_ends_subscriptions():
+    cache = ProductCache(2, 60)
+    cache.subscribe(fakeredis.FakeRedis(), 0, lambda key: [])
+    listening, = [thread for thread in threads() if isinstance(thread, PubSubWorkerThread)]
+    cache.close()
+    listening.join(5)
+    assert not listening.is_alive()
@@ -0,0 +1,54 @@
+import io
+
+import pytest
+
+import inventory_pb2
+from catalog import READERS, WRITERS, guess_format, read_csv, read_delimited, read_jsonl, varint
+
+
+def product(product_identifier, name, quantity, price):
+    return inventory_pb2.Product(product_identifier=product_identifier, product_name=name, product_quantity=quantity, product_price=price)
+
+
+PRODUCTS = [product(1, 'Widget', 5, 9.99), product(2, 'Gadget, "deluxe"', 0, 0.5), product(300, 'Ünïcode ✓', -3, 1234.25),
+            product(4, 'x' * 200, 2, 1.0)]
+
+
+@pytest.mark.parametrize('format', ['csv', 'jsonl', 'protobuf'])
+def test_formats_round_trip(format):
+    file = io.BytesIO() if format == 'protobuf' else io.StringIO(newline='')
+    WRITERS[format](file, PRODUCTS)
+    file.seek(0)
+    assert list(READERS[format](file)) == PRODUCTS
+
+
+def test_prices_are_written_as_entered():
+    file = io.StringIO(newline='')
+    WRITERS['jsonl'](file, PRODUCTS[:1])
+    assert '"product_price": 9.99' in file.getvalue()
+
+
+def test_readers_name_the_bad_line():
+    with pytest.raises(ValueError, match='line 3'):
+        list(read_csv(io.StringIO('product_identifier,product_name,product_quantity,product_price\n1,a,1,1.0\n2,b,many,1.0\n')))
+    with pytest.raises(ValueError, match='missing product_price'):
+        list(read_csv(io.StringIO('product_identifier,product_name,product_quantity\n')))
+    with pytest.raises(ValueError, match='line 3'):
+        list(read_jsonl(io.StringIO('{"product_identifier": 1}\n\n{"colour": "red"}\n')))
+
+
+def test_delimited_reader_rejects_truncated_files():
+    data = PRODUCTS[3].SerializeToString()
+    assert len(varint(len(data))) == 2
+    with pytest.raises(ValueError, match='inside a product'):
+        list(read_delimited(io.BytesIO(varint(len(data)) + data[:-1])))
+    with pytest.raises(ValueError, match='inside a size'):
+        list(read_delimited(io.BytesIO(varint(len(data))[:1])))
+
+
+def test_format_follows_the_extension():
+    assert guess_format('products.csv') == 'csv'
+    assert guess_format('dump.ndjson') == 'jsonl'
+    assert guess_format('-', 'protobuf') == 'protobuf'
+    with pytest.raises(ValueError):
+        guess_format('products.txt')
@@ -0,0 +1,32 @@
+import pytest
+
+from config import DEFAULTS, load_config, parse_settings, read_config_file
+
+
+def test_settings_convert_to_the_types_of_their_defaults():
+    assert parse_settings(['max_workers=4', ' COMPRESSION = gzip', 'compression_methods=ExportProducts=gzip']) == \
+        {'max_workers': 4, 'compression': 'gzip', 'compression_methods': 'ExportProducts=gzip'}
+    with pytest.raises(KeyError):
+        parse_settings(['workers=4'])
+    with pytest.raises(ValueError, match='max_workers must be a int'):
+        parse_settings(['max_workers=many'])
+    with pytest.raises(ValueError, match='NAME=VALUE'):
+        parse_settings(['max_workers'])
+
+
+def test_settings_file_is_overridden_by_environment_and_arguments(tmp_path, monkeypatch):
+    path = tmp_path / 'inventory.conf'
+    path.write_text('# Tuned for the load test\n\nmax_workers=32\nmax_concurrent_rpcs=200\ncompression=deflate\n')
+    monkeypatch.setenv('INVENTORY_MAX_CONCURRENT_RPCS', '300')
+    config = load_config(str(path), compression='gzip')
+    assert (config['max_workers'], config['max_concurrent_rpcs'], config['compression']) == (32, 300, 'gzip')
+    assert config['keepalive_time_ms'] == DEFAULTS['keepalive_time_ms']
+    monkeypatch.setenv('INVENTORY_CONFIG_FILE', str(path))
+    assert load_config()['max_workers'] == 32
+
+
+def test_settings_file_errors_name_the_file(tmp_path):
+    path = tmp_path / 'inventory.conf'
+    path.write_text('max_workers=ten\n')
+    with pytest.raises(ValueError, match='inventory.conf: max_workers'):
+        read_config_file(str(path))
@@ -0,0 +1,43 @@
+from time import monotonic, sleep
+
+import pytest
+from grpc_health.v1 import health_pb2
+
+import inventory_pb2
+from config import load_config
+from health import Readiness, read_identifiers
+from server import InventoryServiceServicer
+
+
+def status(readiness, service=''):
+    return readiness.health.Check(health_pb2.HealthCheckRequest(service=service), None).status
+
+
+def wait_for(readiness, expected, timeout=5.0):
+    deadline = monotonic() + timeout
+    while status(readiness) != expected and monotonic() < deadline:
+        sleep(0.01)
+    return status(readiness)
+
+
+def test_readiness_serves_once_warmed_up(tmp_path):
+    warmup = tmp_path / 'warmup.txt'
+    warmup.write_text('# Best sellers\n1\n\n2\n')
+    config = load_config(storage='memory', cache_size=10, cache_warmup_file=str(warmup))
+    servicer = InventoryServiceServicer(config)
+    servicer.storage.add(inventory_pb2.Product(product_identifier=1, product_name='apple', product_quantity=3, product_price=1.0))
+    readiness = Readiness(config)
+    assert status(readiness) == status(readiness, 'InventoryService') == health_pb2.HealthCheckResponse.NOT_SERVING
+    readiness.start(servicer)
+    assert wait_for(readiness, health_pb2.HealthCheckResponse.SERVING) == health_pb2.HealthCheckResponse.SERVING
+    assert status(readiness, 'InventoryService') == health_pb2.HealthCheckResponse.SERVING
+    assert servicer.cache.get(1) is not None
+    readiness.stop()
+    assert status(readiness) == health_pb2.HealthCheckResponse.NOT_SERVING
+
+
+def test_warmup_file_errors_name_the_line(tmp_path):
+    warmup = tmp_path / 'warmup.txt'
+    warmup.write_text('1\napple\n')
+    with pytest.raises(ValueError, match='line 2'):
+        read_identifiers(str(warmup))
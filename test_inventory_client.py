@@ -0,0 +1,82 @@
+import json
+from concurrent import futures
+
+import grpc
+import pytest
+
+import inventory_client
+import inventory_pb2
+import inventory_pb2_grpc
+from config import load_config
+from inventory_client import CallDetails, DefaultDeadline, InventoryClient, RequestIds, chunked, request_id_metadata, service_config
+from server import InventoryServiceServicer
+
+
+@pytest.fixture
+def target():
+    """Address of an in-process server on the memory storage."""
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    inventory_pb2_grpc.add_InventoryServiceServicer_to_server(InventoryServiceServicer(load_config(storage='memory')), server)
+    port = server.add_insecure_port('127.0.0.1:0')
+    server.start()
+    yield f'127.0.0.1:{port}'
+    server.stop(None)
+
+
+def product(product_identifier, quantity=10):
+    return inventory_pb2.Product(product_identifier=product_identifier, product_name=f'item {product_identifier:02}',
+                                 product_quantity=quantity, product_price=2.0)
+
+
+def call_details(timeout, method='GetProductById', metadata=None):
+    return CallDetails(f'/InventoryService/{method}', timeout, metadata, None, None, None)
+
+
+def test_default_deadline_only_fills_missing_timeouts():
+    sent = []
+    deadline = DefaultDeadline(5.0)
+    deadline.intercept_unary_unary(lambda details, request: sent.append(details.timeout), call_details(None), None)
+    deadline.intercept_unary_unary(lambda details, request: sent.append(details.timeout), call_details(0.5), None)
+    assert sent == [5.0, 0.5]
+
+
+def test_request_ids_go_on_writes_that_have_none():
+    sent = []
+    request_ids = RequestIds()
+    for details in (call_details(None, 'AddProduct'), call_details(None, 'AddProduct'), call_details(None),
+                    call_details(None, 'DeleteProduct', request_id_metadata('mine'))):
+        request_ids.intercept_unary_unary(lambda details, request: sent.append(dict(details.metadata or [])), details, None)
+    assert sent[0][inventory_client.REQUEST_ID_METADATA] != sent[1][inventory_client.REQUEST_ID_METADATA]
+    assert sent[2:] == [{}, {inventory_client.REQUEST_ID_METADATA: 'mine'}]
+
+
+def test_retries_cover_only_idempotent_methods():
+    method_config, = json.loads(service_config(3))['methodConfig']
+    assert method_config['retryPolicy']['maxAttempts'] == 3
+    assert {name['method'] for name in method_config['name']} == set(inventory_client.RETRYABLE_METHODS)
+    assert 'AddProduct' not in inventory_client.RETRYABLE_METHODS
+    assert 'retryPolicy' not in json.loads(service_config(1))['methodConfig'][0]
+
+
+def test_chunked_splits_lazily():
+    assert list(chunked(iter(range(7)), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(chunked([], 3)) == []
+
+
+def test_client_round_trip(target):
+    with InventoryClient(target, timeout=5.0, channels=2) as client:
+        results = list(inventory_client.add_products(client.stub, [product(product_identifier) for product_identifier in range(5)], chunk_size=2))
+        assert [result.success for result in results] == [True] * 5
+        found = list(inventory_client.get_products_by_ids(client.stub, [4, 9], chunk_size=1))
+        assert [result.product for result in found] == [product(4), inventory_pb2.Product()]
+        assert inventory_client.reserve(client.stub, 1, 4).product.product_quantity == 6
+        assert not inventory_client.reserve(client.stub, 1, 7).success
+        listed = list(inventory_client.list_products(client.stub, page_size=2, fields=['product_identifier']))
+        assert listed == [inventory_pb2.Product(product_identifier=product_identifier) for product_identifier in range(5)]
+
+
+def test_closed_client_fails_calls(target):
+    client = InventoryClient(target)
+    client.close()
+    with pytest.raises(ValueError):
+        client.stub.GetProductById(inventory_pb2.ProductIdentifier(product_identifier=1))
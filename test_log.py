@@ -0,0 +1,56 @@
+import json
+import logging
+
+import pytest
+
+import log
+from log import JsonFormatter, RequestLogger, TextFormatter
+
+
+@pytest.fixture
+def records():
+    """Records reaching a fresh 'test.requests' logger."""
+    captured = []
+    handler = logging.Handler()
+    handler.emit = captured.append
+    logger = logging.getLogger('test.requests')
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    yield captured
+    logger.removeHandler(handler)
+
+
+def test_every_request_is_logged_at_full_rate(records):
+    request_log = RequestLogger('test.requests', 1.0)
+    for product_identifier in range(5):
+        request_log.log('GetProductById', product_identifier=product_identifier)
+    assert [record.fields['product_identifier'] for record in records] == list(range(5))
+    assert records[0].getMessage() == 'GetProductById'
+
+
+def test_zero_rate_logs_nothing(records):
+    RequestLogger('test.requests', 0).log('GetProductById', product_identifier=1)
+    assert records == []
+
+
+def test_requests_are_sampled(records, monkeypatch):
+    draws = iter([0.1, 0.6, 0.3, 0.9])
+    monkeypatch.setattr(log, 'random', lambda: next(draws))
+    request_log = RequestLogger('test.requests', 0.5)
+    for product_identifier in range(4):
+        request_log.log('GetProductById', product_identifier=product_identifier)
+    assert [record.fields['product_identifier'] for record in records] == [0, 2]
+
+
+def test_requests_below_the_log_level_are_not_logged(records):
+    logging.getLogger('test.requests').setLevel(logging.WARNING)
+    RequestLogger('test.requests', 1.0).log('GetProductById', product_identifier=1)
+    assert records == []
+
+
+def test_fields_are_formatted():
+    record = logging.LogRecord('inventory.requests', logging.INFO, __file__, 1, 'DeleteProduct', None, None)
+    record.fields = {'product_identifier': 7, 'outcome': 'deleted'}
+    assert TextFormatter().format(record).endswith('INFO DeleteProduct product_identifier=7 outcome=deleted')
+    entry = json.loads(JsonFormatter().format(record))
+    assert (entry['message'], entry['product_identifier'], entry['outcome']) == ('DeleteProduct', 7, 'deleted')
@@ -0,0 +1,65 @@
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+import inventory_pb2
+import metrics
+from config import load_config
+from server import InventoryServiceServicer
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """A fresh registry, so metrics created by a test are the only ones rendered."""
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, 'REGISTRY', registry)
+    return registry
+
+
+def test_counters_render_with_escaped_labels(registry):
+    errors = metrics.counter('test_errors_total', 'Errors.', ('method', 'code'))
+    errors.labels('Get"Product\\', 'UNAVAILABLE').inc()
+    errors.labels('Get"Product\\', 'UNAVAILABLE').inc(2)
+    assert registry.render() == ('# HELP test_errors_total Errors.\n'
+                                 '# TYPE test_errors_total counter\n'
+                                 'test_errors_total{method="Get\\"Product\\\\",code="UNAVAILABLE"} 3\n')
+
+
+def test_histograms_render_cumulative_buckets(registry):
+    duration = metrics.histogram('test_seconds', 'Durations.', (), (0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 2.0):
+        duration.labels().observe(value)
+    assert registry.render().splitlines()[2:] == ['test_seconds_bucket{le="0.1"} 1',
+                                                  'test_seconds_bucket{le="1"} 3',
+                                                  'test_seconds_bucket{le="+Inf"} 4',
+                                                  'test_seconds_sum 3.05',
+                                                  'test_seconds_count 4']
+
+
+def test_servicer_exports_pool_cache_and_redis_metrics(pool, registry):
+    servicer = InventoryServiceServicer(load_config(metrics_port=9464, cache_size=10, cache_subscribe=False), pool)
+    metrics.register_servicer(servicer)
+    hgetall = metrics.REDIS_DURATION.labels('HGETALL')
+    servicer.storage.add(inventory_pb2.Product(product_identifier=1, product_name='apple', product_quantity=3, product_price=1.0))
+    reads = sum(hgetall.counts)
+    servicer.GetProductById(inventory_pb2.Product(product_identifier=1), None)
+    exposition = registry.render()
+    assert 'inventory_cache_misses_total 1\n' in exposition
+    assert 'inventory_redis_pool_max_connections 8\n' in exposition
+    assert sum(hgetall.counts) == reads + 1
+
+
+def test_metrics_are_served_over_http(registry):
+    metrics.counter('test_scrapes_total', 'Scrapes.').labels().inc()
+    http_server = metrics.start_http_server('127.0.0.1', 0)
+    try:
+        url = f'http://127.0.0.1:{http_server.server_address[1]}'
+        with urlopen(f'{url}/metrics') as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert b'test_scrapes_total 1\n' in response.read()
+        with pytest.raises(HTTPError) as error:
+            urlopen(f'{url}/other')
+        assert error.value.code == 404
+    finally:
+        http_server.shutdown()
@@ -0,0 +1,522 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from queue import Queue
+from threading import Event
+
+import grpc
+import pytest
+import redis
+import redis.asyncio
+from google.protobuf.empty_pb2 import Empty
+from google.protobuf.field_mask_pb2 import FieldMask
+import inventory_pb2
+from aio_server import AsyncInventoryServiceServicer, subscription_client
+from config import load_config
+from server import (END_OF_STREAM, REQUEST_ID_METADATA, InventoryServiceServicer, compression_methods, create_pools, read_stream,
+                    resume_gap, server_options)
+from storage import QUANTITY_RANGE, REQUEST_PENDING, MemoryStorage
+
+
+class Aborted(Exception):
+    """Raised by FakeContext.abort(), as grpc raises to end the handler."""
+
+    def __init__(self, code, details):
+        super().__init__(code, details)
+        self.code = code
+        self.details = details
+
+
+class FakeContext:
+    """The parts of grpc.ServicerContext the handlers use."""
+
+    def __init__(self, request_id=None, time_remaining=10.0):
+        self.request_id = request_id
+        self.remaining = time_remaining
+
+    def invocation_metadata(self):
+        return [(REQUEST_ID_METADATA, self.request_id)] if self.request_id else []
+
+    def time_remaining(self):
+        return self.remaining
+
+    def is_active(self):
+        return True
+
+    def abort(self, code, details):
+        raise Aborted(code, details)
+
+
+class AsyncFakeContext(FakeContext):
+    """The parts of grpc.aio.ServicerContext the handlers use."""
+
+    async def abort(self, code, details):
+        raise Aborted(code, details)
+
+
+class FlakyStorage:
+    """Passes calls to a storage, except that the methods named in failing raise as if Redis could not be reached."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.failing = set()
+
+    def __getattr__(self, name):
+        if name in self.failing:
+            def fail(*args):
+                raise redis.ConnectionError('Connection refused.')
+            return fail
+        return getattr(self.storage, name)
+
+
+def config(**overrides):
+    return load_config(**overrides)
+
+
+def product(product_identifier, quantity=10):
+    return inventory_pb2.Product(product_identifier=product_identifier, product_name=f'item {product_identifier}',
+                                 product_quantity=quantity, product_price=2.0)
+
+
+def abort_code(call, *args):
+    with pytest.raises(Aborted) as aborted:
+        call(*args)
+    return aborted.value.code
+
+
+@pytest.fixture
+def servicer(storage):
+    return InventoryServiceServicer(config(scan_batch_size=3), storage=storage)
+
+
+def test_add_get_update_delete(servicer):
+    assert servicer.AddProduct(product(1), FakeContext()).status == 'Product successfully added.'
+    assert servicer.GetProductById(inventory_pb2.ProductIdentifier(product_identifier=1), FakeContext()) == product(1)
+    updated = servicer.UpdateProductQuantity(inventory_pb2.Quantity(product_identifier=1, product_quantity=4), FakeContext())
+    assert updated == product(1, quantity=4)
+    assert servicer.DeleteProduct(inventory_pb2.ProductIdentifier(product_identifier=1), FakeContext()).status == 'Product successfully deleted.'
+    assert servicer.storage.get(1) is None
+
+
+def test_abort_codes(servicer):
+    servicer.AddProduct(product(1), FakeContext())
+    assert abort_code(servicer.AddProduct, product(-1), FakeContext()) == grpc.StatusCode.INVALID_ARGUMENT
+    assert abort_code(servicer.AddProduct, product(1), FakeContext()) == grpc.StatusCode.ALREADY_EXISTS
+    assert abort_code(servicer.GetProductById, inventory_pb2.ProductIdentifier(product_identifier=2), FakeContext()) == grpc.StatusCode.NOT_FOUND
+    assert abort_code(servicer.UpdateProductQuantity, quantity(2, 4), FakeContext()) == grpc.StatusCode.NOT_FOUND
+    assert abort_code(servicer.AdjustProductQuantity, adjustment(2, 1), FakeContext()) == grpc.StatusCode.NOT_FOUND
+    assert abort_code(servicer.DeleteProduct, inventory_pb2.ProductIdentifier(product_identifier=2), FakeContext()) == grpc.StatusCode.NOT_FOUND
+    assert servicer.storage.get(2) is None
+
+
+def test_concurrent_adds_of_one_id_add_once(servicer):
+    def add(quantity):
+        try:
+            return servicer.AddProduct(product(1, quantity), FakeContext()).status
+        except Aborted as aborted:
+            return aborted.code
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        statuses = list(executor.map(add, range(16)))
+    assert statuses.count(grpc.StatusCode.ALREADY_EXISTS) == 15
+    assert servicer.GetProductById(inventory_pb2.ProductIdentifier(product_identifier=1), FakeContext()).product_quantity == statuses.index('Product successfully added.')
+
+
+def test_get_all_products_streams_every_batch(servicer):
+    assert list(servicer.GetAllProducts(Empty(), FakeContext())) == []
+    for product_identifier in range(10):
+        servicer.AddProduct(product(product_identifier), FakeContext())
+    streamed = list(servicer.GetAllProducts(Empty(), FakeContext()))
+    assert sorted(streamed, key=lambda found: found.product_identifier) == [product(product_identifier) for product_identifier in range(10)]
+
+
+def test_batches_keep_request_order(servicer):
+    added = servicer.AddProducts(inventory_pb2.ProductList(products=[product(3), product(-1), product(1), product(3)]), FakeContext())
+    assert [(result.product_identifier, result.success) for result in added.results] == [(3, True), (-1, False), (1, True), (3, False)]
+    found = servicer.GetProductsByIds(inventory_pb2.ProductIdentifierList(product_identifiers=[1, 2, 3]), FakeContext())
+    assert [result.product for result in found.results] == [product(1), inventory_pb2.Product(), product(3)]
+    quantities = [inventory_pb2.Quantity(product_identifier=product_identifier, product_quantity=5) for product_identifier in (2, 3)]
+    updated = servicer.UpdateQuantities(inventory_pb2.QuantityList(quantities=quantities), FakeContext())
+    assert [(result.success, result.product.product_quantity) for result in updated.results] == [(False, 0), (True, 5)]
+    deleted = servicer.DeleteProducts(inventory_pb2.ProductIdentifierList(product_identifiers=[3, 2, 1]), FakeContext())
+    assert [result.success for result in deleted.results] == [True, False, True]
+
+
+def quantity(product_identifier, product_quantity=5):
+    return inventory_pb2.Quantity(product_identifier=product_identifier, product_quantity=product_quantity)
+
+
+def test_stream_quantities_batches_and_acks_in_order(storage):
+    servicer = InventoryServiceServicer(config(stream_max_batch_size=3, stream_max_batch_latency_ms=1000.0), storage=storage)
+    servicer.AddProducts(inventory_pb2.ProductList(products=[product(product_identifier) for product_identifier in range(0, 7, 2)]), FakeContext())
+    batches = []
+    apply_quantities = servicer.apply_quantities
+    servicer.apply_quantities = lambda batch: batches.append(len(batch)) or apply_quantities(batch)
+    results = list(servicer.StreamQuantities(iter([quantity(product_identifier) for product_identifier in range(7)]), FakeContext()))
+    assert batches == [3, 3, 1]
+    assert [(result.product_identifier, result.success) for result in results] == [(product_identifier, product_identifier % 2 == 0)
+                                                                                    for product_identifier in range(7)]
+
+
+def test_stream_quantities_applies_batch_after_latency(servicer):
+    servicer.config.update(stream_max_batch_size=100, stream_max_batch_latency_ms=20.0)
+    servicer.AddProduct(product(1), FakeContext())
+    sent = Event()
+
+    def requests():
+        yield quantity(1, 3)
+        sent.wait(5)
+        yield quantity(1, 4)
+
+    results = servicer.StreamQuantities(requests(), FakeContext())
+    assert next(results).product.product_quantity == 3 # Applied without waiting for the second update
+    sent.set()
+    assert [result.product.product_quantity for result in results] == [4]
+
+
+def test_read_stream_ends_with_end_of_stream_on_cancel():
+    def cancelled():
+        yield quantity(1)
+        raise grpc.RpcError()
+
+    queue = Queue()
+    read_stream(cancelled(), queue, Event())
+    assert [queue.get_nowait(), queue.get_nowait()] == [quantity(1), END_OF_STREAM]
+
+
+def test_read_stream_stops_once_handler_stops():
+    queue = Queue(maxsize=1)
+    queue.put(quantity(1))
+    stop = Event()
+    stop.set()
+    read_stream(iter([quantity(2)]), queue, stop) # Returns instead of waiting for room in the queue
+    assert [queue.get_nowait(), queue.empty()] == [quantity(1), True]
+
+
+def adjustment(product_identifier, delta, minimum_quantity=None):
+    return inventory_pb2.Adjustment(product_identifier=product_identifier, delta=delta, minimum_quantity=minimum_quantity)
+
+
+def test_adjust_outcomes(servicer):
+    servicer.AddProduct(product(1, quantity=3), FakeContext())
+    rejected = servicer.AdjustProductQuantity(adjustment(1, -4, minimum_quantity=0), FakeContext())
+    assert (rejected.success, rejected.product.product_quantity) == (False, 3)
+    applied = servicer.AdjustProductQuantity(adjustment(1, -4), FakeContext())
+    assert (applied.success, applied.product.product_quantity) == (True, -1)
+    adjusted = servicer.AdjustQuantities(inventory_pb2.AdjustmentList(adjustments=[adjustment(1, 5), adjustment(2, 1)]), FakeContext())
+    assert [(result.success, result.product.product_quantity) for result in adjusted.results] == [(True, 4), (False, 0)]
+    out_of_range = servicer.AdjustProductQuantity(adjustment(1, QUANTITY_RANGE[1]), FakeContext())
+    assert (out_of_range.success, out_of_range.product.product_quantity) == (False, 4)
+    assert 'out of range' in out_of_range.status
+
+
+def test_concurrent_reservations_never_oversell(servicer):
+    servicer.AddProduct(product(1, quantity=10), FakeContext())
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda index: servicer.AdjustProductQuantity(adjustment(1, -3, minimum_quantity=0), FakeContext()),
+                                    range(8)))
+    assert sum(result.success for result in results) == 3
+    assert servicer.GetProductById(inventory_pb2.ProductIdentifier(product_identifier=1), FakeContext()).product_quantity == 1
+
+
+def test_writes_invalidate_cache(storage):
+    servicer = InventoryServiceServicer(config(cache_size=100, cache_subscribe=False), storage=storage)
+    servicer.AddProduct(product(1), FakeContext())
+    request = inventory_pb2.ProductIdentifier(product_identifier=1)
+    servicer.GetProductById(request, FakeContext())
+    assert servicer.cache.get(1) is not None
+    servicer.UpdateProductQuantity(quantity(1, 3), FakeContext())
+    assert servicer.GetProductById(request, FakeContext()).product_quantity == 3
+    servicer.AdjustQuantities(inventory_pb2.AdjustmentList(adjustments=[adjustment(1, 2)]), FakeContext())
+    assert servicer.GetProductById(request, FakeContext()).product_quantity == 5
+    found = servicer.GetProductsByIds(inventory_pb2.ProductIdentifierList(product_identifiers=[1, 2]), FakeContext())
+    assert [result.product.product_quantity for result in found.results] == [5, 0]
+    servicer.DeleteProduct(request, FakeContext())
+    assert abort_code(servicer.GetProductById, request, FakeContext()) == grpc.StatusCode.NOT_FOUND
+
+
+def test_get_inventory_stats(storage):
+    servicer = InventoryServiceServicer(config(stats_low_stock_thresholds='5,0'), storage=storage)
+    servicer.AddProducts(inventory_pb2.ProductList(products=[product(1, quantity=0), product(2, quantity=4), product(3)]), FakeContext())
+    stats = servicer.GetInventoryStats(Empty(), FakeContext())
+    assert (stats.products, stats.total_quantity, stats.total_value) == (3, 14, 28.0)
+    assert [(count.maximum_quantity, count.products) for count in stats.low_stock] == [(0, 1), (5, 2)]
+
+
+def test_queries_are_capped_at_query_max_results(servicer):
+    servicer.config.update(query_max_results=2)
+    servicer.AddProducts(inventory_pb2.ProductList(products=[product(product_identifier, quantity=product_identifier) for product_identifier in range(5)]),
+                         FakeContext())
+    low = servicer.FindLowStock(inventory_pb2.StockQuery(maximum_quantity=3, limit=10), FakeContext())
+    assert [found.product_identifier for found in low.products] == [0, 1]
+    named = servicer.FindProductsByName(inventory_pb2.NameQuery(prefix='item 3', limit=1), FakeContext())
+    assert [found.product_identifier for found in named.products] == [3]
+    priced = servicer.FindProductsByPrice(inventory_pb2.PriceQuery(minimum_price=2.0, maximum_price=2.0), FakeContext())
+    assert len(priced.products) == 2
+
+
+def list_request(page_size=0, page_token='', field_mask=(), **product_filter):
+    return inventory_pb2.ListProductsRequest(page_size=page_size, page_token=page_token, filter=inventory_pb2.ProductFilter(**product_filter),
+                                             field_mask=FieldMask(paths=list(field_mask)))
+
+
+def list_all(servicer, context=None, **request):
+    pages, token = [], ''
+    while True:
+        response = servicer.ListProducts(list_request(page_token=token, **request), context or FakeContext())
+        # A page ending on the last product may still carry a token, the empty page after it is left out
+        if response.products:
+            pages.append([found.product_identifier for found in response.products])
+        token = response.next_page_token
+        if not token:
+            return pages
+
+
+def test_list_products_resumes_from_page_tokens(servicer):
+    servicer.AddProducts(inventory_pb2.ProductList(products=[product(product_identifier) for product_identifier in range(12)]), FakeContext())
+    # Name order: 'item 0', 'item 1', 'item 10', 'item 11', 'item 2', ...
+    assert list_all(servicer, page_size=5) == [[0, 1, 10, 11, 2], [3, 4, 5, 6, 7], [8, 9]]
+    assert list_all(servicer, page_size=4) == [[0, 1, 10, 11], [2, 3, 4, 5], [6, 7, 8, 9]]
+
+
+def test_list_products_filters_and_masks(servicer):
+    servicer.config.update(list_page_size=2)
+    servicer.AddProducts(inventory_pb2.ProductList(products=[product(product_identifier, quantity=product_identifier) for product_identifier in range(12)]),
+                         FakeContext())
+    servicer.AddProduct(inventory_pb2.Product(product_identifier=20, product_name='other', product_quantity=5, product_price=9.0), FakeContext())
+    assert list_all(servicer, name_prefix='item 1') == [[1, 10], [11]]
+    assert list_all(servicer, minimum_quantity=3, maximum_quantity=5) == [[3, 4], [5, 20]]
+    assert list_all(servicer, minimum_price=5.0) == [[20]]
+    masked = servicer.ListProducts(list_request(page_size=1, field_mask=['product_name']), FakeContext()).products
+    assert list(masked) == [inventory_pb2.Product(product_name='item 0')]
+
+
+def test_list_products_rejects_invalid_requests(servicer):
+    assert abort_code(servicer.ListProducts, list_request(page_size=-1), FakeContext()) == grpc.StatusCode.INVALID_ARGUMENT
+    assert abort_code(servicer.ListProducts, list_request(field_mask=['stock']), FakeContext()) == grpc.StatusCode.INVALID_ARGUMENT
+    assert abort_code(servicer.ListProducts, list_request(page_token='not a token'), FakeContext()) == grpc.StatusCode.INVALID_ARGUMENT
+
+
+def test_writes_with_a_request_id_apply_once(servicer):
+    assert servicer.AddProduct(product(1, quantity=5), FakeContext('a')).status == 'Product successfully added.'
+    assert servicer.AddProduct(product(1, quantity=5), FakeContext('a')).status == 'Product successfully added.'
+    adjust = adjustment(1, -2, minimum_quantity=0)
+    assert servicer.AdjustProductQuantity(adjust, FakeContext('b')).product.product_quantity == 3
+    assert servicer.AdjustProductQuantity(adjust, FakeContext('b')).product.product_quantity == 3
+    # The same ID sent to another RPC, or no ID, is a new write
+    assert servicer.UpdateProductQuantity(quantity(1, 9), FakeContext('b')).product_quantity == 9
+    assert servicer.AdjustProductQuantity(adjust, FakeContext()).product.product_quantity == 7
+    assert servicer.AdjustProductQuantity(adjust, FakeContext()).product.product_quantity == 5
+    deleted = servicer.DeleteProducts(inventory_pb2.ProductIdentifierList(product_identifiers=[1, 2]), FakeContext('c'))
+    assert servicer.DeleteProducts(inventory_pb2.ProductIdentifierList(product_identifiers=[1, 2]), FakeContext('c')) == deleted
+    assert [result.success for result in deleted.results] == [True, False]
+
+
+def test_retry_while_the_first_call_runs_is_aborted(servicer):
+    servicer.storage.claim_request('AddProduct:a', 30)
+    assert abort_code(servicer.AddProduct, product(1), FakeContext('a')) == grpc.StatusCode.ABORTED
+    assert servicer.storage.get(1) is None
+
+
+def test_retries_get_the_error_of_a_failed_write(servicer):
+    deletion = inventory_pb2.ProductIdentifier(product_identifier=1)
+    assert abort_code(servicer.DeleteProduct, deletion, FakeContext('a')) == grpc.StatusCode.NOT_FOUND
+    servicer.AddProduct(product(1), FakeContext())
+    assert abort_code(servicer.DeleteProduct, deletion, FakeContext('a')) == grpc.StatusCode.NOT_FOUND
+    assert servicer.storage.get(1) is not None
+
+
+def test_failed_write_releases_request_id(storage):
+    flaky = FlakyStorage(storage)
+    servicer = InventoryServiceServicer(config(), storage=flaky)
+    servicer.AddProduct(product(1), FakeContext())
+    adjustment = inventory_pb2.Adjustment(product_identifier=1, delta=-4)
+    flaky.failing.add('adjust')
+    assert abort_code(servicer.AdjustProductQuantity, adjustment, FakeContext('a')) == grpc.StatusCode.UNAVAILABLE
+    flaky.failing.clear()
+    assert servicer.AdjustProductQuantity(adjustment, FakeContext('a')).product.product_quantity == 6
+    assert servicer.AdjustProductQuantity(adjustment, FakeContext('a')).product.product_quantity == 6
+
+
+def test_unsaved_response_is_saved_on_second_try(storage):
+    flaky = FlakyStorage(storage)
+    servicer = InventoryServiceServicer(config(), storage=flaky)
+    saves = []
+
+    def save_once_failing(key, response, ttl):
+        saves.append(key)
+        if len(saves) == 1:
+            raise redis.TimeoutError('Timeout reading from socket.')
+        storage.save_request(key, response, ttl)
+
+    flaky.save_request = save_once_failing
+    servicer.AddProduct(product(1), FakeContext('a'))
+    assert saves == ['AddProduct:a', 'AddProduct:a']
+    assert storage.claim_request('AddProduct:a', 30) not in (None, REQUEST_PENDING)
+
+def test_unreachable_redis_fails_calls_with_unavailable(storage):
+    flaky = FlakyStorage(storage)
+    servicer = InventoryServiceServicer(config(), storage=flaky)
+    servicer.AddProduct(product(1), FakeContext())
+    flaky.failing.update({'get', 'get_many', 'scan', 'set_quantities'})
+    request = inventory_pb2.ProductIdentifier(product_identifier=1)
+    assert abort_code(servicer.GetProductById, request, FakeContext()) == grpc.StatusCode.UNAVAILABLE
+    assert abort_code(servicer.GetProductById, request, FakeContext(time_remaining=0)) == grpc.StatusCode.DEADLINE_EXCEEDED
+    ids = inventory_pb2.ProductIdentifierList(product_identifiers=[1])
+    assert abort_code(servicer.GetProductsByIds, ids, FakeContext()) == grpc.StatusCode.UNAVAILABLE
+    assert abort_code(lambda: list(servicer.GetAllProducts(Empty(), FakeContext()))) == grpc.StatusCode.UNAVAILABLE
+    assert abort_code(lambda: list(servicer.StreamQuantities(iter([quantity(1)]), FakeContext()))) == grpc.StatusCode.UNAVAILABLE
+
+
+def watch(servicer, from_offset, count):
+    """Takes the first count events of a WatchInventory call, then ends it as a cancelling client would."""
+    events = servicer.WatchInventory(inventory_pb2.WatchRequest(from_offset=from_offset), FakeContext())
+    try:
+        return list(islice(events, count))
+    finally:
+        events.close()
+
+
+def test_watch_inventory_resumes_after_offsets(servicer):
+    servicer.AddProducts(inventory_pb2.ProductList(products=[product(1), product(2)]), FakeContext())
+    servicer.UpdateProductQuantity(quantity(1, 4), FakeContext())
+    events = watch(servicer, '0', 3)
+    # Changes to one product arrive in order, a sharded catalog may interleave those of different products
+    assert [(event.operation, event.product.product_identifier) for event in events if event.product.product_identifier == 1] == \
+        [(inventory_pb2.ChangeEvent.ADDED, 1), (inventory_pb2.ChangeEvent.QUANTITY_CHANGED, 1)]
+    assert [event.product for event in events if event.operation == inventory_pb2.ChangeEvent.ADDED] in ([product(1), product(2)], [product(2), product(1)])
+    assert [event.product.product_quantity for event in events if event.operation == inventory_pb2.ChangeEvent.QUANTITY_CHANGED] == [4]
+    assert watch(servicer, events[0].offset, 2) == events[1:]
+    # A listing's change_offset picks up the changes made after it was read
+    listing = servicer.ListProducts(list_request(), FakeContext())
+    assert listing.change_offset == events[-1].offset
+    servicer.DeleteProduct(inventory_pb2.ProductIdentifier(product_identifier=2), FakeContext())
+    deleted, = watch(servicer, listing.change_offset, 1)
+    assert (deleted.operation, deleted.product.product_identifier) == (inventory_pb2.ChangeEvent.DELETED, 2)
+
+
+def test_watch_inventory_rejects_unusable_offsets(storage):
+    servicer = InventoryServiceServicer(config(), storage=storage)
+    assert abort_code(watch, servicer, 'not an offset', 1) == grpc.StatusCode.INVALID_ARGUMENT
+    servicer.config['changes_max_length'] = 0
+    assert abort_code(watch, servicer, '0', 1) == grpc.StatusCode.FAILED_PRECONDITION
+
+
+def test_watch_inventory_reports_trimmed_changes():
+    servicer = InventoryServiceServicer(config(changes_max_length=2), storage=MemoryStorage(4, 2))
+    servicer.AddProducts(inventory_pb2.ProductList(products=[product(product_identifier) for product_identifier in range(5)]), FakeContext())
+    assert abort_code(watch, servicer, '0-1', 1) == grpc.StatusCode.OUT_OF_RANGE
+    assert [event.product.product_identifier for event in watch(servicer, '0-3', 2)] == [3, 4]
+    assert [event.product.product_identifier for event in watch(servicer, '0', 2)] == [3, 4]
+
+
+def test_watchers_beyond_the_limit_are_shed(storage):
+    # Watchers are kept below max_workers, so two of three workers at most
+    servicer = InventoryServiceServicer(config(max_workers=3, watch_max_streams=5), storage=storage)
+    servicer.AddProduct(product(1), FakeContext())
+    watchers = [servicer.WatchInventory(inventory_pb2.WatchRequest(from_offset='0'), FakeContext()) for index in range(2)]
+    for watcher in watchers:
+        assert next(watcher).product == product(1)
+    assert abort_code(watch, servicer, '0', 1) == grpc.StatusCode.RESOURCE_EXHAUSTED
+    watchers.pop().close()
+    assert [event.product for event in watch(servicer, '0', 1)] == [product(1)]
+    watchers.pop().close()
+
+
+def test_import_products_skips_existing_and_invalid(servicer):
+    servicer.AddProduct(product(2, quantity=1), FakeContext())
+    batches = [inventory_pb2.ProductList(products=[product(1), product(2), product(-5)]), inventory_pb2.ProductList(),
+               inventory_pb2.ProductList(products=[product(3)])]
+    summary = servicer.ImportProducts(iter(batches), FakeContext())
+    assert (summary.received, summary.added, summary.already_present, summary.rejected) == (4, 2, 1, 1)
+    assert summary.status == 'Import complete.'
+    assert servicer.GetProductById(inventory_pb2.ProductIdentifier(product_identifier=2), FakeContext()).product_quantity == 1
+
+
+def test_export_products_streams_batches(servicer):
+    servicer.ImportProducts(iter([inventory_pb2.ProductList(products=[product(product_identifier) for product_identifier in range(10)])]), FakeContext())
+    batches = list(servicer.ExportProducts(inventory_pb2.ExportRequest(batch_size=4), FakeContext()))
+    assert [len(batch.products) for batch in batches] == [4, 4, 2]
+    exported = [found for batch in batches for found in batch.products]
+    assert sorted(exported, key=lambda found: found.product_identifier) == [product(product_identifier) for product_identifier in range(10)]
+
+
+def test_resume_gaps_are_checked_per_shard():
+    assert not resume_gap('', '5-0') and not resume_gap('0', '5-0')
+    assert resume_gap('4-0', '5-0') and not resume_gap('5-0', '5-0')
+    assert not resume_gap('7-0,0', '5-0,3-0')
+    assert resume_gap('7-0,2-1', '5-0,3-0')
+    # An offset from before the catalog was resharded
+    assert resume_gap('7-0', '5-0,3-0')
+
+
+def test_async_servicer_runs_the_same_handlers(async_storage):
+    async def updates():
+        for product_quantity in (7, 8):
+            yield quantity(1, product_quantity)
+
+    async def imports():
+        yield inventory_pb2.ProductList(products=[product(5), product(1)])
+
+    async def run():
+        servicer = AsyncInventoryServiceServicer(config(scan_batch_size=2), storage=async_storage)
+        assert (await servicer.AddProduct(product(1), FakeContext())).status == 'Product successfully added.'
+        with pytest.raises(Aborted) as aborted:
+            await servicer.AddProduct(product(1), AsyncFakeContext())
+        assert aborted.value.code == grpc.StatusCode.ALREADY_EXISTS
+        added = await servicer.AddProducts(inventory_pb2.ProductList(products=[product(2), product(1), product(3)]), FakeContext())
+        assert [result.success for result in added.results] == [True, False, True]
+        assert await servicer.GetProductById(inventory_pb2.ProductIdentifier(product_identifier=2), FakeContext()) == product(2)
+        with pytest.raises(Aborted) as aborted:
+            await servicer.GetProductById(inventory_pb2.ProductIdentifier(product_identifier=4), AsyncFakeContext())
+        assert aborted.value.code == grpc.StatusCode.NOT_FOUND
+        updated = await servicer.UpdateProductQuantity(quantity(3, 1), FakeContext())
+        assert updated == product(3, quantity=1)
+        rejected = await servicer.AdjustProductQuantity(adjustment(3, -2, minimum_quantity=0), FakeContext())
+        assert (rejected.success, rejected.product.product_quantity) == (False, 1)
+        acknowledged = [result.product.product_quantity async for result in servicer.StreamQuantities(updates(), FakeContext())]
+        assert acknowledged == [7, 8]
+        streamed = [found async for found in servicer.GetAllProducts(Empty(), FakeContext())]
+        assert sorted(streamed, key=lambda found: found.product_identifier) == [product(1, 8), product(2), product(3, 1)]
+        low = await servicer.FindLowStock(inventory_pb2.StockQuery(maximum_quantity=1), FakeContext())
+        assert [found.product_identifier for found in low.products] == [3]
+        first = await servicer.ListProducts(list_request(page_size=2), AsyncFakeContext())
+        second = await servicer.ListProducts(list_request(page_size=2, page_token=first.next_page_token), AsyncFakeContext())
+        assert [found.product_identifier for found in [*first.products, *second.products]] == [1, 2, 3]
+        with pytest.raises(Aborted):
+            await servicer.ListProducts(list_request(page_size=-1), AsyncFakeContext())
+        summary = await servicer.ImportProducts(imports(), FakeContext())
+        assert (summary.added, summary.already_present) == (1, 1)
+        exported = [len(batch.products) async for batch in servicer.ExportProducts(inventory_pb2.ExportRequest(), FakeContext())]
+        assert exported == [2, 2]
+        # Short scan steps are regrouped into full batches
+        exported = [len(batch.products) async for batch in servicer.ExportProducts(inventory_pb2.ExportRequest(batch_size=3), FakeContext())]
+        assert exported == [3, 1]
+        deleted = await servicer.DeleteProducts(inventory_pb2.ProductIdentifierList(product_identifiers=[1, 4]), FakeContext('d'))
+        assert [result.success for result in deleted.results] == [True, False]
+        assert await servicer.DeleteProducts(inventory_pb2.ProductIdentifierList(product_identifiers=[1, 4]), FakeContext('d')) == deleted
+
+    asyncio.run(run())
+
+
+def test_async_cache_subscriptions_hold_one_connection():
+    pools = create_pools(config(redis_shards='127.0.0.1:6380,127.0.0.1:6381', redis_db=2), redis.asyncio)
+    clients = [subscription_client(pool) for pool in pools]
+    assert [client.connection_pool.max_connections for client in clients] == [1, 1]
+    assert [(client.connection_pool.connection_kwargs['port'], client.connection_pool.connection_kwargs['db']) for client in clients] == \
+        [(6380, 2), (6381, 2)]
+    socket_client = subscription_client(create_pools(config(redis_unix_socket_path='/tmp/redis.sock'), redis.asyncio)[0])
+    assert socket_client.connection_pool.connection_kwargs['path'] == '/tmp/redis.sock'
+
+def test_compression_is_chosen_per_rpc():
+    config = load_config(compression='gzip', compression_methods='ExportProducts=deflate, GetAllProducts=none')
+    assert compression_methods(config) == {'ExportProducts': grpc.Compression.Deflate, 'GetAllProducts': grpc.Compression.NoCompression}
+    assert compression_methods(load_config()) == {}
+    for bad in ({'compression': 'brotli'}, {'compression_methods': 'ExportProducts=brotli'}, {'compression_methods': 'Export=gzip'}):
+        with pytest.raises(ValueError):
+            compression_methods(load_config(**bad))
+
+
+def test_server_options_follow_the_settings():
+    options = dict(server_options(load_config(max_receive_message_length=1024, keepalive_time_ms=5000)))
+    assert (options['grpc.max_receive_message_length'], options['grpc.keepalive_time_ms']) == (1024, 5000)
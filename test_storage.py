@@ -0,0 +1,299 @@
+import asyncio
+from collections import Counter
+from threading import Barrier, Thread
+
+import inventory_pb2
+from conftest import make_storage
+from storage import (ADJUST_APPLIED, ADJUST_NOT_FOUND, ADJUST_OUT_OF_RANGE, ADJUST_REJECTED, CHANGE_ADDED, CHANGE_DELETED, CHANGE_QUANTITY,
+                     QUANTITY_RANGE, REQUEST_PENDING, HashRing, MemoryStorage, ShardedStorage, Storage, bucket_identifiers, hash_identifiers, name_position)
+
+
+def product(product_identifier, name=None, quantity=10, price=2.5):
+    return inventory_pb2.Product(product_identifier=product_identifier, product_name=name or f'item {product_identifier:03}',
+                                 product_quantity=quantity, product_price=price)
+
+
+def catalog(size):
+    return [product(product_identifier, quantity=product_identifier % 20, price=1.0 + product_identifier % 7) for product_identifier in range(size)]
+
+
+def assert_stats_match_scan(storage, thresholds=(5,)):
+    # The totals the writes keep must agree with a full recount
+    assert storage.stats(list(thresholds)) == Storage.stats(storage, list(thresholds))
+
+
+def test_add_get_delete(storage):
+    assert storage.add(product(1))
+    assert not storage.add(product(1, name='other'))
+    assert storage.get(1) == product(1)
+    assert storage.get(2) is None
+    assert storage.delete(1)
+    assert not storage.delete(1)
+    assert storage.get(1) is None
+
+
+def test_batches_keep_request_order(storage):
+    products = catalog(30)
+    assert storage.add_many(products) == [True] * 30
+    assert storage.add_many([product(5), product(40)]) == [False, True]
+    assert storage.get_many([40, 99, 3]) == [product(40), None, products[3]]
+    assert [found.product_quantity if found else None for found in storage.set_quantities([(3, 7), (99, 1), (4, 8)])] == [7, None, 8]
+    assert storage.delete_many([3, 99, 4]) == [True, False, True]
+    assert storage.get_many([3, 4]) == [None, None]
+    assert storage.add_many([]) == storage.get_many([]) == storage.delete_many([]) == []
+
+
+def test_set_quantity(storage):
+    storage.add(product(1))
+    assert storage.set_quantity(1, 42).product_quantity == 42
+    assert storage.get(1).product_quantity == 42
+    assert storage.set_quantity(2, 42) is None
+
+
+def test_adjust_outcomes(storage):
+    storage.add(product(1, quantity=5))
+    outcome, adjusted = storage.adjust(1, -3, 0)
+    assert (outcome, adjusted.product_quantity) == (ADJUST_APPLIED, 2)
+    outcome, rejected = storage.adjust(1, -3, 0)
+    assert (outcome, rejected.product_quantity) == (ADJUST_REJECTED, 2)
+    assert storage.adjust(1, -3)[0] == ADJUST_APPLIED
+    assert storage.adjust(2, 1) == (ADJUST_NOT_FOUND, None)
+    assert storage.get(1).product_quantity == -1
+
+
+def test_adjust_out_of_int32_range_is_rejected(storage):
+    storage.add(product(1, quantity=QUANTITY_RANGE[1] - 1))
+    storage.add(product(2, quantity=QUANTITY_RANGE[0] + 1))
+    outcome, unchanged = storage.adjust(1, 2)
+    assert (outcome, unchanged.product_quantity) == (ADJUST_OUT_OF_RANGE, QUANTITY_RANGE[1] - 1)
+    assert [outcome for outcome, adjusted in storage.adjust_many([(2, -1, None), (2, -1, None)])] == [ADJUST_APPLIED, ADJUST_OUT_OF_RANGE]
+    assert storage.adjust(1, 1)[0] == ADJUST_APPLIED
+    # Every product still decodes
+    assert sorted(found.product_quantity for found in storage.scan(10)) == [QUANTITY_RANGE[0], QUANTITY_RANGE[1]]
+    assert_stats_match_scan(storage)
+
+
+def test_concurrent_adjustments_never_oversell(storage):
+    storage.add(product(1, quantity=100))
+    outcomes = Counter()
+
+    def reserve():
+        for attempt in range(30):
+            outcomes[storage.adjust(1, -1, 0)[0]] += 1
+
+    threads = [Thread(target=reserve) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert outcomes == {ADJUST_APPLIED: 100, ADJUST_REJECTED: 140}
+    assert storage.get(1).product_quantity == 0
+    assert_stats_match_scan(storage)
+
+
+def test_concurrent_adds_of_one_id_add_once(storage):
+    added = []
+    threads = [Thread(target=lambda name=name: added.append(storage.add(product(7, name=name)))) for name in 'abcdefgh']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(added) == [False] * 7 + [True]
+    assert len(list(storage.scan(10))) == 1
+    assert_stats_match_scan(storage)
+
+
+def test_scan_reads_every_product(storage):
+    storage.add_many(catalog(250))
+    storage.delete(17)
+    identifiers = [found.product_identifier for found in storage.scan(40)]
+    assert sorted(identifiers) == [identifier for identifier in range(250) if identifier != 17]
+
+
+def test_indexes_follow_writes(storage):
+    storage.add_many([product(1, 'apple', 3, 1.0), product(2, 'apricot', 8, 4.0), product(3, 'banana', 1, 9.0)])
+    storage.set_quantity(2, 0)
+    storage.adjust(3, 10)
+    storage.delete(1)
+    assert [found.product_identifier for found in storage.find_by_name('ap', 10)] == [2]
+    assert [found.product_identifier for found in storage.find_by_quantity(5, 10)] == [2]
+    assert [found.product_identifier for found in storage.find_by_price(3.0, 10.0, 10)] == [2, 3]
+    assert storage.find_by_name('apple', 10) == []
+
+
+def test_queries_stop_at_limit(storage):
+    storage.add_many(catalog(30))
+    assert [found.product_name for found in storage.find_by_name('item 01', 3)] == ['item 010', 'item 011', 'item 012']
+    assert [found.product_quantity for found in storage.find_by_quantity(19, 4)] == [0, 0, 1, 1]
+
+
+def test_list_by_name_pages(storage):
+    products = catalog(23)
+    storage.add_many(products)
+    listed, after = [], None
+    while True:
+        page, after = storage.list_by_name('item', after, 5)
+        listed.extend(page)
+        if after is None:
+            break
+    assert listed == sorted(products, key=name_position)
+    assert storage.list_by_name('item 02', None, 5) == (products[20:23], None)
+
+
+def test_stats_follow_writes(storage):
+    assert storage.stats([5]) == inventory_pb2.InventoryStats(low_stock=[inventory_pb2.LowStockCount(maximum_quantity=5)])
+    storage.add_many([product(1, quantity=3, price=2.0), product(2, quantity=10, price=1.5), product(3, quantity=6, price=4.0)])
+    storage.set_quantity(2, 4)
+    storage.set_quantities([(3, 8), (9, 1)])
+    storage.adjust(1, 2)
+    storage.adjust_many([(3, -100, 0), (2, 1, None)])
+    storage.delete(9)
+    storage.delete_many([1])
+    stats = storage.stats([0, 5])
+    assert (stats.products, stats.total_quantity, stats.total_value) == (2, 13, 39.5)
+    assert [(count.maximum_quantity, count.products) for count in stats.low_stock] == [(0, 0), (5, 1)]
+    assert_stats_match_scan(storage, (0, 5, 8))
+
+
+def test_memory_storage_keeps_low_stock_counts():
+    storage = MemoryStorage(4, low_stock_thresholds=[0, 5])
+    storage.add_many(catalog(40))
+    storage.set_quantities([(1, 0), (2, 30)])
+    storage.adjust(3, -10)
+    storage.delete_many([4, 5])
+    assert_stats_match_scan(storage, (0, 5))
+    # Other thresholds are counted by scanning
+    assert [count.products for count in storage.stats([10]).low_stock] == [19]
+
+
+def test_keys_name_the_products_they_hold():
+    assert hash_identifiers('inventory:12', 'inventory:') == [12]
+    assert hash_identifiers('12', 'inventory:') == hash_identifiers('inventory:idx:name', 'inventory:') == []
+    assert bucket_identifiers(b'inventory:b:2', 7, 'inventory:') == list(range(14, 21))
+    assert bucket_identifiers('b:2', 7, 'inventory:') == bucket_identifiers('inventory:b:x', 7, 'inventory:') == []
+
+
+def test_scan_skips_keys_outside_the_prefix(storage):
+    storage.add_many(catalog(5))
+    if hasattr(storage, 'redis'):
+        storage.redis.hset('9', 'product_name', 'stray')
+        storage.redis.hset('b:0', '9', 'stray')
+    assert sorted(found.product_identifier for found in storage.scan(10)) == list(range(5))
+
+
+def test_change_log(storage):
+    start = storage.latest_offset()
+    storage.add(product(1, quantity=4))
+    storage.adjust(1, 2)
+    storage.delete(1)
+    changes = storage.read_changes(start, 10)
+    assert [(operation, change.product_identifier) for offset, operation, change in changes] == \
+        [(CHANGE_ADDED, 1), (CHANGE_QUANTITY, 1), (CHANGE_DELETED, 1)]
+    assert changes[1][2].product_quantity == 6
+    assert storage.read_changes(changes[-1][0], 10) == []
+    assert storage.latest_offset() == changes[-1][0]
+
+
+def test_request_ids_are_claimed_once(storage):
+    assert storage.claim_request('AddProduct:a', 30) is None
+    assert storage.claim_request('AddProduct:a', 30) == REQUEST_PENDING
+    storage.save_request('AddProduct:a', 'response', 60)
+    assert storage.claim_request('AddProduct:a', 30) == 'response'
+    assert storage.claim_request('DeleteProduct:a', 30) is None
+    storage.release_request('DeleteProduct:a')
+    assert storage.claim_request('DeleteProduct:a', 30) is None
+
+
+def test_memory_storage_forgets_the_oldest_request_ids():
+    storage = MemoryStorage(4, requests_max_entries=2)
+    for key in 'abc':
+        storage.claim_request(key, 30)
+    assert storage.claim_request('a', 30) is None
+    assert storage.claim_request('c', 30) == REQUEST_PENDING
+    storage.claim_request('expired', 0)
+    assert storage.claim_request('expired', 30) is None
+
+
+def test_hash_ring_is_stable_and_balanced():
+    ring = HashRing(['a', 'b', 'c'])
+    owners = [ring.index(key) for key in range(3000)]
+    assert owners == [HashRing(['a', 'b', 'c']).index(key) for key in range(3000)]
+    assert all(700 < count < 1300 for count in Counter(owners).values())
+    # A new shard takes keys from the others, no key moves between the old shards
+    grown = HashRing(['a', 'b', 'c', 'd'])
+    moved = [key for key in range(3000) if grown.index(key) != owners[key]]
+    assert all(grown.index(key) == 3 for key in moved)
+    assert 450 < len(moved) < 1050
+
+
+def test_sharded_storage_routes_by_ring():
+    storage = make_storage('sharded')
+    storage.add_many(catalog(60))
+    for index, shard in enumerate(storage.shards):
+        held = sorted(found.product_identifier for found in shard.scan(100))
+        assert held == [identifier for identifier in range(60) if storage.ring.index(identifier) == index]
+        assert held
+    assert storage.get_many([5, 59, 60]) == [catalog(60)[5], catalog(60)[59], None]
+
+
+def test_sharded_fan_outs_run_concurrently():
+    # Every shard call of 4 concurrent batches must be running at once to pass the barrier
+    workers, shards = 4, [MemoryStorage(4), MemoryStorage(4)]
+    barrier = Barrier(workers * len(shards), timeout=5)
+
+    class MeetingShard:
+        def __init__(self, shard):
+            self.shard = shard
+
+        def get_many(self, product_identifiers):
+            barrier.wait()
+            return self.shard.get_many(product_identifiers)
+
+        def __getattr__(self, name):
+            return getattr(self.shard, name)
+
+    storage = ShardedStorage([MeetingShard(shard) for shard in shards], workers=workers)
+    storage.add_many(catalog(20))
+    found = []
+    threads = [Thread(target=lambda: found.append(storage.get_many(list(range(20))))) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert found == [catalog(20)] * workers
+    assert not barrier.broken
+
+def test_async_storage_matches_sync(async_storage):
+    async def exercise():
+        assert await async_storage.add_many(catalog(60)) == [True] * 60
+        assert not await async_storage.add(product(1))
+        assert await async_storage.get_many([2, 60]) == [catalog(60)[2], None]
+        assert (await async_storage.adjust(1, -100, 0))[0] == ADJUST_REJECTED
+        assert (await async_storage.adjust(1, QUANTITY_RANGE[1]))[0] == ADJUST_OUT_OF_RANGE
+        assert [outcome for outcome, adjusted in await async_storage.adjust_many([(1, 1, None), (60, 1, None)])] == [ADJUST_APPLIED, ADJUST_NOT_FOUND]
+        assert (await async_storage.set_quantity(2, 9)).product_quantity == 9
+        assert [found.product_quantity for found in await async_storage.set_quantities([(4, 3)])] == [3]
+        assert await async_storage.delete(5)
+        assert await async_storage.delete_many([3, 61]) == [True, False]
+        scanned = [found.product_identifier async for found in async_storage.scan(16)]
+        assert sorted(scanned) == [identifier for identifier in range(60) if identifier not in (3, 5)]
+        # scan() is built on scan_batch(), one shieldable read per step
+        cursor, stepped, steps = None, [], 0
+        while True:
+            cursor, products = await async_storage.scan_batch(cursor, 16)
+            stepped.extend(found.product_identifier for found in products)
+            steps += 1
+            if cursor is None:
+                break
+        assert sorted(stepped) == sorted(scanned) and steps > 1
+        assert [found.product_identifier for found in await async_storage.find_by_quantity(0, 10)] == [0, 20, 40]
+        assert [found.product_identifier for found in await async_storage.find_by_price(7.0, 7.0, 2)] == [13, 20] # Ties in ID text order
+        assert [found.product_identifier for found in await async_storage.find_by_name('item 05', 2)] == [50, 51]
+        assert (await async_storage.stats([0])).products == 58
+        assert await async_storage.claim_request('AddProduct:a', 30) is None
+        await async_storage.save_request('AddProduct:a', 'response', 60)
+        assert await async_storage.claim_request('AddProduct:a', 30) == 'response'
+        assert await async_storage.claim_request('AddProduct:b', 30) is None
+        await async_storage.release_request('AddProduct:b')
+        assert await async_storage.claim_request('AddProduct:b', 30) is None
+    asyncio.run(exercise())